@@ -1,5 +1,7 @@
 import streamlit as st
 import re
+import threading
+import time
 from managers.supabase_config import get_supabase_client
 from typing import Optional, Dict, Any
 from utils.simple_logger import get_logger
@@ -43,56 +45,160 @@ def extract_name_from_email(email: str) -> str:
     
     return formatted_name if formatted_name else username.capitalize()
 
+# ---------------------------------------------------------------------------
+# Principal autenticado (cache por sessão)
+#
+# Perfil e status de trial são resolvidos com uma única consulta a profiles e
+# guardados em st.session_state; reruns dentro do TTL não acessam o banco.
+# invalidate_principal() força a revalidação, inclusive em outras sessões do
+# mesmo processo (ex: admin alterou o plano do usuário).
+# ---------------------------------------------------------------------------
+
+def _principal_ttl_seconds() -> float:
+    from config.config import get_config
+    return get_config("cache").get("principal_ttl_seconds", 60)
+
+
+# email -> instante (time.time()) da última invalidação; a chave None invalida todos
+_principal_invalidations: Dict[Optional[str], float] = {}
+_principal_invalidations_lock = threading.Lock()
+
+
+class AuthPrincipal:
+    """Usuário autenticado: id, papel, plano e status de trial"""
+
+    __slots__ = ("email", "user_info", "trial_info", "loaded_at")
+
+    def __init__(self, email: str, user_info: Dict[str, Any], trial_info: Dict[str, Any]):
+        self.email = email
+        self.user_info = user_info
+        self.trial_info = trial_info
+        self.loaded_at = time.time()
+
+    @property
+    def id(self) -> Optional[str]:
+        return self.user_info.get("id")
+
+    @property
+    def role(self) -> str:
+        return self.user_info.get("role", "viewer")
+
+    @property
+    def plan(self) -> Optional[str]:
+        return self.trial_info.get("plan")
+
+    @property
+    def trial_expires_at(self):
+        return self.trial_info.get("trial_expires_at")
+
+    @property
+    def is_trial_expired(self) -> bool:
+        """Trial expirado e sem acesso ilimitado (admin ou plano ilimitado)"""
+        if self.trial_info.get("unlimited_access", False):
+            return False
+        return bool(self.trial_info.get("is_trial_expired", False) and self.trial_info.get("has_trial", False))
+
+    def is_fresh(self) -> bool:
+        """Dentro do TTL e sem invalidação posterior ao carregamento"""
+        if time.time() - self.loaded_at > _principal_ttl_seconds():
+            return False
+        with _principal_invalidations_lock:
+            invalidated_at = max(_principal_invalidations.get(self.email, 0.0),
+                                 _principal_invalidations.get(None, 0.0))
+        return invalidated_at < self.loaded_at
+
+
+def invalidate_principal(email: Optional[str] = None) -> None:
+    """
+    Invalida o principal em cache de um usuário (ou de todos, sem email).
+
+    Deve ser chamado após alterar papel, plano, status ou trial em profiles.
+    """
+    key = email.lower().strip() if email else None
+    with _principal_invalidations_lock:
+        _principal_invalidations[key] = time.time()
+    principal = st.session_state.get('auth_principal')
+    if principal is not None and (key is None or principal.email == key):
+        del st.session_state['auth_principal']
+
+
+def _load_principal(email: str) -> Optional[AuthPrincipal]:
+    """Carrega perfil e status de trial com uma consulta a profiles (cria o perfil se necessário)"""
+    from services.trial_manager import trial_status_from_profile, check_trial_status
+    from managers.supabase_config import get_service_role_client
+
+    profile = None
+    supabase = get_service_role_client()
+    if supabase:
+        try:
+            response = supabase.table("profiles").select("*").eq("email", email).limit(1).execute()
+            profile = response.data[0] if response.data else None
+        except Exception as e:
+            get_logger().error(f"Erro ao buscar perfil de {email}: {e}")
+
+    if profile:
+        user_info = {
+            "id": profile.get("id"),
+            "email": profile.get("email", email),
+            "full_name": profile.get("full_name", ""),
+            "role": profile.get("role", "viewer")
+        }
+        trial_info = trial_status_from_profile(profile)
+    else:
+        # Usuário novo ou falha na consulta: segue o fluxo completo (cria perfil com trial)
+        user_info = check_user_in_database(email)
+        if not user_info:
+            return None
+        trial_info = check_trial_status(email)
+
+    return AuthPrincipal(email, user_info, trial_info)
+
+
+def get_principal(email: Optional[str] = None) -> Optional[AuthPrincipal]:
+    """Retorna o principal do usuário logado, revalidando apenas após TTL ou invalidação"""
+    email = email or get_user_email()
+    if not email:
+        return None
+
+    principal = st.session_state.get('auth_principal')
+    if principal is not None and principal.email == email and principal.is_fresh():
+        return principal
+
+    principal = _load_principal(email)
+    if principal is None:
+        st.session_state.pop('auth_principal', None)
+        return None
+
+    # Salva informações do usuário na sessão
+    st.session_state.auth_principal = principal
+    st.session_state.user_info = principal.user_info
+    st.session_state.role = principal.role
+    st.session_state.authenticated_user_email = email
+    st.session_state.user_id = principal.id
+    return principal
+
+
+def get_trial_info() -> Dict[str, Any]:
+    """Status de trial do usuário logado (do principal em cache)"""
+    principal = get_principal()
+    return principal.trial_info if principal else {}
+
+
 def authenticate_user() -> bool:
     """Verifica o usuário na base de dados."""
     user_email = get_user_email()
     if not user_email:
         return False
 
-    # Verifica se já está autenticado na sessão
-    if st.session_state.get('authenticated_user_email') == user_email:
-        # Verifica o status do trial para sessões existentes (não bloqueia admins ou planos ilimitados)
-        try:
-            from services.trial_manager import check_trial_status
-            trial_info = check_trial_status(user_email)
-            
-            # Não bloqueia se tiver acesso ilimitado
-            if trial_info.get('unlimited_access', False):
-                pass  # Continua normalmente
-            elif trial_info.get('is_trial_expired', False) and trial_info.get('has_trial', False):
-                # Se o trial expirou, encerra a sessão
-                st.error("Seu período de trial expirou.")
-                return False
-        except:
-            pass  # Se não tiver o trial manager, continua normalmente
-        return True
-
-    # Busca informações do usuário na base de dados
-    user_info = check_user_in_database(user_email)
-    
-    if not user_info:
+    principal = get_principal(user_email)
+    if principal is None:
         return False
 
-    # Verifica o status do trial (não bloqueia admins ou planos ilimitados)
-    try:
-        from services.trial_manager import check_trial_status
-        trial_info = check_trial_status(user_email)
-        
-        # Não bloqueia se tiver acesso ilimitado
-        if trial_info.get('unlimited_access', False):
-            pass  # Continua normalmente
-        elif trial_info.get('is_trial_expired', False) and trial_info.get('has_trial', False):
-            st.error("Seu período de trial expirou.")
-            return False
-    except:
-        pass  # Se não tiver o trial manager, continua normalmente
+    # Não bloqueia admins ou planos ilimitados
+    if principal.is_trial_expired:
+        st.error("Seu período de trial expirou.")
+        return False
 
-    # Salva informações do usuário na sessão
-    st.session_state.user_info = user_info
-    st.session_state.role = user_info.get('role', 'viewer')
-    st.session_state.authenticated_user_email = user_email
-    st.session_state.user_id = user_info.get('id')
-    
     return True
 
 def check_user_in_database(email: str) -> Optional[Dict[str, Any]]:
@@ -281,7 +387,7 @@ def logout_user():
     try:
         # Limpa dados da sessão
         for key in list(st.session_state.keys()):
-            if key.startswith('user_') or key in ['authenticated_user_email', 'role', 'user_id', 'user_info']:
+            if key.startswith('user_') or key in ['authenticated_user_email', 'role', 'user_id', 'user_info', 'auth_principal']:
                 del st.session_state[key]
         
         # Chama logout do Streamlit
@@ -306,22 +412,12 @@ def require_login():
         show_access_denied_page()
         st.stop()
     
-    # Verifica status do trial após autenticação (não bloqueia admins ou planos ilimitados)
-    try:
-        from services.trial_manager import check_trial_status
-        user_email = get_user_email()
-        if user_email:
-            trial_info = check_trial_status(user_email)
-            
-            # Não bloqueia se tiver acesso ilimitado
-            if trial_info.get('unlimited_access', False):
-                pass  # Continua normalmente
-            elif trial_info.get('is_trial_expired', False) and trial_info.get('has_trial', False):
-                from services.trial_manager import show_trial_expired_page
-                show_trial_expired_page()
-                st.stop()
-    except ImportError:
-        pass  # Se não tiver o trial manager, continua normalmente
+    # Status do trial já resolvido pelo principal em cache (sem nova consulta)
+    principal = get_principal()
+    if principal is not None and principal.is_trial_expired:
+        from services.trial_manager import show_trial_expired_page
+        show_trial_expired_page()
+        st.stop()
 
 def show_user_info():
     """Mostra informações do usuário logado na sidebar."""
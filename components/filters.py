@@ -8,17 +8,19 @@ def get_users() -> List[Dict[str, Any]]:
     """Busca lista de usuários disponíveis"""
     try:
         supabase = get_supabase_client()
-        response = supabase.table("profiles").select("email, full_name, role").order("full_name").execute()
-        return response.data
+        response = supabase.table("profiles").select("id, email, full_name, role").order("full_name").execute()
+        return response.data or []
     except Exception as e:
         st.error(f"Erro ao buscar usuários: {str(e)}")
         return []
 
 def user_filter(allow_multiple: bool = True, 
                 default_all: bool = True,
-                key_prefix: str = "") -> List[str]:
+                key_prefix: str = "",
+                users: Optional[List[Dict[str, Any]]] = None) -> List[str]:
     """Filtro de usuários"""
-    users = get_users()
+    if users is None:
+        users = get_users()
     
     if not users:
         return []
@@ -163,6 +165,19 @@ def period_filter(key_prefix: str = "") -> str:
     
     return period_options[selected_period]
 
+def selected_user_ids(selected_emails: List[str], users: List[Dict[str, Any]]) -> Optional[List[str]]:
+    """
+    UUIDs (created_by) dos usuários selecionados.
+
+    None quando todos ou nenhum estão selecionados, para que a consulta não leve
+    um filtro in_ com a lista inteira de usuários. Lista vazia quando nenhum dos
+    e-mails selecionados tem perfil: o filtro existe e não casa com nada.
+    """
+    if not selected_emails or len(set(selected_emails)) >= len(users):
+        return None
+    ids_by_email = {user['email']: user.get('id') for user in users}
+    return [ids_by_email[email] for email in selected_emails if ids_by_email.get(email)]
+
 def create_filter_sidebar() -> Dict[str, Any]:
     """Cria sidebar com filtros essenciais apenas"""
     with st.sidebar:
@@ -178,10 +193,12 @@ def create_filter_sidebar() -> Dict[str, Any]:
         # Usuários (opcional, útil para administradores)
         st.markdown("---")
         st.caption("**Filtros Opcionais**")
-        selected_users = user_filter()
+        users = get_users()
+        selected_users = user_filter(users=users)
         
         return {
             "users": selected_users,
+            "user_ids": selected_user_ids(selected_users, users),
             "months_back": months_back,
             "start_date": start_date,
             "end_date": end_date,
@@ -200,9 +217,9 @@ def apply_filters_to_df(df: pd.DataFrame, filters: Dict[str, Any]) -> pd.DataFra
     if "opened_at" in filtered_df.columns:
         filtered_df["opened_at"] = pd.to_datetime(filtered_df["opened_at"], errors="coerce").dt.date
     
-    # Filtro por usuários
-    if filters.get("users") and "created_by" in filtered_df.columns:
-        filtered_df = filtered_df[filtered_df["created_by"].isin(filters["users"])]
+    # Filtro por usuários (created_by guarda o UUID do perfil)
+    if filters.get("user_ids") is not None and "created_by" in filtered_df.columns:
+        filtered_df = filtered_df[filtered_df["created_by"].isin(filters["user_ids"])]
     
     # Filtro por período (últimos N meses)
     if filters.get("months_back", 0) > 0:
@@ -212,11 +229,13 @@ def apply_filters_to_df(df: pd.DataFrame, filters: Dict[str, Any]) -> pd.DataFra
             cutoff_date = latest_period - pd.DateOffset(months=filters["months_back"])
             filtered_df = filtered_df[pd.to_datetime(filtered_df["period"]) >= cutoff_date]
     
-    # Filtro por data
-    if filters.get("start_date") and "occurred_at" in filtered_df.columns:
+    # Filtro por data (não conformidades são filtradas só por opened_at, abaixo,
+    # como na consulta e nos agregados mensais)
+    by_occurred_at = "occurred_at" in filtered_df.columns and "opened_at" not in filtered_df.columns
+    if filters.get("start_date") and by_occurred_at:
         filtered_df = filtered_df[filtered_df["occurred_at"] >= filters["start_date"]]
     
-    if filters.get("end_date") and "occurred_at" in filtered_df.columns:
+    if filters.get("end_date") and by_occurred_at:
         filtered_df = filtered_df[filtered_df["occurred_at"] <= filters["end_date"]]
     
     # Filtro por data para não conformidades
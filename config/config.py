@@ -49,6 +49,34 @@ REPORT_CONFIG = {
     "export_formats": ["csv", "excel"]
 }
 
+# Configurações do cache de dados (fetchers dos dashboards)
+CACHE_CONFIG = {
+    "ttl_seconds": int(os.environ.get("SSO_CACHE_TTL_SECONDS", "120")),
+    "max_entries": int(os.environ.get("SSO_CACHE_MAX_ENTRIES", "256")),
+    "max_memory_mb": int(os.environ.get("SSO_CACHE_MAX_MEMORY_MB", "128")),
+    # Revalidação do usuário autenticado (perfil, papel, plano e trial)
+    "principal_ttl_seconds": int(os.environ.get("SSO_PRINCIPAL_TTL_SECONDS", "60")),
+    # Estatísticas das páginas de administração (logs e feedbacks)
+    "statistics_ttl_seconds": int(os.environ.get("SSO_STATISTICS_TTL_SECONDS", "30")),
+}
+
+# Gravação assíncrona dos logs de auditoria (user_logs)
+AUDIT_LOG_CONFIG = {
+    "batch_size": int(os.environ.get("SSO_AUDIT_BATCH_SIZE", "50")),
+    "flush_interval_seconds": float(os.environ.get("SSO_AUDIT_FLUSH_SECONDS", "2")),
+    "max_queue_size": int(os.environ.get("SSO_AUDIT_MAX_QUEUE", "5000")),
+    "max_retries": int(os.environ.get("SSO_AUDIT_MAX_RETRIES", "3")),
+    "spill_path": os.environ.get("SSO_AUDIT_SPILL_PATH", os.path.join("logs", "audit_spill.ndjson")),
+    # Reenvios seguidos de um lote rejeitado antes de gravá-lo registro a registro (dead-letter)
+    "max_replay_failures": int(os.environ.get("SSO_AUDIT_MAX_REPLAY_FAILURES", "3")),
+}
+
+# Cache em disco dos diagramas da árvore de falhas (graphviz), endereçado pelo hash do DOT
+GRAPH_CACHE_CONFIG = {
+    "dir": os.environ.get("SSO_GRAPH_CACHE_DIR", os.path.join("logs", "graph_cache")),
+    "max_size_mb": int(os.environ.get("SSO_GRAPH_CACHE_MAX_MB", "64")),
+}
+
 def get_config(section: str) -> Dict[str, Any]:
     """Retorna configurações de uma seção específica"""
     configs = {
@@ -57,7 +85,10 @@ def get_config(section: str) -> Dict[str, Any]:
         "kpi": KPI_CONFIG,
         "upload": UPLOAD_CONFIG,
         "auth": AUTH_CONFIG,
-        "report": REPORT_CONFIG
+        "report": REPORT_CONFIG,
+        "cache": CACHE_CONFIG,
+        "audit_log": AUDIT_LOG_CONFIG,
+        "graph_cache": GRAPH_CACHE_CONFIG
     }
     return configs.get(section, {})
 
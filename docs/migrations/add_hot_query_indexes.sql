@@ -0,0 +1,120 @@
+-- Migration: Índices para os filtros mais usados pelo sistema
+-- Descrição: Índices compostos para os predicados que os serviços aplicam em
+-- toda consulta (tenant created_by + janela de datas, árvore de falhas por
+-- acidente, anexos por entidade, paginação dos logs por (created_at, id)) e as
+-- constraints UNIQUE exigidas pelos upserts (on_conflict).
+--
+-- Verificação: python scripts/explain_hot_queries.py --dsn postgresql://... (EXPLAIN ANALYZE)
+--
+-- Tudo é idempotente (IF NOT EXISTS / verificação no catálogo). Em tabelas grandes
+-- em produção, prefira rodar cada CREATE INDEX isoladamente com CONCURRENTLY
+-- (fora de transação; o editor SQL do Supabase roda o script em uma transação).
+
+-- ========== LISTAGENS DOS DASHBOARDS (services/list_queries.py) ==========
+-- Usuário comum: created_by = X, janela na coluna de data (occurred_at; opened_at nas
+-- não conformidades), ORDER BY data DESC, id
+CREATE INDEX IF NOT EXISTS idx_accidents_created_by_occurred_at
+    ON accidents (created_by, occurred_at DESC, id);
+CREATE INDEX IF NOT EXISTS idx_near_misses_created_by_occurred_at
+    ON near_misses (created_by, occurred_at DESC, id);
+CREATE INDEX IF NOT EXISTS idx_nonconformities_created_by_opened_at
+    ON nonconformities (created_by, opened_at DESC, id);
+
+-- Admin: sem filtro de tenant, apenas janela/ordenação por data
+CREATE INDEX IF NOT EXISTS idx_accidents_occurred_at
+    ON accidents (occurred_at DESC, id);
+
+-- ========== KPIs (services/kpi.py) ==========
+-- Filtro por tenant + ordenação por período e "período mais recente" (months_back)
+CREATE INDEX IF NOT EXISTS idx_kpi_monthly_created_by_period
+    ON kpi_monthly (created_by, period);
+-- Recalcúlo incremental: horas de um tenant em um intervalo de anos
+CREATE INDEX IF NOT EXISTS idx_hours_worked_monthly_created_by_year_month
+    ON hours_worked_monthly (created_by, year, month);
+
+-- ========== INVESTIGAÇÃO (services/investigation.py) ==========
+-- fault_tree_nodes(accident_id, parent_id) já é coberto pelo prefixo de
+-- idx_fault_tree_nodes_display_order (add_display_order_to_fault_tree_nodes.sql);
+-- recriado aqui caso aquela migration não tenha sido aplicada.
+CREATE INDEX IF NOT EXISTS idx_fault_tree_nodes_display_order
+    ON fault_tree_nodes (accident_id, parent_id, display_order);
+CREATE INDEX IF NOT EXISTS idx_involved_people_accident_id
+    ON involved_people (accident_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_evidence_accident_id
+    ON evidence (accident_id, uploaded_at);
+CREATE INDEX IF NOT EXISTS idx_timeline_accident_id
+    ON timeline (accident_id, event_time);
+
+-- ========== ANEXOS (services/uploads.py) ==========
+CREATE INDEX IF NOT EXISTS idx_attachments_entity
+    ON attachments (entity_type, entity_id);
+
+-- ========== LOGS DE AUDITORIA (services/user_logs.py) ==========
+-- Paginação por cursor: ORDER BY created_at DESC, id DESC, com ou sem filtro de usuário
+CREATE INDEX IF NOT EXISTS idx_user_logs_created_at_id
+    ON user_logs (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_user_logs_user_id_created_at_id
+    ON user_logs (user_id, created_at DESC, id DESC);
+-- Limpeza dos logs expirados (cleanup_expired_logs)
+CREATE INDEX IF NOT EXISTS idx_user_logs_expires_at
+    ON user_logs (expires_at);
+
+-- ========== CONSTRAINTS UNIQUE USADAS POR UPSERTS ==========
+-- Cria a constraint só se ainda não houver um índice UNIQUE (não parcial)
+-- exatamente sobre as mesmas colunas, qualquer que seja o nome.
+-- Se houver duplicatas, o ALTER falha; localize-as antes com, por exemplo:
+--   SELECT period, created_by, count(*) FROM kpi_monthly GROUP BY 1, 2 HAVING count(*) > 1;
+DO $$
+DECLARE
+    target RECORD;
+BEGIN
+    FOR target IN
+        SELECT * FROM (VALUES
+            -- upsert(on_conflict="period,created_by") em services/kpi.py
+            ('kpi_monthly', 'kpi_monthly_period_created_by_key', ARRAY['period', 'created_by']),
+            -- upsert(on_conflict="year,month,created_by") em services/bulk_import.py
+            ('hours_worked_monthly', 'hours_worked_monthly_year_month_created_by_key', ARRAY['year', 'month', 'created_by']),
+            -- upsert(on_conflict="email") em pages/8_Perfil_Usuario.py; também indexa o login
+            ('profiles', 'profiles_email_key', ARRAY['email'])
+        ) AS t(table_name, constraint_name, columns)
+    LOOP
+        IF NOT EXISTS (
+            SELECT 1
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'public'
+              AND c.relname = target.table_name
+              AND i.indisunique
+              AND i.indpred IS NULL
+              AND i.indnatts = array_length(target.columns, 1)
+              AND (
+                  SELECT array_agg(a.attname::text ORDER BY a.attname)
+                  FROM pg_attribute a
+                  WHERE a.attrelid = c.oid AND a.attnum = ANY (i.indkey)
+              ) = (SELECT array_agg(col ORDER BY col) FROM unnest(target.columns) AS col)
+        ) THEN
+            EXECUTE format(
+                'ALTER TABLE public.%I ADD CONSTRAINT %I UNIQUE (%s)',
+                target.table_name,
+                target.constraint_name,
+                (SELECT string_agg(quote_ident(col), ', ') FROM unnest(target.columns) AS col)
+            );
+        END IF;
+    END LOOP;
+END $$;
+
+-- accidents.import_key (upsert da importação em lote) tem o seu índice UNIQUE em
+-- add_import_key_to_accidents.sql.
+
+-- Atualiza as estatísticas para o planner considerar os novos índices
+ANALYZE accidents;
+ANALYZE near_misses;
+ANALYZE nonconformities;
+ANALYZE kpi_monthly;
+ANALYZE hours_worked_monthly;
+ANALYZE fault_tree_nodes;
+ANALYZE involved_people;
+ANALYZE attachments;
+ANALYZE user_logs;
+ANALYZE profiles;
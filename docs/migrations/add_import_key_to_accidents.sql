@@ -0,0 +1,20 @@
+-- Migration: Chave natural para importação de acidentes em lote
+-- Descrição: accidents não tem chave natural, então reimportar a mesma planilha
+-- duplicava os registros. A importação (services/bulk_import.py) grava em
+-- import_key um hash de (created_by, occurred_at, type, description, employee_id)
+-- e faz upsert com on_conflict=import_key. Registros criados pelo formulário
+-- ficam com import_key nulo e não são afetados pelo índice.
+
+ALTER TABLE accidents
+ADD COLUMN IF NOT EXISTS import_key TEXT;
+
+-- Índice único (não parcial) para que o PostgREST aceite on_conflict=import_key
+CREATE UNIQUE INDEX IF NOT EXISTS accidents_import_key_key
+    ON accidents (import_key);
+
+COMMENT ON COLUMN accidents.import_key IS 'Hash da linha importada (CSV/XLSX) usado para upsert idempotente';
+
+-- hours_worked_monthly já possui UNIQUE (year, month, created_by), usado como chave do upsert.
+-- Caso o ambiente tenha sido criado sem a constraint:
+-- ALTER TABLE hours_worked_monthly
+--     ADD CONSTRAINT hours_worked_monthly_year_month_created_by_key UNIQUE (year, month, created_by);
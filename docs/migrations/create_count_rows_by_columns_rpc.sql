@@ -0,0 +1,55 @@
+-- Migration: Função de contagens agrupadas para as estatísticas de administração
+-- Descrição: Substitui o download de colunas inteiras de user_logs e feedbacks
+--            (contadas em Python) por um GROUP BY no banco. Usada por
+--            services/statistics.grouped_counts (get_log_statistics e
+--            get_feedback_statistics). Sem esta função, o sistema conta em Python
+--            paginando as colunas.
+
+CREATE OR REPLACE FUNCTION public.count_rows_by_columns(p_table TEXT, p_columns TEXT[])
+RETURNS JSONB
+LANGUAGE plpgsql
+STABLE
+AS $$
+DECLARE
+    v_result JSONB;
+    v_column TEXT;
+    v_counts JSONB;
+BEGIN
+    -- Apenas tabelas e colunas conhecidas (os nomes entram em SQL dinâmico)
+    IF NOT (
+        (p_table = 'user_logs' AND p_columns <@ ARRAY['action_type', 'entity_type'])
+        OR (p_table = 'feedbacks' AND p_columns <@ ARRAY['type', 'status', 'priority'])
+    ) THEN
+        RAISE EXCEPTION 'Contagem não permitida para %(%)', p_table, array_to_string(p_columns, ', ');
+    END IF;
+
+    EXECUTE format('SELECT jsonb_build_object(''total'', count(*)) FROM public.%I', p_table)
+    INTO v_result;
+
+    FOREACH v_column IN ARRAY p_columns LOOP
+        EXECUTE format(
+            'SELECT coalesce(jsonb_object_agg(value, total), ''{}''::jsonb)
+               FROM (SELECT coalesce(%I::text, '''') AS value, count(*) AS total
+                       FROM public.%I
+                      GROUP BY 1) AS counts',
+            v_column, p_table
+        )
+        INTO v_counts;
+        v_result := v_result || jsonb_build_object(v_column, v_counts);
+    END LOOP;
+
+    RETURN v_result;
+END;
+$$;
+
+COMMENT ON FUNCTION public.count_rows_by_columns(TEXT, TEXT[]) IS
+    'Total e contagem por valor das colunas pedidas (estatísticas de user_logs e feedbacks)';
+
+-- Estatísticas globais: somente o service_role (páginas de administração) pode chamar
+REVOKE ALL ON FUNCTION public.count_rows_by_columns(TEXT, TEXT[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.count_rows_by_columns(TEXT, TEXT[]) TO service_role;
+
+-- Índices que permitem GROUP BY por varredura de índice
+CREATE INDEX IF NOT EXISTS idx_user_logs_action_type ON user_logs(action_type);
+CREATE INDEX IF NOT EXISTS idx_user_logs_entity_type ON user_logs(entity_type);
+CREATE INDEX IF NOT EXISTS idx_feedbacks_status ON feedbacks(status);
@@ -0,0 +1,259 @@
+-- Migration: Agregados mensais de acidentes, quase-acidentes e não conformidades
+-- Descrição: Tabela event_monthly_rollups com contagens por tenant (created_by) e mês
+--            por status, gravidade, tipo etc., e a soma dos dias de resolução. O mês
+--            vem da mesma coluna de data que filtra a listagem: occurred_at, ou
+--            opened_at nas não conformidades. As abas de análise leem estes agregados (services/event_rollups.py)
+--            em vez de baixar todas as linhas e agrupar no pandas.
+--
+-- A atualização é incremental: triggers por comando (com tabelas de transição)
+-- recalculam apenas os buckets (tenant, mês) tocados por cada INSERT/UPDATE/DELETE.
+-- (Uma MATERIALIZED VIEW do Postgres só pode ser recalculada por inteiro.)
+-- Para o preenchimento inicial, ou após carga direta no banco:
+--   SELECT public.refresh_event_monthly_rollups();            -- todas as tabelas
+--   SELECT public.refresh_event_monthly_rollups('near_misses');
+--
+-- Sem esta migration o sistema continua funcionando: os agregados são calculados
+-- em Python a partir das colunas necessárias.
+
+-- ========== DATA DE ENCERRAMENTO (dias de resolução) ==========
+ALTER TABLE near_misses ADD COLUMN IF NOT EXISTS closed_at DATE;
+ALTER TABLE nonconformities ADD COLUMN IF NOT EXISTS closed_at DATE;
+
+COMMENT ON COLUMN near_misses.closed_at IS 'Data em que o status passou a fechado (preenchida por trigger)';
+COMMENT ON COLUMN nonconformities.closed_at IS 'Data em que o status passou a encerrada (preenchida por trigger)';
+
+CREATE OR REPLACE FUNCTION public.set_event_closed_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF NEW.status IN ('fechado', 'encerrada', 'closed') THEN
+        IF NEW.closed_at IS NULL AND (TG_OP = 'INSERT' OR OLD.status IS DISTINCT FROM NEW.status) THEN
+            NEW.closed_at := current_date;
+        END IF;
+    ELSE
+        -- Reaberto: deixa de contar como resolvido
+        NEW.closed_at := NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_near_misses_closed_at ON near_misses;
+CREATE TRIGGER trg_near_misses_closed_at
+    BEFORE INSERT OR UPDATE OF status, closed_at ON near_misses
+    FOR EACH ROW EXECUTE FUNCTION public.set_event_closed_at();
+
+DROP TRIGGER IF EXISTS trg_nonconformities_closed_at ON nonconformities;
+CREATE TRIGGER trg_nonconformities_closed_at
+    BEFORE INSERT OR UPDATE OF status, closed_at ON nonconformities
+    FOR EACH ROW EXECUTE FUNCTION public.set_event_closed_at();
+
+-- ========== TABELA DE AGREGADOS ==========
+-- Uma linha por (tabela, tenant, mês, dimensão, valor). A dimensão 'total' (valor '')
+-- traz o total do mês; period NULL agrupa os registros sem data.
+CREATE TABLE IF NOT EXISTS event_monthly_rollups (
+    entity_type TEXT NOT NULL,
+    created_by UUID,
+    period DATE,
+    dimension TEXT NOT NULL,
+    value TEXT NOT NULL DEFAULT '',
+    total INTEGER NOT NULL DEFAULT 0,
+    resolved_total INTEGER NOT NULL DEFAULT 0,
+    resolution_days_sum BIGINT NOT NULL DEFAULT 0,
+    refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_event_monthly_rollups_bucket
+    ON event_monthly_rollups (entity_type, created_by, period);
+CREATE INDEX IF NOT EXISTS idx_event_monthly_rollups_period
+    ON event_monthly_rollups (entity_type, period);
+
+COMMENT ON TABLE event_monthly_rollups IS
+    'Contagens mensais por tenant de accidents, near_misses e nonconformities (mantidas por trigger)';
+
+-- Dados agregados por tenant: apenas o service_role (o código aplica o filtro por created_by)
+ALTER TABLE event_monthly_rollups ENABLE ROW LEVEL SECURITY;
+REVOKE ALL ON event_monthly_rollups FROM anon, authenticated;
+GRANT SELECT ON event_monthly_rollups TO service_role;
+
+-- ========== COLUNA DE DATA DE CADA TABELA ==========
+-- Mesma coluna usada na janela de datas das listagens (DATE_COLUMNS em services/list_queries.py)
+CREATE OR REPLACE FUNCTION public.event_rollup_date_column(p_entity TEXT)
+RETURNS TEXT
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT CASE p_entity WHEN 'nonconformities' THEN 'opened_at' ELSE 'occurred_at' END;
+$$;
+
+-- ========== RECÁLCULO DE UM BUCKET ==========
+CREATE OR REPLACE FUNCTION public.refresh_event_rollup_bucket(p_entity TEXT, p_created_by UUID, p_period DATE)
+RETURNS VOID
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_dimensions TEXT[];
+    v_expressions TEXT[];
+    v_resolution TEXT;
+    v_date_column TEXT := public.event_rollup_date_column(p_entity);
+    v_where TEXT;
+    i INTEGER;
+BEGIN
+    -- Colunas agrupadas de cada tabela (os nomes entram em SQL dinâmico)
+    CASE p_entity
+        WHEN 'accidents' THEN
+            v_dimensions := ARRAY['status', 'type', 'classification'];
+            v_expressions := ARRAY['status', 'type::text', 'classification'];
+            v_resolution := 'NULL::integer';
+        WHEN 'near_misses' THEN
+            v_dimensions := ARRAY['status', 'potential_severity'];
+            v_expressions := ARRAY['status', 'potential_severity'];
+            v_resolution := 'closed_at - occurred_at';
+        WHEN 'nonconformities' THEN
+            v_dimensions := ARRAY['status', 'severity', 'standard_ref'];
+            v_expressions := ARRAY['status', 'severity', 'standard_ref'];
+            v_resolution := 'closed_at - opened_at';
+        ELSE
+            RAISE EXCEPTION 'Agregado não suportado para %', p_entity;
+    END CASE;
+
+    -- Serializa recálculos concorrentes do mesmo bucket
+    PERFORM pg_advisory_xact_lock(hashtext(
+        'event_rollup|' || p_entity || '|' || coalesce(p_created_by::text, '') || '|' || coalesce(p_period::text, '')
+    ));
+
+    DELETE FROM event_monthly_rollups
+     WHERE entity_type = p_entity
+       AND created_by IS NOT DISTINCT FROM p_created_by
+       AND period IS NOT DISTINCT FROM p_period;
+
+    v_where := format(
+        'created_by IS NOT DISTINCT FROM $2 AND (($3 IS NULL AND %1$I IS NULL) '
+        'OR (%1$I >= $3 AND %1$I < ($3 + interval ''1 month'')))',
+        v_date_column
+    );
+
+    EXECUTE format(
+        'INSERT INTO event_monthly_rollups
+                (entity_type, created_by, period, dimension, value, total, resolved_total, resolution_days_sum)
+         SELECT $1, $2, $3, ''total'', '''', count(*), count(%1$s), coalesce(sum(%1$s), 0)
+           FROM public.%2$I
+          WHERE %3$s
+         HAVING count(*) > 0',
+        v_resolution, p_entity, v_where
+    ) USING p_entity, p_created_by, p_period;
+
+    FOR i IN 1 .. array_length(v_dimensions, 1) LOOP
+        EXECUTE format(
+            'INSERT INTO event_monthly_rollups
+                    (entity_type, created_by, period, dimension, value, total, resolved_total, resolution_days_sum)
+             SELECT $1, $2, $3, %1$L, coalesce(%2$s, ''''), count(*), count(%3$s), coalesce(sum(%3$s), 0)
+               FROM public.%4$I
+              WHERE %5$s
+              GROUP BY 5',
+            v_dimensions[i], v_expressions[i], v_resolution, p_entity, v_where
+        ) USING p_entity, p_created_by, p_period;
+    END LOOP;
+END;
+$$;
+
+-- ========== TRIGGERS INCREMENTAIS ==========
+-- Um recálculo por bucket distinto do comando (não por linha): importações em lote
+-- de 500 linhas do mesmo mês recalculam o bucket uma vez só.
+CREATE OR REPLACE FUNCTION public.event_rollup_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    bucket RECORD;
+    v_bucket TEXT := format(
+        'SELECT created_by, date_trunc(''month'', %I)::date AS period FROM %%s',
+        public.event_rollup_date_column(TG_TABLE_NAME)
+    );
+    v_query TEXT;
+BEGIN
+    -- As tabelas de transição também são visíveis no SQL dinâmico do trigger
+    IF TG_OP = 'INSERT' THEN
+        v_query := format(v_bucket, 'new_rows') || ' GROUP BY 1, 2';
+    ELSIF TG_OP = 'DELETE' THEN
+        v_query := format(v_bucket, 'old_rows') || ' GROUP BY 1, 2';
+    ELSE
+        v_query := format(v_bucket, 'new_rows') || ' UNION ' || format(v_bucket, 'old_rows');
+    END IF;
+
+    FOR bucket IN EXECUTE v_query LOOP
+        PERFORM public.refresh_event_rollup_bucket(TG_TABLE_NAME, bucket.created_by, bucket.period);
+    END LOOP;
+    RETURN NULL;
+END;
+$$;
+
+DO $$
+DECLARE
+    v_table TEXT;
+BEGIN
+    FOREACH v_table IN ARRAY ARRAY['accidents', 'near_misses', 'nonconformities'] LOOP
+        -- Tabelas de transição exigem um trigger por evento
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_rollup_insert ON public.%I', v_table, v_table);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_rollup_update ON public.%I', v_table, v_table);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_rollup_delete ON public.%I', v_table, v_table);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%s_rollup_insert AFTER INSERT ON public.%I
+                 REFERENCING NEW TABLE AS new_rows
+                 FOR EACH STATEMENT EXECUTE FUNCTION public.event_rollup_trigger()',
+            v_table, v_table);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%s_rollup_update AFTER UPDATE ON public.%I
+                 REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+                 FOR EACH STATEMENT EXECUTE FUNCTION public.event_rollup_trigger()',
+            v_table, v_table);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%s_rollup_delete AFTER DELETE ON public.%I
+                 REFERENCING OLD TABLE AS old_rows
+                 FOR EACH STATEMENT EXECUTE FUNCTION public.event_rollup_trigger()',
+            v_table, v_table);
+    END LOOP;
+END $$;
+
+-- ========== RECÁLCULO COMPLETO ==========
+CREATE OR REPLACE FUNCTION public.refresh_event_monthly_rollups(p_entity TEXT DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_table TEXT;
+    bucket RECORD;
+    v_buckets INTEGER := 0;
+BEGIN
+    FOREACH v_table IN ARRAY ARRAY['accidents', 'near_misses', 'nonconformities'] LOOP
+        CONTINUE WHEN p_entity IS NOT NULL AND p_entity <> v_table;
+
+        DELETE FROM event_monthly_rollups WHERE entity_type = v_table;
+        FOR bucket IN EXECUTE format(
+            'SELECT DISTINCT created_by, date_trunc(''month'', %I)::date AS period FROM public.%I',
+            public.event_rollup_date_column(v_table), v_table
+        ) LOOP
+            PERFORM public.refresh_event_rollup_bucket(v_table, bucket.created_by, bucket.period);
+            v_buckets := v_buckets + 1;
+        END LOOP;
+    END LOOP;
+    RETURN v_buckets;
+END;
+$$;
+
+COMMENT ON FUNCTION public.refresh_event_monthly_rollups(TEXT) IS
+    'Recalcula por inteiro os agregados mensais (todas as tabelas ou só p_entity); retorna o número de buckets';
+
+REVOKE ALL ON FUNCTION public.refresh_event_rollup_bucket(TEXT, UUID, DATE) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.refresh_event_monthly_rollups(TEXT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.refresh_event_monthly_rollups(TEXT) TO service_role;
+
+-- Preenchimento inicial
+SELECT public.refresh_event_monthly_rollups();
@@ -0,0 +1,32 @@
+-- Migration: Data do primeiro acidente de cada criador
+-- Descrição: Usada por services/work_days.load_work_days_sources (critério do
+--            primeiro acidente). Devolve uma linha por criador em uma chamada, em vez
+--            de paginar todos os acidentes de cada um só para tirar o mínimo. Sem
+--            esta função, o sistema lê o primeiro acidente de cada criador com
+--            ORDER BY occurred_at LIMIT 1.
+
+CREATE OR REPLACE FUNCTION public.first_accident_dates(p_creators UUID[])
+RETURNS TABLE (created_by UUID, occurred_at DATE)
+LANGUAGE sql
+STABLE
+AS $$
+    -- Um LIMIT 1 por criador sobre idx_accidents_created_by_occurred_at
+    -- (docs/migrations/add_hot_query_indexes.sql): não percorre os demais acidentes
+    SELECT creator.id, first_accident.occurred_at
+      FROM unnest(p_creators) AS creator(id)
+      CROSS JOIN LATERAL (
+            SELECT a.occurred_at
+              FROM accidents AS a
+             WHERE a.created_by = creator.id
+               AND a.occurred_at IS NOT NULL
+             ORDER BY a.occurred_at
+             LIMIT 1
+      ) AS first_accident;
+$$;
+
+COMMENT ON FUNCTION public.first_accident_dates(UUID[]) IS
+    'Menor occurred_at de accidents para cada created_by informado (dias trabalhados até o acidente)';
+
+-- Lê acidentes de qualquer tenant: somente o service_role pode chamar
+REVOKE ALL ON FUNCTION public.first_accident_dates(UUID[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.first_accident_dates(UUID[]) TO service_role;
@@ -0,0 +1,35 @@
+-- Migration: Função para reordenar nós da árvore de falhas
+-- Descrição: Grava display_order de vários nós em uma chamada, alterando apenas essa
+--            coluna. Usada por services/investigation.reorganize_nodes; o upsert da
+--            linha lida antes regravaria label, status e justificativa, desfazendo
+--            edições feitas entre a leitura e a escrita. Sem esta função, o sistema
+--            usa um upsert só com id, display_order e as colunas NOT NULL.
+
+CREATE OR REPLACE FUNCTION public.reorder_fault_tree_nodes(p_ids UUID[], p_orders INTEGER[])
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_updated INTEGER;
+BEGIN
+    IF coalesce(array_length(p_ids, 1), 0) <> coalesce(array_length(p_orders, 1), 0) THEN
+        RAISE EXCEPTION 'p_ids e p_orders devem ter o mesmo tamanho';
+    END IF;
+
+    UPDATE fault_tree_nodes AS node
+       SET display_order = new_order.display_order
+      FROM unnest(p_ids, p_orders) AS new_order(id, display_order)
+     WHERE node.id = new_order.id
+       AND node.display_order IS DISTINCT FROM new_order.display_order;
+
+    GET DIAGNOSTICS v_updated = ROW_COUNT;
+    RETURN v_updated;
+END;
+$$;
+
+COMMENT ON FUNCTION public.reorder_fault_tree_nodes(UUID[], INTEGER[]) IS
+    'Atualiza apenas display_order dos nós informados (reorganização da árvore de falhas)';
+
+-- Escrita sem RLS: somente o service_role (o código valida o acidente antes)
+REVOKE ALL ON FUNCTION public.reorder_fault_tree_nodes(UUID[], INTEGER[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.reorder_fault_tree_nodes(UUID[], INTEGER[]) TO service_role;
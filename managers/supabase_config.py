@@ -2,64 +2,216 @@
 Configuração do Supabase para o Sistema SSO
 """
 import os
+import threading
 from supabase import create_client, Client
-from typing import Optional
+from typing import Optional, Dict, Any, Tuple
 from utils.simple_logger import get_logger
 
-def get_supabase_client() -> Optional[Client]:
-    """Cria e retorna cliente Supabase configurado"""
+# Papéis suportados pelo registro de clientes: papel -> (variável de ambiente, chave em secrets)
+CLIENT_ROLES = {
+    "anon": ("SUPABASE_ANON_KEY", "anon_key"),
+    "service_role": ("SUPABASE_SERVICE_ROLE_KEY", "service_role_key"),
+}
+
+# Registro de clientes do processo: um cliente por papel, reutilizado entre reruns e sessões.
+# Cada cliente mantém seu próprio pool HTTP (httpx) com conexões keep-alive; não compartilhamos
+# um único pool entre papéis para que os headers de autenticação nunca se misturem.
+_client_registry: Dict[str, Tuple[Tuple[str, str], Client]] = {}
+_client_registry_lock = threading.Lock()
+_client_stats = {"created": 0, "reused": 0, "invalidated": 0}
+
+# Erros do PostgREST que indicam JWT/chave inválidos ou expirados
+AUTH_ERROR_CODES = {"PGRST301", "PGRST302", "PGRST303", "401"}
+AUTH_ERROR_MARKERS = ("JWT expired", "Invalid API key", "invalid JWT")
+
+
+def _resolve_credentials(role: str) -> Tuple[Optional[str], Optional[str]]:
+    """Obtém URL e chave do papel a partir do ambiente ou do secrets do Streamlit"""
     logger = get_logger()
+    env_var, secrets_key = CLIENT_ROLES[role]
+    url = os.environ.get("SUPABASE_URL")
+    key = os.environ.get(env_var)
+
+    if not url or not key:
+        # Tenta buscar do secrets do Streamlit
+        try:
+            import streamlit as st
+            url = st.secrets.get("supabase", {}).get("url")
+            key = st.secrets.get("supabase", {}).get(secrets_key)
+        except Exception as secrets_error:
+            logger.warning(f"Erro ao acessar secrets ({role}): {secrets_error}")
+
+    return url, key
+
+
+def _get_pooled_client(role: str) -> Client:
+    """
+    Retorna o cliente do papel a partir do registro, criando-o apenas quando necessário.
+
+    O cliente é recriado se as credenciais mudarem (ex: rotação de chave) ou se ele tiver
+    sido invalidado por report_client_failure(). Seguro para uso entre threads.
+
+    O objeto devolvido é o cliente envolvido por _FailureReportingClient: falhas de
+    conexão/autenticação em consultas, RPCs e storage descartam o cliente do registro.
+    """
+    logger = get_logger()
+    url, key = _resolve_credentials(role)
+
+    if not url or not key:
+        env_var = CLIENT_ROLES[role][0]
+        raise ValueError(f"SUPABASE_URL e {env_var} devem estar definidas")
+
+    credentials = (url, key)
+    entry = _client_registry.get(role)
+    if entry is not None and entry[0] == credentials:
+        with _client_registry_lock:
+            _client_stats["reused"] += 1
+        return entry[1]
+
+    with _client_registry_lock:
+        # Verifica novamente dentro do lock (outra thread pode ter criado o cliente)
+        entry = _client_registry.get(role)
+        if entry is not None and entry[0] == credentials:
+            _client_stats["reused"] += 1
+            return entry[1]
+
+        client = _FailureReportingClient(create_client(url, key), role)
+        _client_registry[role] = (credentials, client)
+        _client_stats["created"] += 1
+        logger.info(f"Cliente Supabase ({role}) criado e registrado no pool do processo")
+        return client
+
+
+def report_client_failure(role: str = "service_role", client: Any = None) -> None:
+    """
+    Descarta o cliente registrado para o papel após uma falha de conexão.
+
+    A reconexão é preguiçosa: o próximo get_*_client() cria um cliente novo. Com
+    `client`, só descarta se ele ainda for o registrado (uma falha em um cliente
+    antigo não derruba o que já o substituiu).
+    """
+    with _client_registry_lock:
+        entry = _client_registry.get(role)
+        if entry is None or (client is not None and entry[1] is not client):
+            return
+        del _client_registry[role]
+        _client_stats["invalidated"] += 1
+        get_logger().warning(f"Cliente Supabase ({role}) descartado; será recriado na próxima chamada")
+
+
+def is_client_failure(error: BaseException) -> bool:
+    """
+    Indica se o erro é de conexão (transporte httpx) ou de autenticação (JWT/chave),
+    casos em que o cliente registrado pode estar com conexões ou sessão inválidas.
+    Erros de consulta (sintaxe, RLS, constraint) não contam.
+    """
     try:
-        url = os.environ.get("SUPABASE_URL")
-        key = os.environ.get("SUPABASE_ANON_KEY")
-        
-        if not url or not key:
-            # Tenta buscar do secrets do Streamlit
+        import httpx
+        if isinstance(error, httpx.TransportError):
+            return True
+    except ImportError:
+        pass
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    if getattr(error, "code", None) in AUTH_ERROR_CODES:
+        return True
+    message = str(error)
+    return any(marker in message for marker in AUTH_ERROR_MARKERS)
+
+
+class _FailureReporting:
+    """
+    Encaminha o acesso a um objeto do supabase-py (construtor de consulta, bucket do
+    storage). Exceções de conexão/autenticação em qualquer chamada, inclusive no
+    .execute() final, descartam o cliente antes de serem relançadas; os construtores
+    devolvidos pela cadeia também são envolvidos.
+    """
+
+    __slots__ = ("_target", "_client", "_role")
+
+    def __init__(self, target: Any, client: Any, role: str):
+        self._target = target
+        self._client = client
+        self._role = role
+
+    def _wrap(self, value: Any, name: str) -> Any:
+        # Construtores de consulta (select/eq/order..., rpc) têm execute; table/from_
+        # devolvem o construtor da tabela ou o bucket do storage
+        if hasattr(value, "execute") or name in ("table", "from_", "rpc"):
+            return _FailureReporting(value, self._client, self._role)
+        return value
+
+    def _report(self, error: BaseException) -> None:
+        if is_client_failure(error):
+            report_client_failure(self._role, self._client)
+
+    def __getattr__(self, name: str) -> Any:
+        value = getattr(self._target, name)
+        if not callable(value):
+            return self._wrap(value, name)
+
+        def call(*args, **kwargs):
             try:
-                import streamlit as st
-                url = st.secrets.get("supabase", {}).get("url")
-                key = st.secrets.get("supabase", {}).get("anon_key")
-                logger.info("Usando credenciais do Streamlit secrets")
-            except Exception as secrets_error:
-                logger.warning(f"Erro ao acessar secrets: {secrets_error}")
-        
-        if not url or not key:
-            error_msg = "SUPABASE_URL e SUPABASE_ANON_KEY devem estar definidas"
-            logger.error(error_msg)
-            raise ValueError(error_msg)
-        
-        logger.info("Cliente Supabase anônimo criado com sucesso")
-        return create_client(url, key)
-        
+                result = value(*args, **kwargs)
+            except Exception as error:
+                self._report(error)
+                raise
+            return result if name == "execute" else self._wrap(result, name)
+
+        return call
+
+
+class _FailureReportingClient(_FailureReporting):
+    """
+    Cliente do registro: table/from_/rpc e storage passam por _FailureReporting, de
+    modo que os serviços não precisam tratar falhas de conexão em cada except.
+    Os demais atributos (auth, postgrest...) são os do cliente original.
+    """
+
+    __slots__ = ()
+
+    REPORTED_ATTRIBUTES = {"table", "from_", "rpc", "storage"}
+
+    def __init__(self, client: Client, role: str):
+        super().__init__(client, self, role)
+
+    def __getattr__(self, name: str) -> Any:
+        if name in self.REPORTED_ATTRIBUTES:
+            if name == "storage":
+                return _FailureReporting(self._target.storage, self, self._role)
+            return super().__getattr__(name)
+        return getattr(self._target, name)
+
+
+def reset_client_registry() -> None:
+    """Remove todos os clientes registrados (ex: após trocar credenciais)"""
+    with _client_registry_lock:
+        _client_stats["invalidated"] += len(_client_registry)
+        _client_registry.clear()
+
+
+def get_client_pool_stats() -> Dict[str, Any]:
+    """Retorna contadores de clientes criados versus reutilizados"""
+    with _client_registry_lock:
+        stats = dict(_client_stats)
+        stats["active_roles"] = sorted(_client_registry.keys())
+    return stats
+
+
+def get_supabase_client() -> Optional[Client]:
+    """Retorna o cliente Supabase anônimo (reutilizado pelo registro do processo)"""
+    logger = get_logger()
+    try:
+        return _get_pooled_client("anon")
     except Exception as e:
         logger.error(f"Erro ao configurar Supabase: {e}")
         return None
 
 def get_service_role_client() -> Optional[Client]:
-    """Cria cliente Supabase com service role key (apenas para operações admin)"""
+    """Retorna cliente Supabase com service role key (apenas para operações admin)"""
     logger = get_logger()
     try:
-        url = os.environ.get("SUPABASE_URL")
-        service_key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
-        
-        if not url or not service_key:
-            # Tenta buscar do secrets do Streamlit
-            try:
-                import streamlit as st
-                url = st.secrets.get("supabase", {}).get("url")
-                service_key = st.secrets.get("supabase", {}).get("service_role_key")
-                logger.info("Usando credenciais do Streamlit secrets para Service Role")
-            except Exception as secrets_error:
-                logger.warning(f"Erro ao acessar secrets para Service Role: {secrets_error}")
-        
-        if not url or not service_key:
-            error_msg = "SUPABASE_URL e SUPABASE_SERVICE_ROLE_KEY devem estar definidas"
-            logger.error(error_msg)
-            raise ValueError(error_msg)
-        
-        logger.info("Cliente Supabase Service Role criado com sucesso")
-        return create_client(url, service_key)
-        
+        return _get_pooled_client("service_role")
     except Exception as e:
         logger.error(f"Erro ao configurar Supabase Service Role: {e}")
         return None
@@ -73,12 +225,14 @@ def test_connection() -> bool:
         if not client:
             logger.error("Cliente Supabase não pôde ser criado")
             return False
-        
+
         # Testa uma query simples
         response = client.table("profiles").select("id").limit(1).execute()
         logger.info("Teste de conexão com Supabase bem-sucedido")
         return True
-        
+
     except Exception as e:
         logger.error(f"Erro ao testar conexão: {e}")
+        # Força reconexão na próxima chamada
+        report_client_failure("anon")
         return False
@@ -6,8 +6,6 @@ from services.kpi import (
     fetch_kpi_data, 
     generate_kpi_summary,
     calculate_poisson_control_limits,
-    calculate_ewma,
-    detect_control_chart_patterns,
     fetch_detailed_accidents,
     analyze_accidents_by_category
 )
@@ -45,14 +43,17 @@ def app(filters=None):
         df = fetch_kpi_data(
             user_email=user_email,
             start_date=filters.get("start_date"),
-            end_date=filters.get("end_date")
+            end_date=filters.get("end_date"),
+            months_back=filters.get("months_back", 0),
+            user_ids=filters.get("user_ids")
         )
         
         # Busca dados detalhados de acidentes
         accidents_df = fetch_detailed_accidents(
             user_email=user_email,
             start_date=filters.get("start_date"),
-            end_date=filters.get("end_date")
+            end_date=filters.get("end_date"),
+            user_ids=filters.get("user_ids")
         )
     
     if df.empty:
@@ -62,8 +63,8 @@ def app(filters=None):
     # Aplica filtros adicionais
     df = apply_filters_to_df(df, filters)
     
-    # Gera resumo dos KPIs
-    kpi_summary = generate_kpi_summary(df)
+    # Gera resumo dos KPIs (fetch_kpi_data já devolve as linhas ordenadas por period)
+    kpi_summary = generate_kpi_summary(df, assume_sorted=True)
     
     # Cria abas para diferentes seções
     tab1, tab2, tab3 = st.tabs(["📊 Dashboard", "📚 Metodologia", "📚 Instruções"])
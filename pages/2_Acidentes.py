@@ -9,6 +9,7 @@ from components.cards import create_metric_row, create_bar_chart, create_pie_cha
 from components.filters import apply_filters_to_df
 from managers.supabase_config import get_supabase_client
 from services.employees import get_all_employees
+from services.work_days import get_work_days_analysis
 # Imports da NBR 14280 removidos
 
 def calculate_work_days_until_accident(accident_date, employee_identifier=None, employee_id=None):
@@ -129,239 +130,23 @@ def calculate_work_days_until_accident(accident_date, employee_identifier=None,
         st.error(f"Erro ao calcular dias trabalhados: {str(e)}")
         return 0
 
-def get_work_days_analysis(df):
-    """
-    Analisa os dias trabalhados até acidentes e retorna estatísticas.
-    """
-    if df.empty or 'occurred_at' not in df.columns:
-        return {}, df
-    
-    try:
-        # Cria uma cópia para não modificar o DataFrame original
-        df_work = df.copy()
-        
-        # Converte data para datetime
-        df_work['occurred_at'] = pd.to_datetime(df_work['occurred_at'])
-        df_work['accident_date'] = df_work['occurred_at'].dt.date
-        
-        # Otimização: pré-carregar todos os dados necessários
-        from managers.supabase_config import get_service_role_client
-        supabase = get_service_role_client()
-        
-        # Carregar todos os funcionários de uma vez
-        all_employees = {}
-        try:
-            emp_response = supabase.table("employees").select("id, email, admission_date, user_id").execute()
-            if emp_response and hasattr(emp_response, 'data'):
-                for emp in emp_response.data:
-                    all_employees[emp['id']] = emp
-        except Exception:
-            pass  # Se não tiver permissão ou erro, continua sem dados de funcionários
-        
-        # Carregar todos os perfis de uma vez
-        all_profiles = {}
-        try:
-            profile_response = supabase.table("profiles").select("id, email, created_at").execute()
-            if profile_response and hasattr(profile_response, 'data'):
-                for profile in profile_response.data:
-                    all_profiles[profile['id']] = profile
-                    all_profiles[profile['email']] = profile  # Adiciona também pelo email para busca direta
-        except Exception:
-            pass
-        
-        # Carregar todas as horas trabalhadas de uma vez
-        all_hours = {}
-        try:
-            # Alinhado com estrutura real: employee_id removido, apenas created_by (UUID)
-            hours_response = supabase.table("hours_worked_monthly").select("year, month, hours, created_by").execute()
-            if hours_response and hasattr(hours_response, 'data'):
-                for hour_row in hours_response.data:
-                    # Agrupa por created_by (UUID do usuário)
-                    created_by = hour_row.get('created_by')
-                    if created_by:
-                        if created_by not in all_hours:
-                            all_hours[created_by] = []
-                        all_hours[created_by].append(hour_row)
-        except Exception:
-            pass
-        
-        # Carregar primeiros acidentes por criador (para fallback)
-        first_accidents = {}
-        try:
-            first_accs_response = supabase.table("accidents").select("occurred_at, created_by").order("occurred_at").execute()
-            if first_accs_response and hasattr(first_accs_response, 'data'):
-                for acc in first_accs_response.data:
-                    created_by = acc.get('created_by')
-                    if created_by and created_by not in first_accidents:
-                        first_accidents[created_by] = acc
-        except Exception:
-            pass
-        
-        # Função interna otimizada que usa os dados pré-carregados
-        def calculate_work_days_optimized(accident_date, employee_identifier=None, employee_id=None):
-            """
-            Calcula dias trabalhados usando dados pré-carregados
-            """
-            try:
-                admission_date = None
-                user_email = None
-                user_profile_id = None
-
-                # 1) Prioriza employees.employee_id
-                if employee_id and employee_id in all_employees:
-                    emp = all_employees[employee_id]
-                    if emp.get('admission_date'):
-                        admission_date = pd.to_datetime(emp['admission_date']).date()
-                    user_email = emp.get('email')
-                    user_profile_id = emp.get('user_id')
-
-                # 2) Resolve identificador do funcionário para fallback (profiles)
-                if not user_email and not user_profile_id and employee_identifier:
-                    if isinstance(employee_identifier, str) and '@' in employee_identifier:
-                        user_email = employee_identifier
-                    else:
-                        user_profile_id = employee_identifier
-
-                # 3) Busca perfil nos dados pré-carregados
-                if admission_date is None and (user_email or user_profile_id):
-                    profile = None
-                    if user_email and user_email in all_profiles:
-                        profile = all_profiles[user_email]
-                    elif user_profile_id and user_profile_id in all_profiles:
-                        profile = all_profiles[user_profile_id]
-                    
-                    if profile:
-                        # created_at como proxy de admissão
-                        if profile.get('created_at'):
-                            admission_date = pd.to_datetime(profile['created_at']).date()
-                        user_profile_id = profile.get('id', user_profile_id)
-                        user_email = profile.get('email', user_email)
-
-                # 4) Calcula dias corridos entre admissão e acidente (se conhecido)
-                days_since_admission = None
-                if admission_date is not None:
-                    days_since_admission = (accident_date - admission_date).days
-                    if days_since_admission < 0:
-                        days_since_admission = 0
-
-                # 5) Busca horas trabalhadas nos dados pré-carregados
-                total_hours = 0.0
-                hours_list = []
-                
-                # 5.1) Por employee_id
-                if employee_id and employee_id in all_hours:
-                    hours_list = all_hours[employee_id]
-                # 5.2) Por email (apenas se NÃO houver employee_id)
-                elif (not employee_id) and user_email and user_email in all_hours:
-                    hours_list = all_hours[user_email]
-
-                if hours_list:
-                    for row in hours_list:
-                        if 'year' in row and 'month' in row:
-                            try:
-                                month_date = pd.to_datetime(f"{row['year']}-{int(row['month']):02d}-01").date()
-                                if month_date <= accident_date:
-                                    total_hours += float(row.get('hours', 0) or 0)
-                            except Exception:
-                                continue
-
-                # 6) Converte horas para dias úteis (8h/dia) com escala *100
-                if total_hours > 0:
-                    work_days = (total_hours * 100.0) / 8.0
-                    return min(work_days, days_since_admission) if days_since_admission is not None else work_days
-
-                # 7) Fallback: sem horas, usar dias corridos desde admissão
-                if days_since_admission is not None:
-                    return days_since_admission
-
-                # 8) Último fallback: aproximar pela diferença desde o primeiro acidente do mesmo criador
-                if employee_identifier and employee_identifier in first_accidents:
-                    first_acc = first_accidents[employee_identifier]
-                    first_date = pd.to_datetime(first_acc['occurred_at']).date()
-                    approx_days = (accident_date - first_date).days
-                    return max(0, approx_days)
-
-                return 0
-
-            except Exception as e:
-                # st.error(f"Erro ao calcular dias trabalhados: {str(e)}")  # Comentei para não poluir a interface
-                return 0
-        
-        # Calcula dias trabalhados para cada acidente usando a função otimizada
-        work_days_list = []
-        for idx, row in df_work.iterrows():
-            work_days = calculate_work_days_optimized(
-                row['accident_date'],
-                row.get('created_by'),
-                row.get('employee_id') if 'employee_id' in row else None
-            )
-            # Garante que não há valores negativos
-            work_days = max(0, work_days)
-            work_days_list.append(work_days)
-        
-        df_work['work_days_until_accident'] = work_days_list
-        
-        # Filtra apenas valores válidos (maiores que 0)
-        valid_work_days = df_work[df_work['work_days_until_accident'] > 0]['work_days_until_accident']
-        
-        # Estatísticas
-        analysis = {
-            'total_accidents': len(df_work),
-            'avg_work_days': valid_work_days.mean() if len(valid_work_days) > 0 else 0,
-            'median_work_days': valid_work_days.median() if len(valid_work_days) > 0 else 0,
-            'min_work_days': valid_work_days.min() if len(valid_work_days) > 0 else 0,
-            'max_work_days': valid_work_days.max() if len(valid_work_days) > 0 else 0,
-            'accidents_first_week': len(df_work[df_work['work_days_until_accident'] <= 7]),
-            'accidents_first_month': len(df_work[df_work['work_days_until_accident'] <= 30]),
-            'accidents_first_year': len(df_work[df_work['work_days_until_accident'] <= 365])
-        }
-        
-        return analysis, df_work
-        
-    except Exception as e:
-        st.error(f"Erro na análise de dias trabalhados: {str(e)}")
-        return {}, df
-
-def fetch_accidents(start_date=None, end_date=None):
+def fetch_accidents(start_date=None, end_date=None, user_ids=None):
     """Busca dados de acidentes - filtra por usuário logado"""
     try:
-        from managers.supabase_config import get_service_role_client
-        from auth.auth_utils import get_user_id, is_admin, get_user_email
+        from auth.auth_utils import get_user_id, is_admin
+        from services.list_queries import ACCIDENT_LIST_COLUMNS, fetch_list
         user_id = get_user_id()
-        user_email = get_user_email()
         
         if not user_id:
             return pd.DataFrame()
         
-        # Usa service_role para contornar RLS e aplicar filtro de segurança no código
-        supabase = get_service_role_client()
-        
-        query = supabase.table("accidents").select("*")
+        # Projeção, período e usuários vão na consulta; usuário comum vê apenas
+        # os próprios registros. Cache por tenant/filtros evita novo round-trip
+        # a cada interação de widget
+        df = fetch_list("accidents", ACCIDENT_LIST_COLUMNS, user_id, is_admin(),
+                        start_date, end_date, user_ids=user_ids)
         
-        # Filtra por usuário logado, exceto se for admin
-        # Admin vê todos os dados sem filtro de created_by
-        if not is_admin():
-            # Usuário comum vê apenas seus próprios acidentes
-            query = query.eq("created_by", user_id)
-        # Admin vê todos os acidentes - não aplica filtro de created_by
-        
-        if start_date:
-            query = query.gte("occurred_at", start_date.isoformat())
-        if end_date:
-            query = query.lte("occurred_at", end_date.isoformat())
-            
-        response = query.order("occurred_at", desc=True).execute()
-        
-        if response and hasattr(response, 'data'):
-            df = pd.DataFrame(response.data) if response.data else pd.DataFrame()
-            
-            # Validação adicional de segurança para usuários não-admin
-            if not is_admin() and not df.empty:
-                # Filtra novamente para garantir (segurança em camadas)
-                df = df[df['created_by'] == user_id]
-            
-            return df
-        return pd.DataFrame()
+        return df
     except Exception as e:
         st.error(f"Erro ao buscar acidentes: {str(e)}")
         import traceback
@@ -386,7 +171,8 @@ def app(filters=None):
     with st.spinner("Carregando dados de acidentes..."):
         df = fetch_accidents(
             start_date=filters.get("start_date"),
-            end_date=filters.get("end_date")
+            end_date=filters.get("end_date"),
+            user_ids=filters.get("user_ids")
         )
     
     if df.empty:
@@ -698,11 +484,17 @@ def app(filters=None):
             if status_filter != "Todos" and 'status' in filtered_df.columns:
                 filtered_df = filtered_df[filtered_df['status'] == status_filter]
             
-            if search_term and 'description' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['description'].astype(str).str.contains(search_term, case=False, na=False)]
+            if search_term and 'id' in filtered_df.columns:
+                # A descrição não vem na listagem: a busca é feita no banco
+                from services.list_queries import search_record_ids
+                matching_ids = search_record_ids(
+                    "accidents", search_term,
+                    filters.get("start_date"), filters.get("end_date"), filters.get("user_ids")
+                )
+                filtered_df = filtered_df[filtered_df['id'].astype(str).isin(matching_ids)]
             
             # Exibe tabela de acidentes
-            display_cols = ['occurred_at', 'type', 'description', 'lost_days', 'root_cause', 'status']
+            display_cols = ['occurred_at', 'type', 'lost_days', 'root_cause', 'status']
             available_cols = [col for col in display_cols if col in filtered_df.columns]
             
             # Adiciona coluna de dias trabalhados se disponível
@@ -717,6 +509,43 @@ def app(filters=None):
                 )
             else:
                 st.dataframe(filtered_df, width='stretch', hide_index=True)
+            
+            # Campos de texto longo não vêm na listagem: são lidos só para o acidente aberto
+            if 'id' in filtered_df.columns and not filtered_df.empty:
+                with st.expander("📄 Detalhes do acidente"):
+                    detail_options = {
+                        f"{occurred} - {accident_type or 'Acidente'} ({str(accident_id)[:8]})": accident_id
+                        for accident_id, occurred, accident_type in zip(
+                            filtered_df['id'],
+                            filtered_df.get('occurred_at', pd.Series('', index=filtered_df.index)),
+                            filtered_df.get('type', pd.Series('', index=filtered_df.index))
+                        )
+                    }
+                    selected_detail = st.selectbox(
+                        "Acidente",
+                        options=list(detail_options.keys()),
+                        key="accident_detail_selector"
+                    )
+                    
+                    if selected_detail and st.button("Carregar detalhes", key="btn_accident_details"):
+                        from services.list_queries import fetch_record_fields
+                        details = fetch_record_fields("accidents", detail_options[selected_detail])
+                        detail_labels = {
+                            "title": "Título",
+                            "description": "Descrição",
+                            "product_released": "Produto liberado",
+                            "equipment_involved": "Equipamento envolvido",
+                            "fire_observation": "Observação (incêndio)",
+                            "explosion_observation": "Observação (explosão)",
+                            "process_safety_observation": "Observação (segurança de processo)"
+                        }
+                        shown = False
+                        for field, label in detail_labels.items():
+                            if details.get(field):
+                                st.markdown(f"**{label}:** {details[field]}")
+                                shown = True
+                        if not shown:
+                            st.info("Nenhum detalhe adicional registrado.")
         else:
             st.info("Nenhum acidente encontrado.")
     
@@ -728,9 +557,8 @@ def app(filters=None):
             accident_options = {}
             for idx, row in df.iterrows():
                 accident_id = row.get('id', idx)
-                description = row.get('description', f'Acidente {accident_id}')[:50]
                 date_str = row.get('occurred_at', 'Data não informada')
-                accident_options[f"{date_str} - {description}..."] = accident_id
+                accident_options[f"{date_str} - {row.get('type') or 'Acidente'} ({str(accident_id)[:8]})"] = accident_id
             
             selected_accident = st.selectbox(
                 "Selecionar Acidente",
@@ -1049,6 +877,11 @@ def app(filters=None):
                         
                         if result.data:
                             accident_id = result.data[0]['id']
+                            from services.data_cache import invalidate_table
+                            invalidate_table("accidents", user_id)
+                            # Atualiza apenas o KPI do mês do acidente
+                            from services.kpi import refresh_kpi_buckets, accident_kpi_buckets
+                            refresh_kpi_buckets(accident_kpi_buckets(result.data))
                             st.success("✅ Acidente registrado com sucesso!")
                             st.info("💡 **Dica:** Agora você pode iniciar a investigação deste acidente na página 'Investigação de Acidentes'.")
                             
@@ -1094,7 +927,7 @@ def app(filters=None):
             st.warning("Nenhum acidente encontrado. Registre acidentes primeiro para criar ações corretivas.")
         else:
             # Seleção de acidente
-            accident_options = {f"ID: {row['id'][:8]}... - {row.get('description', 'Sem descrição')[:50]}": row['id'] 
+            accident_options = {f"ID: {row['id'][:8]}... - {row.get('occurred_at', '')} {row.get('type') or ''}": row['id'] 
                               for _, row in df.iterrows()}
             
             selected_accident_id = st.selectbox(
@@ -8,52 +8,65 @@ from components.cards import create_metric_row, create_bar_chart, create_pie_cha
 from components.filters import apply_filters_to_df
 from managers.supabase_config import get_supabase_client
 
-def fetch_near_misses(start_date=None, end_date=None):
+# Normaliza severidade potencial para 3 níveis: low/medium/high
+SEVERITY_MAP = {
+    'baixa': 'low',
+    'media': 'medium',
+    'alta': 'high',
+    'low': 'low',
+    'medium': 'medium',
+    'high': 'high'
+}
+
+# Marca que o usuário pediu as linhas individuais (abas Registros/Evidências/Ações)
+RECORDS_STATE_KEY = "near_miss_records_loaded"
+
+def fetch_near_misses(start_date=None, end_date=None, user_ids=None):
     """Busca dados de quase-acidentes - filtra por usuário logado"""
     try:
-        from managers.supabase_config import get_service_role_client
-        from auth.auth_utils import get_user_id, is_admin, get_user_email
+        from auth.auth_utils import get_user_id, is_admin
+        from services.list_queries import NEAR_MISS_LIST_COLUMNS, fetch_list
         user_id = get_user_id()
-        user_email = get_user_email()
         
         if not user_id:
             return pd.DataFrame()
         
-        # Usa service_role para contornar RLS e aplicar filtro de segurança no código
-        supabase = get_service_role_client()
-        
-        query = supabase.table("near_misses").select("*")
-        
-        # Filtra por usuário logado, exceto se for admin
-        # Admin vê todos os dados sem filtro de created_by
-        if not is_admin():
-            # Usuário comum vê apenas seus próprios quase-acidentes
-            query = query.eq("created_by", user_id)
-        # Admin vê todos os quase-acidentes - não aplica filtro de created_by
+        # Projeção, período e usuários vão na consulta; usuário comum vê apenas
+        # os próprios registros. Cache por tenant/filtros evita novo round-trip
+        # a cada interação de widget
+        df = fetch_list("near_misses", NEAR_MISS_LIST_COLUMNS, user_id, is_admin(),
+                        start_date, end_date, user_ids=user_ids)
         
-        if start_date:
-            query = query.gte("occurred_at", start_date.isoformat())
-        if end_date:
-            query = query.lte("occurred_at", end_date.isoformat())
-            
-        response = query.order("occurred_at", desc=True).execute()
-        
-        if response and hasattr(response, 'data'):
-            df = pd.DataFrame(response.data) if response.data else pd.DataFrame()
-            
-            # Validação adicional de segurança para usuários não-admin
-            if not is_admin() and not df.empty:
-                # Filtra novamente para garantir (segurança em camadas)
-                df = df[df['created_by'] == user_id]
-            
-            return df
-        return pd.DataFrame()
+        return df
     except Exception as e:
         st.error(f"Erro ao buscar quase-acidentes: {str(e)}")
         import traceback
         st.code(traceback.format_exc())
         return pd.DataFrame()
 
+def fetch_near_miss_rollups(start_date=None, end_date=None, user_ids=None):
+    """Agregados mensais de quase-acidentes (contagens por status e severidade)"""
+    try:
+        from auth.auth_utils import get_user_id, is_admin
+        from services.event_rollups import fetch_monthly_rollups
+        user_id = get_user_id()
+        
+        if not user_id:
+            return pd.DataFrame()
+        
+        return fetch_monthly_rollups("near_misses", user_id, is_admin(),
+                                     start_date, end_date, user_ids=user_ids)
+    except Exception as e:
+        st.error(f"Erro ao buscar resumo de quase-acidentes: {str(e)}")
+        return pd.DataFrame()
+
+def request_records_button(key):
+    """Botão que libera a leitura das linhas individuais (só no primeiro acesso)"""
+    st.info("📋 Os registros individuais são carregados sob demanda.")
+    if st.button("📥 Carregar registros", key=key):
+        st.session_state[RECORDS_STATE_KEY] = True
+        st.rerun()
+
 def app(filters=None):
     # Verifica autenticação e trial
     from auth.auth_utils import require_login
@@ -100,14 +113,15 @@ def app(filters=None):
                 "- Acesse **Conta → Feedbacks** no menu para reportar ou sugerir melhorias!"
             )
         
-        # Busca dados
+        # Busca apenas os agregados mensais; as linhas ficam para a aba Registros
         with st.spinner("Carregando dados de quase-acidentes..."):
-            df = fetch_near_misses(
+            rollups = fetch_near_miss_rollups(
                 start_date=filters.get("start_date"),
-                end_date=filters.get("end_date")
+                end_date=filters.get("end_date"),
+                user_ids=filters.get("user_ids")
             )
         
-        if df.empty:
+        if rollups.empty:
             # Verifica se é problema de autenticação ou realmente não há dados
             from auth.auth_utils import get_user_id, get_user_email
             user_id = get_user_id()
@@ -118,34 +132,19 @@ def app(filters=None):
             else:
                 st.warning("Nenhum quase-acidente encontrado com os filtros aplicados.")
         else:
-            # Aplica filtros adicionais
-            df = apply_filters_to_df(df, filters)
+            from services.event_rollups import dimension_counts, monthly_totals, rollup_total
+            
+            # Contagens por severidade normalizada (low/medium/high)
+            severity_counts = dimension_counts(
+                rollups, 'potential_severity',
+                normalize=lambda value: SEVERITY_MAP.get(value.lower(), value.lower())
+            )
             
-            # Normaliza severidade potencial para 3 níveis: low/medium/high
-            if 'potential_severity' in df.columns:
-                sev_map = {
-                    'baixa': 'low',
-                    'media': 'medium',
-                    'alta': 'high',
-                    'low': 'low',
-                    'medium': 'medium',
-                    'high': 'high'
-                }
-                df['_severity_norm'] = (
-                    df['potential_severity']
-                    .astype(str)
-                    .str.lower()
-                    .map(sev_map)
-                    .fillna(df['potential_severity'].astype(str).str.lower())
-                )
-            else:
-                df['_severity_norm'] = []
-
             # Métricas principais
-            total_near_misses = len(df)
-            high_risk = len(df[df['_severity_norm'] == 'high']) if '_severity_norm' in df.columns else 0
-            medium_risk = len(df[df['_severity_norm'] == 'medium']) if '_severity_norm' in df.columns else 0
-            low_risk = len(df[df['_severity_norm'] == 'low']) if '_severity_norm' in df.columns else 0
+            total_near_misses = rollup_total(rollups)
+            high_risk = int(severity_counts.get('high', 0))
+            medium_risk = int(severity_counts.get('medium', 0))
+            low_risk = int(severity_counts.get('low', 0))
             
             metrics = [
                 {
@@ -181,8 +180,7 @@ def app(filters=None):
             
             with col1:
                 # Distribuição por severidade potencial - Simplificada
-                if '_severity_norm' in df.columns and not df['_severity_norm'].empty:
-                    severity_counts = df['_severity_norm'].value_counts()
+                if not severity_counts.empty:
                     severity_names = {'low': 'Baixo', 'medium': 'Médio', 'high': 'Alto'}
                     
                     fig1 = px.pie(
@@ -201,11 +199,8 @@ def app(filters=None):
             
             with col2:
                 # Quase-acidentes por mês - Simplificada
-                if 'occurred_at' in df.columns:
-                    df['month'] = pd.to_datetime(df['occurred_at']).dt.to_period('M')
-                    monthly_counts = df.groupby('month').size().reset_index(name='count')
-                    monthly_counts['month'] = monthly_counts['month'].astype(str)
-                    
+                monthly_counts = monthly_totals(rollups)
+                if not monthly_counts.empty:
                     fig2 = px.bar(
                         monthly_counts,
                         x='month',
@@ -227,9 +222,9 @@ def app(filters=None):
                     st.info("📅 **Quase-Acidentes por Mês**\n\nNenhum dado de data disponível.")
             
             # Análise por status - Simplificada
-            if 'status' in df.columns and not df['status'].isna().all():
+            status_counts = dimension_counts(rollups, 'status')
+            if not status_counts.empty:
                 st.subheader("📊 Análise por Status")
-                status_counts = df['status'].value_counts()
                 status_names = {'aberto': 'Aberto', 'fechado': 'Fechado'}
                 
                 fig3 = px.bar(
@@ -251,10 +246,24 @@ def app(filters=None):
             else:
                 st.info("📊 **Análise por Status**\n\nNenhum dado de status disponível.")
     
+    # Linhas individuais: lidas só depois que o usuário as pede em uma das abas abaixo
+    df = None
+    if st.session_state.get(RECORDS_STATE_KEY):
+        with st.spinner("Carregando registros de quase-acidentes..."):
+            df = fetch_near_misses(
+                start_date=filters.get("start_date"),
+                end_date=filters.get("end_date"),
+                user_ids=filters.get("user_ids")
+            )
+        if not df.empty:
+            df = apply_filters_to_df(df, filters)
+    
     with tab2:
         st.subheader("Registros de Quase-Acidentes")
         
-        if not df.empty:
+        if df is None:
+            request_records_button("near_miss_load_records")
+        elif not df.empty:
             # Filtros adicionais para a tabela
             col1, col2, col3 = st.columns(3)
             
@@ -284,11 +293,17 @@ def app(filters=None):
             if status_filter != "Todos" and 'status' in filtered_df.columns:
                 filtered_df = filtered_df[filtered_df['status'] == status_filter]
             
-            if search_term and 'description' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['description'].str.contains(search_term, case=False, na=False)]
+            if search_term and 'id' in filtered_df.columns:
+                # A descrição não vem na listagem: a busca é feita no banco
+                from services.list_queries import search_record_ids
+                matching_ids = search_record_ids(
+                    "near_misses", search_term,
+                    filters.get("start_date"), filters.get("end_date"), filters.get("user_ids")
+                )
+                filtered_df = filtered_df[filtered_df['id'].astype(str).isin(matching_ids)]
             
             # Exibe tabela
-            display_cols = ['occurred_at', 'potential_severity', 'description', 'status']
+            display_cols = ['occurred_at', 'potential_severity', 'status']
             available_cols = [col for col in display_cols if col in filtered_df.columns]
             
             if available_cols:
@@ -299,20 +314,46 @@ def app(filters=None):
                 )
             else:
                 st.dataframe(filtered_df, width='stretch', hide_index=True)
+
+            # A descrição não vem na listagem: é lida só para o registro aberto
+            if 'id' in filtered_df.columns and not filtered_df.empty:
+                with st.expander("📄 Detalhes do quase-acidente"):
+                    detail_options = {
+                        f"{occurred} - {severity or 'Quase-acidente'} ({str(record_id)[:8]})": record_id
+                        for record_id, occurred, severity in zip(
+                            filtered_df['id'],
+                            filtered_df.get('occurred_at', pd.Series('', index=filtered_df.index)),
+                            filtered_df.get('potential_severity', pd.Series('', index=filtered_df.index))
+                        )
+                    }
+                    selected_detail = st.selectbox(
+                        "Quase-acidente",
+                        options=list(detail_options.keys()),
+                        key="near_miss_detail_selector"
+                    )
+                    
+                    if selected_detail and st.button("Carregar detalhes", key="btn_near_miss_details"):
+                        from services.list_queries import fetch_record_fields
+                        details = fetch_record_fields("near_misses", detail_options[selected_detail])
+                        if details.get('description'):
+                            st.markdown(f"**Descrição:** {details['description']}")
+                        else:
+                            st.info("Nenhuma descrição registrada.")
         else:
             st.info("Nenhum quase-acidente encontrado.")
     
     with tab3:
         st.subheader("Evidências dos Quase-Acidentes")
         
-        if not df.empty:
+        if df is None:
+            request_records_button("near_miss_load_records_evidence")
+        elif not df.empty:
             # Seleciona quase-acidente para ver evidências
             near_miss_options = {}
             for idx, row in df.iterrows():
                 near_miss_id = row.get('id', idx)
-                description = row.get('description', f'Quase-acidente {near_miss_id}')[:50]
                 date_str = row.get('occurred_at', 'Data não informada')
-                near_miss_options[f"{date_str} - {description}..."] = near_miss_id
+                near_miss_options[f"{date_str} - {row.get('potential_severity') or 'Quase-acidente'} ({str(near_miss_id)[:8]})"] = near_miss_id
             
             selected_near_miss = st.selectbox(
                 "Selecionar Quase-Acidente",
@@ -461,6 +502,8 @@ def app(filters=None):
                         
                         if result.data:
                             near_miss_id = result.data[0]['id']
+                            from services.data_cache import invalidate_table
+                            invalidate_table("near_misses", user_id)
                             st.success("✅ Quase-acidente registrado com sucesso!")
                             
                             # Registra log da ação
@@ -501,11 +544,13 @@ def app(filters=None):
         st.info("📋 Registre e gerencie ações corretivas relacionadas aos quase-acidentes usando a metodologia 5W2H")
         
         # Busca todos os quase-acidentes para seleção
-        if df.empty:
+        if df is None:
+            request_records_button("near_miss_load_records_actions")
+        elif df.empty:
             st.warning("Nenhum quase-acidente encontrado. Registre quase-acidentes primeiro para criar ações corretivas.")
         else:
             # Seleção de quase-acidente
-            near_miss_options = {f"ID: {row['id'][:8]}... - {row.get('description', 'Sem descrição')[:50]}": row['id'] 
+            near_miss_options = {f"ID: {row['id'][:8]}... - {row.get('occurred_at', '')} {row.get('potential_severity') or ''}": row['id'] 
                               for _, row in df.iterrows()}
             
             selected_nm_id = st.selectbox(
@@ -8,45 +8,47 @@ from components.cards import create_metric_row, create_bar_chart, create_pie_cha
 from components.filters import apply_filters_to_df
 from managers.supabase_config import get_supabase_client
 
-def fetch_nonconformities(start_date=None, end_date=None):
+# Mapeia status pt-br -> status normalizado (open/in_progress/closed)
+STATUS_MAP = {
+    'aberta': 'open',
+    'tratando': 'in_progress',
+    'encerrada': 'closed',
+    'open': 'open',
+    'in_progress': 'in_progress',
+    'closed': 'closed'
+}
+
+# Mapeia severidade pt-br -> low/medium/high/critical
+SEVERITY_MAP = {
+    'leve': 'low',
+    'moderada': 'medium',
+    'grave': 'high',
+    'critica': 'critical',
+    'crítica': 'critical',
+    'low': 'low',
+    'medium': 'medium',
+    'high': 'high',
+    'critical': 'critical'
+}
+
+# Marca que o usuário pediu as linhas individuais (abas Registros/Evidências/Ações)
+RECORDS_STATE_KEY = "nc_records_loaded"
+
+def fetch_nonconformities(start_date=None, end_date=None, user_ids=None):
     """Busca dados de não conformidades - filtra por usuário logado"""
     try:
-        from managers.supabase_config import get_service_role_client
-        from auth.auth_utils import get_user_id, is_admin, get_user_email
+        from auth.auth_utils import get_user_id, is_admin
+        from services.list_queries import NONCONFORMITY_LIST_COLUMNS, fetch_list
         user_id = get_user_id()
-        user_email = get_user_email()
         
         if not user_id:
             return pd.DataFrame()
         
-        # Usa service_role para contornar RLS e aplicar filtro de segurança no código
-        supabase = get_service_role_client()
-        
-        query = supabase.table("nonconformities").select("*")
-        
-        # Filtra por usuário logado, exceto se for admin
-        # Admin vê todos os dados sem filtro de created_by
-        if not is_admin():
-            # Usuário comum vê apenas suas próprias não conformidades
-            query = query.eq("created_by", user_id)
-        # Admin vê todas as não conformidades - não aplica filtro de created_by
-        
-        if start_date:
-            query = query.gte("occurred_at", start_date.isoformat())
-        if end_date:
-            query = query.lte("occurred_at", end_date.isoformat())
-        
-        response = query.order("occurred_at", desc=True).execute()
-        
-        if response and hasattr(response, 'data'):
-            df = pd.DataFrame(response.data) if response.data else pd.DataFrame()
-            
-            # Validação adicional de segurança para usuários não-admin
-            if not is_admin() and not df.empty:
-                # Filtra novamente para garantir (segurança em camadas)
-                df = df[df['created_by'] == user_id]
-        else:
-            df = pd.DataFrame()
+        # Projeção, período e usuários vão na consulta; usuário comum vê apenas
+        # os próprios registros. Cache por tenant/filtros evita novo round-trip
+        # a cada interação de widget
+        df = fetch_list("nonconformities", NONCONFORMITY_LIST_COLUMNS, user_id, is_admin(),
+                        start_date, end_date, user_ids=user_ids)
 
         # Normalizações para UI
         if not df.empty:
@@ -55,46 +57,50 @@ def fetch_nonconformities(start_date=None, end_date=None):
                 df['norm_reference'] = df['standard_ref']
             # Mapeia status pt-br -> status normalizado (open/in_progress/closed)
             if 'status' in df.columns:
-                status_map = {
-                    'aberta': 'open',
-                    'tratando': 'in_progress',
-                    'encerrada': 'closed',
-                    'open': 'open',
-                    'in_progress': 'in_progress',
-                    'closed': 'closed'
-                }
-                df['status'] = df['status'].astype(str).str.lower().map(status_map).fillna(df['status'])
+                df['status'] = df['status'].astype(str).str.lower().map(STATUS_MAP).fillna(df['status'])
             # Mapeia severidade pt-br -> low/medium/high/critical
             if 'severity' in df.columns:
-                sev_map = {
-                    'leve': 'low',
-                    'moderada': 'medium',
-                    'grave': 'high',
-                    'critica': 'critical',
-                    'crítica': 'critical',
-                    'low': 'low',
-                    'medium': 'medium',
-                    'high': 'high',
-                    'critical': 'critical'
-                }
-                df['severity'] = df['severity'].astype(str).str.lower().map(sev_map).fillna(df['severity'])
+                df['severity'] = df['severity'].astype(str).str.lower().map(SEVERITY_MAP).fillna(df['severity'])
         
-        # Aplica filtro de data após carregar os dados
-        if start_date and 'occurred_at' in df.columns:
+        # Aplica filtro de data (opened_at, mesma coluna da consulta e dos agregados)
+        if start_date and 'opened_at' in df.columns:
             df = df.copy()  # Evita SettingWithCopyWarning
-            df['occurred_at'] = pd.to_datetime(df['occurred_at'], errors='coerce').dt.date
-            df = df[df['occurred_at'] >= start_date]
+            df['opened_at'] = pd.to_datetime(df['opened_at'], errors='coerce').dt.date
+            df = df[df['opened_at'] >= start_date]
         
-        if end_date and 'occurred_at' in df.columns:
+        if end_date and 'opened_at' in df.columns:
             df = df.copy()  # Evita SettingWithCopyWarning
-            df['occurred_at'] = pd.to_datetime(df['occurred_at'], errors='coerce').dt.date
-            df = df[df['occurred_at'] <= end_date]
+            df['opened_at'] = pd.to_datetime(df['opened_at'], errors='coerce').dt.date
+            df = df[df['opened_at'] <= end_date]
         
         return df
     except Exception as e:
         st.error(f"Erro ao buscar não conformidades: {str(e)}")
         return pd.DataFrame()
 
+def fetch_nonconformity_rollups(start_date=None, end_date=None, user_ids=None):
+    """Agregados mensais de não conformidades (status, gravidade, norma e mês de abertura)"""
+    try:
+        from auth.auth_utils import get_user_id, is_admin
+        from services.event_rollups import fetch_monthly_rollups
+        user_id = get_user_id()
+        
+        if not user_id:
+            return pd.DataFrame()
+        
+        return fetch_monthly_rollups("nonconformities", user_id, is_admin(),
+                                     start_date, end_date, user_ids=user_ids)
+    except Exception as e:
+        st.error(f"Erro ao buscar resumo de não conformidades: {str(e)}")
+        return pd.DataFrame()
+
+def request_records_button(key):
+    """Botão que libera a leitura das linhas individuais (só no primeiro acesso)"""
+    st.info("📋 Os registros individuais são carregados sob demanda.")
+    if st.button("📥 Carregar registros", key=key):
+        st.session_state[RECORDS_STATE_KEY] = True
+        st.rerun()
+
 def app(filters=None):
     # Verifica autenticação e trial
     from auth.auth_utils import require_login
@@ -118,7 +124,7 @@ def app(filters=None):
                     "2) Revise métricas: abertas/encerradas e tempo médio.\n"
                     "3) Explore status, mês, norma e gravidade.\n\n"
                     "**Dicas**\n\n"
-                    "- Sem 'opened_at', usamos 'occurred_at' nos gráficos.\n"
+                    "- O filtro de datas usa 'opened_at' (abertura) em todas as abas.\n"
                     "- Campos podem variar (ex.: site_id).\n\n"
                     "**Definições**\n\n"
                     "- 'opened_at': data em que a N/C foi aberta/registrada no sistema.\n"
@@ -136,19 +142,21 @@ def app(filters=None):
         with st.popover("❓ Dicas"):
             st.markdown(
                 "- Alguns campos podem variar entre ambientes (ex.: site).\n"
-                "- Se não houver 'opened_at', os gráficos usam 'occurred_at' como fallback.\n\n"
+                "- O filtro de datas e os gráficos por mês usam a data de abertura (opened_at), "
+                "tanto na análise quanto nos registros.\n\n"
                 "**📝 Encontrou um erro ou tem uma sugestão?**\n"
                 "- Acesse **Conta → Feedbacks** no menu para reportar ou sugerir melhorias!"
             )
         
-        # Busca dados usando a função que respeita isolamento por usuário
+        # Busca apenas os agregados mensais; as linhas ficam para a aba Registros
         with st.spinner("Carregando dados de não conformidades..."):
-            df = fetch_nonconformities(
+            rollups = fetch_nonconformity_rollups(
                 start_date=filters.get("start_date") if filters else None,
-                end_date=filters.get("end_date") if filters else None
+                end_date=filters.get("end_date") if filters else None,
+                user_ids=filters.get("user_ids") if filters else None
             )
         
-        if df.empty:
+        if rollups.empty:
             # Verifica se é problema de autenticação ou realmente não há dados
             from auth.auth_utils import get_user_id, get_user_email
             user_id = get_user_id()
@@ -159,46 +167,35 @@ def app(filters=None):
             else:
                 st.warning("Nenhuma não conformidade encontrada.")
         else:
+            from services.event_rollups import (
+                dimension_counts, mean_resolution_days, monthly_totals, rollup_total
+            )
+            
+            total_nc = rollup_total(rollups)
+            status_counts = dimension_counts(
+                rollups, 'status', normalize=lambda value: STATUS_MAP.get(value.lower(), value)
+            )
+            # Agregados por mês de abertura (opened_at), a mesma data do filtro
+            opened_counts = monthly_totals(rollups)
+            
             # Mostra informações sobre os dados encontrados
-            st.success(f"📊 **{len(df)} não conformidade(s) encontrada(s)**")
+            st.success(f"📊 **{total_nc} não conformidade(s) encontrada(s)**")
             
             # Mostra informações de debug para verificar os dados reais
-            if 'status' in df.columns:
-                status_counts = df['status'].value_counts()
+            if not status_counts.empty:
                 st.write(f"**Status encontrados:** {dict(status_counts)}")
             
-            if 'opened_at' in df.columns:
-                df['opened_at'] = pd.to_datetime(df['opened_at'], errors='coerce')
-                months_count = df['opened_at'].dt.to_period('M').value_counts()
-                st.write(f"**Meses com registros:** {len(months_count)} diferentes")
+            if not opened_counts.empty:
+                st.write(f"**Meses com registros:** {len(opened_counts)} diferentes")
             
-            # Não aplicamos mais nenhum filtro adicional que possa excluir os dados
-            # pois o objetivo é mostrar os dados existentes independentemente dos filtros do sistema
-            pass  # df já está carregado com os dados
+            # Métricas principais - status já normalizados (open/in_progress/closed)
+            open_nc = int(status_counts.get('open', 0))
+            closed_nc = int(status_counts.get('closed', 0))
+            in_progress_nc = int(status_counts.get('in_progress', 0))
+            overdue_nc = int(status_counts.get('overdue', 0))
             
-            # Métricas principais - considerando os status em português originais
-            total_nc = len(df)
-            
-            if 'status' in df.columns:
-                # Conta status em português que estão nos dados
-                open_nc = len(df[df['status'].isin(['aberta', 'open'])])
-                closed_nc = len(df[df['status'].isin(['encerrada', 'closed'])])
-                in_progress_nc = len(df[df['status'].isin(['tratando', 'in_progress'])])
-                overdue_nc = len(df[df['status'] == 'overdue'])
-            else:
-                open_nc = closed_nc = in_progress_nc = overdue_nc = 0
-            
-            # Calcula dias médios de resolução
-            if 'status' in df.columns and 'resolution_date' in df.columns:
-                # Filtra registros fechados considerando ambos os formatos
-                closed_df = df[df['status'].isin(['encerrada', 'closed'])]
-                if not closed_df.empty and 'occurred_at' in closed_df.columns:
-                    closed_df['resolution_days'] = (pd.to_datetime(closed_df['resolution_date']) - pd.to_datetime(closed_df['occurred_at'])).dt.days
-                    avg_resolution_days = closed_df['resolution_days'].mean()
-                else:
-                    avg_resolution_days = 0
-            else:
-                avg_resolution_days = 0
+            # Dias médios de resolução: abertura (opened_at) até encerramento (closed_at)
+            avg_resolution_days = mean_resolution_days(rollups)
             
             metrics = [
                 {
@@ -234,8 +231,7 @@ def app(filters=None):
             
             with col1:
                 # Distribuição por status
-                if 'status' in df.columns:
-                    status_counts = df['status'].value_counts()
+                if not status_counts.empty:
                     fig1 = create_pie_chart(
                         pd.DataFrame({
                             'status': status_counts.index,
@@ -248,42 +244,20 @@ def app(filters=None):
                     st.plotly_chart(fig1, width='stretch')
             
             with col2:
-                # N/C por mês - usando opened_at em vez de occurred_at para análise temporal
-                # porque no INSERT fornecido, occurred_at tem todos o mesmo valor ('2025-10-28')
-                if 'opened_at' in df.columns:
-                    df_temp = df.copy()
-                    df_temp['opened_at'] = pd.to_datetime(df_temp['opened_at'])
-                    df_temp['month'] = df_temp['opened_at'].dt.to_period('M')
-                    monthly_counts = df_temp.groupby('month').size().reset_index(name='count')
-                    monthly_counts['month'] = monthly_counts['month'].astype(str)
-                    
+                # N/C por mês de abertura (opened_at)
+                if not opened_counts.empty:
                     fig2 = create_bar_chart(
-                        monthly_counts,
+                        opened_counts,
                         'month',
                         'count',
                         'Não Conformidades por Mês (abertura)'
                     )
                     st.plotly_chart(fig2, width='stretch')
-                elif 'occurred_at' in df.columns:
-                    # Fallback para occurred_at se opened_at não estiver disponível
-                    df_temp = df.copy()
-                    df_temp['occurred_at'] = pd.to_datetime(df_temp['occurred_at'])
-                    df_temp['month'] = df_temp['occurred_at'].dt.to_period('M')
-                    monthly_counts = df_temp.groupby('month').size().reset_index(name='count')
-                    monthly_counts['month'] = monthly_counts['month'].astype(str)
-                    
-                    fig2 = create_bar_chart(
-                        monthly_counts,
-                        'month',
-                        'count',
-                        'Não Conformidades por Mês (ocorrência)'
-                    )
-                    st.plotly_chart(fig2, width='stretch')
             
             # Análise por norma
-            if 'norm_reference' in df.columns:
+            norm_counts = dimension_counts(rollups, 'standard_ref')
+            if not norm_counts.empty:
                 st.subheader("Análise por Norma")
-                norm_counts = df['norm_reference'].value_counts()
                 
                 fig3 = create_bar_chart(
                     pd.DataFrame({
@@ -297,9 +271,11 @@ def app(filters=None):
                 st.plotly_chart(fig3, width='stretch')
             
             # Análise por gravidade
-            if 'severity' in df.columns:
+            severity_counts = dimension_counts(
+                rollups, 'severity', normalize=lambda value: SEVERITY_MAP.get(value.lower(), value)
+            )
+            if not severity_counts.empty:
                 st.subheader("Análise por Gravidade")
-                severity_counts = df['severity'].value_counts()
                 
                 fig4 = create_bar_chart(
                     pd.DataFrame({
@@ -312,10 +288,22 @@ def app(filters=None):
                 )
                 st.plotly_chart(fig4, width='stretch')
     
+    # Linhas individuais: lidas só depois que o usuário as pede em uma das abas abaixo
+    df = None
+    if st.session_state.get(RECORDS_STATE_KEY):
+        with st.spinner("Carregando registros de não conformidades..."):
+            df = fetch_nonconformities(
+                start_date=filters.get("start_date") if filters else None,
+                end_date=filters.get("end_date") if filters else None,
+                user_ids=filters.get("user_ids") if filters else None
+            )
+    
     with tab2:
         st.subheader("Registros de Não Conformidades")
         
-        if not df.empty:
+        if df is None:
+            request_records_button("nc_load_records")
+        elif not df.empty:
             # Filtros locais para a tabela (não afetam o dataframe principal)
             col1, col2, col3 = st.columns(3)
             
@@ -345,11 +333,19 @@ def app(filters=None):
             if norm_filter != "Todas" and 'norm_reference' in filtered_df.columns:
                 filtered_df = filtered_df[filtered_df['norm_reference'] == norm_filter]
             
-            if search_term and 'description' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['description'].str.contains(search_term, case=False, na=False)]
+            if search_term and 'id' in filtered_df.columns:
+                # A descrição não vem na listagem: a busca é feita no banco
+                from services.list_queries import search_record_ids
+                matching_ids = search_record_ids(
+                    "nonconformities", search_term,
+                    filters.get("start_date") if filters else None,
+                    filters.get("end_date") if filters else None,
+                    filters.get("user_ids") if filters else None
+                )
+                filtered_df = filtered_df[filtered_df['id'].astype(str).isin(matching_ids)]
             
             # Exibe tabela
-            display_cols = ['occurred_at', 'norm_reference', 'severity', 'status', 'description']
+            display_cols = ['opened_at', 'occurred_at', 'norm_reference', 'severity', 'status']
             available_cols = [col for col in display_cols if col in filtered_df.columns]
             
             if available_cols:
@@ -360,20 +356,46 @@ def app(filters=None):
                 )
             else:
                 st.dataframe(filtered_df, width='stretch', hide_index=True)
+
+            # A descrição não vem na listagem: é lida só para o registro aberto
+            if 'id' in filtered_df.columns and not filtered_df.empty:
+                with st.expander("📄 Detalhes do N/C"):
+                    detail_options = {
+                        f"{occurred} - {norm_reference or 'N/C'} ({str(record_id)[:8]})": record_id
+                        for record_id, occurred, norm_reference in zip(
+                            filtered_df['id'],
+                            filtered_df.get('opened_at', pd.Series('', index=filtered_df.index)),
+                            filtered_df.get('norm_reference', pd.Series('', index=filtered_df.index))
+                        )
+                    }
+                    selected_detail = st.selectbox(
+                        "Não conformidade",
+                        options=list(detail_options.keys()),
+                        key="nc_detail_selector"
+                    )
+                    
+                    if selected_detail and st.button("Carregar detalhes", key="btn_nc_details"):
+                        from services.list_queries import fetch_record_fields
+                        details = fetch_record_fields("nonconformities", detail_options[selected_detail])
+                        if details.get('description'):
+                            st.markdown(f"**Descrição:** {details['description']}")
+                        else:
+                            st.info("Nenhuma descrição registrada.")
         else:
             st.info("Nenhuma não conformidade encontrada.")
     
     with tab3:
         st.subheader("Evidências das Não Conformidades")
         
-        if not df.empty:
+        if df is None:
+            request_records_button("nc_load_records_evidence")
+        elif not df.empty:
             # Seleciona não conformidade para ver evidências
             nc_options = {}
             for idx, row in df.iterrows():
                 nc_id = row.get('id', idx)
-                description = row.get('description', f'N/C {nc_id}')[:50]
-                date_str = row.get('occurred_at', 'Data não informada')
-                nc_options[f"{date_str} - {description}..."] = nc_id
+                date_str = row.get('opened_at', 'Data não informada')
+                nc_options[f"{date_str} - {row.get('norm_reference') or 'N/C'} ({str(nc_id)[:8]})"] = nc_id
             
             selected_nc = st.selectbox(
                 "Selecionar Não Conformidade",
@@ -540,6 +562,8 @@ def app(filters=None):
                         
                         if result.data:
                             nc_id = result.data[0]['id']
+                            from services.data_cache import invalidate_table
+                            invalidate_table("nonconformities", user_id)
                             st.success("✅ Não conformidade registrada com sucesso!")
                             
                             # Registra log da ação
@@ -580,11 +604,13 @@ def app(filters=None):
         st.info("📋 Registre e gerencie ações corretivas relacionadas às não conformidades usando a metodologia 5W2H")
         
         # Busca todas as não conformidades para seleção
-        if df.empty:
+        if df is None:
+            request_records_button("nc_load_records_actions")
+        elif df.empty:
             st.warning("Nenhuma não conformidade encontrada. Registre não conformidades primeiro para criar ações corretivas.")
         else:
             # Seleção de não conformidade
-            nc_options = {f"ID: {row['id'][:8]}... - {row.get('description', 'Sem descrição')[:50]}": row['id'] 
+            nc_options = {f"ID: {row['id'][:8]}... - {row.get('opened_at', '')} {row.get('norm_reference') or ''}": row['id'] 
                               for _, row in df.iterrows()}
             
             selected_nc_id = st.selectbox(
@@ -9,12 +9,11 @@ from services.kpi import (
     calculate_frequency_rate, 
     calculate_severity_rate,
     calculate_poisson_control_limits,
-    calculate_ewma,
-    detect_control_chart_patterns,
     generate_kpi_summary,
     calculate_forecast,
     generate_forecast_recommendations
 )
+from services.spc import calculate_ewma, detect_control_chart_patterns, NELSON_RULES
 from components.cards import create_control_chart, create_trend_chart, create_metric_row
 from components.filters import apply_filters_to_df
 
@@ -50,7 +49,9 @@ def app(filters=None):
         df = fetch_kpi_data(
             user_email=user_email,
             start_date=filters.get("start_date"),
-            end_date=filters.get("end_date")
+            end_date=filters.get("end_date"),
+            months_back=filters.get("months_back", 0),
+            user_ids=filters.get("user_ids")
         )
     
     # Aplica filtros adicionais se houver dados
@@ -74,8 +75,8 @@ def app(filters=None):
             if 'sev_rate_per_million' not in df.columns:
                 df['sev_rate_per_million'] = (df['lost_days_total'] / df['hours']) * 1_000_000
             
-            # Resumo dos KPIs
-            kpi_summary = generate_kpi_summary(df)
+            # Resumo dos KPIs (linhas já ordenadas por period na consulta)
+            kpi_summary = generate_kpi_summary(df, assume_sorted=True)
             
             # Seção de análises de KPIs
             # Métricas principais com interpretações
@@ -293,7 +294,8 @@ def app(filters=None):
                     control_df,
                     "accidents_total",
                     "ucl",
-                    "lcl"
+                    "lcl",
+                    center_col="expected"
                 )
                 
                 # Alertas baseados em padrões
@@ -374,6 +376,18 @@ def app(filters=None):
                     st.success("🎉 **Excelente!** Nenhum padrão problemático detectado nos dados.")
                     st.info("📊 Os indicadores estão dentro dos limites estatísticos normais.")
                 
+                # Regras de Nelson (Western Electric) acionadas
+                triggered_rules = {rule: patterns[f'rule_{rule}'] for rule in NELSON_RULES if patterns[f'rule_{rule}']}
+                if triggered_rules:
+                    with st.expander(f"📐 Regras de Nelson acionadas ({len(triggered_rules)} de {len(NELSON_RULES)})"):
+                        rules_display = pd.DataFrame([{
+                            'Regra': rule,
+                            'Descrição': NELSON_RULES[rule],
+                            'Ocorrências': len(positions),
+                            'Último Período': control_df.iloc[positions[-1]]['period']
+                        } for rule, positions in triggered_rules.items()])
+                        st.dataframe(rules_display, width='stretch', hide_index=True)
+                
                 # Recomendações baseadas nos padrões
                 st.subheader("💡 Recomendações")
                 
@@ -1328,7 +1342,8 @@ def app(filters=None):
     with tab8:
         st.subheader("🔄 Calcular KPIs")
         
-        st.info("💡 **Importante**: Os KPIs precisam ser calculados manualmente através do botão abaixo.\n\n"
+        st.info("💡 **Importante**: Os KPIs do mês são atualizados automaticamente ao cadastrar, editar ou importar acidentes e horas. "
+                "Use o botão abaixo para recalcular todo o histórico.\n\n"
                 "📋 **Requisitos para calcular KPIs:**\n"
                 "1. Ter acidentes cadastrados na tabela `accidents`\n"
                 "2. Ter horas trabalhadas cadastradas na tabela `hours_worked_monthly`\n"
@@ -1376,114 +1391,26 @@ def app(filters=None):
         if st.button("🔄 Calcular Meus KPIs", type="primary", key="btn_calculate_my_kpis"):
             with st.spinner("Calculando seus KPIs..."):
                 try:
-                    from services.kpi import calculate_frequency_rate, calculate_severity_rate
-                    from managers.supabase_config import get_service_role_client
+                    from services.kpi import recalculate_kpi_monthly
                     from auth.auth_utils import get_user_id
-                    from collections import defaultdict
                     
-                    supabase = get_service_role_client()
                     user_id = get_user_id()
                     
                     if not user_id:
                         st.error("❌ Usuário não autenticado.")
                         return
                     
-                    # Busca apenas dados do usuário logado
-                    accidents_response = supabase.table("accidents").select(
-                        "id, occurred_at, created_by, lost_days, type"
-                    ).eq("created_by", user_id).execute()
-                    
-                    hours_response = supabase.table("hours_worked_monthly").select(
-                        "id, year, month, hours, created_by"
-                    ).eq("created_by", user_id).execute()
-                    
-                    accidents_data = accidents_response.data if accidents_response and hasattr(accidents_response, 'data') else []
-                    hours_data = hours_response.data if hours_response and hasattr(hours_response, 'data') else []
-                    
-                    # Agrupa acidentes por mês
-                    accidents_by_period = defaultdict(lambda: {'count': 0, 'fatalities': 0, 'lost_days': 0})
-                    
-                    for accident in accidents_data:
-                        period = pd.to_datetime(accident['occurred_at']).strftime('%Y-%m')
-                        accidents_by_period[period]['count'] += 1
-                        if accident.get('type') == 'fatal':
-                            accidents_by_period[period]['fatalities'] += 1
-                        accidents_by_period[period]['lost_days'] += int(accident.get('lost_days', 0))
-                    
-                    # Agrupa horas por mês
-                    hours_by_period = defaultdict(lambda: 0)
-                    
-                    for hour_entry in hours_data:
-                        period = f"{hour_entry['year']}-{str(hour_entry['month']).zfill(2)}"
-                        hours_by_period[period] += float(hour_entry.get('hours', 0))
-                    
-                    # Calcula KPIs mensais do usuário
-                    kpi_count = 0
-                    for period, acc_data in accidents_by_period.items():
-                        if period in hours_by_period:
-                            hours = hours_by_period[period]
-                            
-                            # Calcular dias debitados para acidentes fatais (NBR 14280)
-                            debited_days = acc_data['fatalities'] * 6000  # 6.000 dias por morte
-                            
-                            # ✅ CORRIGIDO: hours vem da tabela hours_worked_monthly em HORAS REAIS (182.0 = 182 horas reais)
-                            # A função espera receber em centenas e multiplica por 100 internamente
-                            # Então dividimos por 100 para converter para centenas antes de calcular
-                            hours_in_hundreds = hours / 100  # Converte 182.0 horas reais para 1.82 centenas
-                            freq_rate = calculate_frequency_rate(acc_data['count'], hours_in_hundreds)
-                            sev_rate = calculate_severity_rate(acc_data['lost_days'], hours_in_hundreds, debited_days)
-                            
-                            # Verifica se já existe KPI para este período e usuário
-                            existing_kpi = supabase.table("kpi_monthly").select("id").eq("period", f"{period}-01").eq("created_by", user_id).execute()
-                            
-                            kpi_data = {
-                                "period": f"{period}-01",
-                                "created_by": user_id,  # UUID do usuário
-                                "accidents_total": acc_data['count'],
-                                "fatalities": acc_data['fatalities'],
-                                "lost_days_total": acc_data['lost_days'],
-                                "hours": hours_in_hundreds,  # ✅ Armazena em centenas (182.0 → 1.82 na tabela)
-                                "frequency_rate": freq_rate,
-                                "severity_rate": sev_rate,
-                                "debited_days": debited_days
-                            }
-                            
-                            if existing_kpi.data:
-                                # Atualiza existente
-                                supabase.table("kpi_monthly").update(kpi_data).eq("period", f"{period}-01").eq("created_by", user_id).execute()
-                                kpi_count += 1
-                            else:
-                                # Insere novo
-                                supabase.table("kpi_monthly").insert(kpi_data).execute()
-                                kpi_count += 1
-                    
-                    # Processa horas sem acidentes (cria KPIs com zero acidentes)
-                    for period, hours in hours_by_period.items():
-                        if period not in accidents_by_period:
-                            # Verifica se já existe KPI para este período e usuário
-                            existing_kpi = supabase.table("kpi_monthly").select("id").eq("period", f"{period}-01").eq("created_by", user_id).execute()
-                            
-                            if not existing_kpi.data:
-                                kpi_data = {
-                                    "period": f"{period}-01",
-                                    "created_by": user_id,
-                                    "accidents_total": 0,
-                                    "fatalities": 0,
-                                    "lost_days_total": 0,
-                                    "hours": hours / 100,  # ✅ Converte horas reais para centenas
-                                    "frequency_rate": 0,
-                                    "severity_rate": 0,
-                                    "debited_days": 0
-                                }
-                                supabase.table("kpi_monthly").insert(kpi_data).execute()
-                                kpi_count += 1
+                    # Agrupa acidentes e horas por mês e grava todos os KPIs em um único upsert
+                    summary = recalculate_kpi_monthly(user_id)
                     
                     st.success(f"✅ Seus KPIs foram calculados com sucesso!\n\n"
                               f"📊 **Resumo:**\n"
-                              f"- Períodos com acidentes processados: {len(accidents_by_period)}\n"
-                              f"- Períodos com horas (sem acidentes) processados: {len([p for p in hours_by_period.keys() if p not in accidents_by_period])}\n"
-                              f"- **Total de KPIs calculados/atualizados: {kpi_count}**\n\n"
+                              f"- Períodos com acidentes processados: {summary['with_accidents']}\n"
+                              f"- Períodos com horas (sem acidentes) processados: {summary['without_accidents']}\n"
+                              f"- **Total de KPIs calculados/atualizados: {summary['total']}**\n\n"
                               f"💡 **Dica**: Atualize os KPIs sempre que cadastrar novos acidentes ou horas trabalhadas.")
+                    if summary['skipped_without_hours']:
+                        st.warning(f"⚠️ {summary['skipped_without_hours']} mês(es) com acidentes não possuem horas trabalhadas cadastradas e foram ignorados.")
                     st.rerun()
                     
                 except Exception as e:
@@ -1,7 +1,7 @@
 import streamlit as st
 import pandas as pd
 from services.auth import require_role
-from services.uploads import import_hours_csv, import_accidents_csv
+from services.bulk_import import import_file, preview_file
 from managers.supabase_config import get_supabase_client
 
 def app(filters=None):
@@ -169,6 +169,9 @@ def app(filters=None):
                                 result = supabase.table("profiles").update(profile_data).eq("email", email).execute()
                                 
                                 if result.data:
+                                    # Papel/status alterados: revalida o usuário na próxima página
+                                    from auth.auth_utils import invalidate_principal
+                                    invalidate_principal(email)
                                     st.success("✅ Perfil atualizado com sucesso!")
                                     st.rerun()
                                 else:
@@ -222,6 +225,9 @@ def app(filters=None):
                                     result = supabase.table("profiles").update(profile_data).eq("email", email).execute()
                                 
                                 if result.data:
+                                    # Papel/status alterados: revalida o usuário na próxima página
+                                    from auth.auth_utils import invalidate_principal
+                                    invalidate_principal(email)
                                     st.success("✅ Perfil atualizado com sucesso!")
                                     st.rerun()
                                 else:
@@ -238,24 +244,20 @@ def app(filters=None):
         st.subheader("📊 Importar Horas Trabalhadas")
         
         uploaded_hours = st.file_uploader(
-            "Arquivo CSV de Horas Trabalhadas",
-            type=['csv'],
+            "Arquivo CSV/XLSX de Horas Trabalhadas",
+            type=['csv', 'xlsx'],
             key="hours_upload",
-            help="Formato esperado: year, month, hours (site_id removido da tabela)"
+            help="Formato esperado: year, month, hours (site_id removido da tabela). "
+                 "Reimportar o arquivo atualiza os meses já existentes."
         )
         
         if uploaded_hours:
             try:
-                hours_df = pd.read_csv(uploaded_hours)
                 st.write("**Preview dos dados:**")
-                st.dataframe(hours_df.head(), width='stretch')
-                
-                # Mapeamento de sites
-                sites = get_sites()
-                site_mapping = {site['code']: site['id'] for site in sites}
+                st.dataframe(preview_file(uploaded_hours), width='stretch')
                 
                 if st.button("📥 Importar Horas", key="import_hours"):
-                    success = import_hours_csv(hours_df, site_mapping)
+                    success = import_file("hours", uploaded_hours)
                     if success:
                         st.rerun()
                         
@@ -266,24 +268,20 @@ def app(filters=None):
         st.subheader("🚨 Importar Acidentes")
         
         uploaded_accidents = st.file_uploader(
-            "Arquivo CSV de Acidentes",
-            type=['csv'],
+            "Arquivo CSV/XLSX de Acidentes",
+            type=['csv', 'xlsx'],
             key="accidents_upload",
-            help="Formato esperado: occurred_at (ou date), type (fatal/lesao/sem_lesao), description, classification (opcional), body_part (opcional), lost_days (opcional), root_cause (opcional), status (opcional, default: fechado)"
+            help="Formato esperado: occurred_at (ou date), type (fatal/lesao/sem_lesao), description, classification (opcional), body_part (opcional), lost_days (opcional), root_cause (opcional), status (opcional, default: fechado). "
+                 "Reimportar o mesmo arquivo não duplica os acidentes."
         )
         
         if uploaded_accidents:
             try:
-                accidents_df = pd.read_csv(uploaded_accidents)
                 st.write("**Preview dos dados:**")
-                st.dataframe(accidents_df.head(), width='stretch')
-                
-                # Mapeamento de sites
-                sites = get_sites()
-                site_mapping = {site['code']: site['id'] for site in sites}
+                st.dataframe(preview_file(uploaded_accidents), width='stretch')
                 
                 if st.button("📥 Importar Acidentes", key="import_accidents"):
-                    success = import_accidents_csv(accidents_df, site_mapping)
+                    success = import_file("accidents", uploaded_accidents)
                     if success:
                         st.rerun()
                         
@@ -334,122 +332,20 @@ def app(filters=None):
         if st.button("🔄 Recalcular KPIs", type="primary", key="btn_recalculate_kpis"):
             with st.spinner("Recalculando KPIs..."):
                 try:
-                    from services.kpi import calculate_frequency_rate, calculate_severity_rate
-                    from managers.supabase_config import get_service_role_client
-                    import datetime
-                    
-                    supabase = get_service_role_client()
-                    
-                    # Busca todos os dados de acidentes e horas trabalhadas
-                    accidents_response = supabase.table("accidents").select(
-                        "id, occurred_at, created_by, lost_days, type"
-                    ).execute()
-                    
-                    hours_response = supabase.table("hours_worked_monthly").select(
-                        "id, year, month, hours, created_by"
-                    ).execute()
-                    
-                    accidents_data = accidents_response.data if accidents_response and hasattr(accidents_response, 'data') else []
-                    hours_data = hours_response.data if hours_response and hasattr(hours_response, 'data') else []
-                    
-                    # Agrupa acidentes por mês/criador
-                    from collections import defaultdict
-                    # pd já está importado no topo do arquivo
-                    
-                    accidents_by_period_user = defaultdict(lambda: {'count': 0, 'fatalities': 0, 'lost_days': 0})
-                    
-                    for accident in accidents_data:
-                        period = pd.to_datetime(accident['occurred_at']).strftime('%Y-%m')
-                        user_id = accident.get('created_by')
-                        if user_id:
-                            key = f"{period}_{user_id}"
-                            accidents_by_period_user[key]['count'] += 1
-                            # is_fatal removido - usa type para identificar fatais
-                            if accident.get('type') == 'fatal':
-                                accidents_by_period_user[key]['fatalities'] += 1
-                            accidents_by_period_user[key]['lost_days'] += int(accident.get('lost_days', 0))
-                    
-                    # Agrupa horas por mês/criador
-                    hours_by_period_user = defaultdict(lambda: 0)
-                    
-                    for hour_entry in hours_data:
-                        period = f"{hour_entry['year']}-{str(hour_entry['month']).zfill(2)}"
-                        user_id = hour_entry.get('created_by')
-                        if user_id:
-                            key = f"{period}_{user_id}"
-                            hours_by_period_user[key] += float(hour_entry.get('hours', 0))
-                    
-                    # Limpa tabela de KPIs existentes (opcional - pode ser substituído por atualização incremental)
-                    # supabase.table("kpi_monthly").delete().neq("id", 0).execute()
+                    from services.kpi import recalculate_kpi_monthly
                     
-                    # Calcula KPIs mensais por usuário
-                    kpi_updates = []
-                    for key, acc_data in accidents_by_period_user.items():
-                        if key in hours_by_period_user:
-                            period, user_id = key.split('_', 1)
-                            hours = hours_by_period_user[key]
-                            
-                            # Calcular dias debitados para acidentes fatais (NBR 14280)
-                            debited_days = acc_data['fatalities'] * 6000  # 6.000 dias por morte
-                            
-                            # ✅ CORRIGIDO: hours vem da tabela hours_worked_monthly em HORAS REAIS (182.0 = 182 horas reais)
-                            # A função espera receber em centenas e multiplica por 100 internamente
-                            # Então dividimos por 100 para converter para centenas antes de calcular
-                            hours_in_hundreds = hours / 100  # Converte 182.0 horas reais para 1.82 centenas
-                            freq_rate = calculate_frequency_rate(acc_data['count'], hours_in_hundreds)
-                            sev_rate = calculate_severity_rate(acc_data['lost_days'], hours_in_hundreds, debited_days)
-                            
-                            # Verifica se já existe KPI para este período e usuário
-                            existing_kpi = supabase.table("kpi_monthly").select("id").eq("period", f"{period}-01").eq("created_by", user_id).execute()
-                            
-                            kpi_data = {
-                                "period": f"{period}-01",
-                                "created_by": user_id,  # UUID do usuário
-                                "accidents_total": acc_data['count'],
-                                "fatalities": acc_data['fatalities'],
-                                "lost_days_total": acc_data['lost_days'],
-                                "hours": hours_in_hundreds,  # ✅ Armazena em centenas (182.0 → 1.82 na tabela)
-                                "frequency_rate": freq_rate,
-                                "severity_rate": sev_rate,
-                                "debited_days": debited_days
-                            }
-                            
-                            if existing_kpi.data:
-                                # Atualiza existente
-                                supabase.table("kpi_monthly").update(kpi_data).eq("period", f"{period}-01").eq("created_by", user_id).execute()
-                            else:
-                                # Insere novo
-                                supabase.table("kpi_monthly").insert(kpi_data).execute()
-                    
-                    # Processa horas sem acidentes (cria KPIs com zero acidentes)
-                    for key, hours in hours_by_period_user.items():
-                        if key not in accidents_by_period_user:
-                            period, user_id = key.split('_', 1)
-                            
-                            # Verifica se já existe KPI para este período e usuário
-                            existing_kpi = supabase.table("kpi_monthly").select("id").eq("period", f"{period}-01").eq("created_by", user_id).execute()
-                            
-                            if not existing_kpi.data:
-                                kpi_data = {
-                                    "period": f"{period}-01",
-                                    "created_by": user_id,
-                                    "accidents_total": 0,
-                                    "fatalities": 0,
-                                    "lost_days_total": 0,
-                                    "hours": hours / 100,  # ✅ Converte horas reais para centenas (182.0 → 1.82 na tabela)
-                                    "frequency_rate": 0,
-                                    "severity_rate": 0,
-                                    "debited_days": 0
-                                }
-                                supabase.table("kpi_monthly").insert(kpi_data).execute()
+                    # Recalcula todos os usuários em uma única execução (um upsert para toda a tabela)
+                    summary = recalculate_kpi_monthly()
                     
-                    total_kpis = len(accidents_by_period_user) + len([k for k in hours_by_period_user.keys() if k not in accidents_by_period_user])
                     st.success(f"✅ KPIs recalculados com sucesso!\n\n"
                               f"📊 **Resumo:**\n"
-                              f"- Períodos com acidentes processados: {len(accidents_by_period_user)}\n"
-                              f"- Períodos com horas (sem acidentes) processados: {len([k for k in hours_by_period_user.keys() if k not in accidents_by_period_user])}\n"
-                              f"- **Total de KPIs calculados/atualizados: {total_kpis}**\n\n"
+                              f"- Usuários processados: {summary['tenants']}\n"
+                              f"- Períodos com acidentes processados: {summary['with_accidents']}\n"
+                              f"- Períodos com horas (sem acidentes) processados: {summary['without_accidents']}\n"
+                              f"- **Total de KPIs calculados/atualizados: {summary['total']}**\n\n"
                               f"💡 **Dica**: Atualize os KPIs sempre que cadastrar novos acidentes ou horas trabalhadas.")
+                    if summary['skipped_without_hours']:
+                        st.warning(f"⚠️ {summary['skipped_without_hours']} mês(es) com acidentes não possuem horas trabalhadas cadastradas e foram ignorados.")
                     
                 except Exception as e:
                     st.error(f"Erro ao recalcular KPIs: {str(e)}")
@@ -4,6 +4,7 @@ Página de Logs do Sistema
 import streamlit as st
 from utils.simple_logger import get_logger
 from managers.supabase_config import test_connection
+import io
 import json
 
 def app(filters=None):
@@ -65,19 +66,16 @@ def app(filters=None):
                 st.rerun()
         
         # Mostra logs
-        logs = logger.get_memory_logs(limit)
-        
-        if logs:
-            st.subheader(f"Últimos {len(logs)} logs")
-            
-            # Filtro por nível
+        if logger.memory_log_count():
+            # Filtro por nível (lido direto do índice por nível do logger)
             levels = st.multiselect(
                 "Filtrar por nível:",
                 ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
                 default=["INFO", "WARNING", "ERROR", "CRITICAL"]
             )
             
-            filtered_logs = [log for log in logs if log["level"] in levels]
+            filtered_logs = logger.get_memory_logs(limit, levels=levels)
+            st.subheader(f"Últimos {len(filtered_logs)} logs")
             
             if filtered_logs:
                 for log in reversed(filtered_logs[-20:]):  # Mostra últimos 20
@@ -103,7 +101,10 @@ def app(filters=None):
         st.subheader("Logs de Ações dos Usuários")
         st.info("📋 Esta seção exibe logs temporários de ações realizadas pelos usuários no sistema")
         
-        from services.user_logs import get_all_logs, cleanup_expired_logs, get_log_statistics
+        from services.user_logs import (
+            get_all_logs, cleanup_expired_logs, get_log_statistics,
+            iter_all_log_pages, next_log_cursor, write_logs_export
+        )
         from datetime import datetime, timedelta
         import pandas as pd
         
@@ -127,7 +128,7 @@ def app(filters=None):
             )
         
         with col4:
-            limit = st.selectbox("Limite", [50, 100, 200, 500], index=1)
+            limit = st.selectbox("Logs por página", [50, 100, 200, 500], index=1)
         
         # Botões de ação
         col_btn1, col_btn2 = st.columns(2)
@@ -153,17 +154,78 @@ def app(filters=None):
         action_type = None if action_filter == "Todos" else action_filter
         entity_type = None if entity_filter == "Todos" else entity_filter
         
+        # Paginação por cursor (created_at, id): guarda o cursor de cada página visitada
+        # e volta para a primeira página quando os filtros mudam
+        filter_key = (days_back, action_type, entity_type, limit)
+        if st.session_state.get("user_logs_filter_key") != filter_key:
+            st.session_state["user_logs_filter_key"] = filter_key
+            st.session_state["user_logs_cursors"] = [None]
+        cursors = st.session_state["user_logs_cursors"]
+        
         with st.spinner("Carregando logs de ações..."):
             logs = get_all_logs(
                 start_date=start_date,
                 end_date=end_date,
                 action_type=action_type,
                 entity_type=entity_type,
-                limit=limit
+                limit=limit,
+                cursor=cursors[-1]
             )
         
+        col_page1, col_page2, col_page3 = st.columns([1, 2, 1])
+        
+        with col_page1:
+            if st.button("⬅️ Página anterior", key="btn_user_logs_prev", disabled=len(cursors) == 1):
+                cursors.pop()
+                st.rerun()
+        
+        with col_page2:
+            st.caption(f"Página {len(cursors)}")
+        
+        with col_page3:
+            if st.button("Próxima página ➡️", key="btn_user_logs_next", disabled=len(logs) < limit):
+                cursors.append(next_log_cursor(logs))
+                st.rerun()
+        
+        with st.expander("📥 Exportar logs filtrados"):
+            st.caption("Exporta todos os logs dos filtros acima, gravados página a página.")
+            export_format = st.radio("Formato", ["csv", "ndjson"], horizontal=True, key="user_logs_export_format")
+            
+            if st.button("Gerar exportação", key="btn_user_logs_export"):
+                import tempfile
+                
+                with st.spinner("Exportando logs..."):
+                    try:
+                        # As páginas vão direto para um arquivo temporário, sem acumular em memória
+                        with tempfile.TemporaryFile(mode="w+b") as tmp:
+                            text = io.TextIOWrapper(tmp, encoding="utf-8", newline="")
+                            exported = write_logs_export(
+                                text,
+                                iter_all_log_pages(
+                                    start_date=start_date,
+                                    end_date=end_date,
+                                    action_type=action_type,
+                                    entity_type=entity_type
+                                ),
+                                fmt=export_format
+                            )
+                            text.flush()
+                            text.detach()
+                            tmp.seek(0)
+                            
+                            st.success(f"✅ {exported} logs exportados")
+                            st.download_button(
+                                label="💾 Download",
+                                data=tmp,
+                                file_name=f"user_logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}",
+                                mime="text/csv" if export_format == "csv" else "application/x-ndjson",
+                                key="btn_user_logs_export_file"
+                            )
+                    except Exception as e:
+                        st.error(f"Erro ao exportar logs: {str(e)}")
+        
         if logs:
-            st.success(f"✅ {len(logs)} logs encontrados")
+            st.success(f"✅ {len(logs)} logs nesta página")
             
             # Estatísticas
             st.subheader("📊 Estatísticas")
@@ -307,6 +369,12 @@ def app(filters=None):
         
         with st.expander("Ver informações do sistema"):
             st.json(system_info)
+        
+        from services.audit_writer import get_audit_writer_stats
+        audit_stats = get_audit_writer_stats()
+        if audit_stats:
+            with st.expander("Gravação de logs de auditoria"):
+                st.json(audit_stats)
     
     with tab5:
         st.subheader("Informações Técnicas")
@@ -344,13 +412,8 @@ def app(filters=None):
         
         # Estatísticas de logs
         st.subheader("Estatísticas")
-        logs = logger.get_memory_logs()
-        
-        if logs:
-            level_counts = {}
-            for log in logs:
-                level = log["level"]
-                level_counts[level] = level_counts.get(level, 0) + 1
+        if logger.memory_log_count():
+            level_counts = logger.get_level_counts()
             
             col1, col2, col3, col4, col5 = st.columns(5)
             
@@ -24,6 +24,9 @@ def save_profile(data: dict) -> bool:
         return False
     # upsert por email
     result = supabase.table("profiles").upsert(data, on_conflict="email").execute()
+    if result and getattr(result, 'data', None):
+        from auth.auth_utils import invalidate_principal
+        invalidate_principal(data.get("email"))
     return bool(result and hasattr(result, 'data'))
 
 
@@ -54,6 +57,9 @@ def update_investigation(accident_id: int, completed: bool, inv_date: date | Non
         "status": "fechado" if completed else "aberto",
     }
     res = supabase.table("accidents").update(payload).eq("id", accident_id).execute()
+    if res and getattr(res, 'data', None):
+        from services.data_cache import invalidate_table
+        invalidate_table("accidents", res.data[0].get('created_by'))
     return bool(res and hasattr(res, 'data'))
 
 
@@ -6,13 +6,8 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime, date, time, timezone
 from typing import Optional, Dict, Any, List
-import requests
+import importlib.util
 import os
-try:
-    import google.generativeai as genai
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
 from services.investigation import (
     create_accident,
     get_accidents,
@@ -28,17 +23,13 @@ from services.investigation import (
     get_commission_actions,
     update_commission_action,
     delete_commission_action,
-    get_root_node,
     create_root_node,
     add_fault_tree_node,
-    get_tree_nodes,
     update_node_status,
     update_node_label,
     link_nbr_standard_to_node,
-    get_nbr_standards,
-    get_validated_nodes,
     update_accident_status,
-    build_fault_tree_json,
+    get_tree_snapshot,
     get_involved_people,
     upsert_involved_people,
     get_sites,
@@ -51,12 +42,24 @@ from services.investigation import (
 )
 from auth.auth_utils import require_login
 
-# Verifica disponibilidade do graphviz
-try:
-    import graphviz
-    GRAPHVIZ_AVAILABLE = True
-except ImportError:
-    GRAPHVIZ_AVAILABLE = False
+def _module_available(name: str) -> bool:
+    """Verifica se um módulo está instalado sem importá-lo"""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+# SDK do Gemini e graphviz são pesados: aqui só verificamos se estão instalados;
+# a importação acontece quando a IA é usada ou a árvore é desenhada
+GEMINI_AVAILABLE = _module_available("google.generativeai")
+GRAPHVIZ_AVAILABLE = _module_available("graphviz")
+
+
+def _load_genai():
+    """Importa o SDK do Google Gemini na primeira vez que a IA é usada"""
+    import google.generativeai as genai
+    return genai
 
 
 def render_progress_bar(current_step: int, total_steps: int = 4):
@@ -111,259 +114,19 @@ def render_progress_bar(current_step: int, total_steps: int = 4):
 
 def render_fault_tree_html(tree_json: Dict[str, Any]) -> str:
     """Renderiza a árvore de falhas no padrão FTA (Fault Tree Analysis) - idêntico ao diagrama"""
-    if not tree_json:
-        return ""
-    
-    import html
-    
-    # Contadores para numeração automática
-    hypothesis_counter = 0
-    basic_cause_counter = 0
-    contributing_cause_counter = 0
-    
-    def get_node_number(node_type: str, status: str, has_children: bool, is_basic_cause: bool = False, is_contributing_cause: bool = False) -> str:
-        """Retorna o número do nó (H1, H2, CB1, CB2, CC1, CC2, etc.)"""
-        nonlocal hypothesis_counter, basic_cause_counter, contributing_cause_counter
-        
-        # Root NUNCA tem numeração
-        if node_type == 'root':
-            return ""
-        
-        # Causa básica: marcada manualmente pelo usuário (is_basic_cause = True)
-        if is_basic_cause:
-            basic_cause_counter += 1
-            return f"CB{basic_cause_counter}"
-        # Causa contribuinte: marcada manualmente pelo usuário (is_contributing_cause = True)
-        elif is_contributing_cause:
-            contributing_cause_counter += 1
-            return f"CC{contributing_cause_counter}"
-        # Hipótese: qualquer hypothesis (pendente ou descartada)
-        elif node_type == 'hypothesis':
-            hypothesis_counter += 1
-            return f"H{hypothesis_counter}"
-        # Fact com filhos: trata como hipótese
-        elif node_type == 'fact' and has_children:
-            hypothesis_counter += 1
-            return f"H{hypothesis_counter}"
-        # Causa intermediária validada (não root): também pode ter numeração H
-        elif status == 'validated' and has_children and node_type != 'root':
-            hypothesis_counter += 1
-            return f"H{hypothesis_counter}"
-        # Status pending ou discarded (mas não root)
-        elif status in ['pending', 'discarded'] and node_type != 'root':
-            hypothesis_counter += 1
-            return f"H{hypothesis_counter}"
-        # Sem numeração
-        return ""
-    
-    def get_node_shape(node_type: str, status: str, has_children: bool, is_basic_cause: bool = False, is_contributing_cause: bool = False) -> Dict[str, str]:
-        """Retorna a forma e cor do nó baseado no tipo e status"""
-        # Causa básica: marcada manualmente pelo usuário (is_basic_cause = True) - Oval verde
-        if is_basic_cause:
-            return {
-                'shape': 'oval',
-                'bg_color': '#c8e6c9',  # Verde claro
-                'border_color': '#4caf50',
-                'text_color': '#000000',
-                'border_radius': '50px'
-            }
-        # Causa contribuinte: marcada manualmente pelo usuário (is_contributing_cause = True) - Oval azul
-        elif is_contributing_cause:
-            return {
-                'shape': 'oval',
-                'bg_color': '#bbdefb',  # Azul claro
-                'border_color': '#2196f3',
-                'text_color': '#000000',
-                'border_radius': '50px'
-            }
-        # Root: Retângulo arredondado vermelho
-        elif node_type == 'root':
-            return {
-                'shape': 'rounded-rect',
-                'bg_color': '#ffcdd2',  # Vermelho claro
-                'border_color': '#f44336',
-                'text_color': '#000000',
-                'border_radius': '10px'
-            }
-        # Causa intermediária validada: Retângulo arredondado amarelo
-        elif status == 'validated' and has_children:
-            return {
-                'shape': 'rounded-rect',
-                'bg_color': '#fff9c4',  # Amarelo claro
-                'border_color': '#f9a825',
-                'text_color': '#000000',
-                'border_radius': '10px'
-            }
-        # Hipótese descartada: Losango vermelho com X
-        elif status == 'discarded':
-            return {
-                'shape': 'diamond',
-                'bg_color': '#ffcdd2',  # Vermelho claro
-                'border_color': '#f44336',
-                'text_color': '#000000',
-                'border_radius': '0px'
-            }
-        # Hipótese pendente: Losango
-        else:
-            return {
-                'shape': 'diamond',
-                'bg_color': '#e0e0e0',  # Cinza claro
-                'border_color': '#757575',
-                'text_color': '#000000',
-                'border_radius': '0px'
-            }
-    
-    def render_node(node: Dict[str, Any], level: int = 0) -> str:
-        """Renderiza um nó recursivamente no formato FTA"""
-        status = node.get('status', 'pending')
-        node_type = node.get('type', 'hypothesis')
-        label = node.get('label', '')
-        nbr_code = node.get('nbr_code')
-        is_basic_cause = node.get('is_basic_cause', False)  # Campo para marcar manualmente como causa básica
-        is_contributing_cause = node.get('is_contributing_cause', False)  # Campo para marcar manualmente como causa contribuinte
-        children = node.get('children', [])
-        has_children = len(children) > 0
-        
-        # Obtém número do nó
-        node_number = get_node_number(node_type, status, has_children, is_basic_cause, is_contributing_cause)
-        
-        # Obtém forma e cores
-        shape_config = get_node_shape(node_type, status, has_children, is_basic_cause, is_contributing_cause)
-        
-        # Escapa HTML
-        label_escaped = html.escape(label).replace('\n', '<br>')
-        
-        # Determina forma CSS (tamanhos otimizados para A4 paisagem)
-        if shape_config['shape'] == 'diamond':
-            # Losango: usa div externa para dimensões e interna para conteúdo
-            shape_style = "width: 140px; height: 140px; position: relative;"
-            inner_style = f"position: absolute; top: 0; left: 0; width: 100%; height: 100%; clip-path: polygon(50% 0%, 100% 50%, 50% 100%, 0% 50%); background-color: {shape_config['bg_color']}; border: 2px solid {shape_config['border_color']}; box-shadow: 0 2px 6px rgba(0,0,0,0.15);"
-            content_container = "position: absolute; top: 50%; left: 50%; transform: translate(-50%, -50%); width: 70%; text-align: center; z-index: 2;"
-        elif shape_config['shape'] == 'oval':
-            shape_style = "border-radius: 50%; width: 130px; min-height: 50px; display: flex; align-items: center; justify-content: center; padding: 8px 12px; position: relative;"
-            inner_style = ""
-            content_container = "z-index: 2; position: relative;"
-        else:
-            shape_style = f"border-radius: {shape_config['border_radius']}; width: 160px; min-height: 50px; display: flex; align-items: center; justify-content: center; padding: 8px 12px; position: relative;"
-            inner_style = ""
-            content_container = "z-index: 2; position: relative;"
-        
-        # Estilo base do nó (wrapper)
-        if shape_config['shape'] == 'diamond':
-            node_style = f"{shape_style}"
-            node_bg_border = inner_style
-        else:
-            node_style = f"{shape_style} background-color: {shape_config['bg_color']}; border: 2px solid {shape_config['border_color']}; box-shadow: 0 2px 6px rgba(0,0,0,0.15);"
-            node_bg_border = ""
-        
-        # Número do nó
-        number_html = ""
-        if node_number:
-            number_html = f'<div style="position: absolute; top: -8px; left: -8px; background-color: {shape_config["border_color"]}; color: white; width: 22px; height: 22px; border-radius: 50%; display: flex; align-items: center; justify-content: center; font-weight: bold; font-size: 0.65em; box-shadow: 0 2px 4px rgba(0,0,0,0.3); z-index: 10;">{node_number}</div>'
-        
-        # X para descartado
-        discard_x = ""
-        if status == 'discarded':
-            discard_x = '<div style="position: absolute; top: 50%; left: 50%; transform: translate(-50%, -50%); font-size: 2em; color: #d32f2f; font-weight: bold; pointer-events: none; z-index: 5; text-shadow: 1px 1px 3px rgba(255,255,255,0.9);">✕</div>'
-        
-        # Código NBR
-        nbr_html = ""
-        if nbr_code:
-            nbr_code_escaped = html.escape(str(nbr_code))
-            nbr_html = f'<div style="margin-top: 3px; font-size: 0.6em; color: #1976d2; font-weight: 600;">NBR: {nbr_code_escaped}</div>'
-        
-        # Container do conteúdo do nó
-        content_html = f'<div style="{content_container}"><div style="color: {shape_config["text_color"]}; font-weight: 500; font-size: 0.7em; line-height: 1.15; word-wrap: break-word;">{label_escaped}{nbr_html}</div></div>'
-        
-        # Monta o nó completo
-        if shape_config['shape'] == 'diamond':
-            node_html_inner = f'<div style="{node_style} margin: 6px;">{number_html}<div style="{node_bg_border}"></div>{discard_x}{content_html}</div>'
-        else:
-            node_html_inner = f'<div style="{node_style} margin: 6px;">{number_html}{discard_x}{content_html}</div>'
-        
-        # Renderiza filhos
-        children_html = ""
-        if children:
-            children_items = [render_node(child, level + 1) for child in children]
-            children_html = "".join(children_items)
-            
-            # Container dos filhos com linhas conectivas (otimizado para A4 paisagem)
-            children_html = f'<div style="position: relative; margin-top: 12px;"><div style="position: absolute; left: 50%; top: 0; width: 2px; height: 12px; background-color: #2196f3; transform: translateX(-50%);"></div><div style="position: absolute; left: 0; right: 0; top: 12px; height: 2px; background-color: #2196f3;"></div><div style="display: flex; flex-wrap: wrap; justify-content: center; align-items: flex-start; gap: 12px; padding-top: 25px;">{children_html}</div></div>'
-        
-        # Linha conectora ao pai
-        connector = ""
-        if level > 0:
-            connector = '<div style="position: absolute; left: 50%; top: -12px; width: 2px; height: 12px; background-color: #2196f3; transform: translateX(-50%);"></div>'
-        
-        # HTML completo do nó
-        return f'<div style="position: relative; display: inline-flex; flex-direction: column; align-items: center;">{connector}{node_html_inner}{children_html}</div>'
-    
-    # Renderiza a árvore completa
-    tree_html = render_node(tree_json, level=0)
-    
-    # Legenda (otimizada para A4 paisagem)
-    legend_html = '<div style="position: absolute; top: 8px; right: 8px; background: white; border: 2px solid #333; padding: 8px; border-radius: 4px; font-size: 0.7em; z-index: 1000; box-shadow: 0 2px 6px rgba(0,0,0,0.2); max-width: 180px;"><div style="font-weight: bold; margin-bottom: 6px; border-bottom: 1px solid #ccc; padding-bottom: 4px; font-size: 0.9em;">LEGENDA</div><div style="margin-bottom: 4px;"><strong>H:</strong> Hipótese</div><div style="margin-bottom: 4px;"><strong>CB:</strong> Causa Básica</div><div style="margin-bottom: 4px;"><strong>CC:</strong> Causa Contribuinte</div><div style="margin-bottom: 4px; display: flex; align-items: center; gap: 6px;"><div style="width: 14px; height: 14px; background: #ffcdd2; border: 2px solid #f44336; border-radius: 3px;"></div><span>Evento Topo</span></div><div style="margin-bottom: 4px; display: flex; align-items: center; gap: 6px;"><div style="width: 14px; height: 14px; clip-path: polygon(50% 0%, 100% 50%, 50% 100%, 0% 50%); background: #e0e0e0; border: 2px solid #757575;"></div><span>Hipótese</span></div><div style="margin-bottom: 4px; display: flex; align-items: center; gap: 6px;"><div style="width: 14px; height: 14px; clip-path: polygon(50% 0%, 100% 50%, 50% 100%, 0% 50%); background: #ffcdd2; border: 2px solid #f44336; position: relative;"><span style="position: absolute; top: 50%; left: 50%; transform: translate(-50%, -50%); color: #d32f2f; font-size: 10px;">✕</span></div><span>Descartada</span></div><div style="margin-bottom: 4px; display: flex; align-items: center; gap: 6px;"><div style="width: 14px; height: 14px; background: #fff9c4; border: 2px solid #f9a825; border-radius: 3px;"></div><span>Intermediária</span></div><div style="margin-bottom: 4px; display: flex; align-items: center; gap: 6px;"><div style="width: 14px; height: 14px; background: #c8e6c9; border: 2px solid #4caf50; border-radius: 50%;"></div><span>Causa Básica</span></div><div style="display: flex; align-items: center; gap: 6px;"><div style="width: 14px; height: 14px; background: #bbdefb; border: 2px solid #2196f3; border-radius: 50%;"></div><span>Causa Contribuinte</span></div></div>'
-    
-    # HTML completo (otimizado para A4 paisagem)
-    from datetime import date
-    return f'<div style="position: relative; font-family: Arial, sans-serif; padding: 15px 10px; background: white; min-height: 250px; overflow-x: auto; border: 1px solid #e0e0e0; border-radius: 8px;"><div style="text-align: center; margin-bottom: 15px;"><h2 style="margin: 0; color: #333; font-size: 1.2em; font-weight: bold;">ÁRVORE DE FALHAS (FTA)</h2><div style="color: #666; font-size: 0.8em; margin-top: 3px;">{date.today().strftime("%d/%m/%Y")}</div></div>{legend_html}<div style="display: flex; justify-content: center; align-items: flex-start; min-height: 180px; padding: 10px 0;">{tree_html}</div></div>'
+    from services.fault_tree_html import render_fault_tree
+    return render_fault_tree(tree_json, theme='screen')
 
 
-def render_fault_tree_graph_from_json(tree_json: Dict[str, Any]):
-    """Renderiza a árvore de falhas usando graphviz a partir do JSON hierárquico"""
+def render_fault_tree_graph_from_json(tree_json: Dict[str, Any], fmt: str = 'svg') -> Optional[bytes]:
+    """Renderiza a árvore de falhas usando graphviz a partir do JSON hierárquico (SVG/PNG em cache)"""
     if not GRAPHVIZ_AVAILABLE:
         return None
     if not tree_json:
         return None
     
-    import graphviz
-    dot = graphviz.Digraph(comment='Fault Tree Analysis')
-    dot.attr(rankdir='TB')
-    dot.attr('node', shape='box', style='rounded')
-    
-    # Cores baseadas no status (semáforo)
-    color_map = {
-        'validated': '#28a745',  # Verde - Confirmado
-        'discarded': '#dc3545',  # Vermelho - Descartado
-        'pending': '#6c757d'     # Cinza - Em análise
-    }
-    
-    def add_node_recursive(node_json: Dict[str, Any]):
-        """Função recursiva para adicionar nós e arestas ao gráfico"""
-        node_id = node_json['id']
-        label = node_json['label'][:50] + '...' if len(node_json['label']) > 50 else node_json['label']
-        status = node_json['status']
-        node_type = node_json['type']
-        nbr_code = node_json.get('nbr_code')
-        
-        # Define cor e estilo baseado no status
-        color = color_map.get(status, '#6c757d')
-        style = 'filled'
-        if status == 'discarded':
-            style = 'filled,strikethrough'
-        
-        # Label com tipo e código NBR (se existir)
-        display_label = f"{label}\n[{node_type}]"
-        if nbr_code:
-            display_label += f"\nNBR: {nbr_code}"
-        if status == 'discarded':
-            display_label = f"~~{label}~~\n[{node_type}] - DESCARTADO"
-        
-        # Adiciona nó ao gráfico
-        font_color = 'white' if status != 'pending' else 'black'
-        dot.node(node_id, display_label, fillcolor=color, style=style, fontcolor=font_color)
-        
-        # Processa filhos recursivamente
-        for child in node_json.get('children', []):
-            # Adiciona aresta do pai para o filho
-            dot.edge(node_id, child['id'])
-            # Processa o filho recursivamente
-            add_node_recursive(child)
-    
-    # Inicia recursão a partir do nó raiz
-    add_node_recursive(tree_json)
-    
-    return dot
+    from services.fault_tree_graph import render_fault_tree_graph
+    return render_fault_tree_graph(tree_json, fmt)
 
 
 def main():
@@ -1894,7 +1657,7 @@ def main():
                             # Salva pessoas envolvidas (incluindo comissão)
                             all_people = drivers + injured + witnesses + commission
                             logger.info(f"[INVESTIGATION] Total de pessoas para salvar: {len(all_people)}")
-                            logger.info(f"[INVESTIGATION] Tipos: {[p.get('person_type') for p in all_people]}")
+                            logger.debug(f"[INVESTIGATION] Tipos: {[p.get('person_type') for p in all_people]}")
                             
                             if all_people:
                                 people_success = upsert_involved_people(accident_id, all_people)
@@ -2007,6 +1770,7 @@ def main():
                                     except Exception as e:
                                         # Se falhar, tenta baixar via HTTP
                                         try:
+                                            import requests
                                             response = requests.get(image_url, timeout=10)
                                             if response.status_code == 200:
                                                 st.image(
@@ -2307,8 +2071,11 @@ def main():
         st.header("🌳 Passo 3: Árvore de Porquês")
         st.markdown("**Por que aconteceu?** Identifique todas as causas possíveis usando a metodologia de árvore de falhas.")
         
+        # Snapshot da árvore: nós, JSON e padrões NBR buscados uma vez por versão
+        tree = get_tree_snapshot(accident_id)
+        
         # Verifica/cria nó raiz automaticamente
-        root_node = get_root_node(accident_id)
+        root_node = tree.root_node
         if not root_node:
             root_label = investigation.get('title', 'Evento Principal')
             root_id = create_root_node(accident_id, root_label)
@@ -2317,7 +2084,7 @@ def main():
                 st.rerun()
         
         # Constrói JSON hierárquico
-        tree_json = build_fault_tree_json(accident_id)
+        tree_json = tree.tree_json
         
         # Visualização da árvore
         st.markdown("### 🌳 Estrutura da Árvore de Causas")
@@ -2349,6 +2116,22 @@ def main():
                     </div>
                 </div>
                 """, unsafe_allow_html=True)
+                
+                # Diagrama graphviz: layout feito no servidor e reaproveitado enquanto a árvore não mudar
+                if GRAPHVIZ_AVAILABLE:
+                    with st.expander("🕸️ Diagrama Graphviz"):
+                        tree_svg = render_fault_tree_graph_from_json(tree_json, 'svg')
+                        if tree_svg:
+                            st.image(tree_svg.decode('utf-8'), width='stretch')
+                            st.download_button(
+                                "📥 Baixar diagrama (SVG)",
+                                data=tree_svg,
+                                file_name=f"arvore_falhas_{accident_id}.svg",
+                                mime="image/svg+xml",
+                                key=f"download_tree_svg_{accident_id}"
+                            )
+                        else:
+                            st.info("ℹ️ Não foi possível gerar o diagrama (graphviz/dot indisponível no servidor).")
             else:
                 st.warning("⚠️ Erro ao renderizar árvore")
         else:
@@ -2361,7 +2144,7 @@ def main():
         st.markdown("**Pergunta:** Por que isso aconteceu?")
         
         # Busca nós para seleção
-        nodes = get_tree_nodes(accident_id)
+        nodes = tree.nodes
         
         if nodes:
             # Seleção do evento/causa pai (terminologia natural)
@@ -2453,7 +2236,7 @@ def main():
         
         if hypothesis_nodes:
             # Constrói a árvore JSON para calcular números corretamente
-            tree_json = build_fault_tree_json(accident_id)
+            tree_json = tree.tree_json
             
             # Função para calcular números dos nós (mesma lógica da árvore)
             node_number_map = {}  # Mapeia node_id -> número (H1, H2, CB1, etc.)
@@ -2617,6 +2400,7 @@ Retorne APENAS o texto da descrição melhorada, sem explicações adicionais.""
                                         try:
                                             api_key = os.getenv('GOOGLE_AI_API_KEY') or st.secrets.get('general', {}).get('GOOGLE_AI_API_KEY', None)
                                             if api_key:
+                                                genai = _load_genai()
                                                 genai.configure(api_key=api_key)
                                                 # Usa gemini-3-flash-preview ou gemini-2.5-flash como fallback
                                                 try:
@@ -2745,6 +2529,7 @@ Retorne APENAS o texto da descrição melhorada, sem explicações adicionais.""
                                 except Exception as e:
                                     # Se falhar, tenta baixar via HTTP
                                     try:
+                                        import requests
                                         response = requests.get(justification_image_url, timeout=10)
                                         if response.status_code == 200:
                                             st.image(
@@ -2885,6 +2670,7 @@ Use a justificativa acima como base e contexto. Se ela existir, melhore-a. Se n
                                             if not api_key:
                                                 error_msg = "Chave da API do Google Gemini não configurada. Configure GOOGLE_AI_API_KEY nas variáveis de ambiente ou secrets."
                                             else:
+                                                genai = _load_genai()
                                                 genai.configure(api_key=api_key)
                                                 # Usa gemini-3-flash-preview ou gemini-2.5-flash como fallback
                                                 try:
@@ -3118,7 +2904,7 @@ Com base nas evidências coletadas e na análise realizada, esta hipótese foi *
                     st.warning("⚠️ **Atenção:** Ao excluir esta hipótese, todos os nós filhos também serão excluídos permanentemente. Esta ação não pode ser desfeita.")
                     
                     # Verifica se o nó tem filhos
-                    tree_json = build_fault_tree_json(accident_id)
+                    tree_json = tree.tree_json
                     has_children = False
                     if tree_json:
                         def check_children(node_data: Dict[str, Any], target_id: str) -> bool:
@@ -3219,11 +3005,13 @@ Com base nas evidências coletadas e na análise realizada, esta hipótese foi *
         st.header("📋 Passo 4: Classificação Oficial (NBR 14280)")
         st.markdown("**O que falhou na norma?** Classifique as causas confirmadas conforme os padrões NBR 14280.")
         
+        tree = get_tree_snapshot(accident_id)
+        
         # Busca todos os padrões NBR
-        nbr_standards_list = get_nbr_standards()
+        nbr_standards_list = tree.nbr_standards
         
         # Busca causas básicas e contribuintes (validadas E marcadas)
-        nodes = get_tree_nodes(accident_id)
+        nodes = tree.nodes
         basic_cause_nodes = [n for n in nodes if n['status'] == 'validated' and n.get('is_basic_cause', False) == True]
         contributing_cause_nodes = [n for n in nodes if n['status'] == 'validated' and n.get('is_contributing_cause', False) == True]
         
@@ -3416,6 +3204,7 @@ Use a justificativa acima para entender melhor a causa e gerar recomendações m
                                             if not api_key:
                                                 error_msg = "Chave da API do Google Gemini não configurada. Configure GOOGLE_AI_API_KEY nas variáveis de ambiente ou secrets."
                                             else:
+                                                genai = _load_genai()
                                                 genai.configure(api_key=api_key)
                                                 # Usa gemini-3-flash-preview ou gemini-2.5-flash como fallback
                                                 try:
@@ -3693,6 +3482,7 @@ Use a justificativa acima para entender melhor a causa e gerar recomendações m
                                             if not api_key:
                                                 error_msg = "Chave da API do Google Gemini não configurada. Configure GOOGLE_AI_API_KEY nas variáveis de ambiente ou secrets."
                                             else:
+                                                genai = _load_genai()
                                                 genai.configure(api_key=api_key)
                                                 # Usa gemini-3-flash-preview ou gemini-2.5-flash como fallback
                                                 try:
@@ -3836,7 +3626,8 @@ Esta recomendação deve ser revisada e complementada com ações específicas b
                         timeline_events = get_timeline(accident_id)
                         
                         # 4. Busca causas validadas com códigos NBR
-                        validated_nodes = get_validated_nodes(accident_id)
+                        tree = get_tree_snapshot(accident_id)
+                        validated_nodes = tree.validated_nodes
                         verified_causes = []
                         
                         # Processa nós validados (já vem com join de nbr_standards)
@@ -3926,7 +3717,7 @@ Esta recomendação deve ser revisada e complementada com ações específicas b
                         evidence_images = evidence_images_cached
                         
                         # 6. Busca JSON da árvore para gerar imagem
-                        tree_json = build_fault_tree_json(accident_id)
+                        tree_json = tree.tree_json
                         
                         # 6.3. Pré-carrega imagens de justificativa das hipóteses
                         if tree_json:
@@ -4043,7 +3834,8 @@ Esta recomendação deve ser revisada e complementada com ações específicas b
                         timeline_events = get_timeline(accident_id)
                         
                         # 4. Busca causas validadas com códigos NBR
-                        validated_nodes = get_validated_nodes(accident_id)
+                        tree = get_tree_snapshot(accident_id)
+                        validated_nodes = tree.validated_nodes
                         verified_causes = []
                         
                         # Processa nós validados (já vem com join de nbr_standards)
@@ -4071,7 +3863,7 @@ Esta recomendação deve ser revisada e complementada com ações específicas b
                         evidence_images = [e.get('image_url', '') for e in evidence_list if e.get('image_url')]
                         
                         # 6. Busca JSON da árvore
-                        tree_json = build_fault_tree_json(accident_id)
+                        tree_json = tree.tree_json
                         
                         # 7. Busca ações da comissão
                         commission_actions = get_commission_actions(accident_id)
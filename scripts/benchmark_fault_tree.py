@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Benchmark da montagem da árvore de falhas (build_fault_tree_json)
+
+Compara a implementação anterior (filhos buscados com uma varredura completa
+por nó, O(N²), e construção recursiva) com services.fault_tree.assemble_fault_tree
+usando árvores sintéticas.
+
+Uso:
+    python scripts/benchmark_fault_tree.py
+    python scripts/benchmark_fault_tree.py --sizes 10000 100000 --legacy-max 10000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.fault_tree import assemble_fault_tree, node_to_json, subtree_delete_batches  # noqa: E402
+
+
+def legacy_assemble(nodes, nbr_standards_map):
+    """Reprodução do algoritmo anterior: varredura completa da lista para cada nó"""
+    nodes_dict = {node['id']: node for node in nodes}
+    root_node = next((n for n in nodes if n.get('parent_id') is None), None)
+    if not root_node:
+        return None
+
+    def build_node_json(node_id):
+        node = nodes_dict.get(node_id)
+        node_json = node_to_json(node, nbr_standards_map)
+        children = [n for n in nodes if n.get('parent_id') == node_id]
+        children.sort(key=lambda x: (x.get('display_order', 0) or 0, x.get('created_at', '') or ''))
+        for child in children:
+            node_json["children"].append(build_node_json(child['id']))
+        return node_json
+
+    return build_node_json(root_node['id'])
+
+
+def make_tree(size, max_children=6, seed=42):
+    """Gera uma árvore sintética com `size` nós e ramificação aleatória"""
+    rng = random.Random(seed)
+    nodes = [{
+        "id": "n0", "parent_id": None, "label": "Evento topo", "type": "root",
+        "status": "pending", "display_order": 1, "created_at": "2024-01-01T00:00:00",
+    }]
+    open_parents = ["n0"]
+    child_counts = {"n0": 0}
+    for i in range(1, size):
+        parent = rng.choice(open_parents)
+        child_counts[parent] += 1
+        if child_counts[parent] >= max_children:
+            open_parents.remove(parent)
+        node_id = f"n{i}"
+        nodes.append({
+            "id": node_id, "parent_id": parent, "label": f"Hipótese {i}",
+            "type": rng.choice(["fact", "hypothesis"]),
+            "status": rng.choice(["pending", "validated", "discarded"]),
+            "display_order": rng.randint(1, 10), "created_at": f"2024-01-01T00:{i % 60:02d}:00",
+            "nbr_standard_id": rng.choice([None, 1, 2]),
+        })
+        open_parents.append(node_id)
+        child_counts[node_id] = 0
+    rng.shuffle(nodes)
+    return nodes
+
+
+def make_chain(size):
+    """Gera uma árvore degenerada (cadeia) com profundidade `size`"""
+    return [{
+        "id": f"c{i}", "parent_id": f"c{i - 1}" if i else None, "label": f"Nível {i}",
+        "type": "hypothesis" if i else "root", "status": "pending",
+    } for i in range(size)]
+
+
+def count_nodes(tree):
+    total, stack = 0, [tree]
+    while stack:
+        node = stack.pop()
+        total += 1
+        stack.extend(node["children"])
+    return total
+
+
+def check_delete_order(nodes, node_id, batch_size=200):
+    """Simula os DELETEs em lote com a FK parent_id sem cascade (nenhum pai antes dos filhos)"""
+    parent_of = {node["id"]: node.get("parent_id") for node in nodes}
+    remaining = set(parent_of)
+    batches = subtree_delete_batches(nodes, node_id, batch_size)
+    for batch in batches:
+        remaining.difference_update(batch)
+        orphans = [i for i in remaining if parent_of[i] is not None and parent_of[i] not in remaining]
+        assert not orphans, f"violação de FK: {len(orphans)} nó(s) ficariam sem pai"
+    return sum(len(batch) for batch in batches), len(batches)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--legacy-max", type=int, default=10_000,
+                        help="Maior tamanho em que a versão O(N²) é executada (acima disso é estimada)")
+    args = parser.parse_args()
+
+    nbr_map = {1: {"code": "NBR 14280", "description": "Cadastro de acidente"},
+               2: {"code": "NR-12", "description": "Máquinas"}}
+    legacy_rate = None
+
+    print(f"{'nós':>10} | {'anterior (s)':>14} | {'novo (s)':>10} | {'ganho':>8}")
+    print("-" * 52)
+    for size in args.sizes:
+        nodes = make_tree(size)
+        new_tree, new_time = timed(assemble_fault_tree, nodes, nbr_map)
+        assert count_nodes(new_tree) == size
+
+        if size <= args.legacy_max:
+            old_tree, old_time = timed(legacy_assemble, nodes, nbr_map)
+            assert old_tree == new_tree, "resultado divergente da implementação anterior"
+            legacy_rate = old_time / (size * size)
+            old_label = f"{old_time:14.3f}"
+        elif legacy_rate is not None:
+            old_time = legacy_rate * size * size
+            old_label = f"~{old_time:13.1f}"
+        else:
+            old_time, old_label = None, f"{'-':>14}"
+
+        speedup = f"{old_time / new_time:7.0f}x" if old_time else f"{'-':>8}"
+        print(f"{size:>10} | {old_label} | {new_time:10.3f} | {speedup}")
+
+    depth = max(args.sizes)
+    chain_tree, chain_time = timed(assemble_fault_tree, make_chain(depth), nbr_map)
+    assert count_nodes(chain_tree) == depth
+    print(f"\nCadeia com profundidade {depth}: {chain_time:.3f}s "
+          f"(limite de recursão do Python: {sys.getrecursionlimit()})")
+    print("~ = estimado a partir do tempo O(N²) medido no maior tamanho executado")
+
+    # Exclusão de subárvores maiores que um lote (NODE_BATCH_SIZE = 200)
+    delete_tree = make_tree(1_000)
+    deleted, batches = check_delete_order(delete_tree, "n0")
+    assert deleted == 1_000 and batches == 5
+    deleted, batches = check_delete_order(make_chain(450), "c0")
+    assert deleted == 450 and batches == 3
+    print("Exclusão em lotes: descendentes sempre removidos antes dos ancestrais")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Benchmark do resumo de KPIs (generate_kpi_summary)
+
+Compara a implementação anterior (taxas por período com df.apply linha a linha,
+coerção no próprio DataFrame e duas ordenações) com a versão vetorizada de
+services.kpi, usando linhas sintéticas da kpi_monthly.
+
+Uso:
+    python scripts/benchmark_kpi_summary.py
+    python scripts/benchmark_kpi_summary.py --sizes 1000 10000 100000 --repeat 3
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.kpi import (  # noqa: E402
+    HOURS_SCALE,
+    analyze_accident_trends,
+    calculate_frequency_rate,
+    calculate_iso_compliance_metrics,
+    calculate_severity_rate,
+    generate_kpi_summary,
+)
+
+
+def legacy_generate_kpi_summary(df):
+    """Reprodução do cálculo anterior (sem interpretações, que não mudaram)"""
+    df['hours'] = pd.to_numeric(df['hours'], errors='coerce').fillna(0)
+    df['accidents_total'] = pd.to_numeric(df['accidents_total'], errors='coerce').fillna(0)
+    df['lost_days_total'] = pd.to_numeric(df['lost_days_total'], errors='coerce').fillna(0)
+
+    total_accidents = float(df['accidents_total'].sum())
+    total_lost_days = float(df['lost_days_total'].sum())
+    total_hours = float(df['hours'].sum())
+    total_fatalities = float(df.get('fatalities', pd.Series([0] * len(df))).sum())
+    total_debited_days = float(df.get('debited_days', pd.Series([0] * len(df))).sum()) + total_fatalities * 6000
+
+    freq_rate = calculate_frequency_rate(int(total_accidents), total_hours)
+    sev_rate = calculate_severity_rate(int(total_lost_days), total_hours, int(total_debited_days))
+
+    df_with_rates = df.copy()
+    df_with_rates['freq_rate_period'] = df_with_rates.apply(
+        lambda row: calculate_frequency_rate(row['accidents_total'], row['hours']) if row['hours'] > 0 else 0,
+        axis=1
+    )
+    df_with_rates['period_debited_days'] = df_with_rates.get('debited_days', 0) + (df_with_rates.get('fatalities', 0) * 6000)
+    df_with_rates['sev_rate_period'] = df_with_rates.apply(
+        lambda row: calculate_severity_rate(row['lost_days_total'], row['hours'], row['period_debited_days'])
+        if row['hours'] > 0 else 0,
+        axis=1
+    )
+
+    freq_change = sev_change = None
+    df_sorted = df_with_rates.sort_values('period')
+    latest_freq = df_sorted['freq_rate_period'].iloc[-1]
+    latest_sev = df_sorted['sev_rate_period'].iloc[-1]
+    prev_3_freq = df_sorted['freq_rate_period'].iloc[-4:-1].mean()
+    prev_3_sev = df_sorted['sev_rate_period'].iloc[-4:-1].mean()
+    if prev_3_freq > 0:
+        freq_change = (latest_freq - prev_3_freq) / prev_3_freq * 100
+    if prev_3_sev > 0:
+        sev_change = (latest_sev - prev_3_sev) / prev_3_sev * 100
+
+    return {
+        'frequency_rate': freq_rate,
+        'severity_rate': sev_rate,
+        'frequency_change': freq_change,
+        'severity_change': sev_change,
+        'total_hours': total_hours * HOURS_SCALE,
+        'iso_compliance_metrics': calculate_iso_compliance_metrics(df_with_rates),
+        'accident_trend_analysis': analyze_accident_trends(df_with_rates),
+    }
+
+
+def make_kpi_rows(size, seed=42):
+    """Gera `size` linhas da kpi_monthly (vários tenants, ordenadas por período)"""
+    rng = np.random.default_rng(seed)
+    months = pd.period_range("2000-01", periods=max(size // 50, 1), freq="M").strftime("%Y-%m-01")
+    periods = np.sort(rng.choice(months, size=size))
+    accidents = rng.poisson(2, size)
+    fatalities = rng.binomial(1, 0.01, size)
+    hours = rng.uniform(0, 500, size).round(2)
+    hours[rng.random(size) < 0.02] = 0  # meses sem horas
+    return pd.DataFrame({
+        "period": periods,
+        "created_by": rng.choice([f"user-{i}" for i in range(20)], size=size),
+        "accidents_total": accidents,
+        "fatalities": fatalities,
+        "lost_days_total": rng.poisson(5, size) * (accidents > 0),
+        "hours": hours,
+        "debited_days": np.zeros(size, dtype=int),
+    })
+
+
+def best_of(repeat, func, df):
+    best = math.inf
+    for _ in range(repeat):
+        frame = df.copy()
+        start = time.perf_counter()
+        result = func(frame)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def same_summary(old, new):
+    for key in ('frequency_rate', 'severity_rate', 'frequency_change', 'severity_change', 'total_hours'):
+        if old[key] is None or new[key] is None:
+            if old[key] is not new[key]:
+                return False
+        elif not math.isclose(old[key], new[key], rel_tol=1e-9, abs_tol=1e-9):
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3, help="Execuções por tamanho (usa o melhor tempo)")
+    args = parser.parse_args()
+
+    print(f"{'linhas':>10} | {'anterior (s)':>12} | {'novo (s)':>9} | {'ordenado (s)':>12} | {'ganho':>7}")
+    print("-" * 63)
+    for size in args.sizes:
+        df = make_kpi_rows(size)
+        old, old_time = best_of(args.repeat, legacy_generate_kpi_summary, df)
+        new, new_time = best_of(args.repeat, generate_kpi_summary, df)
+        _, sorted_time = best_of(args.repeat, lambda frame: generate_kpi_summary(frame, assume_sorted=True), df)
+        assert same_summary(old, new), "resultado divergente da implementação anterior"
+        print(f"{size:>10} | {old_time:12.3f} | {new_time:9.4f} | {sorted_time:12.4f} | {old_time / new_time:6.0f}x")
+
+
+if __name__ == "__main__":
+    main()
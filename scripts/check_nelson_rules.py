@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Verificação das regras de Nelson vetorizadas (services.spc.nelson_rules)
+
+Compara cada regra com uma implementação direta, ponto a ponto, sobre séries
+aleatórias, e confere os limites exatos de cada regra (ex.: 13 pontos
+alternando não disparam a regra 4; 14 disparam).
+
+Uso:
+    python scripts/check_nelson_rules.py
+    python scripts/check_nelson_rules.py --series 500 --length 120
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.spc import nelson_rules  # noqa: E402
+
+
+def naive_rules(x, center, sigma):
+    """Regras avaliadas com laços explícitos sobre a janela que termina em cada ponto"""
+    n = len(x)
+    z = [(x[i] - center) / sigma for i in range(n)]
+    rules = {rule: np.zeros(n, dtype=bool) for rule in range(1, 9)}
+
+    def window(i, size):
+        return range(i - size + 1, i + 1) if i - size + 1 >= 0 else None
+
+    for i in range(n):
+        rules[1][i] = abs(z[i]) > 3
+        w = window(i, 9)
+        if w:
+            rules[2][i] = all(z[j] > 0 for j in w) or all(z[j] < 0 for j in w)
+        w = window(i, 6)
+        if w:
+            steps = [x[j] - x[j - 1] for j in list(w)[1:]]
+            rules[3][i] = all(s > 0 for s in steps) or all(s < 0 for s in steps)
+        w = window(i, 14)
+        if w:
+            steps = [x[j] - x[j - 1] for j in list(w)[1:]]
+            rules[4][i] = all(steps[k] * steps[k - 1] < 0 for k in range(1, len(steps)))
+        w = [j for j in range(max(0, i - 2), i + 1)]
+        rules[5][i] = (z[i] > 2 and sum(z[j] > 2 for j in w) >= 2) or \
+            (z[i] < -2 and sum(z[j] < -2 for j in w) >= 2)
+        w = [j for j in range(max(0, i - 4), i + 1)]
+        rules[6][i] = (z[i] > 1 and sum(z[j] > 1 for j in w) >= 4) or \
+            (z[i] < -1 and sum(z[j] < -1 for j in w) >= 4)
+        w = window(i, 15)
+        if w:
+            rules[7][i] = all(abs(z[j]) < 1 for j in w)
+        w = window(i, 8)
+        if w:
+            rules[8][i] = all(abs(z[j]) > 1 for j in w)
+    return rules
+
+
+def zigzag(points):
+    """Série alternando em torno de zero dentro de 1σ (só a regra 4 pode disparar)"""
+    return np.array([0.5 if i % 2 else -0.5 for i in range(points)])
+
+
+def check_boundaries():
+    # Regra 4: 14 pontos seguidos alternando
+    assert not nelson_rules(zigzag(13), 0.0, 1.0)[4].any(), "13 pontos alternando não deveriam disparar"
+    rule_4 = nelson_rules(zigzag(14), 0.0, 1.0)[4]
+    assert rule_4.tolist() == [False] * 13 + [True], "14 pontos alternando deveriam disparar no último"
+
+    # Regra 3: 6 pontos seguidos crescendo
+    assert not nelson_rules(np.arange(5, dtype=float) * 0.1, 0.0, 1.0)[3].any()
+    assert nelson_rules(np.arange(6, dtype=float) * 0.1, 0.0, 1.0)[3][-1]
+
+    # Regra 2: 9 pontos do mesmo lado
+    assert not nelson_rules(np.full(8, 0.5), 0.0, 1.0)[2].any()
+    assert nelson_rules(np.full(9, 0.5), 0.0, 1.0)[2][-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--series", type=int, default=200)
+    parser.add_argument("--length", type=int, default=80)
+    args = parser.parse_args()
+
+    check_boundaries()
+    print("ok  limites das regras 2, 3 e 4")
+
+    rng = np.random.default_rng(42)
+    for k in range(args.series):
+        # Mistura ruído, tendências e zigue-zagues para exercitar todas as regras
+        x = rng.normal(0, 1, args.length)
+        if k % 3 == 1:
+            x += np.linspace(-2, 2, args.length)
+        if k % 3 == 2:
+            x = np.where(np.arange(args.length) % 2, 1, -1) * rng.uniform(0.1, 1.5, args.length)
+        expected = naive_rules(x, 0.0, 1.0)
+        actual = nelson_rules(x, 0.0, 1.0)
+        for rule in range(1, 9):
+            assert np.array_equal(expected[rule], actual[rule]), f"regra {rule} divergente na série {k}"
+    print(f"ok  {args.series} séries aleatórias iguais à implementação ponto a ponto (regras 1-8)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Verificação do cálculo de dias trabalhados até o acidente (services.work_days)
+
+Roda compute_work_days sobre fontes sintéticas, sem banco, e confere a ordem de
+prioridade dos critérios, inclusive quando uma fonte vem vazia (falha de
+permissão/tabela ou criadores identificados só por e-mail).
+
+Uso:
+    python scripts/check_work_days.py
+"""
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.work_days import compute_work_days  # noqa: E402
+
+
+def empty_sources():
+    """Todas as fontes vazias, como quando cada busca falha"""
+    return {
+        'employees': pd.DataFrame(columns=["id", "email", "admission_date", "user_id"]),
+        'profiles': pd.DataFrame(columns=["id", "email", "created_at"]),
+        'hours': pd.DataFrame(columns=["year", "month", "hours", "created_by"]),
+        'first_accidents': pd.DataFrame(columns=["occurred_at", "created_by"]),
+    }
+
+
+def check_all_sources_failed():
+    accidents = pd.DataFrame({
+        'accident_date': ['2025-03-10', '2025-04-01'],
+        'created_by': ['u1', ''],
+    })
+    result = compute_work_days(accidents, empty_sources())
+    assert result.tolist() == [0, 0], result.tolist()
+
+
+def check_creators_are_emails():
+    # Criadores só por e-mail: não há acidentes por UUID a buscar e o critério 3
+    # recebe uma fonte vazia; o perfil (created_at) ainda resolve o primeiro acidente
+    accidents = pd.DataFrame({
+        'accident_date': ['2025-03-10', '2025-04-01', '2025-05-01'],
+        'created_by': ['ana@example.com', 'bruno@example.com', ''],
+    })
+    sources = empty_sources()
+    sources['profiles'] = pd.DataFrame({
+        'id': ['p1'], 'email': ['ana@example.com'], 'created_at': ['2025-03-01T12:00:00+00:00'],
+    })
+    result = compute_work_days(accidents, sources)
+    assert result.tolist() == [9, 0, 0], result.tolist()
+
+
+def check_first_accident_fallback():
+    accidents = pd.DataFrame({
+        'accident_date': ['2025-01-05', '2025-02-04', '2025-02-04'],
+        'created_by': ['u1', 'u1', 'sem-registro'],
+    })
+    sources = empty_sources()
+    sources['first_accidents'] = pd.DataFrame({
+        'occurred_at': ['2025-01-05', '2025-02-04'], 'created_by': ['u1', 'u1'],
+    })
+    result = compute_work_days(accidents, sources)
+    assert result.tolist() == [0, 30, 0], result.tolist()
+
+
+def check_hours_then_admission():
+    accidents = pd.DataFrame({
+        'accident_date': ['2025-03-15', '2025-03-15'],
+        'created_by': ['u1', 'u1'],
+        'employee_id': ['e1', 'e2'],
+    })
+    sources = empty_sources()
+    sources['employees'] = pd.DataFrame({
+        'id': ['e1', 'e2'], 'email': [None, None],
+        'admission_date': ['2024-03-15', '2025-03-05'], 'user_id': [None, None],
+    })
+    # 0,8 centenas de horas por mês = 10 dias; e2 é limitado aos 10 dias desde a admissão
+    sources['hours'] = pd.DataFrame({
+        'year': [2025, 2025, 2025, 2025], 'month': [1, 2, 1, 3],
+        'hours': [0.8, 0.8, 4.0, 4.0], 'created_by': ['e1', 'e1', 'e2', 'e2'],
+    })
+    result = compute_work_days(accidents, sources)
+    assert result.tolist() == [20, 10], result.tolist()
+
+
+def main():
+    checks = [
+        check_all_sources_failed,
+        check_creators_are_emails,
+        check_first_accident_fallback,
+        check_hours_then_admission,
+    ]
+    for check in checks:
+        check()
+        print(f"ok  {check.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Perfil do tempo de importação na inicialização (python -X importtime)
+
+Importa cada alvo em um interpretador novo, soma os tempos reportados pelo
+-X importtime e lista os módulos mais caros. Também acusa dependências pesadas
+(weasyprint, docx, graphviz, scipy, PIL, Gemini) carregadas na inicialização:
+elas devem ser importadas apenas quando o recurso correspondente é usado.
+
+Alvos podem ser módulos (services.kpi) ou arquivos de página (pages/2_Acidentes.py);
+páginas são executadas com runpy fora do `streamlit run`, então o tempo inclui
+apenas o que é importado/executado no nível do módulo até o primeiro erro de UI.
+
+Uso:
+    python scripts/profile_imports.py
+    python scripts/profile_imports.py services.kpi utils.report_generator --top 15
+    python scripts/profile_imports.py --output baseline.json
+    python scripts/profile_imports.py --baseline baseline.json --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_TARGETS = [
+    "services.kpi",
+    "services.list_queries",
+    "services.work_days",
+    "services.user_logs",
+    "components.filters",
+    "utils.report_generator",
+]
+
+# Dependências que não podem ser carregadas só por importar os módulos do app
+HEAVY_MODULES = ["weasyprint", "docx", "graphviz", "scipy", "PIL", "google.generativeai"]
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def _target_code(target: str) -> str:
+    """Código que importa o alvo (módulo ou arquivo .py de página)"""
+    if target.endswith(".py"):
+        path = os.path.abspath(os.path.join(ROOT, target))
+        return (
+            "import runpy\n"
+            "try:\n"
+            f"    runpy.run_path({path!r}, run_name='profiled_page')\n"
+            "except BaseException:\n"
+            "    pass\n"
+        )
+    return f"import {target}\n"
+
+
+def profile_target(target: str) -> dict:
+    """Roda o alvo em um interpretador novo com -X importtime e agrega o resultado"""
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _target_code(target)],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+
+    modules = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append({
+                "module": name,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+                "top_level": len(indent) <= 1,
+            })
+
+    loaded = {m["module"] for m in modules}
+    heavy = sorted(
+        name for name in HEAVY_MODULES
+        if name in loaded or any(m.startswith(name + ".") for m in loaded)
+    )
+    error = None
+    if proc.returncode != 0:
+        error = (proc.stderr.strip().splitlines() or ["erro desconhecido"])[-1]
+
+    return {
+        "target": target,
+        "total_ms": round(sum(m["cumulative_ms"] for m in modules if m["top_level"]), 1),
+        "modules": modules,
+        "heavy": heavy,
+        "error": error,
+    }
+
+
+def print_report(result: dict, top: int) -> None:
+    print(f"\n=== {result['target']}: {result['total_ms']:.1f} ms ===")
+    if result["error"]:
+        print(f"  ! falha ao importar: {result['error']}")
+    if result["heavy"]:
+        print(f"  ! dependências pesadas carregadas na inicialização: {', '.join(result['heavy'])}")
+
+    by_cumulative = sorted(result["modules"], key=lambda m: m["cumulative_ms"], reverse=True)[:top]
+    by_self = sorted(result["modules"], key=lambda m: m["self_ms"], reverse=True)[:top]
+    print(f"  {'acumulado (ms)':>14}  módulo")
+    for m in by_cumulative:
+        print(f"  {m['cumulative_ms']:>14.1f}  {m['module']}")
+    print(f"  {'próprio (ms)':>14}  módulo")
+    for m in by_self:
+        print(f"  {m['self_ms']:>14.1f}  {m['module']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("targets", nargs="*", default=DEFAULT_TARGETS,
+                        help="Módulos ou páginas (.py) a perfilar")
+    parser.add_argument("--top", type=int, default=10, help="Módulos listados por alvo")
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="Orçamento de importação por alvo; acima dele o script falha")
+    parser.add_argument("--output", help="Salva os totais em JSON (para usar como baseline)")
+    parser.add_argument("--baseline", help="JSON de uma execução anterior para comparação")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Aumento relativo aceito em relação ao baseline (padrão: 0.25)")
+    args = parser.parse_args()
+
+    results = [profile_target(target) for target in args.targets]
+    for result in results:
+        print_report(result, args.top)
+
+    failures = []
+    for result in results:
+        if result["heavy"]:
+            failures.append(f"{result['target']}: importa {', '.join(result['heavy'])} na inicialização")
+        if args.max_ms is not None and result["total_ms"] > args.max_ms:
+            failures.append(f"{result['target']}: {result['total_ms']:.1f} ms > orçamento de {args.max_ms:.1f} ms")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fp:
+            baseline = {item["target"]: item for item in json.load(fp)["targets"]}
+        print("\n=== Comparação com o baseline ===")
+        for result in results:
+            previous = baseline.get(result["target"])
+            if not previous or not previous["total_ms"]:
+                continue
+            ratio = result["total_ms"] / previous["total_ms"] - 1
+            print(f"  {result['target']}: {previous['total_ms']:.1f} -> {result['total_ms']:.1f} ms ({ratio:+.0%})")
+            if ratio > args.tolerance:
+                failures.append(f"{result['target']}: regressão de {ratio:+.0%} no tempo de importação")
+            new_heavy = set(result["heavy"]) - set(previous.get("heavy", []))
+            if new_heavy:
+                failures.append(f"{result['target']}: passou a importar {', '.join(sorted(new_heavy))}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            json.dump({
+                "python": sys.version.split()[0],
+                "targets": [
+                    {"target": r["target"], "total_ms": r["total_ms"], "heavy": r["heavy"]}
+                    for r in results
+                ],
+            }, fp, indent=2)
+        print(f"\nResultado salvo em {args.output}")
+
+    if failures:
+        print("\nProblemas encontrados:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+Gravação assíncrona e em lote dos logs de auditoria (user_logs)
+
+log_action() apenas monta o registro e o coloca em uma fila limitada; uma
+thread de fundo do processo faz os inserts em lote quando a fila atinge
+batch_size registros ou quando passam flush_interval_seconds. O caminho da
+interface nunca espera pela rede:
+
+- fila cheia (backpressure): o registro vai direto para o arquivo de spill
+  em disco, sem bloquear o rerun;
+- falha transitória no insert: novas tentativas com espera exponencial e,
+  esgotadas, o lote é gravado no arquivo de spill;
+- o arquivo de spill é reenviado no próximo lote gravado com sucesso; linhas
+  ilegíveis (ex.: truncadas por uma queda no meio da escrita) vão para
+  <spill>.bad, e um lote que o banco rejeita em max_replay_failures reenvios
+  seguidos é gravado registro a registro, com os rejeitados em <spill>.dead;
+- ao encerrar o processo (atexit), a fila é esvaziada e o que não puder ser
+  gravado fica no spill.
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from config.config import get_config
+from utils.simple_logger import get_logger
+
+
+class AuditLogWriter:
+    """Fila limitada + thread de gravação em lote para a tabela user_logs"""
+
+    def __init__(self,
+                 batch_size: int = 50,
+                 flush_interval_seconds: float = 2.0,
+                 max_queue_size: int = 5000,
+                 max_retries: int = 3,
+                 spill_path: str = os.path.join("logs", "audit_spill.ndjson"),
+                 table: str = "user_logs",
+                 max_replay_failures: int = 3):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_retries = max(1, max_retries)
+        self.spill_path = spill_path
+        self.quarantine_path = f"{spill_path}.bad"
+        self.dead_letter_path = f"{spill_path}.dead"
+        self.table = table
+        self.max_replay_failures = max(1, max_replay_failures)
+        self._replay_failures = 0
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue_size)
+        self._spill_lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {"enqueued": 0, "written": 0, "batches": 0, "retries": 0,
+                      "spilled": 0, "replayed": 0, "dropped": 0,
+                      "quarantined": 0, "dead_lettered": 0}
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        # A thread de gravação e os reruns da interface atualizam os mesmos contadores
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def get_stats(self) -> Dict[str, int]:
+        """Cópia consistente dos contadores"""
+        with self._stats_lock:
+            return dict(self.stats)
+
+    # ------------------------------------------------------------------
+    # Lado da interface
+    # ------------------------------------------------------------------
+    def enqueue(self, record: Dict[str, Any]) -> bool:
+        """
+        Enfileira um registro sem bloquear.
+
+        Retorna True se o registro foi aceito (na fila ou no spill em disco).
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            # Backpressure: não espera a thread de gravação, persiste em disco
+            return self._spill([record])
+        self._count("enqueued")
+        if self._queue.qsize() >= self.batch_size:
+            self._flush_requested.set()
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Pede a gravação imediata e espera a fila esvaziar (uso em scripts/encerramento)"""
+        self._flush_requested.set()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            time.sleep(0.05)
+
+    def pending(self) -> int:
+        """Registros aguardando na fila"""
+        return self._queue.qsize()
+
+    # ------------------------------------------------------------------
+    # Thread de gravação
+    # ------------------------------------------------------------------
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._flush_requested.wait(self.flush_interval_seconds)
+            self._flush_requested.clear()
+            self._drain()
+        self._drain()
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self) -> None:
+        """Grava a fila em lotes de batch_size até esvaziá-la"""
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            try:
+                if self._write_with_retry(batch):
+                    self._replay_spill()
+                else:
+                    self._spill(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _insert(self, records: List[Dict[str, Any]]) -> None:
+        from managers.supabase_config import get_service_role_client
+        # Usa service_role para contornar RLS ao inserir logs
+        supabase = get_service_role_client()
+        supabase.table(self.table).insert(records).execute()
+
+    def _write_with_retry(self, batch: List[Dict[str, Any]]) -> bool:
+        delay = 0.5
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                self._insert(batch)
+                self._count("written", len(batch))
+                self._count("batches")
+                return True
+            except Exception as e:
+                get_logger().warning(
+                    f"Falha ao gravar {len(batch)} logs de auditoria (tentativa {attempt}/{self.max_retries}): {e}"
+                )
+                if attempt < self.max_retries and not self._stopped.is_set():
+                    self._count("retries")
+                    time.sleep(delay)
+                    delay *= 2
+        return False
+
+    # ------------------------------------------------------------------
+    # Spill em disco (NDJSON, um registro por linha)
+    # ------------------------------------------------------------------
+    def _spill(self, records: List[Dict[str, Any]]) -> bool:
+        try:
+            with self._spill_lock:
+                directory = os.path.dirname(self.spill_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.spill_path, "a", encoding="utf-8") as spill_file:
+                    for record in records:
+                        spill_file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            self._count("spilled", len(records))
+            return True
+        except Exception as e:
+            self._count("dropped", len(records))
+            get_logger().error(f"Não foi possível gravar {len(records)} logs de auditoria no spill: {e}")
+            return False
+
+    def _append_lines(self, path: str, lines: List[str]) -> None:
+        """Acrescenta linhas a um arquivo auxiliar do spill (quarentena / dead-letter)"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as target:
+            for line in lines:
+                target.write(line.rstrip("\n") + "\n")
+
+    def _read_replay_file(self, replay_path: str) -> List[Dict[str, Any]]:
+        """Lê o spill linha a linha; linhas ilegíveis vão para a quarentena em vez de travar o reenvio"""
+        records: List[Dict[str, Any]] = []
+        bad_lines: List[str] = []
+        with open(replay_path, encoding="utf-8", errors="replace") as replay_file:
+            for line in replay_file:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    bad_lines.append(line)
+                    continue
+                if isinstance(record, dict):
+                    records.append(record)
+                else:
+                    bad_lines.append(line)
+        if bad_lines:
+            self._append_lines(self.quarantine_path, bad_lines)
+            self._count("quarantined", len(bad_lines))
+            get_logger().error(
+                f"{len(bad_lines)} linha(s) ilegível(is) do spill de auditoria movidas para {self.quarantine_path}"
+            )
+        return records
+
+    def _write_individually(self, records: List[Dict[str, Any]]) -> None:
+        """Último recurso para um lote sempre rejeitado: grava um a um e separa os rejeitados"""
+        rejected = []
+        for record in records:
+            try:
+                self._insert([record])
+                self._count("written")
+                self._count("replayed")
+            except Exception as e:
+                get_logger().error(f"Log de auditoria rejeitado pelo banco, enviado ao dead-letter: {e}")
+                rejected.append(json.dumps(record, ensure_ascii=False, default=str))
+        if rejected:
+            try:
+                self._append_lines(self.dead_letter_path, rejected)
+                self._count("dead_lettered", len(rejected))
+            except OSError as e:
+                self._count("dropped", len(rejected))
+                get_logger().error(f"Não foi possível gravar {len(rejected)} logs no dead-letter: {e}")
+
+    def _replay_spill(self) -> None:
+        """Reenvia o conteúdo do spill após um insert bem-sucedido"""
+        if not os.path.exists(self.spill_path) and not os.path.exists(f"{self.spill_path}.replay"):
+            return
+        with self._spill_lock:
+            # Renomeia antes de ler para que novos spills não se misturem com o reenvio
+            replay_path = f"{self.spill_path}.replay"
+            try:
+                if not os.path.exists(replay_path):
+                    os.replace(self.spill_path, replay_path)
+                records = self._read_replay_file(replay_path)
+            except FileNotFoundError:
+                return
+            except OSError as e:
+                get_logger().error(f"Erro ao ler o spill de logs de auditoria: {e}")
+                return
+
+        for start in range(0, len(records), self.batch_size):
+            chunk = records[start:start + self.batch_size]
+            if self._write_with_retry(chunk):
+                self._replay_failures = 0
+                self._count("replayed", len(chunk))
+                continue
+
+            # O insert do lote da fila acabou de funcionar: falhas repetidas aqui
+            # indicam um registro que o banco sempre rejeita
+            self._replay_failures += 1
+            if self._replay_failures >= self.max_replay_failures:
+                self._replay_failures = 0
+                self._write_individually(chunk)
+                continue
+
+            # Devolve ao spill o que ainda não foi gravado e tenta de novo depois
+            self._spill(records[start:])
+            break
+        try:
+            os.remove(replay_path)
+        except OSError:
+            pass
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """Grava o que estiver na fila e encerra a thread (chamado no atexit)"""
+        self._stopped.set()
+        self._flush_requested.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+        # Se a thread não terminou a tempo, o restante da fila vai para o disco
+        leftover = []
+        while True:
+            try:
+                leftover.append(self._queue.get_nowait())
+                self._queue.task_done()
+            except queue.Empty:
+                break
+        if leftover:
+            self._spill(leftover)
+
+
+# Instância do processo (criada no primeiro log)
+_writer: Optional[AuditLogWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_audit_writer() -> AuditLogWriter:
+    """Retorna o gravador de logs de auditoria do processo"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                config = get_config("audit_log")
+                _writer = AuditLogWriter(
+                    batch_size=config.get("batch_size", 50),
+                    flush_interval_seconds=config.get("flush_interval_seconds", 2.0),
+                    max_queue_size=config.get("max_queue_size", 5000),
+                    max_retries=config.get("max_retries", 3),
+                    spill_path=config.get("spill_path", os.path.join("logs", "audit_spill.ndjson")),
+                    max_replay_failures=config.get("max_replay_failures", 3),
+                )
+                atexit.register(_writer.shutdown)
+    return _writer
+
+
+def get_audit_writer_stats() -> Dict[str, Any]:
+    """Contadores do gravador (para a página de logs do sistema)"""
+    if _writer is None:
+        return {}
+    return dict(_writer.get_stats(), pending=_writer.pending())
@@ -0,0 +1,402 @@
+"""
+Importação em lote de horas trabalhadas e acidentes (CSV/XLSX)
+
+O arquivo é lido em blocos de IMPORT_CHUNK_ROWS linhas; cada bloco é validado e
+convertido de forma vetorizada e gravado com upsert em lotes limitados por número
+de linhas e por tamanho do JSON, sobre uma chave natural:
+
+- hours_worked_monthly: UNIQUE (year, month, created_by)
+- accidents: import_key, hash da linha (docs/migrations/add_import_key_to_accidents.sql)
+
+Reimportar o mesmo arquivo atualiza as linhas em vez de duplicá-las. O progresso
+(último bloco gravado) fica em st.session_state por arquivo, então uma importação
+interrompida recomeça do bloco seguinte ao último confirmado.
+"""
+import csv
+import hashlib
+import io
+import json
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+
+# Linhas lidas do arquivo por bloco
+IMPORT_CHUNK_ROWS = 2000
+# Limites de cada requisição de upsert
+IMPORT_BATCH_ROWS = 500
+IMPORT_BATCH_BYTES = 512 * 1024
+# Linhas rejeitadas exibidas no resumo
+MAX_REJECTED_SHOWN = 20
+
+# Valores aceitos para accidents.type (coluna severity ou type do arquivo)
+ACCIDENT_TYPE_MAP = {
+    'fatal': 'fatal',
+    'lesao': 'lesao',
+    'lesão': 'lesao',
+    'com lesao': 'lesao',
+    'com lesão': 'lesao',
+    'sem_lesao': 'sem_lesao',
+    'sem lesao': 'sem_lesao',
+    'sem lesão': 'sem_lesao',
+}
+
+HOURS_COLUMNS = ["year", "month", "hours", "created_by"]
+ACCIDENT_COLUMNS = [
+    "occurred_at", "type", "classification", "body_part", "description", "lost_days",
+    "root_cause", "status", "employee_id", "created_by", "import_key",
+]
+
+
+def _read_upload(source) -> bytes:
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    source.seek(0)
+    return source.read()
+
+
+def _is_excel(name: str) -> bool:
+    return name.lower().endswith((".xlsx", ".xlsm"))
+
+
+def iter_file_chunks(data: bytes, name: str, chunk_rows: int = IMPORT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    Lê o arquivo em blocos de `chunk_rows` linhas (todas as colunas como texto).
+
+    CSV usa o leitor em blocos do pandas; XLSX é percorrido em modo read_only do
+    openpyxl, sem carregar a planilha inteira em um DataFrame.
+    """
+    if not _is_excel(name):
+        # Detecta ',' ou ';' (planilhas exportadas em pt-BR usam ';')
+        sample = data[:4096].decode("utf-8-sig", errors="ignore")
+        try:
+            sep = csv.Sniffer().sniff(sample, delimiters=",;").delimiter
+        except csv.Error:
+            sep = ","
+        yield from pd.read_csv(io.BytesIO(data), sep=sep, dtype=str, chunksize=chunk_rows,
+                               encoding="utf-8-sig", skip_blank_lines=True)
+        return
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if not header:
+            return
+        columns = [str(c).strip() if c is not None else f"col_{i}" for i, c in enumerate(header)]
+        block: List[tuple] = []
+        start = 0
+        for row in rows:
+            if row is None or all(v is None for v in row):
+                continue
+            block.append(row)
+            if len(block) >= chunk_rows:
+                # Índice contínuo entre blocos, como no read_csv, para numerar as linhas
+                yield pd.DataFrame(block, columns=columns, index=pd.RangeIndex(start, start + len(block)))
+                start += len(block)
+                block = []
+        if block:
+            yield pd.DataFrame(block, columns=columns, index=pd.RangeIndex(start, start + len(block)))
+    finally:
+        workbook.close()
+
+
+def preview_file(source, rows: int = 5) -> pd.DataFrame:
+    """Primeiras linhas do arquivo enviado, sem ler o restante"""
+    data = _read_upload(source)
+    return next(iter_file_chunks(data, getattr(source, "name", ""), chunk_rows=rows), pd.DataFrame())
+
+
+def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
+    return df.rename(columns=lambda c: str(c).strip().lower())
+
+
+def _text(df: pd.DataFrame, column: str, default: Optional[str] = None) -> pd.Series:
+    """Coluna como texto sem espaços nas pontas; vazio/ausente vira `default`"""
+    if column not in df.columns:
+        return pd.Series(default, index=df.index, dtype=object)
+    values = df[column].astype("string").str.strip()
+    values = values.mask(values == "", pd.NA)
+    return values.astype(object).where(values.notna(), default)
+
+
+def _number(df: pd.DataFrame, column: str) -> pd.Series:
+    """Coluna numérica; aceita vírgula decimal. Inválidos viram NaN"""
+    if column not in df.columns:
+        return pd.Series(float("nan"), index=df.index)
+    values = df[column]
+    if not pd.api.types.is_numeric_dtype(values):
+        values = values.astype("string").str.strip().str.replace(",", ".", regex=False)
+    return pd.to_numeric(values, errors="coerce")
+
+
+def _reject(rejected: List[Dict[str, Any]], df: pd.DataFrame, mask: pd.Series, reason: str) -> None:
+    for line in df.index[mask]:
+        rejected.append({"linha": int(line) + 2, "motivo": reason})
+
+
+def prepare_hours_chunk(df: pd.DataFrame, user_id: str) -> Tuple[pd.DataFrame, List[Dict[str, Any]]]:
+    """
+    Valida e converte um bloco de horas trabalhadas.
+
+    Returns:
+        (linhas válidas com HOURS_COLUMNS, linhas rejeitadas com o motivo)
+    """
+    df = _normalize_columns(df)
+    rejected: List[Dict[str, Any]] = []
+
+    year = _number(df, "year")
+    month = _number(df, "month")
+    hours = _number(df, "hours")
+
+    bad_year = year.isna() | (year % 1 != 0) | ~year.between(1900, 2100)
+    bad_month = ~bad_year & (month.isna() | (month % 1 != 0) | ~month.between(1, 12))
+    bad_hours = ~bad_year & ~bad_month & (hours.isna() | (hours < 0))
+    _reject(rejected, df, bad_year, "ano inválido")
+    _reject(rejected, df, bad_month, "mês inválido")
+    _reject(rejected, df, bad_hours, "horas inválidas")
+
+    valid = ~(bad_year | bad_month | bad_hours)
+    rows = pd.DataFrame({
+        "year": year[valid].astype(int),
+        "month": month[valid].astype(int),
+        "hours": hours[valid].astype(float),
+        "created_by": user_id,
+    }, columns=HOURS_COLUMNS)
+    # Um upsert não pode tocar a mesma chave duas vezes: vale a última linha do bloco
+    rows = rows.drop_duplicates(subset=["year", "month", "created_by"], keep="last")
+    return rows, rejected
+
+
+def _accident_import_keys(rows: pd.DataFrame) -> pd.Series:
+    parts = rows[["created_by", "occurred_at", "type", "description", "employee_id"]].fillna("")
+    joined = parts.astype(str).agg("|".join, axis=1)
+    return joined.map(lambda value: hashlib.sha1(value.encode("utf-8")).hexdigest())
+
+
+def prepare_accidents_chunk(df: pd.DataFrame, user_id: str) -> Tuple[pd.DataFrame, List[Dict[str, Any]]]:
+    """
+    Valida e converte um bloco de acidentes.
+
+    occurred_at (ou date) é convertido para data; o tipo vem de `severity` ou
+    `type` (fatal, lesao, sem_lesao e variações com acento), com 'lesao' como padrão.
+
+    Returns:
+        (linhas válidas com ACCIDENT_COLUMNS, linhas rejeitadas com o motivo)
+    """
+    df = _normalize_columns(df)
+    rejected: List[Dict[str, Any]] = []
+
+    raw_date = _text(df, "occurred_at")
+    if "date" in df.columns:
+        raw_date = raw_date.where(raw_date.notna(), _text(df, "date"))
+    # ISO (AAAA-MM-DD) primeiro; o que sobrar é lido como data brasileira (DD/MM/AAAA)
+    occurred = pd.to_datetime(raw_date, errors="coerce", format="ISO8601")
+    leftover = occurred.isna() & raw_date.notna()
+    if leftover.any():
+        occurred = occurred.where(~leftover, pd.to_datetime(
+            raw_date[leftover], errors="coerce", format="mixed", dayfirst=True
+        ))
+    description = _text(df, "description")
+
+    bad_date = occurred.isna()
+    bad_description = ~bad_date & description.isna()
+    _reject(rejected, df, bad_date, "data de ocorrência inválida")
+    _reject(rejected, df, bad_description, "descrição vazia")
+
+    type_source = _text(df, "severity")
+    type_source = type_source.where(type_source.notna(), _text(df, "type"))
+    accident_type = type_source.str.lower().map(ACCIDENT_TYPE_MAP).fillna("lesao")
+
+    lost_days = _number(df, "lost_days").fillna(0).clip(lower=0).round().astype(int)
+
+    valid = ~(bad_date | bad_description)
+    rows = pd.DataFrame({
+        "occurred_at": occurred[valid].dt.strftime("%Y-%m-%d"),
+        "type": accident_type[valid],
+        "classification": _text(df, "classification", "leve")[valid],
+        "body_part": _text(df, "body_part")[valid],
+        "description": description[valid],
+        "lost_days": lost_days[valid],
+        "root_cause": _text(df, "root_cause", "")[valid],
+        "status": _text(df, "status", "fechado")[valid],
+        "employee_id": _text(df, "employee_id")[valid],
+        "created_by": user_id,
+    })
+    rows["import_key"] = _accident_import_keys(rows) if not rows.empty else pd.Series(dtype=object)
+    rows = rows.drop_duplicates(subset=["import_key"], keep="last")
+    return rows[ACCIDENT_COLUMNS], rejected
+
+
+def _records(rows: pd.DataFrame) -> List[Dict[str, Any]]:
+    """DataFrame -> lista de dicts com None no lugar de NaN/NA"""
+    return rows.astype(object).where(rows.notna(), None).to_dict("records")
+
+
+def bounded_batches(records: List[Dict[str, Any]], max_rows: int = IMPORT_BATCH_ROWS,
+                    max_bytes: int = IMPORT_BATCH_BYTES) -> Iterator[List[Dict[str, Any]]]:
+    """Divide os registros em lotes de no máximo `max_rows` linhas e ~`max_bytes` de JSON"""
+    batch: List[Dict[str, Any]] = []
+    size = 2
+    for record in records:
+        record_size = len(json.dumps(record, default=str, ensure_ascii=False).encode("utf-8")) + 1
+        if batch and (len(batch) >= max_rows or size + record_size > max_bytes):
+            yield batch
+            batch, size = [], 2
+        batch.append(record)
+        size += record_size
+    if batch:
+        yield batch
+
+
+def _upsert(supabase, table: str, records: List[Dict[str, Any]], on_conflict: str) -> List[Dict[str, Any]]:
+    written: List[Dict[str, Any]] = []
+    for batch in bounded_batches(records):
+        result = supabase.table(table).upsert(batch, on_conflict=on_conflict).execute()
+        written.extend(result.data or [])
+    return written
+
+
+IMPORT_KINDS: Dict[str, Dict[str, Any]] = {
+    "hours": {
+        "table": "hours_worked_monthly",
+        "required": ["year", "month", "hours"],
+        "prepare": prepare_hours_chunk,
+        "on_conflict": "year,month,created_by",
+        "label": "registros de horas",
+    },
+    "accidents": {
+        "table": "accidents",
+        "required": ["occurred_at|date", "description"],
+        "prepare": prepare_accidents_chunk,
+        "on_conflict": "import_key",
+        "label": "acidentes",
+    },
+}
+
+
+def _missing_columns(columns: Iterable[str], required: List[str]) -> List[str]:
+    present = {str(c).strip().lower() for c in columns}
+    return [spec.replace("|", " ou ") for spec in required
+            if not any(option in present for option in spec.split("|"))]
+
+
+def _kpi_buckets(kind: str, rows: List[Dict[str, Any]]) -> set:
+    from services.kpi import accident_kpi_buckets, hours_kpi_buckets
+    return hours_kpi_buckets(rows) if kind == "hours" else accident_kpi_buckets(rows)
+
+
+def import_file(kind: str, source=None, name: str = "", frame: Optional[pd.DataFrame] = None,
+                progress: Optional[Callable[[int, Optional[int]], None]] = None) -> bool:
+    """
+    Importa horas ("hours") ou acidentes ("accidents") de um CSV/XLSX em blocos.
+
+    Args:
+        kind: Chave de IMPORT_KINDS
+        source: Arquivo enviado (UploadedFile), bytes ou objeto com read()
+        name: Nome do arquivo (define CSV ou XLSX); padrão: source.name
+        frame: DataFrame já carregado, no lugar de `source` (sem retomada)
+        progress: Callback (linhas lidas, total estimado ou None); padrão: barra do Streamlit
+
+    Returns:
+        True se todos os blocos foram gravados
+    """
+    from auth.auth_utils import get_user_id
+    from managers.supabase_config import get_service_role_client
+
+    spec = IMPORT_KINDS[kind]
+    user_id = get_user_id()
+    if not user_id:
+        st.error("Usuário não autenticado")
+        return False
+
+    # Usa service_role para contornar RLS; created_by é sempre o usuário atual
+    supabase = get_service_role_client()
+    if not supabase:
+        st.error("Erro ao conectar com o banco de dados")
+        return False
+
+    if frame is None:
+        data = _read_upload(source)
+        name = name or getattr(source, "name", "")
+        fingerprint = hashlib.sha1(data).hexdigest()
+        chunks: Iterable[pd.DataFrame] = iter_file_chunks(data, name)
+        total_rows = None if _is_excel(name) else max(data.count(b"\n") - 1, 1)
+    else:
+        fingerprint = None
+        chunks = (frame.iloc[i:i + IMPORT_CHUNK_ROWS] for i in range(0, max(len(frame), 1), IMPORT_CHUNK_ROWS))
+        total_rows = len(frame)
+
+    # Progresso por arquivo + usuário: permite retomar após uma falha
+    state_key = f"bulk_import_{kind}_{user_id}_{fingerprint}" if fingerprint else None
+    state = st.session_state.get(state_key) if state_key else None
+    if not state:
+        state = {"chunks_done": 0, "rows": 0, "rejected": [], "buckets": set()}
+    if state_key:
+        st.session_state[state_key] = state
+    if state["chunks_done"]:
+        st.info(f"↩️ Retomando a importação a partir do bloco {state['chunks_done'] + 1} "
+                f"({state['rows']} linhas já gravadas).")
+
+    if progress is None:
+        bar = st.progress(0.0, text="Importando...")
+
+        def progress(read_rows: int, total: Optional[int]) -> None:
+            fraction = read_rows / total if total else read_rows / (read_rows + IMPORT_CHUNK_ROWS)
+            bar.progress(min(fraction, 1.0), text=f"{read_rows} linhas processadas")
+
+    read_rows = 0
+    try:
+        for index, chunk in enumerate(chunks):
+            if index == 0:
+                missing = _missing_columns(chunk.columns, spec["required"])
+                if missing:
+                    if state_key:
+                        st.session_state.pop(state_key, None)
+                    st.error(f"Colunas obrigatórias ausentes: {missing}")
+                    return False
+            read_rows += len(chunk)
+            if index < state["chunks_done"]:
+                continue
+
+            rows, rejected = spec["prepare"](chunk, user_id)
+            if not rows.empty:
+                records = _records(rows)
+                written = _upsert(supabase, spec["table"], records, spec["on_conflict"])
+                state["buckets"] |= _kpi_buckets(kind, written or records)
+                state["rows"] += len(rows)
+
+            # Bloco confirmado: uma nova tentativa começa no próximo
+            state["rejected"].extend(rejected)
+            state["chunks_done"] = index + 1
+            progress(read_rows, total_rows)
+    except Exception as e:
+        st.error(f"Erro na importação (bloco {state['chunks_done'] + 1}): {str(e)}")
+        if state_key:
+            st.warning("Os blocos anteriores foram gravados; importe o mesmo arquivo novamente para continuar.")
+        return False
+
+    if state_key:
+        st.session_state.pop(state_key, None)
+
+    if state["rejected"]:
+        state["rejected"].sort(key=lambda item: item["linha"])
+        st.warning(f"⚠️ {len(state['rejected'])} linhas ignoradas por dados inválidos.")
+        st.dataframe(pd.DataFrame(state["rejected"][:MAX_REJECTED_SHOWN]), hide_index=True)
+
+    if not state["rows"]:
+        st.error("Nenhum dado válido para importar")
+        return False
+
+    from services.data_cache import invalidate_table
+    invalidate_table(spec["table"], user_id)
+    # Recalcula apenas os meses importados
+    from services.kpi import refresh_kpi_buckets
+    refresh_kpi_buckets(state["buckets"])
+
+    st.success(f"✅ {state['rows']} {spec['label']} importados com sucesso!")
+    return True
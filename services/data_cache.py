@@ -0,0 +1,224 @@
+"""
+Cache em memória (TTL + LRU) para os fetchers dos dashboards
+
+As chaves incluem o tenant (user_id, is_admin), a tabela e o intervalo de datas,
+então usuários comuns nunca compartilham resultados entre si. Os serviços que
+inserem/atualizam/removem registros chamam invalidate_table() para que a próxima
+leitura no mesmo processo busque dados frescos.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from config.config import get_config
+
+
+def _estimate_size(value: Any) -> int:
+    """Estima o tamanho em bytes de um valor armazenado no cache"""
+    try:
+        if hasattr(value, "memory_usage"):
+            # DataFrame do pandas: considera o conteúdo das colunas object
+            return int(value.memory_usage(index=True, deep=True).sum())
+    except Exception:
+        pass
+    return sys.getsizeof(value)
+
+
+def estimate_rows_size(rows, sample: int = 20) -> int:
+    """
+    Estima o tamanho em bytes de uma lista de linhas (dicts) retornadas pelo banco:
+    número de linhas × tamanho médio de uma amostra (dict, chaves e valores).
+    """
+    if not rows:
+        return 0
+    sampled = rows[:sample]
+    total = 0
+    for row in sampled:
+        total += sys.getsizeof(row)
+        if isinstance(row, dict):
+            total += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in row.items())
+    return int(total / len(sampled) * len(rows))
+
+
+def _copy_value(value: Any) -> Any:
+    """Retorna uma cópia para que o chamador não altere o valor em cache"""
+    if hasattr(value, "copy"):
+        try:
+            return value.copy()
+        except Exception:
+            return value
+    return value
+
+
+class TTLCache:
+    """
+    Cache LRU com expiração por tempo e limite de memória, seguro entre threads.
+
+    on_evict(key, value) é chamado (fora do lock) sempre que uma chave deixa o
+    cache: expiração, remoção por limite, invalidate() ou clear(). Substituir o
+    valor de uma chave com set() não conta como remoção.
+    """
+
+    def __init__(self, ttl_seconds: float = 120, max_entries: int = 256, max_memory_mb: float = 128,
+                 on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        self.max_entries = max_entries
+        self.max_bytes = int(max_memory_mb * 1024 * 1024)
+        self._entries: "OrderedDict[Hashable, Tuple[float, int, Any]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """Retorna (encontrado, valor); entradas expiradas são descartadas"""
+        removed = []
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return False, None
+            expires_at, size, value = entry
+            if expires_at < time.monotonic():
+                removed.append((key, self._pop(key)))
+                self.stats["misses"] += 1
+            else:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return True, value
+        self._notify(removed)
+        return False, None
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None,
+            size: Optional[int] = None) -> bool:
+        """
+        Armazena um valor, removendo os menos usados se exceder os limites.
+
+        `size` (bytes) substitui a estimativa automática, que só enxerga o objeto
+        externo de valores que não são DataFrames. Retorna False se o valor não
+        couber no cache.
+        """
+        if size is None:
+            size = _estimate_size(value)
+        if size > self.max_bytes:
+            # Valor maior que o cache inteiro: não armazena
+            return False
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        removed = []
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (time.monotonic() + ttl, size, value)
+            self._total_bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+                oldest_key = next(iter(self._entries))
+                removed.append((oldest_key, self._pop(oldest_key)))
+                self.stats["evictions"] += 1
+        self._notify(removed)
+        return key not in {evicted for evicted, _ in removed}
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Remove as entradas cujas chaves satisfazem o predicado"""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            removed = [(key, self._pop(key)) for key in keys]
+            self.stats["invalidations"] += len(keys)
+        self._notify(removed)
+        return len(keys)
+
+    def clear(self) -> None:
+        """Remove todas as entradas"""
+        with self._lock:
+            removed = [(key, value) for key, (_, _, value) in self._entries.items()]
+            self._entries.clear()
+            self._total_bytes = 0
+        self._notify(removed)
+
+    def info(self) -> Dict[str, Any]:
+        """Retorna estatísticas de uso do cache"""
+        with self._lock:
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "memory_bytes": self._total_bytes,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+    def _pop(self, key: Hashable) -> Any:
+        _, size, value = self._entries.pop(key)
+        self._total_bytes -= size
+        return value
+
+    def _notify(self, removed) -> None:
+        if self.on_evict is None:
+            return
+        for key, value in removed:
+            try:
+                self.on_evict(key, value)
+            except Exception:
+                pass
+
+
+_data_cache: Optional[TTLCache] = None
+_data_cache_lock = threading.Lock()
+
+
+def get_data_cache() -> TTLCache:
+    """Retorna a instância global do cache de dados"""
+    global _data_cache
+    if _data_cache is None:
+        with _data_cache_lock:
+            if _data_cache is None:
+                config = get_config("cache")
+                _data_cache = TTLCache(
+                    ttl_seconds=config.get("ttl_seconds", 120),
+                    max_entries=config.get("max_entries", 256),
+                    max_memory_mb=config.get("max_memory_mb", 128),
+                )
+    return _data_cache
+
+
+def make_cache_key(table: str, user_id: Optional[str], is_admin: bool,
+                   start_date: Any = None, end_date: Any = None, *extra: Hashable) -> Tuple:
+    """Monta a chave (table, user_id, is_admin, início, fim, ...) usada pelos fetchers"""
+    start = start_date.isoformat() if hasattr(start_date, "isoformat") else start_date
+    end = end_date.isoformat() if hasattr(end_date, "isoformat") else end_date
+    return (table, user_id, bool(is_admin), start, end) + tuple(extra)
+
+
+def cached_fetch(table: str, user_id: Optional[str], is_admin: bool,
+                 start_date: Any, end_date: Any, loader: Callable[[], Any],
+                 *extra: Hashable) -> Any:
+    """
+    Retorna o resultado em cache para o tenant/tabela/período ou executa o loader.
+
+    Uma cópia é devolvida ao chamador, pois as páginas alteram os DataFrames recebidos.
+    Resultados vazios não são armazenados (podem indicar erro transitório).
+    """
+    cache = get_data_cache()
+    key = make_cache_key(table, user_id, is_admin, start_date, end_date, *extra)
+    found, value = cache.get(key)
+    if found:
+        return _copy_value(value)
+
+    value = loader()
+    if value is not None and not getattr(value, "empty", False):
+        cache.set(key, value)
+    return _copy_value(value)
+
+
+def invalidate_table(table: str, user_id: Optional[str] = None) -> int:
+    """
+    Invalida as entradas de uma tabela após escrita.
+
+    Com user_id, remove apenas as entradas desse tenant e as visões de admin
+    (que incluem dados de todos os tenants); sem user_id, remove todas.
+    """
+    def matches(key: Tuple) -> bool:
+        if key[0] != table:
+            return False
+        return user_id is None or key[1] == user_id or key[2]
+
+    return get_data_cache().invalidate(matches)
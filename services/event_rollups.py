@@ -0,0 +1,300 @@
+"""
+Agregados mensais de acidentes, quase-acidentes e não conformidades
+
+As abas de análise usam apenas contagens por status, gravidade, tipo e mês (o mês
+da coluna de data da listagem: occurred_at, ou opened_at nas não conformidades).
+Essas contagens vêm da tabela event_monthly_rollups
+(docs/migrations/create_event_monthly_rollups.sql), mantida por triggers que
+recalculam só os meses alterados, em vez de baixar todas as linhas e agrupar no
+pandas a cada rerun. As linhas individuais são lidas apenas na aba de registros.
+
+Os agregados cobrem meses inteiros; quando a janela de datas começa ou termina no
+meio de um mês, esses meses parciais são contados a partir das linhas, com as
+mesmas datas exatas da aba de registros. Se a tabela ainda não existir no projeto,
+todos os agregados são montados em Python a partir das colunas agrupadas (sem
+descrições).
+"""
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from services.data_cache import cached_fetch
+from services.kpi import _fetch_all_rows
+from services.list_queries import DATE_COLUMNS, build_list_query
+from utils.simple_logger import get_logger
+
+ROLLUP_TABLE = "event_monthly_rollups"
+
+ROLLUP_COLUMNS = [
+    "created_by", "period", "dimension", "value", "total", "resolved_total", "resolution_days_sum",
+]
+
+# Dimensões de cada tabela (mesmas da função refresh_event_rollup_bucket)
+ROLLUP_DIMENSIONS = {
+    "accidents": ["status", "type", "classification"],
+    "near_misses": ["status", "potential_severity"],
+    "nonconformities": ["status", "severity", "standard_ref"],
+}
+
+# Dimensão com o total do mês (valor vazio)
+TOTAL_DIMENSION = "total"
+
+# Tabelas com closed_at (criada pela mesma migration dos agregados)
+CLOSED_AT_TABLES = {"near_misses", "nonconformities"}
+
+# Marcado quando a tabela não existe no banco, para não repetir a consulta que falha
+_rollups_unavailable = False
+_rollups_lock = threading.Lock()
+
+
+def _iso(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def _as_date(value: Any) -> Optional[date]:
+    if not value:
+        return None
+    parsed = pd.to_datetime(value, errors="coerce")
+    return None if pd.isna(parsed) else parsed.date()
+
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def split_date_window(start_date: Any, end_date: Any) -> Tuple[Optional[Tuple[Optional[date], Optional[date]]],
+                                                              List[Tuple[Optional[date], Optional[date]]]]:
+    """
+    Divide a janela de datas em meses completos e trechos parciais.
+
+    Returns:
+        (meses, parciais): `meses` é (primeiro, último) mês completo, como o dia 1 de
+        cada mês (None = sem limite), ou None se a janela não cobre nenhum mês
+        inteiro; `parciais` são os intervalos (início, fim) de datas exatas que
+        sobram no início e no fim da janela
+    """
+    start, end = _as_date(start_date), _as_date(end_date)
+    first_month = None if start is None else (start if start.day == 1 else _next_month(start))
+    last_month = None
+    if end is not None:
+        last_month = end.replace(day=1) if _next_month(end) - timedelta(days=1) == end \
+            else (end.replace(day=1) - timedelta(days=1)).replace(day=1)
+
+    if first_month is not None and last_month is not None and first_month > last_month:
+        return None, [(start, end)]
+
+    partials = []
+    if start is not None and start != first_month:
+        partials.append((start, first_month - timedelta(days=1)))
+    if end is not None and _next_month(last_month) - timedelta(days=1) != end:
+        partials.append((_next_month(last_month), end))
+    return (first_month, last_month), partials
+
+
+def _source_columns(table: str, with_closed_at: bool = False) -> List[str]:
+    columns = ["id", DATE_COLUMNS[table], "created_by"]
+    for dimension in ROLLUP_DIMENSIONS[table]:
+        columns.append(dimension)
+    if with_closed_at and table in CLOSED_AT_TABLES:
+        columns.append("closed_at")
+    return list(dict.fromkeys(columns))
+
+
+def aggregate_rows(table: str, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Agregados no formato de event_monthly_rollups a partir das linhas da tabela.
+
+    Sem closed_at nas linhas, os dias de resolução ficam zerados.
+    """
+    if df is None or df.empty:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS)
+
+    occurred = pd.to_datetime(df[DATE_COLUMNS[table]], errors="coerce")
+    # Mesmo formato da coluna period lida do banco ('YYYY-MM-01')
+    period = occurred.dt.strftime("%Y-%m-01").astype(object)
+    base = pd.DataFrame({
+        "created_by": df["created_by"] if "created_by" in df.columns else None,
+        "period": period.where(occurred.notna(), None),
+    })
+
+    if "closed_at" in df.columns:
+        start_column = "opened_at" if "opened_at" in df.columns else "occurred_at"
+        resolution = (pd.to_datetime(df["closed_at"], errors="coerce")
+                      - pd.to_datetime(df[start_column], errors="coerce")).dt.days
+    else:
+        resolution = pd.Series(float("nan"), index=df.index)
+    base["resolution"] = resolution
+
+    values = {TOTAL_DIMENSION: pd.Series("", index=df.index)}
+    for dimension in ROLLUP_DIMENSIONS[table]:
+        if dimension in df.columns:
+            values[dimension] = df[dimension].astype(object).where(df[dimension].notna(), "").astype(str)
+
+    frames = []
+    for dimension, value in values.items():
+        grouped = base.assign(value=value).groupby(["created_by", "period", "value"], dropna=False).agg(
+            total=("resolution", "size"),
+            resolved_total=("resolution", "count"),
+            resolution_days_sum=("resolution", "sum"),
+        ).reset_index()
+        grouped.insert(2, "dimension", dimension)
+        frames.append(grouped)
+
+    result = pd.concat(frames, ignore_index=True)[ROLLUP_COLUMNS]
+    result["resolution_days_sum"] = result["resolution_days_sum"].fillna(0).astype("int64")
+    return result
+
+
+def _rollups_from_table(supabase, table: str, user_id: Optional[str], is_admin: bool,
+                        months: Optional[Tuple[Optional[date], Optional[date]]],
+                        user_ids: Optional[List[str]]) -> Optional[pd.DataFrame]:
+    """
+    Agregados dos meses completos `months` lidos de event_monthly_rollups (months=None
+    apenas confere se a tabela existe); None se a tabela não estiver disponível.
+    """
+    global _rollups_unavailable
+    if _rollups_unavailable:
+        return None
+
+    def build_query():
+        query = supabase.table(ROLLUP_TABLE).select(",".join(ROLLUP_COLUMNS)).eq("entity_type", table)
+        # Admin vê todos os tenants; usuário comum apenas os próprios agregados
+        if not is_admin:
+            query = query.eq("created_by", user_id)
+        if user_ids is not None:
+            query = query.in_("created_by", user_ids)
+        first_month, last_month = months
+        if first_month:
+            query = query.gte("period", _iso(first_month))
+        if last_month:
+            query = query.lte("period", _iso(last_month))
+        return query.order("period").order("created_by").order("dimension").order("value")
+
+    try:
+        if months is None:
+            supabase.table(ROLLUP_TABLE).select("entity_type").limit(1).execute()
+            return pd.DataFrame(columns=ROLLUP_COLUMNS)
+        rows = _fetch_all_rows(build_query)
+    except Exception as e:
+        message = str(e)
+        # Só a ausência da tabela (PGRST205) desativa a leitura no processo; outros
+        # erros agregam em Python apenas nesta chamada
+        if getattr(e, "code", None) == "PGRST205" or "PGRST205" in message \
+                or "Could not find the table" in message:
+            with _rollups_lock:
+                _rollups_unavailable = True
+            get_logger().warning(f"Tabela {ROLLUP_TABLE} indisponível, agregando em Python: {e}")
+        else:
+            get_logger().warning(f"Falha ao ler {ROLLUP_TABLE}, agregando em Python nesta chamada: {e}")
+        return None
+    return pd.DataFrame(rows, columns=ROLLUP_COLUMNS) if rows else pd.DataFrame(columns=ROLLUP_COLUMNS)
+
+
+def fetch_monthly_rollups(table: str, user_id: Optional[str], is_admin: bool,
+                          start_date: Any = None, end_date: Any = None,
+                          user_ids: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    Agregados mensais de `table` para o tenant e os filtros (em cache por tenant/filtros).
+
+    Cobre exatamente os mesmos registros que a listagem com a mesma janela de datas:
+    meses completos vêm da tabela de agregados e meses parciais das linhas.
+
+    Returns:
+        DataFrame com ROLLUP_COLUMNS (uma linha por tenant, mês, dimensão e valor)
+    """
+    from managers.supabase_config import get_service_role_client
+
+    # None = sem filtro de usuários; lista vazia = a seleção não casa com nenhum perfil
+    if user_ids is not None:
+        user_ids = sorted(set(user_ids))
+        if not user_ids:
+            return pd.DataFrame(columns=ROLLUP_COLUMNS)
+
+    def load() -> pd.DataFrame:
+        # Usa service_role para contornar RLS e aplicar filtro de segurança na consulta
+        supabase = get_service_role_client()
+        if not supabase:
+            return pd.DataFrame(columns=ROLLUP_COLUMNS)
+
+        def from_rows(start: Any, end: Any, with_closed_at: bool) -> pd.DataFrame:
+            columns = _source_columns(table, with_closed_at)
+            rows = _fetch_all_rows(lambda: build_list_query(
+                supabase, table, columns, user_id, is_admin, start, end, user_ids
+            ))
+            return aggregate_rows(table, pd.DataFrame(rows, columns=columns) if rows else pd.DataFrame())
+
+        months, partials = split_date_window(start_date, end_date)
+        rollups = _rollups_from_table(supabase, table, user_id, is_admin, months, user_ids)
+        if rollups is None:
+            # Sem a migration: tudo a partir das linhas, com as datas exatas
+            return from_rows(start_date, end_date, with_closed_at=False)
+
+        frames = [rollups] + [from_rows(start, end, with_closed_at=True) for start, end in partials]
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame(columns=ROLLUP_COLUMNS)
+        return pd.concat(frames, ignore_index=True)[ROLLUP_COLUMNS]
+
+    # A chave começa pela tabela de origem: invalidate_table(table) também limpa os agregados
+    extra = ("monthly_rollups", tuple(user_ids) if user_ids is not None else None)
+    return cached_fetch(table, user_id, is_admin, start_date, end_date, load, *extra)
+
+
+def rollup_total(rollups: pd.DataFrame) -> int:
+    """Número de registros cobertos pelos agregados"""
+    if rollups is None or rollups.empty:
+        return 0
+    totals = rollups[rollups["dimension"] == TOTAL_DIMENSION]
+    return int(pd.to_numeric(totals["total"], errors="coerce").fillna(0).sum())
+
+
+def dimension_counts(rollups: pd.DataFrame, dimension: str,
+                     normalize: Optional[Callable[[str], str]] = None,
+                     include_empty: bool = False) -> pd.Series:
+    """
+    Contagem por valor de uma dimensão somada em todos os meses e tenants
+    (equivalente a value_counts() sobre a coluna das linhas).
+
+    `normalize` agrupa valores equivalentes (ex.: 'alta' e 'high').
+    """
+    if rollups is None or rollups.empty:
+        return pd.Series(dtype="int64")
+    selected = rollups[rollups["dimension"] == dimension]
+    if not include_empty:
+        selected = selected[selected["value"] != ""]
+    if selected.empty:
+        return pd.Series(dtype="int64")
+
+    values = selected["value"].astype(str)
+    if normalize is not None:
+        values = values.map(normalize)
+    counts = pd.to_numeric(selected["total"], errors="coerce").fillna(0).astype("int64")
+    result = counts.groupby(values.values).sum()
+    return result[result > 0].sort_values(ascending=False)
+
+
+def monthly_totals(rollups: pd.DataFrame) -> pd.DataFrame:
+    """Total por mês ('YYYY-MM'), em ordem cronológica; registros sem data ficam de fora"""
+    if rollups is None or rollups.empty:
+        return pd.DataFrame(columns=["month", "count"])
+    totals = rollups[(rollups["dimension"] == TOTAL_DIMENSION) & rollups["period"].notna()]
+    if totals.empty:
+        return pd.DataFrame(columns=["month", "count"])
+    months = pd.to_datetime(totals["period"], errors="coerce").dt.strftime("%Y-%m")
+    counts = pd.to_numeric(totals["total"], errors="coerce").fillna(0).astype("int64")
+    monthly = counts.groupby(months.values).sum().sort_index()
+    return pd.DataFrame({"month": monthly.index, "count": monthly.values})
+
+
+def mean_resolution_days(rollups: pd.DataFrame) -> float:
+    """Média de dias entre abertura e encerramento dos registros encerrados"""
+    if rollups is None or rollups.empty:
+        return 0.0
+    totals = rollups[rollups["dimension"] == TOTAL_DIMENSION]
+    resolved = pd.to_numeric(totals["resolved_total"], errors="coerce").fillna(0).sum()
+    if resolved <= 0:
+        return 0.0
+    days = pd.to_numeric(totals["resolution_days_sum"], errors="coerce").fillna(0).sum()
+    return float(days / resolved)
@@ -0,0 +1,124 @@
+"""
+Montagem da árvore de falhas a partir dos nós planos do banco
+
+Funções puras (sem acesso ao banco ou ao Streamlit), usadas pela investigação
+e pelos exportadores PDF/Word. A montagem é O(N log N): um único índice
+pai -> filhos já ordenado e construção iterativa (sem recursão), de modo que
+árvores profundas não atingem o limite de recursão do Python.
+"""
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+# Campos obrigatórios para que um nó seja incluído na árvore
+REQUIRED_NODE_FIELDS = ('id', 'label', 'type', 'status')
+
+
+def node_sort_key(node: Dict[str, Any]):
+    """Ordenação dos irmãos: display_order (NULL como 0), depois created_at"""
+    return (node.get('display_order', 0) or 0, node.get('created_at', '') or '')
+
+
+def index_children(nodes: List[Dict[str, Any]]) -> Dict[Optional[str], List[Dict[str, Any]]]:
+    """Cria o índice parent_id -> filhos ordenados em uma única passada"""
+    children: Dict[Optional[str], List[Dict[str, Any]]] = defaultdict(list)
+    for node in nodes:
+        children[node.get('parent_id')].append(node)
+    for siblings in children.values():
+        siblings.sort(key=node_sort_key)
+    return children
+
+
+def node_to_json(node: Dict[str, Any], nbr_standards_map: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+    """Converte um nó do banco no formato JSON da árvore (sem os filhos)"""
+    # Busca código NBR e descrição se existir
+    nbr_code = None
+    nbr_description = None
+    nbr_standard_id = node.get('nbr_standard_id')
+    if nbr_standard_id is not None:
+        try:
+            nbr_info = nbr_standards_map.get(int(nbr_standard_id))
+        except (TypeError, ValueError):
+            nbr_info = None
+        if nbr_info:
+            nbr_code = nbr_info.get('code')
+            nbr_description = nbr_info.get('description')
+
+    # Constrói objeto do nó com valores defensivos para campos opcionais
+    return {
+        "id": str(node.get('id', '')),
+        "label": node.get('label', ''),
+        "type": node.get('type', 'hypothesis'),
+        "status": node.get('status', 'pending'),
+        "is_basic_cause": bool(node.get('is_basic_cause', False)),  # Campo para marcar manualmente como causa básica
+        "is_contributing_cause": bool(node.get('is_contributing_cause', False)),  # Campo para marcar manualmente como causa contribuinte
+        "nbr_code": nbr_code or None,
+        "nbr_description": nbr_description or '',
+        "justification": node.get('justification') or '',  # Justificativa para confirmação/descarte
+        "justification_image_url": node.get('justification_image_url') or None,  # URL da imagem da justificativa
+        "recommendation": node.get('recommendation') or None,  # Recomendação para prevenir/corrigir a causa
+        "children": []
+    }
+
+
+def assemble_fault_tree(nodes: List[Dict[str, Any]],
+                        nbr_standards_map: Optional[Dict[int, Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Constrói a estrutura hierárquica JSON a partir da lista plana de nós.
+
+    O nó raiz é o primeiro nó sem parent_id. Nós órfãos (pai inexistente) ficam
+    de fora, e ciclos são ignorados. Retorna None se não houver nó raiz.
+    """
+    nbr_standards_map = nbr_standards_map or {}
+
+    root_node = next((node for node in nodes if node.get('parent_id') is None), None)
+    if root_node is None:
+        return None
+
+    children_by_parent = index_children(nodes)
+
+    root_json = node_to_json(root_node, nbr_standards_map)
+    visited = {root_node['id']}
+    stack = [(root_node['id'], root_json)]
+
+    while stack:
+        node_id, node_json = stack.pop()
+        for child in children_by_parent.get(node_id, ()):
+            child_id = child['id']
+            if child_id in visited:
+                continue
+            visited.add(child_id)
+            child_json = node_to_json(child, nbr_standards_map)
+            # A ordem dos filhos é definida aqui; a ordem da pilha não a altera
+            node_json["children"].append(child_json)
+            stack.append((child_id, child_json))
+
+    return root_json
+
+
+def subtree_delete_batches(nodes: List[Dict[str, Any]], node_id: str,
+                           batch_size: int) -> List[List[str]]:
+    """
+    IDs do nó e de todos os seus descendentes, em lotes para DELETE ... in_().
+
+    parent_id é uma FK para o próprio fault_tree_nodes sem cascade: os lotes saem
+    com os descendentes antes dos ancestrais, de modo que nenhum lote remove um
+    nó cujos filhos ainda estão em um lote posterior.
+    """
+    children_by_parent: Dict[str, List[str]] = defaultdict(list)
+    for row in nodes:
+        if row.get('parent_id') is not None:
+            children_by_parent[str(row['parent_id'])].append(str(row['id']))
+
+    # Pré-ordem: todo nó aparece depois do seu pai
+    subtree_ids = [str(node_id)]
+    seen = {str(node_id)}
+    stack = [str(node_id)]
+    while stack:
+        for child_id in children_by_parent.get(stack.pop(), ()):
+            if child_id not in seen:
+                seen.add(child_id)
+                subtree_ids.append(child_id)
+                stack.append(child_id)
+
+    subtree_ids.reverse()
+    return [subtree_ids[start:start + batch_size] for start in range(0, len(subtree_ids), batch_size)]
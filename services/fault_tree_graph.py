@@ -0,0 +1,211 @@
+"""
+Diagrama graphviz da árvore de falhas com cache em disco endereçado por conteúdo
+
+O código DOT é gerado a partir do JSON da árvore e o seu hash (mais o formato e a
+versão do graphviz) é o nome do arquivo renderizado. Árvores iguais nunca passam
+pelo layout do dot duas vezes: a página (SVG) e o exportador Word (PNG) leem o
+mesmo diretório. O diretório é limitado por tamanho (GRAPH_CACHE_CONFIG), e os
+arquivos menos usados recentemente (mtime) são removidos primeiro.
+"""
+import functools
+import hashlib
+import logging
+import os
+import tempfile
+from typing import Any, Dict, List, Optional
+
+from config.config import get_config
+
+logger = logging.getLogger(__name__)
+
+# Cores baseadas no status (semáforo)
+STATUS_COLORS = {
+    'validated': '#28a745',  # Verde - Confirmado
+    'discarded': '#dc3545',  # Vermelho - Descartado
+    'pending': '#6c757d',    # Cinza - Em análise
+}
+
+# Formatos aceitos e resolução do PNG usado nos exportadores
+GRAPH_FORMATS = ('svg', 'png')
+PNG_DPI = 150
+
+
+def _quote(value: Any) -> str:
+    """Texto como string DOT entre aspas (quebras de linha viram \\n)"""
+    text = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return f'"{text}"'
+
+
+def build_fault_tree_dot(tree_json: Dict[str, Any], dpi: Optional[int] = None) -> str:
+    """Código DOT da árvore (rótulo, tipo, NBR e cor por status), montado sem recursão"""
+    lines = [
+        '// Fault Tree Analysis',
+        'digraph {',
+        '\trankdir=TB',
+    ]
+    if dpi:
+        lines.append(f'\tdpi={int(dpi)}')
+    lines.append('\tnode [shape=box style=rounded]')
+
+    stack: List[Dict[str, Any]] = [tree_json]
+    edges: List[str] = []
+    while stack:
+        node = stack.pop()
+        node_id = str(node['id'])
+        full_label = node.get('label', '') or ''
+        label = full_label[:50] + '...' if len(full_label) > 50 else full_label
+        status = node.get('status', 'pending')
+        node_type = node.get('type', 'hypothesis')
+        nbr_code = node.get('nbr_code')
+
+        # Label com tipo e código NBR (se existir)
+        display_label = f"{label}\n[{node_type}]"
+        if nbr_code:
+            display_label += f"\nNBR: {nbr_code}"
+        if status == 'discarded':
+            display_label = f"~~{label}~~\n[{node_type}] - DESCARTADO"
+
+        color = STATUS_COLORS.get(status, '#6c757d')
+        font_color = 'white' if status != 'pending' else 'black'
+        lines.append(
+            f'\t{_quote(node_id)} [label={_quote(display_label)} fillcolor={_quote(color)} '
+            f'fontcolor={_quote(font_color)} style=filled]'
+        )
+
+        children = node.get('children') or []
+        for child in children:
+            edges.append(f'\t{_quote(node_id)} -> {_quote(child["id"])}')
+        stack.extend(reversed(children))
+
+    lines.extend(edges)
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+@functools.lru_cache(maxsize=1)
+def _graphviz_version() -> str:
+    """Versão do dot instalado (faz parte da chave: outra versão gera outro layout)"""
+    try:
+        import graphviz
+        return '.'.join(str(part) for part in graphviz.version())
+    except Exception:
+        return 'unknown'
+
+
+def graph_cache_key(dot_source: str, fmt: str) -> str:
+    """Chave (sha256) do artefato renderizado"""
+    digest = hashlib.sha256()
+    digest.update(f'{fmt}|{_graphviz_version()}|'.encode('utf-8'))
+    digest.update(dot_source.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _cache_dir() -> str:
+    path = get_config("graph_cache").get("dir") or os.path.join(tempfile.gettempdir(), "sso_graph_cache")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def prune_graph_cache(max_bytes: Optional[int] = None, keep: Optional[str] = None) -> int:
+    """
+    Remove os arquivos menos usados até o diretório caber no limite.
+
+    `keep` (o arquivo recém-gerado) nunca é removido.
+
+    Returns:
+        Número de arquivos removidos
+    """
+    if max_bytes is None:
+        max_bytes = int(get_config("graph_cache").get("max_size_mb", 64)) * 1024 * 1024
+    directory = _cache_dir()
+
+    entries = []
+    total = 0
+    with os.scandir(directory) as it:
+        for entry in it:
+            if not entry.is_file() or entry.name.startswith('.'):
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if keep and path == keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except FileNotFoundError:
+            total -= size
+        except OSError as e:
+            logger.warning(f"[GRAPH_CACHE] Não foi possível remover {path}: {e}")
+    return removed
+
+
+def fault_tree_graph_path(tree_json: Optional[Dict[str, Any]], fmt: str = 'svg') -> Optional[str]:
+    """
+    Caminho do diagrama renderizado, gerando-o apenas se ainda não estiver no cache.
+
+    Args:
+        tree_json: Árvore no formato de services.fault_tree
+        fmt: "svg" (página) ou "png" (exportadores)
+
+    Returns:
+        Caminho do arquivo, ou None sem árvore ou sem graphviz/dot disponível
+    """
+    if not tree_json or fmt not in GRAPH_FORMATS:
+        return None
+
+    source = build_fault_tree_dot(tree_json, dpi=PNG_DPI if fmt == 'png' else None)
+    directory = _cache_dir()
+    path = os.path.join(directory, f'{graph_cache_key(source, fmt)}.{fmt}')
+
+    if os.path.exists(path):
+        try:
+            # Marca como usado recentemente para a remoção por tamanho
+            os.utime(path, None)
+        except OSError:
+            pass
+        return path
+
+    try:
+        import graphviz
+        rendered = graphviz.pipe('dot', fmt, source.encode('utf-8'))
+    except Exception as e:
+        logger.warning(f"[GRAPH_CACHE] Falha ao renderizar a árvore com graphviz: {e}")
+        return None
+
+    # Grava em arquivo temporário e renomeia: leitores nunca veem um arquivo parcial
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix=f'.{fmt}')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(rendered)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    prune_graph_cache(keep=path)
+    return path
+
+
+def render_fault_tree_graph(tree_json: Optional[Dict[str, Any]], fmt: str = 'svg') -> Optional[bytes]:
+    """Conteúdo do diagrama renderizado (SVG ou PNG), lido do cache quando possível"""
+    try:
+        path = fault_tree_graph_path(tree_json, fmt)
+    except OSError as e:
+        logger.warning(f"[GRAPH_CACHE] Erro no cache de diagramas: {e}")
+        return None
+    if not path:
+        return None
+    try:
+        with open(path, 'rb') as fp:
+            return fp.read()
+    except FileNotFoundError:
+        # Removido por outro processo entre a verificação e a leitura
+        return None
@@ -0,0 +1,362 @@
+"""
+Renderização da árvore de falhas (FTA) em HTML, compartilhada pela tela e pelo PDF
+
+Dois temas sobre a mesma numeração e classificação dos nós:
+- "screen": layout flex usado na página de investigação (st.markdown)
+- "pdf": layout em tabelas, compatível com o WeasyPrint
+
+O estilo fica em uma folha de estilo por árvore (classes CSS) em vez de ~1 KB de
+estilo inline por nó. O HTML de cada subárvore é memorizado pelo hash do seu
+conteúdo (campos exibidos, numeração, nível e hashes dos filhos), então, entre um
+rerun e outro, só as subárvores que mudaram são montadas de novo.
+"""
+import hashlib
+import html
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.data_cache import TTLCache
+
+# Subárvores memorizadas (compartilhado entre sessões; o conteúdo faz parte da chave)
+_subtree_cache = TTLCache(ttl_seconds=3600, max_entries=20000, max_memory_mb=32)
+
+# Cores de cada categoria de nó: (fundo, borda)
+NODE_PALETTE = {
+    'basic': ('#c8e6c9', '#4caf50'),         # Causa básica (oval verde)
+    'contributing': ('#bbdefb', '#2196f3'),  # Causa contribuinte (oval azul)
+    'root': ('#ffcdd2', '#f44336'),          # Evento topo (retângulo vermelho)
+    'intermediate': ('#fff9c4', '#f9a825'),  # Causa intermediária validada (retângulo amarelo)
+    'discarded': ('#ffcdd2', '#f44336'),     # Hipótese descartada (losango vermelho com X)
+    'pending': ('#e0e0e0', '#757575'),       # Hipótese pendente (losango cinza)
+}
+
+NODE_SHAPES = {
+    'basic': 'oval',
+    'contributing': 'oval',
+    'root': 'rect',
+    'intermediate': 'rect',
+    'discarded': 'diamond',
+    'pending': 'diamond',
+}
+
+# Tamanho máximo do rótulo no PDF (A4 paisagem)
+PDF_LABEL_MAX = 50
+
+
+def node_category(node: Dict[str, Any]) -> str:
+    """Categoria visual do nó (chave de NODE_PALETTE)"""
+    status = node.get('status', 'pending')
+    node_type = node.get('type', 'hypothesis')
+    if node.get('is_basic_cause', False):
+        return 'basic'
+    if node.get('is_contributing_cause', False):
+        return 'contributing'
+    if node_type == 'root':
+        return 'root'
+    if status == 'validated' and node.get('children'):
+        return 'intermediate'
+    if status == 'discarded':
+        return 'discarded'
+    return 'pending'
+
+
+def _number_prefix(node: Dict[str, Any]) -> str:
+    """Prefixo da numeração do nó: H, CB, CC ou vazio"""
+    status = node.get('status', 'pending')
+    node_type = node.get('type', 'hypothesis')
+    has_children = bool(node.get('children'))
+
+    # Root NUNCA tem numeração
+    if node_type == 'root':
+        return ""
+    # Causa básica / contribuinte: marcadas manualmente pelo usuário
+    if node.get('is_basic_cause', False):
+        return "CB"
+    if node.get('is_contributing_cause', False):
+        return "CC"
+    # Hipóteses, fatos com filhos, intermediárias validadas e pendentes/descartadas
+    if node_type == 'hypothesis' or (node_type == 'fact' and has_children):
+        return "H"
+    if status == 'validated' and has_children:
+        return "H"
+    if status in ['pending', 'discarded']:
+        return "H"
+    return ""
+
+
+def _walk(tree_json: Dict[str, Any]) -> List[Tuple[Dict[str, Any], int]]:
+    """Nós em pré-ordem com o nível (iterativo, sem limite de recursão)"""
+    ordered = []
+    stack = [(tree_json, 0)]
+    while stack:
+        node, level = stack.pop()
+        ordered.append((node, level))
+        for child in reversed(node.get('children') or []):
+            stack.append((child, level + 1))
+    return ordered
+
+
+def number_nodes(tree_json: Dict[str, Any]) -> Dict[int, str]:
+    """Numeração H1, CB1, CC1... em pré-ordem, indexada por id() do nó"""
+    counters = {"H": 0, "CB": 0, "CC": 0}
+    numbers = {}
+    for node, _ in _walk(tree_json):
+        prefix = _number_prefix(node)
+        if prefix:
+            counters[prefix] += 1
+            numbers[id(node)] = f"{prefix}{counters[prefix]}"
+        else:
+            numbers[id(node)] = ""
+    return numbers
+
+
+# ---------------------------------------------------------------------------
+# Tema "screen" (página de investigação)
+# ---------------------------------------------------------------------------
+
+_SCREEN_CSS = (
+    ".fta{position:relative;font-family:Arial,sans-serif;padding:15px 10px;background:white;min-height:250px;"
+    "overflow-x:auto;border:1px solid #e0e0e0;border-radius:8px}"
+    ".fta-head{text-align:center;margin-bottom:15px}"
+    ".fta-head h2{margin:0;color:#333;font-size:1.2em;font-weight:bold}"
+    ".fta-date{color:#666;font-size:0.8em;margin-top:3px}"
+    ".fta-body{display:flex;justify-content:center;align-items:flex-start;min-height:180px;padding:10px 0}"
+    ".fta-sub{position:relative;display:inline-flex;flex-direction:column;align-items:center}"
+    ".fta-up{position:absolute;left:50%;top:-12px;width:2px;height:12px;background-color:#2196f3;transform:translateX(-50%)}"
+    ".fta-n{position:relative;margin:6px}"
+    ".fta-rect,.fta-oval{min-height:50px;display:flex;align-items:center;justify-content:center;padding:8px 12px;"
+    "border:2px solid;box-shadow:0 2px 6px rgba(0,0,0,0.15)}"
+    ".fta-rect{border-radius:10px;width:160px}"
+    ".fta-oval{border-radius:50%;width:130px}"
+    ".fta-diamond{width:140px;height:140px}"
+    ".fta-bg{position:absolute;top:0;left:0;width:100%;height:100%;clip-path:polygon(50% 0%,100% 50%,50% 100%,0% 50%);"
+    "border:2px solid;box-shadow:0 2px 6px rgba(0,0,0,0.15)}"
+    ".fta-c{z-index:2;position:relative}"
+    ".fta-diamond>.fta-c{position:absolute;top:50%;left:50%;transform:translate(-50%,-50%);width:70%;text-align:center}"
+    ".fta-l{color:#000000;font-weight:500;font-size:0.7em;line-height:1.15;word-wrap:break-word}"
+    ".fta-nbr{margin-top:3px;font-size:0.6em;color:#1976d2;font-weight:600}"
+    ".fta-num{position:absolute;top:-8px;left:-8px;color:white;width:22px;height:22px;border-radius:50%;display:flex;"
+    "align-items:center;justify-content:center;font-weight:bold;font-size:0.65em;box-shadow:0 2px 4px rgba(0,0,0,0.3);z-index:10}"
+    ".fta-x{position:absolute;top:50%;left:50%;transform:translate(-50%,-50%);font-size:2em;color:#d32f2f;font-weight:bold;"
+    "pointer-events:none;z-index:5;text-shadow:1px 1px 3px rgba(255,255,255,0.9)}"
+    ".fta-kids{position:relative;margin-top:12px}"
+    ".fta-vl{position:absolute;left:50%;top:0;width:2px;height:12px;background-color:#2196f3;transform:translateX(-50%)}"
+    ".fta-hl{position:absolute;left:0;right:0;top:12px;height:2px;background-color:#2196f3}"
+    ".fta-row{display:flex;flex-wrap:wrap;justify-content:center;align-items:flex-start;gap:12px;padding-top:25px}"
+) + "".join(
+    f".fta-k-{key}.fta-rect,.fta-k-{key}.fta-oval,.fta-k-{key}>.fta-bg{{background-color:{bg};border-color:{border}}}"
+    f".fta-k-{key}>.fta-num{{background-color:{border}}}"
+    for key, (bg, border) in NODE_PALETTE.items()
+)
+
+_SCREEN_LEGEND = '<div style="position: absolute; top: 8px; right: 8px; background: white; border: 2px solid #333; padding: 8px; border-radius: 4px; font-size: 0.7em; z-index: 1000; box-shadow: 0 2px 6px rgba(0,0,0,0.2); max-width: 180px;"><div style="font-weight: bold; margin-bottom: 6px; border-bottom: 1px solid #ccc; padding-bottom: 4px; font-size: 0.9em;">LEGENDA</div><div style="margin-bottom: 4px;"><strong>H:</strong> Hipótese</div><div style="margin-bottom: 4px;"><strong>CB:</strong> Causa Básica</div><div style="margin-bottom: 4px;"><strong>CC:</strong> Causa Contribuinte</div><div style="margin-bottom: 4px; display: flex; align-items: center; gap: 6px;"><div style="width: 14px; height: 14px; background: #ffcdd2; border: 2px solid #f44336; border-radius: 3px;"></div><span>Evento Topo</span></div><div style="margin-bottom: 4px; display: flex; align-items: center; gap: 6px;"><div style="width: 14px; height: 14px; clip-path: polygon(50% 0%, 100% 50%, 50% 100%, 0% 50%); background: #e0e0e0; border: 2px solid #757575;"></div><span>Hipótese</span></div><div style="margin-bottom: 4px; display: flex; align-items: center; gap: 6px;"><div style="width: 14px; height: 14px; clip-path: polygon(50% 0%, 100% 50%, 50% 100%, 0% 50%); background: #ffcdd2; border: 2px solid #f44336; position: relative;"><span style="position: absolute; top: 50%; left: 50%; transform: translate(-50%, -50%); color: #d32f2f; font-size: 10px;">✕</span></div><span>Descartada</span></div><div style="margin-bottom: 4px; display: flex; align-items: center; gap: 6px;"><div style="width: 14px; height: 14px; background: #fff9c4; border: 2px solid #f9a825; border-radius: 3px;"></div><span>Intermediária</span></div><div style="margin-bottom: 4px; display: flex; align-items: center; gap: 6px;"><div style="width: 14px; height: 14px; background: #c8e6c9; border: 2px solid #4caf50; border-radius: 50%;"></div><span>Causa Básica</span></div><div style="display: flex; align-items: center; gap: 6px;"><div style="width: 14px; height: 14px; background: #bbdefb; border: 2px solid #2196f3; border-radius: 50%;"></div><span>Causa Contribuinte</span></div></div>'
+
+
+def _screen_node(node: Dict[str, Any], number: str, level: int, children_html: List[str]) -> str:
+    category = node_category(node)
+    shape = NODE_SHAPES[category]
+    label = html.escape(node.get('label', '') or '').replace('\n', '<br>')
+    nbr_code = node.get('nbr_code')
+
+    number_html = f'<div class="fta-num">{number}</div>' if number else ""
+    discard_x = '<div class="fta-x">✕</div>' if node.get('status', 'pending') == 'discarded' else ""
+    nbr_html = f'<div class="fta-nbr">NBR: {html.escape(str(nbr_code))}</div>' if nbr_code else ""
+    content = f'<div class="fta-c"><div class="fta-l">{label}{nbr_html}</div></div>'
+    background = '<div class="fta-bg"></div>' if shape == 'diamond' else ""
+
+    node_html = f'<div class="fta-n fta-{shape} fta-k-{category}">{number_html}{background}{discard_x}{content}</div>'
+    kids = ""
+    if children_html:
+        kids = f'<div class="fta-kids"><div class="fta-vl"></div><div class="fta-hl"></div><div class="fta-row">{"".join(children_html)}</div></div>'
+    connector = '<div class="fta-up"></div>' if level > 0 else ""
+    return f'<div class="fta-sub">{connector}{node_html}{kids}</div>'
+
+
+def _screen_page(tree_html: str) -> str:
+    return (
+        f'<div class="fta"><style>{_SCREEN_CSS}</style>'
+        f'<div class="fta-head"><h2>ÁRVORE DE FALHAS (FTA)</h2><div class="fta-date">{date.today().strftime("%d/%m/%Y")}</div></div>'
+        f'{_SCREEN_LEGEND}<div class="fta-body">{tree_html}</div></div>'
+    )
+
+
+# ---------------------------------------------------------------------------
+# Tema "pdf" (tabelas para o WeasyPrint, A4 paisagem)
+# ---------------------------------------------------------------------------
+
+_PDF_CSS = (
+    ".ftp-t{border-collapse:collapse;margin:0 auto}"
+    ".ftp-top{text-align:center;padding-bottom:2px}"
+    ".ftp-cell{vertical-align:top;padding:0 3px}"
+    ".ftp-vl{width:1px;height:8px;background-color:#2196f3;margin:0 auto}"
+    ".ftp-leaf{margin-bottom:2px}"
+    ".ftp-hl{height:1px;background-color:#2196f3;margin:0 auto;width:95%}"
+    ".ftp-n{position:relative;margin:0 auto}"
+    ".ftp-diamond{width:60px;height:60px}"
+    ".ftp-svg{position:absolute;top:0;left:0}"
+    ".ftp-rect,.ftp-oval{min-height:35px;border:1px solid;padding:4px 8px}"
+    ".ftp-rect{width:80px;border-radius:5px}"
+    ".ftp-oval{width:70px;border-radius:25px}"
+    ".ftp-l{text-align:center;font-size:5pt;line-height:1.0;color:#000000}"
+    ".ftp-diamond>.ftp-l{position:absolute;top:50%;left:50%;width:50px;margin-left:-25px;margin-top:-12px}"
+    ".ftp-nbr{margin-top:1px;font-size:4.5pt;color:#1976d2;font-weight:600}"
+    ".ftp-x{position:absolute;top:50%;left:50%;margin-left:-8px;margin-top:-8px;font-size:16px;color:#d32f2f;font-weight:bold}"
+    ".ftp-num{position:absolute;top:-2px;left:-2px;color:white;width:14px;height:14px;border-radius:50%;text-align:center;"
+    "line-height:14px;font-weight:bold;font-size:6pt}"
+) + "".join(
+    f".ftp-k-{key}.ftp-rect,.ftp-k-{key}.ftp-oval{{background-color:{bg};border-color:{border}}}"
+    f".ftp-k-{key}>.ftp-num{{background-color:{border}}}"
+    for key, (bg, border) in NODE_PALETTE.items()
+)
+
+_PDF_LEGEND = '''
+    <div style="position: absolute; top: 5px; right: 5px; background: white; border: 1.5px solid #333; padding: 5px; border-radius: 3px; font-size: 5.5pt; width: 120px;">
+        <div style="font-weight: bold; margin-bottom: 3px; border-bottom: 1px solid #ccc; padding-bottom: 2px; font-size: 6pt;">LEGENDA</div>
+        <div style="margin-bottom: 2px;"><strong>H:</strong> Hipótese</div>
+        <div style="margin-bottom: 2px;"><strong>CB:</strong> Causa Básica</div>
+        <div style="margin-bottom: 2px;"><strong>CC:</strong> Causa Contribuinte</div>
+        <div style="margin-top: 3px; margin-bottom: 2px;">
+            <span style="display: inline-block; width: 10px; height: 10px; background: #ffcdd2; border: 1px solid #f44336; border-radius: 2px; vertical-align: middle;"></span>
+            <span style="margin-left: 3px;">Evento Topo</span>
+        </div>
+        <div style="margin-bottom: 2px;">
+            <svg width="10" height="10" style="display: inline-block; vertical-align: middle; margin-right: 3px;">
+                <polygon points="5,1 9,5 5,9 1,5" fill="#e0e0e0" stroke="#757575" stroke-width="1"/>
+            </svg>
+            <span style="margin-left: 3px;">Hipótese</span>
+        </div>
+        <div style="margin-bottom: 2px;">
+            <svg width="10" height="10" style="display: inline-block; vertical-align: middle; margin-right: 3px;">
+                <polygon points="5,1 9,5 5,9 1,5" fill="#ffcdd2" stroke="#f44336" stroke-width="1"/>
+                <text x="5" y="7" text-anchor="middle" font-size="8" fill="#d32f2f" font-weight="bold">✕</text>
+            </svg>
+            <span style="margin-left: 3px;">Descartada</span>
+        </div>
+        <div style="margin-bottom: 2px;">
+            <span style="display: inline-block; width: 10px; height: 10px; background: #fff9c4; border: 1px solid #f9a825; border-radius: 2px; vertical-align: middle;"></span>
+            <span style="margin-left: 3px;">Intermediária</span>
+        </div>
+        <div style="margin-bottom: 2px;">
+            <span style="display: inline-block; width: 10px; height: 10px; background: #c8e6c9; border: 1px solid #4caf50; border-radius: 50%; vertical-align: middle;"></span>
+            <span style="margin-left: 3px;">Causa Básica</span>
+        </div>
+        <div>
+            <span style="display: inline-block; width: 10px; height: 10px; background: #bbdefb; border: 1px solid #2196f3; border-radius: 50%; vertical-align: middle;"></span>
+            <span style="margin-left: 3px;">Causa Contribuinte</span>
+        </div>
+    </div>
+'''
+
+
+def _pdf_node(node: Dict[str, Any], number: str, level: int, children_html: List[str]) -> str:
+    category = node_category(node)
+    shape = NODE_SHAPES[category]
+    bg, border = NODE_PALETTE[category]
+
+    # Trunca label se muito longo
+    label = node.get('label', '') or ''
+    if len(label) > PDF_LABEL_MAX:
+        label = label[:PDF_LABEL_MAX] + '...'
+    label = html.escape(label).replace('\n', '<br>')
+    nbr_code = node.get('nbr_code')
+    number_html = f'<div class="ftp-num">{number}</div>' if number else ""
+
+    if shape == 'diamond':
+        # Losango em SVG (fill/stroke como atributos: o WeasyPrint não aplica o CSS da página dentro do SVG)
+        discard_x = '<div class="ftp-x">✕</div>' if node.get('status', 'pending') == 'discarded' else ""
+        node_html = (
+            f'<div class="ftp-n ftp-diamond ftp-k-{category}">'
+            f'<svg width="60" height="60" class="ftp-svg"><polygon points="30,2 58,30 30,58 2,30" fill="{bg}" stroke="{border}" stroke-width="1"/></svg>'
+            f'<div class="ftp-l">{label}</div>{discard_x}{number_html}</div>'
+        )
+    else:
+        nbr_html = f'<div class="ftp-nbr">NBR: {html.escape(str(nbr_code))}</div>' if nbr_code else ""
+        node_html = f'<div class="ftp-n ftp-{shape} ftp-k-{category}"><div class="ftp-l">{label}{nbr_html}</div>{number_html}</div>'
+
+    if children_html:
+        horizontal_line = '<div class="ftp-hl"></div>' if len(children_html) > 1 else ""
+        cells = "".join(f'<td class="ftp-cell">{child}</td>' for child in children_html)
+        return (
+            f'<table class="ftp-t"><tr><td colspan="{len(children_html)}" class="ftp-top">'
+            f'{node_html}<div class="ftp-vl"></div>{horizontal_line}</td></tr><tr>{cells}</tr></table>'
+        )
+    if level > 0:
+        return f'<div class="ftp-vl ftp-leaf"></div>{node_html}'
+    return node_html
+
+
+def _pdf_page(tree_html: str) -> str:
+    # Árvore centralizada em A4 paisagem
+    return f'''
+    <div class="fault-tree-landscape" style="position: relative; padding: 5px; padding-top: 6cm; background: white; min-height: 190mm; page-break-inside: avoid; border: 1px solid #e0e0e0;">
+        <style>{_PDF_CSS}</style>
+        {_PDF_LEGEND}
+        <div style="overflow: hidden;">
+            {tree_html}
+        </div>
+    </div>
+    '''
+
+
+_THEMES = {
+    'screen': (_screen_node, _screen_page),
+    'pdf': (_pdf_node, _pdf_page),
+}
+
+
+def _subtree_key(theme: str, node: Dict[str, Any], number: str, level: int, child_keys: List[str]) -> str:
+    """Hash do conteúdo exibido da subárvore (inclui numeração e hashes dos filhos)"""
+    fields = (
+        theme, node.get('status', 'pending'), node.get('type', 'hypothesis'), node.get('label', ''),
+        node.get('nbr_code'), bool(node.get('is_basic_cause', False)),
+        bool(node.get('is_contributing_cause', False)), number, level > 0, tuple(child_keys),
+    )
+    return hashlib.blake2b(repr(fields).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def render_fault_tree(tree_json: Optional[Dict[str, Any]], theme: str = 'screen') -> str:
+    """
+    Renderiza a árvore de falhas no padrão FTA.
+
+    Args:
+        tree_json: Árvore no formato de services.fault_tree (nós com "children")
+        theme: "screen" (página de investigação) ou "pdf" (relatório WeasyPrint)
+
+    Returns:
+        HTML completo (folha de estilo, legenda e árvore) ou "" sem árvore
+    """
+    if not tree_json:
+        return ""
+    render_node, render_page = _THEMES[theme]
+
+    nodes = _walk(tree_json)
+    numbers = number_nodes(tree_json)
+
+    # Hashes de baixo para cima (pré-ordem invertida: filhos antes dos pais)
+    keys: Dict[int, str] = {}
+    for node, level in reversed(nodes):
+        child_keys = [keys[id(child)] for child in node.get('children') or []]
+        keys[id(node)] = _subtree_key(theme, node, numbers[id(node)], level, child_keys)
+
+    # Desce a partir da raiz só enquanto a subárvore não estiver memorizada
+    rendered: Dict[int, str] = {}
+    pending: List[Tuple[Dict[str, Any], int]] = []
+    stack = [(tree_json, 0)]
+    while stack:
+        node, level = stack.pop()
+        found, cached = _subtree_cache.get(keys[id(node)])
+        if found:
+            rendered[id(node)] = cached
+            continue
+        pending.append((node, level))
+        for child in node.get('children') or []:
+            stack.append((child, level + 1))
+
+    # Monta as subárvores que mudaram, filhos antes dos pais
+    for node, level in reversed(pending):
+        children_html = [rendered[id(child)] for child in node.get('children') or []]
+        node_html = render_node(node, numbers[id(node)], level, children_html)
+        rendered[id(node)] = node_html
+        _subtree_cache.set(keys[id(node)], node_html)
+
+    return render_page(rendered[id(tree_json)])
@@ -6,6 +6,7 @@ from managers.supabase_config import get_supabase_client, get_service_role_clien
 from auth.auth_utils import get_user_id, is_admin, get_user_email
 from typing import List, Dict, Optional
 import pandas as pd
+from services.data_cache import invalidate_table
 
 def get_user_feedbacks() -> List[Dict]:
     """Busca todos os feedbacks do usuário logado"""
@@ -74,6 +75,7 @@ def create_feedback(feedback_data: Dict) -> bool:
         result = supabase.table("feedbacks").insert(feedback_data).execute()
         
         if result.data:
+            invalidate_table("feedbacks")
             st.success("✅ Feedback registrado com sucesso! Obrigado pela sua contribuição.")
             
             # Registra log da ação
@@ -127,6 +129,7 @@ def update_feedback_status(feedback_id: str, new_status: str, admin_notes: Optio
             .execute()
         
         if result.data:
+            invalidate_table("feedbacks")
             return True
         else:
             st.error("Erro ao atualizar feedback")
@@ -172,6 +175,7 @@ def delete_feedback(feedback_id: str) -> bool:
             .execute()
         
         if result.data:
+            invalidate_table("feedbacks")
             st.success("Feedback removido com sucesso!")
             return True
         else:
@@ -190,40 +194,18 @@ def get_feedback_statistics() -> Dict:
         # Admin usa service_role para ver todas as estatísticas
         supabase = get_service_role_client()
         
-        # Total de feedbacks
-        total = supabase.table("feedbacks").select("id", count="exact").execute()
+        from services.statistics import grouped_counts
         
-        # Por tipo
-        tipos = supabase.table("feedbacks").select("type").execute()
-        
-        # Por status
-        status = supabase.table("feedbacks").select("status").execute()
-        
-        # Por prioridade
-        prioridades = supabase.table("feedbacks").select("priority").execute()
+        # Total e contagens por tipo/status/prioridade agrupados no banco (com cache curto)
+        counts = grouped_counts(supabase, "feedbacks", {"type": "outro", "status": "aberto", "priority": "media"})
         
         stats = {
-            "total": total.count if hasattr(total, 'count') else 0,
-            "por_tipo": {},
-            "por_status": {},
-            "por_prioridade": {}
+            "total": counts["total"],
+            "por_tipo": counts["type"],
+            "por_status": counts["status"],
+            "por_prioridade": counts["priority"]
         }
         
-        if tipos.data:
-            for tipo in tipos.data:
-                tipo_val = tipo.get('type', 'outro')
-                stats["por_tipo"][tipo_val] = stats["por_tipo"].get(tipo_val, 0) + 1
-        
-        if status.data:
-            for stat in status.data:
-                stat_val = stat.get('status', 'aberto')
-                stats["por_status"][stat_val] = stats["por_status"].get(stat_val, 0) + 1
-        
-        if prioridades.data:
-            for prioridade in prioridades.data:
-                prior_val = prioridade.get('priority', 'media')
-                stats["por_prioridade"][prior_val] = stats["por_prioridade"].get(prior_val, 0) + 1
-        
         return stats
     except Exception as e:
         st.error(f"Erro ao buscar estatísticas: {str(e)}")
@@ -6,10 +6,12 @@ import io
 import time
 import tempfile
 import os
+import threading
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from managers.supabase_config import get_supabase_client
 from auth.auth_utils import get_user_id, get_user_email
+from services.fault_tree import assemble_fault_tree, subtree_delete_batches, REQUIRED_NODE_FIELDS
 import streamlit as st
 
 
@@ -82,6 +84,10 @@ def create_accident(title: str, description: str = "", occurrence_date: Optional
         response = supabase.table("accidents").insert(data).execute()
         
         if response.data:
+            from services.data_cache import invalidate_table
+            from services.kpi import refresh_kpi_buckets, accident_kpi_buckets
+            invalidate_table("accidents", user_id)
+            refresh_kpi_buckets(accident_kpi_buckets(response.data))
             return response.data[0]["id"]
         return None
     except Exception as e:
@@ -89,6 +95,10 @@ def create_accident(title: str, description: str = "", occurrence_date: Optional
         return None
 
 
+# Colunas de accidents usadas no cálculo da kpi_monthly
+KPI_ACCIDENT_FIELDS = frozenset({'occurred_at', 'lost_days', 'type'})
+
+
 def update_accident(accident_id: str, **kwargs) -> bool:
     """Atualiza dados de uma investigação de acidente"""
     import logging
@@ -182,12 +192,22 @@ def update_accident(accident_id: str, **kwargs) -> bool:
             logger.warning("[UPDATE_ACCIDENT] Nenhum campo para atualizar após filtro")
             return True
         
+        # Campos que alteram o KPI mensal: guarda o mês anterior para recalculá-lo também
+        previous_rows = []
+        if KPI_ACCIDENT_FIELDS.intersection(final_data):
+            previous_rows = supabase.table("accidents").select("created_by, occurred_at").eq("id", accident_id).execute().data or []
+        
         # Executa atualização
         try:
             response = supabase.table("accidents").update(final_data).eq("id", accident_id).execute()
             
             if response.data and len(response.data) > 0:
                 logger.info(f"[UPDATE_ACCIDENT] Acidente {accident_id} atualizado com sucesso. Registros afetados: {len(response.data)}")
+                from services.data_cache import invalidate_table
+                invalidate_table("accidents", response.data[0].get('created_by'))
+                if previous_rows:
+                    from services.kpi import refresh_kpi_buckets, accident_kpi_buckets
+                    refresh_kpi_buckets(accident_kpi_buckets(previous_rows) | accident_kpi_buckets(response.data))
                 return True
             else:
                 logger.error(f"[UPDATE_ACCIDENT] Nenhum dado foi atualizado para acidente {accident_id}")
@@ -226,8 +246,118 @@ def get_involved_people(accident_id: str, person_type: Optional[str] = None) ->
         return []
 
 
+# Colunas de involved_people gravadas a partir do formulário de investigação
+INVOLVED_PEOPLE_FIELDS = (
+    'person_type', 'name', 'registration_id', 'job_title', 'company', 'age', 'time_in_role',
+    'aso_date', 'training_status',
+    'commission_role',  # Função na comissão de investigação
+    # Campos detalhados do perfil do acidentado (para person_type = 'Injured')
+    'birth_date', 'rg', 'marital_status', 'birthplace', 'children_count', 'injury_type',
+    'body_part', 'lost_days', 'cat_number', 'is_fatal', 'employment_type',
+    'previous_accident_history', 'certifications',
+    # Campos adicionais do condutor (para person_type = 'Driver')
+    'time_in_company', 'time_driving_vehicle_type', 'time_license', 'driver_observation',
+    # created_by não é passado (será NULL no banco) para evitar erro de FK com auth.users
+)
+
+
+def _same_value(a: Any, b: Any) -> bool:
+    """Compara valor do formulário com o do banco (1 == 1.0, datas como texto)"""
+    if a is None or b is None:
+        return a is None and b is None
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)) and not isinstance(a, bool) and not isinstance(b, bool):
+        return float(a) == float(b)
+    if hasattr(a, 'isoformat'):
+        a = a.isoformat()
+    if hasattr(b, 'isoformat'):
+        b = b.isoformat()
+    return a == b if type(a) is type(b) else str(a) == str(b)
+
+
+def _person_key(person: Dict[str, Any]) -> tuple:
+    return (
+        person.get('person_type'),
+        str(person.get('name') or '').strip().casefold(),
+        str(person.get('registration_id') or '').strip(),
+    )
+
+
+def diff_involved_people(stored: List[Dict[str, Any]], people: List[Dict[str, Any]]):
+    """
+    Compara as pessoas enviadas pelo formulário com as linhas gravadas.
+
+    Cada pessoa enviada é casada com uma linha existente pelo `id` (quando vier),
+    depois por (person_type, nome, matrícula) e, por fim, pela posição dentro do
+    mesmo person_type, que é como o formulário preenche os campos. Pessoas sem
+    par são inseridas; linhas sem par são removidas.
+
+    Returns:
+        (inserts, updates, delete_ids): cada linha traz só os campos preenchidos
+        ou alterados (ausente = NULL); updates trazem também o `id`
+    """
+    remaining = list(stored)
+    pairs = []
+    pending = []
+
+    by_id = {row.get('id'): row for row in remaining}
+    for person in people:
+        row = by_id.pop(person.get('id'), None) if person.get('id') else None
+        if row is not None:
+            remaining.remove(row)
+            pairs.append((person, row))
+        else:
+            pending.append(person)
+
+    unmatched = []
+    for person in pending:
+        key = _person_key(person)
+        row = next((r for r in remaining if _person_key(r) == key), None)
+        if row is not None:
+            remaining.remove(row)
+            pairs.append((person, row))
+        else:
+            unmatched.append(person)
+
+    inserts = []
+    for person in unmatched:
+        row = next((r for r in remaining if r.get('person_type') == person.get('person_type')), None)
+        if row is not None:
+            remaining.remove(row)
+            pairs.append((person, row))
+        else:
+            inserts.append({field: person[field] for field in INVOLVED_PEOPLE_FIELDS
+                            if person.get(field) is not None})
+
+    updates = []
+    for person, row in pairs:
+        changed = [field for field in INVOLVED_PEOPLE_FIELDS if not _same_value(person.get(field), row.get(field))]
+        if changed:
+            # Campo limpo no formulário vai como None; os demais ausentes já são NULL no banco
+            data = {field: person.get(field) for field in INVOLVED_PEOPLE_FIELDS
+                    if field in changed or person.get(field) is not None}
+            updates.append({'id': row['id'], **data})
+
+    return inserts, updates, [row['id'] for row in remaining]
+
+
+def _uniform_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Lote com as mesmas chaves em todas as linhas (exigência do PostgREST).
+
+    Só entram colunas citadas por alguma linha, então colunas de migrations ainda
+    não aplicadas continuam de fora enquanto ninguém as preenche.
+    """
+    columns = list(dict.fromkeys(column for row in rows for column in row))
+    return [{column: row.get(column) for column in columns} for row in rows]
+
+
 def upsert_involved_people(accident_id: str, people: List[Dict[str, Any]]) -> bool:
-    """Insere ou atualiza pessoas envolvidas (remove existentes e insere novas) usando batch insert"""
+    """
+    Sincroniza as pessoas envolvidas do acidente com a lista enviada.
+
+    Grava apenas a diferença em relação ao banco (diff_involved_people): um insert
+    para as novas, um upsert por id para as alteradas e um delete para as removidas.
+    """
     import logging
     logger = logging.getLogger(__name__)
     
@@ -238,116 +368,65 @@ def upsert_involved_people(accident_id: str, people: List[Dict[str, Any]]) -> bo
             logger.error("[UPSERT_PEOPLE] Erro ao conectar com o banco de dados - Service Role não disponível")
             return False
         
-        logger.info("[UPSERT_PEOPLE] Cliente Service Role obtido com sucesso (RLS bypass ativo)")
-        
-        # O campo created_by aponta para auth.users.id, não profiles.id
-        # Como o campo é nullable e pode causar problemas de FK, não vamos passá-lo
-        # Isso evita erros quando o ID de profiles não corresponde ao ID de auth.users
-        logger.info(f"[UPSERT_PEOPLE] Salvando {len(people)} pessoas para acidente {accident_id}")
-        logger.info("[UPSERT_PEOPLE] Campo created_by não será passado (nullable) para evitar problemas de FK com auth.users")
-        
-        # Remove pessoas existentes do mesmo accident_id
-        delete_response = supabase.table("involved_people").delete().eq("accident_id", accident_id).execute()
-        logger.info(f"[UPSERT_PEOPLE] Removidas pessoas existentes: {delete_response}")
-        
-        # Prepara dados para inserção em lote
-        if people:
-            batch_data = []
-            for person in people:
-                # Valida campos obrigatórios
-                person_type = person.get('person_type')
-                name = person.get('name')
-                
-                if not person_type or not name:
-                    logger.warning(f"[UPSERT_PEOPLE] Pessoa ignorada: person_type={person_type}, name={name}")
-                    continue
-                
-                person_data = {
-                    'accident_id': accident_id,
-                    'person_type': person_type,
-                    'name': name,
-                    'registration_id': person.get('registration_id'),
-                    'job_title': person.get('job_title'),
-                    'company': person.get('company'),
-                    'age': person.get('age'),
-                    'time_in_role': person.get('time_in_role'),
-                    'aso_date': person.get('aso_date'),
-                    'training_status': person.get('training_status'),
-                    'commission_role': person.get('commission_role'),  # Função na comissão de investigação
-                    # Campos detalhados do perfil do acidentado (para person_type = 'Injured')
-                    'birth_date': person.get('birth_date'),
-                    'rg': person.get('rg'),
-                    'marital_status': person.get('marital_status'),
-                    'birthplace': person.get('birthplace'),
-                    'children_count': person.get('children_count'),
-                    'injury_type': person.get('injury_type'),
-                    'body_part': person.get('body_part'),
-                    'lost_days': person.get('lost_days'),
-                    'cat_number': person.get('cat_number'),
-                    'is_fatal': person.get('is_fatal'),
-                    'employment_type': person.get('employment_type'),
-                    'previous_accident_history': person.get('previous_accident_history'),
-                    'certifications': person.get('certifications'),
-                    # Campos adicionais do condutor (para person_type = 'Driver')
-                    'time_in_company': person.get('time_in_company'),
-                    'time_driving_vehicle_type': person.get('time_driving_vehicle_type'),
-                    'time_license': person.get('time_license'),
-                    'driver_observation': person.get('driver_observation'),
-                    # created_by não é passado (será NULL no banco) para evitar erro de FK com auth.users
-                }
-                # Remove campos None para não enviar dados desnecessários
-                person_data = {k: v for k, v in person_data.items() if v is not None}
-                batch_data.append(person_data)
-            
-            if not batch_data:
-                logger.warning("[UPSERT_PEOPLE] Nenhum dado válido após validação")
-                return False
+        # Valida campos obrigatórios
+        valid_people = []
+        for person in people:
+            if not person.get('person_type') or not person.get('name'):
+                logger.warning(f"[UPSERT_PEOPLE] Pessoa ignorada: person_type={person.get('person_type')}")
+                continue
+            valid_people.append(person)
+        
+        if people and not valid_people:
+            logger.warning("[UPSERT_PEOPLE] Nenhum dado válido após validação")
+            return False
+        
+        stored = supabase.table("involved_people").select("*").eq("accident_id", accident_id) \
+            .order("created_at", desc=False).execute().data or []
+        inserts, updates, delete_ids = diff_involved_people(stored, valid_people)
+        
+        logger.info(
+            f"[UPSERT_PEOPLE] Acidente {accident_id}: {len(valid_people)} pessoas enviadas, "
+            f"{len(inserts)} novas, {len(updates)} alteradas, {len(delete_ids)} removidas"
+        )
+        
+        try:
+            if delete_ids:
+                supabase.table("involved_people").delete().eq("accident_id", accident_id).in_("id", delete_ids).execute()
             
-            logger.info(f"[UPSERT_PEOPLE] Dados preparados: {len(batch_data)} registros")
-            logger.info(f"[UPSERT_PEOPLE] Tipos de pessoas: {[p.get('person_type') for p in batch_data]}")
+            if updates:
+                batch = _uniform_rows([{'accident_id': accident_id, **row} for row in updates])
+                logger.debug(f"[UPSERT_PEOPLE] Alterações: {batch}")
+                supabase.table("involved_people").upsert(batch, on_conflict="id").execute()
             
-            # Insere em lote (batch insert)
-            try:
-                logger.info(f"[UPSERT_PEOPLE] Tentando inserir {len(batch_data)} registros")
-                logger.info(f"[UPSERT_PEOPLE] Primeiro registro (exemplo): {batch_data[0] if batch_data else 'N/A'}")
-                
-                response = supabase.table("involved_people").insert(batch_data).execute()
-                
-                if response.data:
-                    logger.info(f"[UPSERT_PEOPLE] {len(response.data)} pessoas salvas com sucesso")
-                    logger.info(f"[UPSERT_PEOPLE] Dados salvos: {[p.get('person_type') + ' - ' + p.get('name', 'N/A') for p in response.data]}")
-                    return True
-                else:
-                    logger.error(f"[UPSERT_PEOPLE] Nenhum dado foi inserido. Response: {response}")
-                    logger.error(f"[UPSERT_PEOPLE] Response completo: {response}")
+            if inserts:
+                batch = _uniform_rows([{'accident_id': accident_id, **row} for row in inserts])
+                logger.debug(f"[UPSERT_PEOPLE] Inclusões: {batch}")
+                response = supabase.table("involved_people").insert(batch).execute()
+                if not response.data:
+                    logger.error("[UPSERT_PEOPLE] Nenhum dado foi inserido")
                     return False
-            except Exception as insert_error:
-                error_msg = str(insert_error)
-                logger.error(f"[UPSERT_PEOPLE] Erro na execução do insert: {error_msg}")
-                logger.error(f"[UPSERT_PEOPLE] Tipo de erro: {type(insert_error).__name__}")
-                
-                # Log detalhado do erro
-                if hasattr(insert_error, 'message'):
-                    logger.error(f"[UPSERT_PEOPLE] Mensagem do erro: {insert_error.message}")
-                if hasattr(insert_error, 'code'):
-                    logger.error(f"[UPSERT_PEOPLE] Código do erro: {insert_error.code}")
-                if hasattr(insert_error, 'details'):
-                    logger.error(f"[UPSERT_PEOPLE] Detalhes do erro: {insert_error.details}")
-                
-                # Verifica se é erro de RLS
-                error_str = error_msg.lower()
-                if 'permission' in error_str or 'policy' in error_str or 'rls' in error_str:
-                    logger.error("[UPSERT_PEOPLE] Possível problema de RLS detectado")
-                elif 'foreign key' in error_str or 'constraint' in error_str:
-                    logger.error("[UPSERT_PEOPLE] Erro de foreign key constraint detectado")
-                elif 'null value' in error_str or 'not null' in error_str:
-                    logger.error("[UPSERT_PEOPLE] Erro de campo obrigatório (NOT NULL) detectado")
-                
-                # Não faz raise, retorna False para que a UI mostre o erro
-                return False
-        
-        logger.info("[UPSERT_PEOPLE] Nenhuma pessoa para salvar")
-        return True
+            
+            return True
+        except Exception as write_error:
+            error_msg = str(write_error)
+            logger.error(f"[UPSERT_PEOPLE] Erro ao gravar pessoas envolvidas: {error_msg}")
+            logger.error(f"[UPSERT_PEOPLE] Tipo de erro: {type(write_error).__name__}")
+            
+            # Log detalhado do erro
+            if hasattr(write_error, 'details'):
+                logger.error(f"[UPSERT_PEOPLE] Detalhes do erro: {write_error.details}")
+            
+            # Verifica se é erro de RLS
+            error_str = error_msg.lower()
+            if 'permission' in error_str or 'policy' in error_str or 'rls' in error_str:
+                logger.error("[UPSERT_PEOPLE] Possível problema de RLS detectado")
+            elif 'foreign key' in error_str or 'constraint' in error_str:
+                logger.error("[UPSERT_PEOPLE] Erro de foreign key constraint detectado")
+            elif 'null value' in error_str or 'not null' in error_str:
+                logger.error("[UPSERT_PEOPLE] Erro de campo obrigatório (NOT NULL) detectado")
+            
+            # Não faz raise, retorna False para que a UI mostre o erro
+            return False
     except Exception as e:
         logger.error(f"[UPSERT_PEOPLE] Erro ao salvar pessoas envolvidas: {str(e)}", exc_info=True)
         return False
@@ -931,6 +1010,7 @@ def create_root_node(accident_id: str, label: str) -> Optional[str]:
         response = supabase.table("fault_tree_nodes").insert(data).execute()
         
         if response.data:
+            invalidate_fault_tree(accident_id=accident_id)
             return response.data[0]["id"]
         return None
     except Exception as e:
@@ -981,6 +1061,7 @@ def add_fault_tree_node(accident_id: str, parent_id: Optional[str], label: str,
         response = supabase.table("fault_tree_nodes").insert(data).execute()
         
         if response.data:
+            invalidate_fault_tree(accident_id=accident_id)
             return response.data[0]["id"]
         return None
     except Exception as e:
@@ -1019,6 +1100,67 @@ def get_tree_nodes(accident_id: str) -> List[Dict[str, Any]]:
         return []
 
 
+# Tamanho máximo de cada lote em escritas em massa (limita o tamanho da URL do filtro in_)
+NODE_BATCH_SIZE = 200
+
+# Requisições HTTP evitadas pelas escritas em lote, acumuladas no processo
+_bulk_write_stats = {"reorganize_calls": 0, "delete_calls": 0, "round_trips_saved": 0}
+
+
+def _record_round_trips_saved(operation: str, saved: int) -> None:
+    import logging
+    _bulk_write_stats[f"{operation}_calls"] += 1
+    _bulk_write_stats["round_trips_saved"] += max(saved, 0)
+    logging.getLogger(__name__).info(f"[FAULT_TREE] {operation}: {saved} requisição(ões) evitada(s) pelo lote")
+
+
+def get_bulk_write_stats() -> Dict[str, int]:
+    """Retorna quantas requisições as escritas em lote da árvore evitaram"""
+    return dict(_bulk_write_stats)
+
+
+# RPC que altera apenas display_order (docs/migrations/create_reorder_fault_tree_nodes_rpc.sql)
+REORDER_NODES_RPC = "reorder_fault_tree_nodes"
+
+# Colunas do upsert de reserva: id, display_order e as NOT NULL exigidas pelo INSERT ... ON CONFLICT
+REORDER_UPSERT_COLUMNS = ["id", "display_order", "accident_id", "parent_id", "type", "label"]
+
+# Marcado quando a RPC não existe no banco, para não repetir a chamada que falha
+_reorder_rpc_unavailable = False
+
+
+def _write_display_orders(supabase, updates: List[Dict[str, Any]]) -> int:
+    """
+    Grava display_order dos nós em lotes de NODE_BATCH_SIZE; retorna o número de requisições.
+
+    A RPC faz só UPDATE de display_order, sem regravar label/status/justificativa lidos
+    antes. Sem ela, o upsert leva apenas REORDER_UPSERT_COLUMNS.
+    """
+    global _reorder_rpc_unavailable
+    requests = 0
+    for start in range(0, len(updates), NODE_BATCH_SIZE):
+        batch = updates[start:start + NODE_BATCH_SIZE]
+        requests += 1
+        if not _reorder_rpc_unavailable:
+            try:
+                supabase.rpc(REORDER_NODES_RPC, {
+                    "p_ids": [node['id'] for node in batch],
+                    "p_orders": [node['display_order'] for node in batch],
+                }).execute()
+                continue
+            except Exception as e:
+                message = str(e)
+                if getattr(e, "code", None) != "PGRST202" and "PGRST202" not in message \
+                        and "Could not find the function" not in message:
+                    raise
+                _reorder_rpc_unavailable = True
+        supabase.table("fault_tree_nodes").upsert(
+            [{column: node.get(column) for column in REORDER_UPSERT_COLUMNS} for node in batch],
+            on_conflict="id"
+        ).execute()
+    return requests
+
+
 def reorganize_nodes(accident_id: str, sort_by: str = "status") -> bool:
     """
     Reorganiza nós da árvore de falhas de forma inteligente
@@ -1080,17 +1222,17 @@ def reorganize_nodes(accident_id: str, sort_by: str = "status") -> bool:
             # Ordena o grupo
             sorted_nodes = sorted(group_nodes, key=get_sort_key)
             
-            # Atribui novos display_order
+            # Atribui novos display_order (apenas nós cuja posição mudou)
             for idx, node in enumerate(sorted_nodes, start=1):
-                updates.append({
-                    'id': node['id'],
-                    'display_order': idx
-                })
+                if node.get('display_order') != idx:
+                    updates.append({**node, 'display_order': idx})
         
-        # Atualiza em lote
-        for update in updates:
-            supabase.table("fault_tree_nodes").update({"display_order": update['display_order']}).eq("id", update['id']).execute()
+        # Atualiza em lote: uma requisição por lote em vez de um UPDATE por nó
+        batches = _write_display_orders(supabase, updates)
         
+        _record_round_trips_saved("reorganize", len(nodes.data) - batches)
+        if updates:
+            invalidate_fault_tree(accident_id=accident_id)
         return True
     except Exception as e:
         st.error(f"Erro ao reorganizar nós: {str(e)}")
@@ -1107,6 +1249,8 @@ def update_node_display_order(node_id: str, new_order: int) -> bool:
             return False
         
         response = supabase.table("fault_tree_nodes").update({"display_order": new_order}).eq("id", node_id).execute()
+        if response.data:
+            invalidate_fault_tree(node_id=node_id)
         return bool(response.data)
     except Exception as e:
         st.error(f"Erro ao atualizar ordem: {str(e)}")
@@ -1129,6 +1273,8 @@ def update_node_status(node_id: str, status: str, justification: Optional[str] =
             update_data["justification_image_url"] = justification_image_url
         
         response = supabase.table("fault_tree_nodes").update(update_data).eq("id", node_id).execute()
+        if response.data:
+            invalidate_fault_tree(node_id=node_id)
         return bool(response.data)
     except Exception as e:
         st.error(f"Erro ao atualizar status: {str(e)}")
@@ -1226,6 +1372,7 @@ def upload_justification_image(node_id: str, accident_id: str, file_bytes: bytes
             update_response = supabase.table("fault_tree_nodes").update({"justification_image_url": public_url}).eq("id", node_id).execute()
             
             if update_response.data:
+                invalidate_fault_tree(accident_id=accident_id)
                 return public_url
             else:
                 st.error("Erro ao atualizar nó com URL da imagem")
@@ -1249,6 +1396,8 @@ def update_node_justification_image(node_id: str, image_url: Optional[str]) -> b
             return False
         
         response = supabase.table("fault_tree_nodes").update({"justification_image_url": image_url}).eq("id", node_id).execute()
+        if response.data:
+            invalidate_fault_tree(node_id=node_id)
         return bool(response.data)
     except Exception as e:
         st.error(f"Erro ao atualizar imagem de justificativa: {str(e)}")
@@ -1265,6 +1414,8 @@ def update_node_recommendation(node_id: str, recommendation: Optional[str]) -> b
             return False
         
         response = supabase.table("fault_tree_nodes").update({"recommendation": recommendation}).eq("id", node_id).execute()
+        if response.data:
+            invalidate_fault_tree(node_id=node_id)
         return bool(response.data)
     except Exception as e:
         st.error(f"Erro ao atualizar recomendação: {str(e)}")
@@ -1281,6 +1432,8 @@ def update_node_label(node_id: str, label: str) -> bool:
             return False
         
         response = supabase.table("fault_tree_nodes").update({"label": label}).eq("id", node_id).execute()
+        if response.data:
+            invalidate_fault_tree(node_id=node_id)
         return bool(response.data)
     except Exception as e:
         st.error(f"Erro ao atualizar label: {str(e)}")
@@ -1300,6 +1453,7 @@ def update_node_is_basic_cause(node_id: str, is_basic_cause: bool) -> bool:
         
         response = supabase.table("fault_tree_nodes").update({"is_basic_cause": is_basic_cause}).eq("id", node_id).execute()
         if response.data:
+            invalidate_fault_tree(node_id=node_id)
             logger.info(f"[UPDATE_BASIC_CAUSE] Nó {node_id} atualizado: is_basic_cause={is_basic_cause}")
             return True
         else:
@@ -1325,6 +1479,7 @@ def update_node_is_contributing_cause(node_id: str, is_contributing_cause: bool)
         
         response = supabase.table("fault_tree_nodes").update({"is_contributing_cause": is_contributing_cause}).eq("id", node_id).execute()
         if response.data:
+            invalidate_fault_tree(node_id=node_id)
             logger.info(f"[UPDATE_CONTRIBUTING_CAUSE] Nó {node_id} atualizado: is_contributing_cause={is_contributing_cause}")
             return True
         else:
@@ -1347,6 +1502,8 @@ def link_nbr_standard_to_node(node_id: str, nbr_standard_id: int) -> bool:
             return False
         
         response = supabase.table("fault_tree_nodes").update({"nbr_standard_id": nbr_standard_id}).eq("id", node_id).execute()
+        if response.data:
+            invalidate_fault_tree(node_id=node_id)
         return bool(response.data)
     except Exception as e:
         st.error(f"Erro ao vincular padrão NBR: {str(e)}")
@@ -1372,7 +1529,7 @@ def delete_fault_tree_node(node_id: str) -> bool:
             return False
         
         # Verifica se o nó existe e se é raiz
-        node_response = supabase.table("fault_tree_nodes").select("id, parent_id, type").eq("id", node_id).execute()
+        node_response = supabase.table("fault_tree_nodes").select("id, parent_id, type, accident_id").eq("id", node_id).execute()
         if not node_response.data:
             st.error("Nó não encontrado")
             return False
@@ -1384,23 +1541,21 @@ def delete_fault_tree_node(node_id: str) -> bool:
             st.error("⚠️ Não é possível deletar o nó raiz da árvore de falhas")
             return False
         
-        # Função recursiva para deletar filhos primeiro
-        def delete_children_recursive(parent_id: str):
-            """Deleta todos os filhos de um nó recursivamente"""
-            children_response = supabase.table("fault_tree_nodes").select("id").eq("parent_id", parent_id).execute()
-            if children_response.data:
-                for child in children_response.data:
-                    # Deleta os filhos deste filho primeiro (recursivo)
-                    delete_children_recursive(child['id'])
-                    # Depois deleta o filho
-                    supabase.table("fault_tree_nodes").delete().eq("id", child['id']).execute()
-        
-        # Deleta todos os filhos primeiro
-        delete_children_recursive(node_id)
-        
-        # Agora deleta o nó
-        delete_response = supabase.table("fault_tree_nodes").delete().eq("id", node_id).execute()
-        return bool(delete_response.data)
+        # Busca a árvore do acidente uma única vez e coleta os descendentes em memória
+        tree_response = supabase.table("fault_tree_nodes").select("id, parent_id").eq("accident_id", node.get('accident_id')).execute()
+        batches = subtree_delete_batches(tree_response.data or [], node_id, NODE_BATCH_SIZE)
+        
+        # Deleta com filtro in_, descendentes antes dos ancestrais (FK parent_id sem cascade)
+        deleted_ids = set()
+        for batch in batches:
+            delete_response = supabase.table("fault_tree_nodes").delete().in_("id", batch).execute()
+            deleted_ids.update(str(row.get('id')) for row in delete_response.data or [])
+        subtree_size = sum(len(batch) for batch in batches)
+        
+        # Antes: um SELECT de filhos e um DELETE por nó da subárvore
+        _record_round_trips_saved("delete", 2 * subtree_size - 1 - len(batches))
+        invalidate_fault_tree(accident_id=node.get('accident_id'), node_id=node_id)
+        return str(node_id) in deleted_ids
     except Exception as e:
         st.error(f"Erro ao deletar nó: {str(e)}")
         return False
@@ -1444,7 +1599,7 @@ def get_validated_nodes(accident_id: str) -> List[Dict[str, Any]]:
 def build_fault_tree_json(accident_id: str) -> Optional[Dict[str, Any]]:
     """
     Converte dados planos do banco em estrutura hierárquica JSON.
-    Função recursiva que constrói a árvore de falhas.
+    A montagem é feita por services.fault_tree.assemble_fault_tree (sem recursão).
     
     Retorna None se não houver nó raiz, ou um dicionário com a estrutura completa.
     """
@@ -1459,7 +1614,7 @@ def build_fault_tree_json(accident_id: str) -> Optional[Dict[str, Any]]:
             return None
         
         # Valida estrutura básica dos nós
-        required_fields = ['id', 'label', 'type', 'status']
+        required_fields = REQUIRED_NODE_FIELDS
         invalid_nodes = []
         for node in nodes:
             if not isinstance(node, dict):
@@ -1494,76 +1649,8 @@ def build_fault_tree_json(accident_id: str) -> Optional[Dict[str, Any]]:
             # Se falhar, continua sem códigos NBR
             pass
         
-        # Cria dicionário indexado por ID para acesso rápido
-        nodes_dict = {node['id']: node for node in nodes}
-        
-        # Encontra o nó raiz (parent_id é None)
-        root_node = None
-        for node in nodes:
-            if node.get('parent_id') is None:
-                root_node = node
-                break
-        
-        if not root_node:
-            return None
-        
-        def build_node_json(node_id: str) -> Optional[Dict[str, Any]]:
-            """Função recursiva para construir JSON de um nó e seus filhos"""
-            node = nodes_dict.get(node_id)
-            if not node or not isinstance(node, dict):
-                return None
-            
-            # Valida campos essenciais antes de processar
-            if 'id' not in node or 'label' not in node or 'type' not in node or 'status' not in node:
-                logger.warning(f"[BUILD_TREE] Nó {node_id} tem estrutura incompleta, ignorando")
-                return None
-            
-            # Busca código NBR e descrição se existir
-            nbr_code = None
-            nbr_description = None
-            nbr_standard_id = node.get('nbr_standard_id')
-            if nbr_standard_id is not None:
-                # Converte para int se necessário
-                nbr_standard_id_int = int(nbr_standard_id) if not isinstance(nbr_standard_id, int) else nbr_standard_id
-                if nbr_standard_id_int in nbr_standards_map:
-                    nbr_info = nbr_standards_map[nbr_standard_id_int]
-                    nbr_code = nbr_info.get('code')
-                    nbr_description = nbr_info.get('description')
-            
-            # Constrói objeto do nó com valores defensivos para campos opcionais
-            node_json = {
-                "id": str(node.get('id', '')),
-                "label": node.get('label', ''),
-                "type": node.get('type', 'hypothesis'),
-                "status": node.get('status', 'pending'),
-                "is_basic_cause": bool(node.get('is_basic_cause', False)),  # Campo para marcar manualmente como causa básica
-                "is_contributing_cause": bool(node.get('is_contributing_cause', False)),  # Campo para marcar manualmente como causa contribuinte
-                "nbr_code": nbr_code or None,
-                "nbr_description": nbr_description or '',
-                "justification": node.get('justification') or '',  # Justificativa para confirmação/descarte
-                "justification_image_url": node.get('justification_image_url') or None,  # URL da imagem da justificativa
-                "recommendation": node.get('recommendation') or None,  # Recomendação para prevenir/corrigir a causa
-                "children": []
-            }
-            
-            # Busca filhos (nós que têm este nó como pai) e ordena por display_order
-            children = [n for n in nodes if n.get('parent_id') == node_id]
-            # Ordena filhos por display_order, depois por created_at
-            children.sort(key=lambda x: (
-                x.get('display_order', 0) or 0,
-                x.get('created_at', '') or ''
-            ))
-            
-            # Recursivamente constrói filhos
-            for child in children:
-                child_json = build_node_json(child['id'])
-                if child_json:
-                    node_json["children"].append(child_json)
-            
-            return node_json
-        
-        # Constrói JSON a partir do nó raiz
-        return build_node_json(root_node['id'])
+        # Índice pai -> filhos em uma única passada e montagem iterativa (O(N log N))
+        return assemble_fault_tree(nodes, nbr_standards_map)
         
     except Exception as e:
         st.error(f"Erro ao construir JSON da árvore: {str(e)}")
@@ -1572,6 +1659,181 @@ def build_fault_tree_json(accident_id: str) -> Optional[Dict[str, Any]]:
         return None
 
 
+# ---------------------------------------------------------------------------
+# Snapshot da árvore de falhas
+#
+# Uma etapa da investigação lê a lista de nós, o JSON da árvore, os nós
+# validados e a tabela nbr_standards várias vezes. O snapshot busca nós e
+# padrões NBR uma única vez por versão da árvore; os mutadores de nós chamam
+# invalidate_fault_tree() para que a próxima leitura recarregue os dados.
+# ---------------------------------------------------------------------------
+
+_tree_versions: Dict[str, int] = {}
+_node_accidents: Dict[str, str] = {}
+_accident_nodes: Dict[str, List[str]] = {}
+_tree_epoch = 0
+_tree_versions_lock = threading.Lock()
+_tree_snapshots = None
+
+
+def invalidate_fault_tree(accident_id: Optional[str] = None, node_id: Optional[str] = None) -> None:
+    """
+    Incrementa a versão da árvore de um acidente, invalidando seu snapshot.
+
+    Quando apenas node_id é conhecido, o acidente é resolvido pelos snapshots já
+    carregados; se não for possível, todos os snapshots são invalidados. O
+    snapshot invalidado sai do cache, levando junto seu mapeamento nó -> acidente.
+    """
+    global _tree_epoch
+    with _tree_versions_lock:
+        if accident_id is None and node_id is not None:
+            accident_id = _node_accidents.get(str(node_id))
+        key = str(accident_id) if accident_id is not None else None
+        if key is None:
+            _tree_epoch += 1
+        else:
+            _tree_versions[key] = _tree_versions.get(key, 0) + 1
+
+    # Fora do lock: a remoção do cache chama _forget_tree_nodes
+    if _tree_snapshots is not None:
+        if key is None:
+            _tree_snapshots.clear()
+        else:
+            _tree_snapshots.invalidate(lambda cached_key: cached_key == key)
+
+
+def _forget_tree_nodes(accident_id: str, snapshot: Any = None) -> None:
+    """Remove do mapa nó -> acidente os nós do snapshot que saiu do cache"""
+    with _tree_versions_lock:
+        for node_id in _accident_nodes.pop(str(accident_id), []):
+            if _node_accidents.get(node_id) == str(accident_id):
+                del _node_accidents[node_id]
+
+
+def _get_tree_version(accident_id: str) -> tuple:
+    with _tree_versions_lock:
+        return (_tree_epoch, _tree_versions.get(str(accident_id), 0))
+
+
+class FaultTreeSnapshot:
+    """
+    Visão somente leitura da árvore de falhas de um acidente.
+
+    Os dados derivados (JSON hierárquico, nós validados, mapa NBR) são calculados
+    sob demanda e memorizados. Não altere os objetos retornados.
+    """
+
+    def __init__(self, accident_id: str, nodes: List[Dict[str, Any]],
+                 nbr_standards: List[Dict[str, Any]], version: tuple):
+        self.accident_id = accident_id
+        self.nodes = nodes
+        self.nbr_standards = nbr_standards
+        self.version = version
+        self._nbr_map: Optional[Dict[int, Dict[str, Any]]] = None
+        self._tree_json: Optional[Dict[str, Any]] = None
+        self._tree_built = False
+        self._validated_nodes: Optional[List[Dict[str, Any]]] = None
+
+    @property
+    def root_node(self) -> Optional[Dict[str, Any]]:
+        """Nó raiz (type == 'root'), equivalente a get_root_node()"""
+        return next((n for n in self.nodes if n.get('type') == 'root'), None)
+
+    @property
+    def nbr_map(self) -> Dict[int, Dict[str, Any]]:
+        """Mapa nbr_standard_id (int) -> {code, description, category}"""
+        if self._nbr_map is None:
+            nbr_map = {}
+            for std in self.nbr_standards:
+                try:
+                    nbr_map[int(std['id'])] = {
+                        'code': std.get('code'),
+                        'description': std.get('description', ''),
+                        'category': std.get('category')
+                    }
+                except (KeyError, TypeError, ValueError):
+                    continue
+            self._nbr_map = nbr_map
+        return self._nbr_map
+
+    @property
+    def tree_json(self) -> Optional[Dict[str, Any]]:
+        """Estrutura hierárquica equivalente a build_fault_tree_json()"""
+        if not self._tree_built:
+            valid_nodes = [
+                node for node in self.nodes
+                if isinstance(node, dict) and all(field in node for field in REQUIRED_NODE_FIELDS)
+            ]
+            self._tree_json = assemble_fault_tree(valid_nodes, self.nbr_map)
+            self._tree_built = True
+        return self._tree_json
+
+    @property
+    def validated_nodes(self) -> List[Dict[str, Any]]:
+        """Nós validados com o join de nbr_standards, equivalente a get_validated_nodes()"""
+        if self._validated_nodes is None:
+            validated = []
+            for node in self.nodes:
+                if node.get('status') != 'validated':
+                    continue
+                nbr_info = None
+                nbr_standard_id = node.get('nbr_standard_id')
+                if nbr_standard_id is not None:
+                    try:
+                        nbr_info = self.nbr_map.get(int(nbr_standard_id))
+                    except (TypeError, ValueError):
+                        nbr_info = None
+                validated.append({**node, 'nbr_standards': dict(nbr_info) if nbr_info else None})
+            self._validated_nodes = validated
+        return self._validated_nodes
+
+
+def get_tree_snapshot(accident_id: str) -> FaultTreeSnapshot:
+    """
+    Retorna o snapshot da árvore de falhas do acidente, recarregando apenas se a
+    versão mudou (ou após o TTL do cache, para escritas feitas em outro processo).
+    """
+    global _tree_snapshots
+    from services.data_cache import TTLCache, estimate_rows_size
+    from config.config import get_config
+
+    if _tree_snapshots is None:
+        config = get_config("cache")
+        _tree_snapshots = TTLCache(
+            ttl_seconds=config.get("ttl_seconds", 120),
+            max_entries=config.get("max_entries", 256),
+            max_memory_mb=config.get("max_memory_mb", 128),
+            on_evict=_forget_tree_nodes,
+        )
+
+    key = str(accident_id)
+    version = _get_tree_version(key)
+    found, snapshot = _tree_snapshots.get(key)
+    if found and snapshot.version == version:
+        return snapshot
+
+    snapshot = FaultTreeSnapshot(key, get_tree_nodes(key), get_nbr_standards(), version)
+    if not snapshot.nodes:
+        # Lista vazia pode indicar erro transitório: não armazena
+        return snapshot
+
+    # O mapa nó -> acidente acompanha os snapshots em cache: os nós da versão
+    # anterior são trocados pelos atuais e tudo é removido quando o snapshot sai
+    node_ids = [str(node['id']) for node in snapshot.nodes if node.get('id') is not None]
+    _forget_tree_nodes(key)
+    with _tree_versions_lock:
+        for node_id in node_ids:
+            _node_accidents[node_id] = key
+        _accident_nodes[key] = node_ids
+
+    # sys.getsizeof mediria só o objeto FaultTreeSnapshot; conta as linhas dos nós
+    # em dobro (JSON hierárquico e nós validados memorizados) mais a tabela NBR
+    size = 2 * estimate_rows_size(snapshot.nodes) + estimate_rows_size(snapshot.nbr_standards)
+    if not _tree_snapshots.set(key, snapshot, size=size):
+        _forget_tree_nodes(key)
+    return snapshot
+
+
 def update_accident_status(accident_id: str, status: str) -> bool:
     """Atualiza status do acidente (normaliza para 'aberto'/'fechado')"""
     try:
@@ -1584,6 +1846,9 @@ def update_accident_status(accident_id: str, status: str) -> bool:
         # Normaliza status: 'Open'/'Closed' -> 'aberto'/'fechado'
         normalized_status = "aberto" if status.lower() in ['open', 'aberto'] else "fechado"
         response = supabase.table("accidents").update({"status": normalized_status}).eq("id", accident_id).execute()
+        if response.data:
+            from services.data_cache import invalidate_table
+            invalidate_table("accidents", response.data[0].get('created_by'))
         return bool(response.data)
     except Exception as e:
         st.error(f"Erro ao atualizar status: {str(e)}")
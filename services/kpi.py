@@ -4,56 +4,31 @@ from typing import List, Optional, Dict, Any
 from managers.supabase_config import get_supabase_client
 import streamlit as st
 
-# Import scipy opcionalmente
-try:
-    from scipy import stats
-    SCIPY_AVAILABLE = True
-except ImportError:
-    SCIPY_AVAILABLE = False
-    print("⚠️ SciPy não está disponível. Algumas funcionalidades estatísticas podem estar limitadas.")
-
 # Escala das horas: dados cadastrados em centenas (ex: 176 representa 17.600 horas)
 HOURS_SCALE = 100
 
 def fetch_kpi_data(user_email: Optional[str] = None,
                    start_date: Optional[str] = None, 
-                   end_date: Optional[str] = None) -> pd.DataFrame:
-    """Busca dados de KPI do Supabase"""
+                   end_date: Optional[str] = None,
+                   months_back: int = 0,
+                   user_ids: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Busca dados de KPI do Supabase
+    
+    Projeção, período, últimos N meses (a partir do período mais recente) e
+    filtro de usuários são aplicados na consulta (services.list_queries).
+    """
     try:
         from auth.auth_utils import get_user_id, is_admin
-        from managers.supabase_config import get_service_role_client
+        from services.list_queries import KPI_LIST_COLUMNS, fetch_list
         
         user_id = get_user_id()
         if not user_id:
             return pd.DataFrame()
         
-        # Usa service_role para contornar RLS e aplicar filtro de segurança no código
-        supabase = get_service_role_client()
-        
-        query = supabase.table("kpi_monthly").select("*")
-        
-        # Admin vê todos os dados sem filtro de created_by
-        if not is_admin():
-            # Usuário comum vê apenas seus próprios KPIs
-            query = query.eq("created_by", user_id)
-        
-        if start_date:
-            query = query.gte("period", start_date)
-        if end_date:
-            query = query.lte("period", end_date)
-            
-        response = query.order("period").execute()
-        
-        if response and hasattr(response, 'data'):
-            df = pd.DataFrame(response.data) if response.data else pd.DataFrame()
-            
-            # Validação adicional de segurança para usuários não-admin
-            if not is_admin() and not df.empty:
-                # Filtra novamente para garantir (segurança em camadas)
-                df = df[df['created_by'] == user_id]
-            
-            return df
-        return pd.DataFrame()
+        # Cache por tenant/filtros: evita novo round-trip a cada interação de widget
+        return fetch_list("kpi_monthly", KPI_LIST_COLUMNS, user_id, is_admin(),
+                          start_date, end_date, months_back=months_back, user_ids=user_ids)
     except Exception as e:
         st.error(f"Erro ao buscar dados de KPI: {str(e)}")
         import traceback
@@ -98,6 +73,231 @@ def calculate_severity_rate(lost_days: int, hours_worked: float, debited_days: i
         return 0.0
     return ((lost_days + debited_days) / (hours_worked * HOURS_SCALE)) * 1_000_000
 
+# ---------------------------------------------------------------------------
+# Motor de recálculo da tabela kpi_monthly
+# ---------------------------------------------------------------------------
+
+# Dias debitados por fatalidade (NBR 14280)
+FATALITY_DEBITED_DAYS = 6000
+
+# Linhas por página nas leituras (limite padrão de linhas do PostgREST)
+FETCH_PAGE_SIZE = 1000
+
+# Linhas por requisição de upsert na kpi_monthly
+KPI_UPSERT_BATCH_SIZE = 1000
+
+KPI_MONTHLY_COLUMNS = ["period", "created_by", "accidents_total", "fatalities", "lost_days_total",
+                       "hours", "frequency_rate", "severity_rate", "debited_days"]
+
+
+def _fetch_all_rows(build_query, page_size: int = FETCH_PAGE_SIZE) -> List[Dict[str, Any]]:
+    """Lê todas as linhas de uma consulta paginando com range() (o PostgREST limita cada resposta)"""
+    rows: List[Dict[str, Any]] = []
+    start = 0
+    while True:
+        response = build_query().range(start, start + page_size - 1).execute()
+        page = response.data if response and hasattr(response, 'data') and response.data else []
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        start += page_size
+
+
+def compute_monthly_kpis(accidents_df: pd.DataFrame, hours_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Agrupa acidentes e horas trabalhadas por (created_by, mês) e calcula TF/TG vetorizados.
+
+    Args:
+        accidents_df: Colunas occurred_at, created_by, lost_days, type
+        hours_df: Colunas year, month, hours (horas reais), created_by
+
+    Returns:
+        DataFrame com as colunas de kpi_monthly. Só há linha para meses com horas
+        cadastradas; horas são gravadas em centenas (HOURS_SCALE).
+    """
+    if hours_df is None or hours_df.empty:
+        return pd.DataFrame(columns=KPI_MONTHLY_COLUMNS)
+
+    years = pd.to_numeric(hours_df['year'], errors='coerce')
+    months = pd.to_numeric(hours_df['month'], errors='coerce')
+    valid = hours_df['created_by'].notna() & years.notna() & months.notna()
+    hours = pd.DataFrame({
+        'created_by': hours_df['created_by'][valid],
+        'period': (years[valid].astype(int).astype(str) + '-' +
+                   months[valid].astype(int).astype(str).str.zfill(2)),
+        'hours': pd.to_numeric(hours_df['hours'][valid], errors='coerce').fillna(0.0),
+    })
+    hours_by_bucket = hours.groupby(['created_by', 'period'], sort=False)['hours'].sum()
+
+    kpis = hours_by_bucket.to_frame()
+    if accidents_df is not None and not accidents_df.empty:
+        accidents = accidents_df[accidents_df['created_by'].notna()]
+        # occurred_at é ISO 8601: o prefixo AAAA-MM é o mês no fuso em que foi registrado
+        occurred = accidents['occurred_at'].astype(str)
+        valid = occurred.str.match(r'^\d{4}-\d{2}')
+        accidents = pd.DataFrame({
+            'created_by': accidents['created_by'][valid],
+            'period': occurred[valid].str[:7],
+            'fatal': (accidents['type'][valid] == 'fatal') if 'type' in accidents else False,
+            'lost_days': pd.to_numeric(accidents['lost_days'][valid], errors='coerce').fillna(0)
+                         if 'lost_days' in accidents else 0,
+        })
+        accidents_by_bucket = accidents.groupby(['created_by', 'period'], sort=False).agg(
+            accidents_total=('period', 'size'),
+            fatalities=('fatal', 'sum'),
+            lost_days_total=('lost_days', 'sum'),
+        )
+        kpis = kpis.join(accidents_by_bucket, how='left')
+    for column in ('accidents_total', 'fatalities', 'lost_days_total'):
+        kpis[column] = kpis[column].fillna(0).astype(int) if column in kpis else 0
+
+    real_hours = kpis['hours'].to_numpy(dtype=float)
+    debited_days = kpis['fatalities'].to_numpy(dtype=np.int64) * FATALITY_DEBITED_DAYS
+    has_hours = real_hours != 0
+    kpis['debited_days'] = debited_days
+    kpis['frequency_rate'] = np.divide(kpis['accidents_total'].to_numpy(dtype=float) * 1_000_000, real_hours,
+                                       out=np.zeros_like(real_hours), where=has_hours)
+    kpis['severity_rate'] = np.divide((kpis['lost_days_total'].to_numpy(dtype=float) + debited_days) * 1_000_000,
+                                      real_hours, out=np.zeros_like(real_hours), where=has_hours)
+    # Horas reais -> centenas (ex: 182.0 horas reais são gravadas como 1.82)
+    kpis['hours'] = real_hours / HOURS_SCALE
+
+    kpis = kpis.reset_index()
+    kpis['period'] = kpis['period'] + '-01'
+    return kpis[KPI_MONTHLY_COLUMNS].sort_values(['created_by', 'period'], ignore_index=True)
+
+
+def recalculate_kpi_monthly(user_id: Optional[str] = None) -> Dict[str, int]:
+    """
+    Recalcula a kpi_monthly a partir de accidents e hours_worked_monthly.
+
+    Com user_id, recalcula apenas os KPIs desse usuário; sem user_id (admin),
+    recalcula todos os tenants em uma única execução. Todas as linhas são gravadas
+    com upsert(on_conflict="period,created_by"), sem consulta prévia por mês.
+
+    Returns:
+        Resumo com meses com/sem acidentes, meses de acidentes sem horas
+        (ignorados), total gravado e número de tenants.
+    """
+    from managers.supabase_config import get_service_role_client
+    from services.data_cache import invalidate_table
+
+    supabase = get_service_role_client()
+    if not supabase:
+        raise RuntimeError("Erro ao conectar com o banco de dados")
+
+    def accidents_query():
+        query = supabase.table("accidents").select("occurred_at, created_by, lost_days, type")
+        return query.eq("created_by", user_id) if user_id else query
+
+    def hours_query():
+        query = supabase.table("hours_worked_monthly").select("year, month, hours, created_by")
+        return query.eq("created_by", user_id) if user_id else query
+
+    accidents_df = pd.DataFrame(_fetch_all_rows(accidents_query))
+    hours_df = pd.DataFrame(_fetch_all_rows(hours_query))
+    kpis = compute_monthly_kpis(accidents_df, hours_df)
+
+    records = kpis.to_dict('records')
+    for start in range(0, len(records), KPI_UPSERT_BATCH_SIZE):
+        supabase.table("kpi_monthly").upsert(
+            records[start:start + KPI_UPSERT_BATCH_SIZE], on_conflict="period,created_by"
+        ).execute()
+
+    invalidate_table("kpi_monthly", user_id)
+
+    accident_buckets = 0
+    if not accidents_df.empty:
+        accident_buckets = (accidents_df[accidents_df['created_by'].notna()]
+                            .assign(period=accidents_df['occurred_at'].astype(str).str[:7])
+                            .drop_duplicates(['created_by', 'period']).shape[0])
+    with_accidents = int((kpis['accidents_total'] > 0).sum())
+    return {
+        "with_accidents": with_accidents,
+        "without_accidents": len(kpis) - with_accidents,
+        "skipped_without_hours": max(accident_buckets - with_accidents, 0),
+        "total": len(kpis),
+        "tenants": int(kpis['created_by'].nunique()),
+    }
+
+
+def accident_kpi_buckets(rows: List[Dict[str, Any]]) -> set:
+    """Retorna os buckets (created_by, 'AAAA-MM') afetados por linhas de accidents"""
+    buckets = set()
+    for row in rows or []:
+        occurred_at = str(row.get('occurred_at') or '')
+        if row.get('created_by') and len(occurred_at) >= 7 and occurred_at[4] == '-':
+            buckets.add((row['created_by'], occurred_at[:7]))
+    return buckets
+
+
+def hours_kpi_buckets(rows: List[Dict[str, Any]]) -> set:
+    """Retorna os buckets (created_by, 'AAAA-MM') afetados por linhas de hours_worked_monthly"""
+    buckets = set()
+    for row in rows or []:
+        try:
+            buckets.add((row['created_by'], f"{int(row['year'])}-{int(row['month']):02d}"))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return buckets
+
+
+def refresh_kpi_buckets(buckets) -> int:
+    """
+    Recalcula apenas os meses afetados por uma escrita em accidents/hours_worked_monthly.
+
+    Para cada usuário, lê somente os acidentes e horas do intervalo de meses
+    afetado e grava as linhas com um upsert, então o custo não cresce com o
+    histórico. Falhas não desfazem a escrita original: apenas exibem um aviso
+    (o recálculo completo continua disponível na página de KPIs).
+
+    Returns:
+        Número de linhas de kpi_monthly gravadas
+    """
+    buckets = {(user_id, period) for user_id, period in buckets if user_id and period}
+    if not buckets:
+        return 0
+
+    try:
+        from managers.supabase_config import get_service_role_client
+        from services.data_cache import invalidate_table
+
+        supabase = get_service_role_client()
+        if not supabase:
+            return 0
+
+        months_by_user: Dict[str, List[str]] = {}
+        for user_id, period in buckets:
+            months_by_user.setdefault(user_id, []).append(period)
+
+        written = 0
+        for user_id, months in months_by_user.items():
+            first, last = min(months), max(months)
+            end = (pd.Period(last, freq='M') + 1).strftime('%Y-%m')
+
+            accidents_df = pd.DataFrame(_fetch_all_rows(
+                lambda: supabase.table("accidents").select("occurred_at, created_by, lost_days, type")
+                .eq("created_by", user_id).gte("occurred_at", f"{first}-01").lt("occurred_at", f"{end}-01")
+            ))
+            hours_df = pd.DataFrame(_fetch_all_rows(
+                lambda: supabase.table("hours_worked_monthly").select("year, month, hours, created_by")
+                .eq("created_by", user_id).gte("year", int(first[:4])).lte("year", int(last[:4]))
+            ))
+
+            kpis = compute_monthly_kpis(accidents_df, hours_df)
+            kpis = kpis[kpis['period'].str[:7].isin(set(months))]
+            if kpis.empty:
+                continue
+
+            supabase.table("kpi_monthly").upsert(kpis.to_dict('records'), on_conflict="period,created_by").execute()
+            invalidate_table("kpi_monthly", user_id)
+            written += len(kpis)
+        return written
+    except Exception as e:
+        st.warning(f"⚠️ Dados salvos, mas os KPIs do período não puderam ser atualizados: {str(e)}")
+        return 0
+
+
 def get_frequency_rate_interpretation(tf_value: float) -> dict:
     """
     Retorna interpretação da Taxa de Frequência conforme parâmetros de referência
@@ -188,93 +388,65 @@ def calculate_poisson_control_limits(df: pd.DataFrame,
     
     return df
 
-def calculate_ewma(df: pd.DataFrame, 
-                  value_col: str, 
-                  lambda_param: float = 0.2) -> pd.DataFrame:
-    """Calcula EWMA (Exponentially Weighted Moving Average)"""
-    df = df.copy()
-    df = df.sort_values('period')
-    
-    # Inicializa com a média dos primeiros valores
-    initial_mean = df[value_col].head(12).mean() if len(df) >= 12 else df[value_col].mean()
-    
-    ewma_values = []
-    ewma = initial_mean
-    
-    for value in df[value_col]:
-        ewma = lambda_param * value + (1 - lambda_param) * ewma
-        ewma_values.append(ewma)
-    
-    df['ewma'] = ewma_values
-    
-    # Limites de controle para EWMA
-    variance = df[value_col].var()
-    sigma_ewma = np.sqrt((lambda_param / (2 - lambda_param)) * variance)
-    
-    df['ewma_ucl'] = initial_mean + 3 * sigma_ewma
-    df['ewma_lcl'] = initial_mean - 3 * sigma_ewma
-    
-    return df
+def _numeric_column(df: pd.DataFrame, column: str) -> np.ndarray:
+    """Retorna a coluna como array float (valores inválidos/ausentes = 0), sem alterar o DataFrame"""
+    if column not in df.columns:
+        return np.zeros(len(df))
+    return pd.to_numeric(df[column], errors='coerce').fillna(0).to_numpy(dtype=float)
 
-def detect_control_chart_patterns(df: pd.DataFrame, 
-                                value_col: str, 
-                                ucl_col: str, 
-                                lcl_col: str) -> Dict[str, List[int]]:
-    """Detecta padrões de controle estatístico"""
-    patterns = {
-        'out_of_control': [],
-        'trend_up': [],
-        'trend_down': [],
-        'runs_above_center': [],
-        'runs_below_center': []
-    }
-    
-    values = df[value_col].values
-    ucl_values = df[ucl_col].values
-    lcl_values = df[lcl_col].values
-    center_line = values.mean()
-    
-    for i in range(len(values)):
-        # Pontos fora de controle
-        if values[i] > ucl_values[i] or values[i] < lcl_values[i]:
-            patterns['out_of_control'].append(i)
-        
-        # Tendência ascendente (8 pontos consecutivos)
-        if i >= 7:
-            if all(values[j] > values[j-1] for j in range(i-7, i+1)):
-                patterns['trend_up'].append(i)
-        
-        # Tendência descendente (8 pontos consecutivos)
-        if i >= 7:
-            if all(values[j] < values[j-1] for j in range(i-7, i+1)):
-                patterns['trend_down'].append(i)
-    
-    return patterns
 
-def generate_kpi_summary(df: pd.DataFrame) -> Dict[str, Any]:
-    """Gera resumo dos KPIs com interpretações conforme NBR 14280 e ISO 45001"""
+def calculate_period_rates(accidents: np.ndarray, lost_days: np.ndarray, hours: np.ndarray,
+                           debited_days: np.ndarray) -> tuple:
+    """
+    Calcula TF e TG de cada período de forma vetorizada.
+
+    Horas em centenas (HOURS_SCALE); períodos sem horas positivas ficam com taxa 0.
+    """
+    real_hours = hours * HOURS_SCALE
+    has_hours = hours > 0
+    freq_rates = np.divide(accidents * 1_000_000, real_hours, out=np.zeros_like(real_hours), where=has_hours)
+    sev_rates = np.divide((lost_days + debited_days) * 1_000_000, real_hours,
+                          out=np.zeros_like(real_hours), where=has_hours)
+    return freq_rates, sev_rates
+
+
+def _percent_change(latest: float, previous: float) -> Optional[float]:
+    return (latest - previous) / previous * 100 if previous > 0 else None
+
+
+def generate_kpi_summary(df: pd.DataFrame, assume_sorted: bool = False) -> Dict[str, Any]:
+    """
+    Gera resumo dos KPIs com interpretações conforme NBR 14280 e ISO 45001
+
+    Args:
+        df: Linhas da kpi_monthly (não é alterado)
+        assume_sorted: Indica que df já está ordenado por period (ex: fetch_kpi_data),
+            dispensando a ordenação
+    """
     if df.empty:
         return {}
     
-    # Calcula totais acumulados para todo o período
-    # ✅ VALIDAÇÃO: Garante que horas são numéricas
-    df['hours'] = pd.to_numeric(df['hours'], errors='coerce').fillna(0)
-    df['accidents_total'] = pd.to_numeric(df['accidents_total'], errors='coerce').fillna(0)
-    df['lost_days_total'] = pd.to_numeric(df['lost_days_total'], errors='coerce').fillna(0)
-    
-    total_accidents = float(df['accidents_total'].sum())
-    total_lost_days = float(df['lost_days_total'].sum())
+    # ✅ VALIDAÇÃO: Garante que os valores são numéricos (sem alterar o DataFrame recebido)
+    if not assume_sorted:
+        df = df.sort_values('period', kind='stable')
+    hours = _numeric_column(df, 'hours')
+    accidents = _numeric_column(df, 'accidents_total')
+    lost_days = _numeric_column(df, 'lost_days_total')
+    fatalities = _numeric_column(df, 'fatalities')
+    debited_days = _numeric_column(df, 'debited_days')
+    
+    total_accidents = float(accidents.sum())
+    total_lost_days = float(lost_days.sum())
     # ✅ CORRIGIDO: A tabela armazena horas em centenas (1.82 = 182 horas reais)
     # Precisa multiplicar por 100 para converter para horas reais
-    total_hours = float(df['hours'].sum())  # Soma dos valores da tabela em centenas (ex: 40.79 centenas)
+    total_hours = float(hours.sum())  # Soma dos valores da tabela em centenas (ex: 40.79 centenas)
     total_hours_corrected = total_hours * HOURS_SCALE  # Multiplica por 100: 40.79 × 100 = 4.079 horas reais
-    total_fatalities = float(df.get('fatalities', pd.Series([0] * len(df))).sum())
-    total_debited_days = float(df.get('debited_days', pd.Series([0] * len(df))).sum())
+    total_fatalities = float(fatalities.sum())
     
     # Calcula automaticamente os dias debitados para acidentes fatais conforme NBR 14280
     # Morte = 6.000 dias debitados
-    automatic_debited_days = total_fatalities * 6000
-    total_debited_days = total_debited_days + automatic_debited_days
+    automatic_debited_days = total_fatalities * FATALITY_DEBITED_DAYS
+    total_debited_days = float(debited_days.sum()) + automatic_debited_days
     
     # ✅ VALIDAÇÃO: Verifica se há horas válidas
     if total_hours_corrected <= 0:
@@ -290,56 +462,26 @@ def generate_kpi_summary(df: pd.DataFrame) -> Dict[str, Any]:
         }
     
     # ✅ Cálculos ACUMULADOS para todo o período (correto para visão geral)
-    # total_hours na tabela está em centenas (4079 = 4.079 centenas = 407.900 horas reais)
-    # A função espera receber em centenas e multiplica por 100 internamente
-    # Então passamos total_hours diretamente (já está em centenas)
+    # total_hours está em centenas; a função multiplica por 100 internamente
     freq_rate = calculate_frequency_rate(int(total_accidents), total_hours)
     sev_rate = calculate_severity_rate(int(total_lost_days), total_hours, int(total_debited_days))
     
-    # ✅ VALIDAÇÃO: Verifica se o cálculo está correto
-    if total_hours_corrected > 0:
-        expected_freq = (total_accidents / total_hours_corrected) * 1_000_000
-        expected_sev = ((total_lost_days + total_debited_days) / total_hours_corrected) * 1_000_000
-        # Se houver diferença significativa, algo está errado
-        if abs(freq_rate - expected_freq) > 0.01:
-            import warnings
-            warnings.warn(f"TF calculada ({freq_rate:.2f}) diferente da esperada ({expected_freq:.2f})")
-    
-    # ✅ NOVO: Calcula também taxas POR PERÍODO para análise mais precisa
-    df_with_rates = df.copy()
-    # ✅ CORRIGIDO: Horas na tabela estão em centenas (176.0 = 176 centenas = 17.600 horas reais)
-    # A função espera em centenas, então passamos diretamente (já está no formato correto)
-    df_with_rates['freq_rate_period'] = df_with_rates.apply(
-        lambda row: calculate_frequency_rate(
-            row['accidents_total'], 
-            row['hours']  # Já está em centenas (176.0), que é o formato esperado pela função
-        ) if row['hours'] > 0 else 0, 
-        axis=1
-    )
-    
-    # Calcula dias debitados por período (fatalidades * 6000)
-    df_with_rates['period_debited_days'] = (
-        df_with_rates.get('debited_days', 0) + 
-        (df_with_rates.get('fatalities', 0) * 6000)
-    )
-    
-    df_with_rates['sev_rate_period'] = df_with_rates.apply(
-        lambda row: calculate_severity_rate(
-            row['lost_days_total'], 
-            row['hours'],  # Já está em centenas (176.0), que é o formato esperado pela função
-            row['period_debited_days']
-        ) if row['hours'] > 0 else 0, 
-        axis=1
-    )
+    # ✅ Taxas POR PERÍODO para análise de tendências (sem apply linha a linha)
+    period_debited_days = debited_days + fatalities * FATALITY_DEBITED_DAYS
+    freq_rates, sev_rates = calculate_period_rates(accidents, lost_days, hours, period_debited_days)
+    df_with_rates = pd.DataFrame({
+        'period': df['period'].to_numpy(),
+        'accidents_total': accidents,
+        'lost_days_total': lost_days,
+        'hours': hours,
+        'period_debited_days': period_debited_days,
+        'freq_rate_period': freq_rates,
+        'sev_rate_period': sev_rates,
+    })
     
     # ✅ CORRIGIDO: Taxa acumulada é sempre a forma correta conforme NBR 14280
     # A "média por período" não faz sentido estatístico quando horas variam entre períodos
     # O padrão da norma é: (Total de acidentes / Total de horas) × 1.000.000
-    # 
-    # Calculamos taxas por período apenas para análise de tendências, não para exibição principal
-    
-    # Para múltiplos períodos, usa a TAXA ACUMULADA (padrão da norma)
-    # A taxa acumulada já é a forma correta de calcular quando há múltiplos períodos
     avg_freq_rate = float(freq_rate)  # Na verdade é taxa acumulada
     avg_sev_rate = float(sev_rate)    # Na verdade é taxa acumulada
     
@@ -347,44 +489,16 @@ def generate_kpi_summary(df: pd.DataFrame) -> Dict[str, Any]:
     freq_interpretation = get_frequency_rate_interpretation(float(freq_rate))
     sev_interpretation = get_severity_rate_interpretation(float(sev_rate))
     
-    # ✅ MELHORADO: Comparação com média dos últimos 3 períodos (mais estável)
+    # ✅ MELHORADO: Último período comparado à média dos 3 anteriores (ou ao anterior, com 2-3 períodos)
     freq_change = None
     sev_change = None
     
     if len(df_with_rates) >= 4:
-        # Ordena por período
-        df_sorted = df_with_rates.sort_values('period')
-        
-        # Último período
-        latest_freq = df_sorted['freq_rate_period'].iloc[-1]
-        latest_sev = df_sorted['sev_rate_period'].iloc[-1]
-        
-        # Média dos 3 períodos anteriores
-        prev_3_freq = df_sorted['freq_rate_period'].iloc[-4:-1].mean()
-        prev_3_sev = df_sorted['sev_rate_period'].iloc[-4:-1].mean()
-        
-        # Calcula variação percentual
-        if prev_3_freq > 0:
-            freq_change = ((latest_freq - prev_3_freq) / prev_3_freq * 100)
-        
-        if prev_3_sev > 0:
-            sev_change = ((latest_sev - prev_3_sev) / prev_3_sev * 100)
-    
+        freq_change = _percent_change(freq_rates[-1], freq_rates[-4:-1].mean())
+        sev_change = _percent_change(sev_rates[-1], sev_rates[-4:-1].mean())
     elif len(df_with_rates) >= 2:
-        # Se tiver apenas 2-3 períodos, compara com o anterior
-        df_sorted = df_with_rates.sort_values('period')
-        
-        latest_freq = df_sorted['freq_rate_period'].iloc[-1]
-        latest_sev = df_sorted['sev_rate_period'].iloc[-1]
-        
-        prev_freq = df_sorted['freq_rate_period'].iloc[-2]
-        prev_sev = df_sorted['sev_rate_period'].iloc[-2]
-        
-        if prev_freq > 0:
-            freq_change = ((latest_freq - prev_freq) / prev_freq * 100)
-        
-        if prev_sev > 0:
-            sev_change = ((latest_sev - prev_sev) / prev_sev * 100)
+        freq_change = _percent_change(freq_rates[-1], freq_rates[-2])
+        sev_change = _percent_change(sev_rates[-1], sev_rates[-2])
     
     # ✅ ISO 45001: Adicionando métricas de desempenho e análise de tendências
     # Conformidade com requisitos ISO 45001:2018
@@ -720,147 +834,93 @@ def generate_forecast_recommendations(forecasts: Dict[str, Any]) -> List[str]:
     
     return recommendations
 
-def fetch_detailed_accidents(user_email: str, start_date=None, end_date=None) -> pd.DataFrame:
+def fetch_detailed_accidents(user_email: str, start_date=None, end_date=None,
+                             user_ids: Optional[List[str]] = None) -> pd.DataFrame:
     """
     Busca dados detalhados de acidentes do usuário atual
+    
+    Só as colunas usadas em analyze_accidents_by_category são lidas.
     """
     try:
-        from managers.supabase_config import get_service_role_client
         from auth.auth_utils import get_user_id, is_admin
-        
-        # Sempre usa service_role e aplica filtro de segurança no código
-        supabase = get_service_role_client()
-        if not supabase:
-            return pd.DataFrame()
+        from services.list_queries import ACCIDENT_ANALYSIS_COLUMNS, fetch_list
         
         user_id = get_user_id()
         if not user_id:
             return pd.DataFrame()
         
-        query = supabase.table("accidents").select("*")
-        
-        # Admin vê todos os dados, usuário comum vê apenas seus próprios
-        if not is_admin():
-            query = query.eq("created_by", user_id)
-        
-        if start_date:
-            query = query.gte("occurred_at", start_date.isoformat())
-        if end_date:
-            query = query.lte("occurred_at", end_date.isoformat())
-            
-        response = query.order("occurred_at", desc=True).execute()
-        
-        if response and hasattr(response, 'data') and response.data:
-            return pd.DataFrame(response.data)
-        return pd.DataFrame()
+        return fetch_list("accidents", ACCIDENT_ANALYSIS_COLUMNS, user_id, is_admin(),
+                          start_date, end_date, user_ids=user_ids)
         
     except Exception as e:
         st.error(f"Erro ao buscar dados de acidentes: {str(e)}")
         return pd.DataFrame()
 
+# Dimensões da análise por categoria: chave do resultado -> coluna agrupada
+ACCIDENT_CATEGORY_DIMENSIONS = {
+    'by_type': 'type',
+    'by_classification': 'classification',
+    'by_body_part': 'body_part',
+    'by_root_cause': 'root_cause',
+    'temporal': 'year_month',
+}
+
+def _category_breakdown(frame: pd.DataFrame, column: str) -> Dict[str, Dict[str, int]]:
+    """
+    Quantidade, dias perdidos e fatais por valor de `column` em um único groupby.
+    Valores nulos ou vazios ficam de fora.
+    """
+    if column not in frame.columns:
+        return {}
+    
+    grouped = frame.groupby(column, sort=True, observed=True).agg(
+        count=('lost_days', 'size'),
+        lost_days=('lost_days', 'sum'),
+        fatalities=('is_fatal', 'sum')
+    )
+    keys = grouped.index.astype(str)
+    valid = keys != ''
+    grouped = grouped[valid].astype('int64')
+    return dict(zip(keys[valid], grouped.to_dict('records')))
+
 def analyze_accidents_by_category(accidents_df: pd.DataFrame) -> Dict[str, Any]:
     """
     Analisa acidentes por categoria (lesão/fatalidade) e calcula frequência
+    
+    Fatais são os acidentes com type == 'fatal'. O DataFrame recebido não é
+    alterado (ele pode vir do cache dos fetchers).
     """
     if accidents_df.empty:
         return {}
     
-    # Converte data para datetime se necessário
-    if 'occurred_at' in accidents_df.columns:
-        accidents_df['occurred_at'] = pd.to_datetime(accidents_df['occurred_at'])
-        accidents_df['year_month'] = accidents_df['occurred_at'].dt.to_period('M')
+    columns = accidents_df.columns
     
-    # Análise por tipo de acidente
-    agg_dict = {
-        'id': 'count',
-        'lost_days': 'sum'
-    }
+    # Quadro com apenas as colunas usadas, já convertidas
+    frame = pd.DataFrame({
+        'lost_days': pd.to_numeric(accidents_df['lost_days'], errors='coerce').fillna(0)
+        if 'lost_days' in columns else 0,
+        'is_fatal': accidents_df['type'].eq('fatal') if 'type' in columns else False,
+    }, index=accidents_df.index)
     
-    # is_fatal removido - usar type == 'fatal' em vez disso
-    type_analysis = accidents_df.groupby('type').agg(agg_dict).rename(columns={'id': 'count'})
-    
-    # Análise por classificação
-    classification_analysis = accidents_df.groupby('classification').agg({
-        'id': 'count',
-        'lost_days': 'sum'
-    }).rename(columns={'id': 'count'})
-    
-    # Análise por parte do corpo
-    body_part_analysis = accidents_df.groupby('body_part').agg({
-        'id': 'count',
-        'lost_days': 'sum'
-    }).rename(columns={'id': 'count'})
-    
-    # Análise por causa raiz
-    root_cause_analysis = accidents_df.groupby('root_cause').agg({
-        'id': 'count',
-        'lost_days': 'sum'
-    }).rename(columns={'id': 'count'})
-    
-    # Análise temporal (últimos 12 meses)
-    if 'year_month' in accidents_df.columns:
-        temporal_agg_dict = {
-            'id': 'count',
-            'lost_days': 'sum'
-        }
-        
-        # is_fatal removido - usar type == 'fatal' em vez disso
-        temporal_analysis = accidents_df.groupby('year_month').agg(temporal_agg_dict).rename(columns={'id': 'count'})
-    else:
-        temporal_analysis = pd.DataFrame()
-    
-    # Converte para formato mais legível
-    def format_analysis(df, analysis_name, group_key=None):
-        if df.empty:
-            return {}
-        
-        result = {}
-        for idx, row in df.iterrows():
-            if pd.isna(idx) or idx == '':
-                continue
-            
-            # Calcula fatalities baseado em type == 'fatal'
-            fatalities_count = 0
-            if analysis_name == 'by_type':
-                # Para análise por tipo, se o índice for 'fatal', todos são fatais
-                fatalities_count = int(row['count']) if str(idx) == 'fatal' else 0
-            elif group_key is not None and 'type' in accidents_df.columns:
-                # Para outras análises, filtra o dataframe original pelo grupo e conta fatais
-                if group_key == 'classification':
-                    group_data = accidents_df[accidents_df['classification'] == idx]
-                elif group_key == 'body_part':
-                    group_data = accidents_df[accidents_df['body_part'] == idx]
-                elif group_key == 'root_cause':
-                    group_data = accidents_df[accidents_df['root_cause'] == idx]
-                elif group_key == 'year_month':
-                    group_data = accidents_df[accidents_df['year_month'] == idx]
-                else:
-                    group_data = pd.DataFrame()
-                
-                if not group_data.empty:
-                    fatalities_count = len(group_data[group_data['type'] == 'fatal'])
-            
-            result[str(idx)] = {
-                'count': int(row['count']),
-                'lost_days': int(row.get('lost_days', 0)),
-                'fatalities': fatalities_count
-            }
-        return result
+    for column in ('type', 'classification', 'body_part', 'root_cause'):
+        if column in columns:
+            frame[column] = accidents_df[column]
     
-    # Calcula total de fatais baseado em type == 'fatal'
-    total_fatalities = len(accidents_df[accidents_df['type'] == 'fatal']) if 'type' in accidents_df.columns else 0
+    if 'occurred_at' in columns:
+        frame['occurred_at'] = pd.to_datetime(accidents_df['occurred_at'])
+        frame['year_month'] = frame['occurred_at'].dt.to_period('M')
     
-    return {
-        'by_type': format_analysis(type_analysis, 'by_type'),
-        'by_classification': format_analysis(classification_analysis, 'by_classification', 'classification'),
-        'by_body_part': format_analysis(body_part_analysis, 'by_body_part', 'body_part'),
-        'by_root_cause': format_analysis(root_cause_analysis, 'by_root_cause', 'root_cause'),
-        'temporal': format_analysis(temporal_analysis, 'temporal', 'year_month'),
-        'total_accidents': len(accidents_df),
-        'total_fatalities': total_fatalities,
-        'total_lost_days': int(accidents_df['lost_days'].sum()) if 'lost_days' in accidents_df.columns else 0,
-        'frequency_by_period': calculate_accident_frequency_by_period(accidents_df)
+    result = {
+        key: _category_breakdown(frame, column)
+        for key, column in ACCIDENT_CATEGORY_DIMENSIONS.items()
     }
+    result.update({
+        'total_accidents': len(accidents_df),
+        'total_fatalities': int(frame['is_fatal'].sum()),
+        'total_lost_days': int(frame['lost_days'].sum()) if 'lost_days' in columns else 0,
+        'frequency_by_period': calculate_accident_frequency_by_period(frame)
+    })
+    return result
 
 def calculate_accident_frequency_by_period(accidents_df: pd.DataFrame) -> Dict[str, Any]:
     """
@@ -869,24 +929,13 @@ def calculate_accident_frequency_by_period(accidents_df: pd.DataFrame) -> Dict[s
     if accidents_df.empty or 'occurred_at' not in accidents_df.columns:
         return {}
     
-    # Converte data para datetime
-    accidents_df['occurred_at'] = pd.to_datetime(accidents_df['occurred_at'])
-    accidents_df['year_month'] = accidents_df['occurred_at'].dt.to_period('M')
-    
-    # Agrupa por período e tipo
-    period_analysis = accidents_df.groupby(['year_month', 'type']).size().unstack(fill_value=0)
+    # Agrupa por período e tipo (sem alterar o DataFrame recebido)
+    year_month = pd.to_datetime(accidents_df['occurred_at']).dt.to_period('M')
+    period_analysis = accidents_df.groupby([year_month, accidents_df['type']]).size().unstack(fill_value=0)
     
-    # Calcula frequência relativa
-    period_totals = period_analysis.sum(axis=1)
-    period_frequency = {}
-    
-    for period in period_analysis.index:
-        period_str = str(period)
-        period_frequency[period_str] = {
-            'total': int(period_totals[period]),
-            'fatal': int(period_analysis.loc[period, 'fatal']) if 'fatal' in period_analysis.columns else 0,
-            'lesao': int(period_analysis.loc[period, 'lesao']) if 'lesao' in period_analysis.columns else 0,
-            'sem_lesao': int(period_analysis.loc[period, 'sem_lesao']) if 'sem_lesao' in period_analysis.columns else 0
-        }
+    # Total do período e quantidade por tipo
+    counts = period_analysis.reindex(columns=['fatal', 'lesao', 'sem_lesao'], fill_value=0)
+    counts.insert(0, 'total', period_analysis.sum(axis=1))
+    counts = counts.astype('int64')
     
-    return period_frequency
\ No newline at end of file
+    return {str(period): values for period, values in counts.to_dict('index').items()}
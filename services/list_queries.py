@@ -0,0 +1,208 @@
+"""
+Consultas de listagem dos dashboards (acidentes, quase-acidentes, N/C e KPIs)
+
+Cada página declara as colunas de que precisa; fetch_list leva para a consulta do
+PostgREST a projeção, a janela de datas, o recorte "últimos N meses" e os filtros
+de usuário, em vez de baixar a tabela inteira e filtrar no pandas. Campos de texto
+longos (inclusive a descrição) ficam fora das listagens: são lidos sob demanda com
+fetch_record_fields, e a busca por texto é feita no banco com search_record_ids.
+"""
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Optional, Sequence, Set
+
+import pandas as pd
+
+from services.data_cache import cached_fetch
+from services.kpi import _fetch_all_rows
+
+# Coluna de data usada na janela de datas e na ordenação de cada tabela
+DATE_COLUMNS = {
+    "accidents": "occurred_at",
+    "near_misses": "occurred_at",
+    # A N/C é filtrada pela data de abertura (occurred_at é opcional)
+    "nonconformities": "opened_at",
+    "kpi_monthly": "period",
+}
+
+# Tabelas em que "últimos N meses" é contado a partir do período mais recente
+MONTHS_BACK_TABLES = {"kpi_monthly"}
+
+# Colunas declaradas pelas páginas
+ACCIDENT_LIST_COLUMNS = [
+    "id", "occurred_at", "type", "classification", "body_part", "lost_days",
+    "root_cause", "status", "employee_id", "created_by",
+]
+ACCIDENT_ANALYSIS_COLUMNS = [
+    "id", "occurred_at", "type", "classification", "body_part", "lost_days",
+    "root_cause", "created_by",
+]
+NEAR_MISS_LIST_COLUMNS = ["id", "occurred_at", "potential_severity", "status", "created_by"]
+NONCONFORMITY_LIST_COLUMNS = [
+    "id", "opened_at", "occurred_at", "standard_ref", "severity", "status", "created_by",
+]
+KPI_LIST_COLUMNS = [
+    "id", "period", "created_by", "accidents_total", "fatalities", "lost_days_total",
+    "hours", "frequency_rate", "severity_rate", "debited_days",
+]
+
+# Campos de texto longo de cada tabela, lidos apenas quando um registro é aberto
+DETAIL_TEXT_COLUMNS = {
+    "accidents": [
+        "title", "description", "product_released", "equipment_involved",
+        "fire_observation", "explosion_observation", "process_safety_observation",
+    ],
+    "near_misses": ["description"],
+    "nonconformities": ["description"],
+}
+
+# Coluna pesquisada pela busca das abas de registros (filtrada no banco)
+SEARCH_COLUMNS = {
+    "accidents": "description",
+    "near_misses": "description",
+    "nonconformities": "description",
+}
+
+
+def _iso(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def _like_pattern(term: str) -> str:
+    """Padrão de ILIKE que casa o termo em qualquer posição (curingas do termo escapados)"""
+    escaped = term.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _months_back_cutoff(supabase, table: str, user_id: Optional[str], is_admin: bool,
+                        months_back: int, end: Any = None,
+                        created_by: Optional[Iterable[str]] = None) -> Optional[str]:
+    """Início do recorte: período mais recente dentro dos filtros menos N meses"""
+    date_column = DATE_COLUMNS[table]
+    query = supabase.table(table).select(date_column)
+    if not is_admin:
+        query = query.eq("created_by", user_id)
+    if created_by is not None:
+        query = query.in_("created_by", list(created_by))
+    if end:
+        query = query.lte(date_column, _iso(end))
+    response = query.order(date_column, desc=True).limit(1).execute()
+    if not response or not response.data or not response.data[0].get(date_column):
+        return None
+    latest = pd.to_datetime(response.data[0][date_column])
+    return (latest - pd.DateOffset(months=months_back)).date().isoformat()
+
+
+def build_list_query(supabase, table: str, columns: Sequence[str], user_id: Optional[str],
+                     is_admin: bool, start: Any = None, end: Any = None,
+                     created_by: Optional[Iterable[str]] = None, search: Optional[str] = None):
+    """
+    Consulta com projeção e filtros aplicados no banco.
+
+    Usuários comuns sempre veem apenas os próprios registros; `created_by`
+    restringe ainda mais (filtro de usuários da barra lateral). `search` filtra
+    por trecho de texto na coluna SEARCH_COLUMNS da tabela (sem diferenciar caixa).
+    """
+    date_column = DATE_COLUMNS[table]
+    query = supabase.table(table).select(",".join(columns))
+
+    # Admin vê todos os dados; usuário comum apenas os que criou
+    if not is_admin:
+        query = query.eq("created_by", user_id)
+    if created_by is not None:
+        query = query.in_("created_by", list(created_by))
+
+    if start:
+        query = query.gte(date_column, _iso(start))
+    if end:
+        query = query.lte(date_column, _iso(end))
+    if search and search.strip():
+        query = query.ilike(SEARCH_COLUMNS[table], _like_pattern(search))
+
+    # id desempata a ordem para a paginação por range()
+    return query.order(date_column, desc=table not in MONTHS_BACK_TABLES).order("id")
+
+
+def fetch_list(table: str, columns: Sequence[str], user_id: Optional[str], is_admin: bool,
+               start_date: Any = None, end_date: Any = None, months_back: int = 0,
+               user_ids: Optional[Iterable[str]] = None, search: Optional[str] = None) -> pd.DataFrame:
+    """
+    Lista os registros de `table` com as colunas pedidas (em cache por tenant/filtros).
+
+    Args:
+        table: accidents, near_misses, nonconformities ou kpi_monthly
+        columns: Colunas usadas pela página
+        user_id / is_admin: Tenant atual
+        start_date / end_date: Janela de datas (opcional)
+        months_back: Últimos N meses, só para tabelas de MONTHS_BACK_TABLES (0 = todos)
+        user_ids: Restringe a estes criadores (None = sem restrição; lista vazia =
+            a seleção não corresponde a nenhum usuário, resultado vazio)
+        search: Trecho de texto procurado na coluna SEARCH_COLUMNS da tabela (opcional)
+    """
+    from managers.supabase_config import get_service_role_client
+
+    columns = list(dict.fromkeys(columns))
+    # None = sem filtro de usuários; lista vazia = nenhum usuário selecionado casou com um perfil
+    if user_ids is not None:
+        user_ids = sorted(set(user_ids))
+        if not user_ids:
+            return pd.DataFrame()
+    months_back = months_back if table in MONTHS_BACK_TABLES else 0
+    search = search.strip() if search and search.strip() else None
+
+    def load() -> pd.DataFrame:
+        # Usa service_role para contornar RLS e aplicar filtro de segurança na consulta
+        supabase = get_service_role_client()
+        if not supabase:
+            return pd.DataFrame()
+
+        start = start_date
+        if months_back and months_back > 0:
+            cutoff = _months_back_cutoff(supabase, table, user_id, is_admin, months_back, end_date, user_ids)
+            if cutoff and (not start or cutoff > _iso(start)):
+                start = cutoff
+
+        rows = _fetch_all_rows(lambda: build_list_query(
+            supabase, table, columns, user_id, is_admin, start, end_date, user_ids, search
+        ))
+        return pd.DataFrame(rows, columns=columns) if rows else pd.DataFrame()
+
+    extra = (tuple(columns), months_back, tuple(user_ids) if user_ids is not None else None, search)
+    return cached_fetch(table, user_id, is_admin, start_date, end_date, load, *extra)
+
+
+def fetch_record_fields(table: str, record_id: str, columns: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """
+    Lê sob demanda os campos longos de um registro (padrão: DETAIL_TEXT_COLUMNS da tabela).
+
+    Usuários comuns só leem registros que criaram.
+    """
+    from managers.supabase_config import get_service_role_client
+    from auth.auth_utils import get_user_id, is_admin
+
+    user_id = get_user_id()
+    if not user_id or not record_id:
+        return {}
+
+    columns = list(columns or DETAIL_TEXT_COLUMNS.get(table, ["description"]))
+    supabase = get_service_role_client()
+    query = supabase.table(table).select(",".join(["id"] + columns)).eq("id", record_id)
+    if not is_admin():
+        query = query.eq("created_by", user_id)
+    response = query.limit(1).execute()
+    return response.data[0] if response and response.data else {}
+
+
+def search_record_ids(table: str, term: str, start_date: Any = None, end_date: Any = None,
+                      user_ids: Optional[Iterable[str]] = None) -> Set[str]:
+    """
+    IDs dos registros do tenant cuja descrição contém `term` (busca feita no banco,
+    sem baixar a descrição). Mesma janela de datas e filtro de usuários da listagem.
+    """
+    from auth.auth_utils import get_user_id, is_admin
+
+    user_id = get_user_id()
+    if not user_id or not term or not term.strip():
+        return set()
+    df = fetch_list(table, ["id"], user_id, is_admin(), start_date, end_date,
+                    user_ids=user_ids, search=term)
+    return set(df["id"].astype(str)) if not df.empty else set()
@@ -0,0 +1,183 @@
+"""
+Controle estatístico de processo (CEP) para os gráficos de KPIs
+
+Cálculos vetorizados com NumPy: EWMA por filtro linear (scipy.signal.lfilter,
+com pandas como alternativa quando o SciPy não está instalado), limites EWMA
+variáveis no tempo e regras de Western Electric/Nelson 1-8 avaliadas com
+janelas deslizantes sobre arrays, sem laços Python por ponto.
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Regras de Nelson (as regras 1, 5 e 6 são as de Western Electric)
+NELSON_RULES = {
+    1: "1 ponto além de 3σ da linha central",
+    2: "9 pontos seguidos do mesmo lado da linha central",
+    3: "6 pontos seguidos sempre crescendo ou sempre decrescendo",
+    4: "14 pontos seguidos alternando para cima e para baixo",
+    5: "2 de 3 pontos além de 2σ, do mesmo lado",
+    6: "4 de 5 pontos além de 1σ, do mesmo lado",
+    7: "15 pontos seguidos dentro de 1σ",
+    8: "8 pontos seguidos fora de 1σ, em qualquer lado",
+}
+
+# Tendência crítica exibida na página: 8 variações seguidas no mesmo sentido
+TREND_LENGTH = 8
+
+
+def run_lengths(mask: np.ndarray) -> np.ndarray:
+    """Tamanho da sequência de True que termina em cada posição"""
+    mask = np.asarray(mask, dtype=bool)
+    idx = np.arange(len(mask))
+    last_false = np.maximum.accumulate(np.where(mask, -1, idx))
+    return idx - last_false
+
+
+def window_counts(mask: np.ndarray, window: int) -> np.ndarray:
+    """Quantidade de True nas últimas `window` posições (janelas incompletas contam o que houver)"""
+    counts = np.cumsum(np.asarray(mask, dtype=np.int64))
+    shifted = np.concatenate([np.zeros(window, dtype=np.int64), counts])[:len(counts)]
+    return counts - shifted
+
+
+def ewma(values: np.ndarray, lambda_param: float = 0.2, initial_value: Optional[float] = None) -> np.ndarray:
+    """
+    EWMA z[i] = λ·x[i] + (1-λ)·z[i-1], com z[-1] = initial_value (padrão: média da série).
+
+    Calculada como filtro IIR de primeira ordem (scipy.signal.lfilter).
+    """
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return values
+    if initial_value is None:
+        initial_value = float(np.nanmean(values))
+    try:
+        from scipy.signal import lfilter
+        zi = np.array([(1 - lambda_param) * initial_value])
+        result, _ = lfilter([lambda_param], [1.0, -(1 - lambda_param)], values, zi=zi)
+        return result
+    except ImportError:
+        # Mesma recorrência pela implementação Cython do pandas (adjust=False)
+        seeded = pd.Series(np.concatenate([[initial_value], values]))
+        return seeded.ewm(alpha=lambda_param, adjust=False).mean().to_numpy()[1:]
+
+
+def ewma_limits(n: int, center: float, sigma: float, lambda_param: float = 0.2,
+                width: float = 3.0) -> tuple:
+    """
+    Limites EWMA variáveis no tempo:
+    center ± L·σ·sqrt(λ/(2-λ)·(1-(1-λ)^(2i))), i = 1..n, que convergem para o limite assintótico
+    """
+    i = np.arange(1, n + 1)
+    spread = width * sigma * np.sqrt(lambda_param / (2 - lambda_param) * (1 - (1 - lambda_param) ** (2 * i)))
+    return center + spread, center - spread
+
+
+def calculate_ewma(df: pd.DataFrame,
+                   value_col: str,
+                   lambda_param: float = 0.2,
+                   width: float = 3.0) -> pd.DataFrame:
+    """
+    Calcula o gráfico EWMA (Exponentially Weighted Moving Average)
+
+    Adiciona as colunas ewma, ewma_center, ewma_ucl, ewma_lcl (limites variáveis
+    no tempo) e ewma_out_of_control. A linha central é a média dos 12 primeiros
+    períodos (ou de todos, se houver menos).
+    """
+    df = df.sort_values('period')
+    values = pd.to_numeric(df[value_col], errors='coerce').to_numpy(dtype=float)
+    if len(values) == 0:
+        return df.assign(ewma=[], ewma_center=[], ewma_ucl=[], ewma_lcl=[], ewma_out_of_control=[])
+
+    center = float(np.nanmean(values[:12]))
+    sigma = float(np.nanstd(values, ddof=1)) if len(values) > 1 else 0.0
+    smoothed = ewma(np.where(np.isnan(values), center, values), lambda_param, center)
+    ucl, lcl = ewma_limits(len(values), center, sigma, lambda_param, width)
+
+    return df.assign(
+        ewma=smoothed,
+        ewma_center=center,
+        ewma_ucl=ucl,
+        ewma_lcl=lcl,
+        ewma_out_of_control=(smoothed > ucl) | (smoothed < lcl),
+    )
+
+
+def nelson_rules(values: np.ndarray, center, sigma) -> Dict[int, np.ndarray]:
+    """
+    Avalia as regras de Nelson 1-8.
+
+    center e sigma podem ser escalares ou arrays (limites variáveis por período).
+    Retorna, para cada regra, a máscara dos pontos em que o padrão se completa.
+    """
+    x = np.asarray(values, dtype=float)
+    n = len(x)
+    sigma = np.broadcast_to(np.asarray(sigma, dtype=float), (n,))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(sigma > 0, (x - center) / sigma, 0.0)
+
+    above, below = z > 0, z < 0
+    diff = np.diff(x, prepend=np.nan)
+    rising, falling = diff > 0, diff < 0
+    # Alternância: a variação atual tem sinal oposto à anterior (diff[0] é NaN, então
+    # N pontos alternando marcam N-2 posições: 14 pontos = 12 alternâncias seguidas)
+    alternating = np.concatenate([[False], (diff[1:] * diff[:-1]) < 0]) if n else np.zeros(0, dtype=bool)
+
+    return {
+        1: np.abs(z) > 3,
+        2: (run_lengths(above) >= 9) | (run_lengths(below) >= 9),
+        3: (run_lengths(rising) >= 5) | (run_lengths(falling) >= 5),
+        4: run_lengths(alternating) >= 12,
+        5: ((window_counts(z > 2, 3) >= 2) & (z > 2)) | ((window_counts(z < -2, 3) >= 2) & (z < -2)),
+        6: ((window_counts(z > 1, 5) >= 4) & (z > 1)) | ((window_counts(z < -1, 5) >= 4) & (z < -1)),
+        7: run_lengths((np.abs(z) < 1) & (sigma > 0)) >= 15,
+        8: run_lengths(np.abs(z) > 1) >= 8,
+    }
+
+
+def detect_control_chart_patterns(df: pd.DataFrame,
+                                  value_col: str,
+                                  ucl_col: str,
+                                  lcl_col: str,
+                                  center_col: Optional[str] = None) -> Dict[str, List[int]]:
+    """
+    Detecta padrões de controle estatístico
+
+    Retorna as posições (iloc) de: out_of_control (fora dos limites), trend_up /
+    trend_down (8 variações seguidas no mesmo sentido), runs_above_center /
+    runs_below_center (9 pontos do mesmo lado) e rule_1 ... rule_8 (Nelson).
+
+    Com center_col, a linha central e o σ de cada período vêm dos limites
+    ((UCL - centro) / 3); sem ela, usa a média da série e (UCL - LCL) / 6.
+    """
+    values = pd.to_numeric(df[value_col], errors='coerce').to_numpy(dtype=float)
+    ucl = pd.to_numeric(df[ucl_col], errors='coerce').to_numpy(dtype=float)
+    lcl = pd.to_numeric(df[lcl_col], errors='coerce').to_numpy(dtype=float)
+
+    if center_col:
+        center = pd.to_numeric(df[center_col], errors='coerce').to_numpy(dtype=float)
+        sigma = (ucl - center) / 3
+    else:
+        center = np.nanmean(values) if len(values) else 0.0
+        sigma = (ucl - lcl) / 6
+
+    rules = nelson_rules(values, center, sigma)
+    diff = np.diff(values, prepend=np.nan)
+    side_runs_above = run_lengths(values > center)
+    side_runs_below = run_lengths(values < center)
+
+    def positions(mask: np.ndarray) -> List[int]:
+        return np.flatnonzero(mask).tolist()
+
+    patterns = {
+        'out_of_control': positions((values > ucl) | (values < lcl)),
+        'trend_up': positions(run_lengths(diff > 0) >= TREND_LENGTH),
+        'trend_down': positions(run_lengths(diff < 0) >= TREND_LENGTH),
+        'runs_above_center': positions(side_runs_above >= 9),
+        'runs_below_center': positions(side_runs_below >= 9),
+    }
+    for rule, mask in rules.items():
+        patterns[f'rule_{rule}'] = positions(mask)
+    return patterns
@@ -0,0 +1,110 @@
+"""
+Contagens agrupadas para as estatísticas das páginas de administração
+
+As contagens são feitas no banco pela função count_rows_by_columns
+(docs/migrations/create_count_rows_by_columns_rpc.sql), que devolve o total e
+um GROUP BY por coluna em uma única chamada. Se a função ainda não existir no
+projeto, as colunas pedidas são lidas em páginas e contadas em Python, sem
+manter as linhas em memória. O resultado fica em cache por alguns segundos.
+"""
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from services.data_cache import get_data_cache, make_cache_key
+from config.config import get_config
+from utils.simple_logger import get_logger
+
+STATISTICS_RPC = "count_rows_by_columns"
+
+# Linhas por página no cálculo em Python (limite padrão de resposta do PostgREST)
+STATISTICS_PAGE_SIZE = 1000
+
+# Marcado quando a RPC não existe no banco, para não repetir a chamada que falha
+# (erros transitórios apenas usam o cálculo em Python naquela chamada)
+_rpc_unavailable = False
+_rpc_lock = threading.Lock()
+
+
+def _normalize_counts(counts: Dict[Any, Any], default: str) -> Dict[str, int]:
+    """Valores nulos/vazios são agrupados sob o valor padrão da coluna"""
+    normalized: Dict[str, int] = {}
+    for value, total in (counts or {}).items():
+        key = value if value not in (None, "") else default
+        normalized[key] = normalized.get(key, 0) + int(total)
+    return normalized
+
+
+def _counts_from_rpc(supabase, table: str, columns: List[str]) -> Optional[Dict[str, Any]]:
+    """Contagens pela RPC; None se a função não estiver disponível"""
+    global _rpc_unavailable
+    if _rpc_unavailable:
+        return None
+    try:
+        response = supabase.rpc(STATISTICS_RPC, {"p_table": table, "p_columns": columns}).execute()
+    except Exception as e:
+        message = str(e)
+        # Só a ausência da função (PGRST202) desativa a RPC no processo; outros erros
+        # (ex.: coluna inexistente, timeout) afetam apenas esta chamada
+        if getattr(e, "code", None) == "PGRST202" or "PGRST202" in message \
+                or "Could not find the function" in message:
+            with _rpc_lock:
+                _rpc_unavailable = True
+            get_logger().warning(f"RPC {STATISTICS_RPC} indisponível, contando em Python: {e}")
+        else:
+            get_logger().warning(f"Falha na RPC {STATISTICS_RPC}, contando em Python nesta chamada: {e}")
+        return None
+    return response.data if response and isinstance(response.data, dict) else None
+
+
+def _counts_by_paging(supabase, table: str, columns: List[str],
+                      page_size: int = STATISTICS_PAGE_SIZE) -> Dict[str, Any]:
+    """Lê apenas as colunas agrupadas, página a página, acumulando as contagens"""
+    counters = {column: Counter() for column in columns}
+    total = 0
+    start = 0
+    select = ",".join(["id"] + columns)
+    while True:
+        response = supabase.table(table).select(select).order("id")\
+            .range(start, start + page_size - 1).execute()
+        page = response.data if response and response.data else []
+        total += len(page)
+        for row in page:
+            for column in columns:
+                counters[column][row.get(column)] += 1
+        if len(page) < page_size:
+            break
+        start += page_size
+
+    result: Dict[str, Any] = {"total": total}
+    for column, counter in counters.items():
+        result[column] = dict(counter)
+    return result
+
+
+def grouped_counts(supabase, table: str, defaults: Dict[str, str],
+                   ttl_seconds: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Retorna {"total": n, coluna: {valor: quantidade}} para as colunas de `defaults`.
+
+    `defaults` mapeia cada coluna ao rótulo usado para valores nulos.
+    """
+    columns = list(defaults)
+    cache = get_data_cache()
+    key = make_cache_key(table, None, True, None, None, "grouped_counts", tuple(columns))
+    found, value = cache.get(key)
+    if found:
+        return value
+
+    raw = _counts_from_rpc(supabase, table, columns)
+    if raw is None:
+        raw = _counts_by_paging(supabase, table, columns)
+
+    result: Dict[str, Any] = {"total": int(raw.get("total") or 0)}
+    for column, default in defaults.items():
+        result[column] = _normalize_counts(raw.get(column), default)
+
+    if ttl_seconds is None:
+        ttl_seconds = get_config("cache").get("statistics_ttl_seconds", 30)
+    cache.set(key, result, ttl_seconds=ttl_seconds)
+    return result
@@ -29,8 +29,23 @@ def check_trial_status(email: str) -> Dict[str, Any]:
             # Usuário não existe, vamos criar com trial
             return create_new_trial_user(email)
         
-        profile = response.data[0]
-        
+        return trial_status_from_profile(response.data[0])
+    
+    except Exception as e:
+        st.error(f"Erro ao verificar status de trial: {str(e)}")
+        return {
+            "has_trial": False,
+            "is_trial_expired": True,
+            "trial_expires_at": None,
+            "error": str(e)
+        }
+
+def trial_status_from_profile(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Calcula o status de trial a partir de uma linha já carregada de profiles
+    (mesmo retorno de check_trial_status, sem acessar o banco)
+    """
+    try:
         # Verifica se o usuário é admin ou tem plano ilimitado
         role = profile.get("role", "viewer")
         plan = profile.get("plan", "trial")
@@ -189,7 +204,9 @@ def show_trial_notification():
     if not user_email:
         return
     
-    trial_info = check_trial_status(user_email)
+    # Usa o status já resolvido pelo require_login (sem nova consulta a profiles)
+    from auth.auth_utils import get_trial_info
+    trial_info = get_trial_info()
     
     if trial_info.get("error"):
         st.error("Erro ao verificar status do trial")
@@ -268,7 +285,7 @@ def show_trial_expired_page():
         except:
             # Se não tiver a função de logout, limpa a sessão
             for key in list(st.session_state.keys()):
-                if key.startswith('user_') or key in ['authenticated_user_email', 'role', 'user_id', 'user_info']:
+                if key.startswith('user_') or key in ['authenticated_user_email', 'role', 'user_id', 'user_info', 'auth_principal']:
                     del st.session_state[key]
             st.rerun()
 
@@ -295,6 +312,10 @@ def update_user_plan(email: str, plan: str) -> bool:
             "updated_at": now.isoformat()
         }).eq("email", email).execute()
         
+        if update_response.data:
+            # Força a revalidação do usuário (inclusive em outras sessões) na próxima página
+            from auth.auth_utils import invalidate_principal
+            invalidate_principal(email)
         return bool(update_response.data)
     
     except Exception as e:
@@ -326,6 +347,10 @@ def extend_trial(email: str, additional_days: int = 14) -> bool:
             "updated_at": now.isoformat()
         }).eq("email", email).execute()
         
+        if update_response.data:
+            # Força a revalidação do usuário (inclusive em outras sessões) na próxima página
+            from auth.auth_utils import invalidate_principal
+            invalidate_principal(email)
         return bool(update_response.data)
     
     except Exception as e:
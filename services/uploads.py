@@ -122,122 +122,11 @@ def delete_attachment(attachment_id: str) -> bool:
         return False
 
 def import_hours_csv(df: pd.DataFrame, site_mapping: Dict[str, str]) -> bool:
-    """Importa dados de horas trabalhadas de CSV"""
-    try:
-        from auth.auth_utils import get_user_id
-        from managers.supabase_config import get_service_role_client
-        supabase = get_service_role_client()
-        if not supabase:
-            st.error("Erro ao conectar com o banco de dados")
-            return False
-        
-        # Valida colunas necessárias (site_id removido da tabela)
-        required_cols = ['year', 'month', 'hours']
-        missing_cols = [col for col in required_cols if col not in df.columns]
-        if missing_cols:
-            st.error(f"Colunas obrigatórias ausentes: {missing_cols}")
-            return False
-        
-        user_id = get_user_id()
-        if not user_id:
-            st.error("Usuário não autenticado")
-            return False
-        
-        # Prepara dados para inserção (alinhado com estrutura real)
-        hours_rows = []
-        for _, row in df.iterrows():
-            hours_rows.append({
-                "year": int(row['year']),
-                "month": int(row['month']),
-                "hours": float(row['hours']),
-                "created_by": user_id
-            })
-            # site_id removido - não existe na tabela hours_worked_monthly
-        
-        if not hours_rows:
-            st.error("Nenhum dado válido para importar")
-            return False
-        
-        # Insere no banco (não há unique constraint para upsert)
-        result = supabase.table("hours_worked_monthly").insert(hours_rows).execute()
-        
-        if result.data:
-            st.success(f"✅ {len(hours_rows)} registros de horas importados com sucesso!")
-            return True
-        else:
-            st.error("Erro ao importar dados")
-            return False
-            
-    except Exception as e:
-        st.error(f"Erro na importação: {str(e)}")
-        return False
+    """Importa dados de horas trabalhadas de CSV (upsert em lotes por ano/mês/usuário)"""
+    from services.bulk_import import import_file
+    return import_file("hours", frame=df)
 
 def import_accidents_csv(df: pd.DataFrame, site_mapping: Dict[str, str]) -> bool:
-    """Importa dados de acidentes de CSV"""
-    try:
-        from auth.auth_utils import get_user_id
-        from managers.supabase_config import get_service_role_client
-        # Usa service_role para contornar RLS ao importar acidentes
-        supabase = get_service_role_client()
-        
-        # Valida colunas necessárias (alinhado com estrutura real)
-        required_cols = ['occurred_at', 'type', 'description']
-        missing_cols = [col for col in required_cols if col not in df.columns]
-        if missing_cols:
-            st.error(f"Colunas obrigatórias ausentes: {missing_cols}")
-            return False
-        
-        user_id = get_user_id()
-        if not user_id:
-            st.error("Usuário não autenticado")
-            return False
-        
-        # Prepara dados para inserção (alinhado com estrutura real da tabela accidents)
-        accident_rows = []
-        for _, row in df.iterrows():
-            # Mapeia 'severity' do CSV para 'type' enum (fatal, lesao, sem_lesao)
-            severity = str(row.get('severity', 'lesao')).lower()
-            type_map = {
-                'fatal': 'fatal',
-                'lesao': 'lesao',
-                'sem_lesao': 'sem_lesao',
-                'com lesão': 'lesao',
-                'sem lesão': 'sem_lesao'
-            }
-            accident_type = type_map.get(severity, 'lesao')
-            
-            accident_row = {
-                "occurred_at": row['occurred_at'] if 'occurred_at' in row else row.get('date', ''),
-                "type": accident_type,  # severity -> type (enum)
-                "classification": row.get('classification', 'leve'),
-                "body_part": row.get('body_part'),
-                "description": row['description'],
-                "lost_days": int(row.get('lost_days', 0)),
-                "root_cause": row.get('root_cause', ''),
-                "status": row.get('status', 'fechado'),  # default 'fechado'
-                "created_by": user_id
-            }
-            
-            # Adiciona employee_id se presente no CSV
-            if 'employee_id' in row and row.get('employee_id'):
-                accident_row["employee_id"] = row['employee_id']
-            
-            accident_rows.append(accident_row)
-        
-        if not accident_rows:
-            st.error("Nenhum dado válido para importar")
-            return False
-        
-        # Insere no banco
-        result = supabase.table("accidents").insert(accident_rows).execute()
-        
-        if result.data:
-            st.success(f"✅ {len(accident_rows)} acidentes importados com sucesso!")
-            return True
-        else:
-            st.error("Erro ao importar dados")
-            return False
-            
-    except Exception as e:
-        st.error(f"Erro na importação: {str(e)}")
-        return False
+    """Importa dados de acidentes de CSV (upsert em lotes pela chave import_key)"""
+    from services.bulk_import import import_file
+    return import_file("accidents", frame=df)
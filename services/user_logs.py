@@ -4,8 +4,9 @@ Serviços para registro de logs de ações dos usuários
 import streamlit as st
 from managers.supabase_config import get_supabase_client, get_service_role_client
 from auth.auth_utils import get_user_id, is_admin
-from typing import Dict, List, Optional
-from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+from datetime import datetime, timedelta, timezone
+import csv
 import json
 
 def log_action(
@@ -28,11 +29,12 @@ def log_action(
         expires_days: Dias até o log expirar (padrão: 90 dias)
     
     Returns:
-        True se o log foi registrado com sucesso, False caso contrário
+        True se o log foi aceito para gravação, False caso contrário
+    
+    A gravação é feita em lote por uma thread de fundo (services.audit_writer),
+    então esta função não espera pelo banco.
     """
     try:
-        # Usa service_role para contornar RLS ao inserir logs
-        supabase = get_service_role_client()
         user_id = get_user_id()
         
         if not user_id:
@@ -53,6 +55,9 @@ def log_action(
         expires_at = (datetime.now() + timedelta(days=expires_days)).isoformat()
         
         log_data = {
+            # Momento da ação: a gravação em lote (ou o reenvio do spill) pode
+            # acontecer bem depois, e o now() do insert quebraria a ordem dos logs
+            "created_at": datetime.now(timezone.utc).isoformat(),
             "user_id": user_id,
             "action_type": action_type,
             "entity_type": entity_type,
@@ -73,9 +78,8 @@ def log_action(
         if user_agent:
             log_data["user_agent"] = user_agent
         
-        result = supabase.table("user_logs").insert(log_data).execute()
-        
-        return bool(result.data)
+        from services.audit_writer import get_audit_writer
+        return get_audit_writer().enqueue(log_data)
     except Exception as e:
         # Não interrompe o fluxo se houver erro no log
         # Apenas registra silenciosamente para não afetar a experiência do usuário
@@ -86,12 +90,193 @@ def log_action(
             pass
         return False
 
+# Linhas por página na leitura paginada dos logs (keyset em created_at, id)
+LOG_PAGE_SIZE = 500
+
+# Colunas exportadas, na ordem em que aparecem no CSV
+LOG_EXPORT_COLUMNS = [
+    "id", "created_at", "user_id", "action_type", "entity_type", "entity_id",
+    "description", "ip_address", "user_agent", "metadata", "created_by", "expires_at"
+]
+
+# (created_at, id) do último log de uma página; a próxima página começa depois dele
+LogCursor = Tuple[str, str]
+
+def _apply_log_filters(
+    query,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    action_type: Optional[str] = None,
+    entity_type: Optional[str] = None,
+    user_id: Optional[str] = None
+):
+    """Aplica os filtros comuns das consultas de logs"""
+    if start_date:
+        query = query.gte("created_at", start_date.isoformat())
+    
+    if end_date:
+        query = query.lte("created_at", end_date.isoformat())
+    
+    if action_type:
+        query = query.eq("action_type", action_type)
+    
+    if entity_type:
+        query = query.eq("entity_type", entity_type)
+    
+    if user_id:
+        query = query.eq("user_id", user_id)
+    
+    return query
+
+def _apply_log_cursor(query, cursor: Optional[LogCursor]):
+    """Restringe a consulta aos logs depois do cursor na ordem (created_at desc, id desc)"""
+    if not cursor:
+        return query
+    created_at, log_id = cursor
+    # Valores entre aspas porque o timestamp contém ':' e '+'
+    return query.or_(
+        f'created_at.lt."{created_at}",'
+        f'and(created_at.eq."{created_at}",id.lt.{log_id})'
+    )
+
+def _decode_metadata(logs: List[Dict]) -> List[Dict]:
+    """Processa metadata JSON se existir"""
+    for log in logs:
+        if log.get('metadata') and isinstance(log['metadata'], str):
+            try:
+                log['metadata'] = json.loads(log['metadata'])
+            except:
+                pass
+    return logs
+
+def next_log_cursor(page: List[Dict]) -> Optional[LogCursor]:
+    """Cursor para buscar a página seguinte a `page` (None se a página estiver vazia)"""
+    if not page:
+        return None
+    last = page[-1]
+    if not last.get("created_at") or not last.get("id"):
+        return None
+    return (last["created_at"], last["id"])
+
+def _fetch_log_page(supabase, filters: Dict, cursor: Optional[LogCursor], page_size: int) -> List[Dict]:
+    """Uma página de logs, ordenada do mais recente para o mais antigo"""
+    query = supabase.table("user_logs").select("*")
+    query = _apply_log_filters(query, **filters)
+    # Logs sem created_at não têm posição no cursor
+    query = query.not_.is_("created_at", "null")
+    query = _apply_log_cursor(query, cursor)
+    
+    response = query\
+        .order("created_at", desc=True)\
+        .order("id", desc=True)\
+        .limit(page_size)\
+        .execute()
+    
+    return _decode_metadata(response.data if response.data else [])
+
+def _iter_log_pages(
+    supabase,
+    filters: Dict,
+    page_size: int = LOG_PAGE_SIZE,
+    cursor: Optional[LogCursor] = None,
+    max_rows: Optional[int] = None
+) -> Iterator[List[Dict]]:
+    """Percorre os logs página a página; cada página é buscada só quando pedida"""
+    fetched = 0
+    while True:
+        size = page_size if max_rows is None else min(page_size, max_rows - fetched)
+        if size <= 0:
+            return
+        page = _fetch_log_page(supabase, filters, cursor, size)
+        if not page:
+            return
+        yield page
+        fetched += len(page)
+        cursor = next_log_cursor(page)
+        if len(page) < size or cursor is None:
+            return
+
+def iter_user_log_pages(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    action_type: Optional[str] = None,
+    entity_type: Optional[str] = None,
+    page_size: int = LOG_PAGE_SIZE,
+    cursor: Optional[LogCursor] = None,
+    max_rows: Optional[int] = None
+) -> Iterator[List[Dict]]:
+    """
+    Percorre os logs do usuário logado em páginas (keyset em created_at, id)
+    
+    Args:
+        start_date: Data inicial (opcional)
+        end_date: Data final (opcional)
+        action_type: Filtrar por tipo de ação (opcional)
+        entity_type: Filtrar por tipo de entidade (opcional)
+        page_size: Logs por página (padrão: 500)
+        cursor: Começa depois deste cursor (opcional, ver next_log_cursor)
+        max_rows: Para depois de tantos logs (opcional, padrão: todos)
+    
+    Yields:
+        Listas de logs, do mais recente para o mais antigo
+    
+    Erros do banco são propagados para que uma exportação não termine incompleta
+    sem aviso.
+    """
+    supabase = get_service_role_client()
+    user_id = get_user_id()
+    if not supabase or not user_id:
+        return
+    
+    # Filtro explícito por user_id para garantir segurança
+    filters = {
+        "start_date": start_date,
+        "end_date": end_date,
+        "action_type": action_type,
+        "entity_type": entity_type,
+        "user_id": user_id
+    }
+    yield from _iter_log_pages(supabase, filters, page_size, cursor, max_rows)
+
+def iter_all_log_pages(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    action_type: Optional[str] = None,
+    entity_type: Optional[str] = None,
+    user_id: Optional[str] = None,
+    page_size: int = LOG_PAGE_SIZE,
+    cursor: Optional[LogCursor] = None,
+    max_rows: Optional[int] = None
+) -> Iterator[List[Dict]]:
+    """
+    Percorre todos os logs em páginas (apenas para admins)
+    
+    Mesmos argumentos de iter_user_log_pages, mais o filtro por usuário.
+    """
+    if not is_admin():
+        return
+    
+    # Admin usa service_role para ver todos os logs
+    supabase = get_service_role_client()
+    if not supabase:
+        return
+    
+    filters = {
+        "start_date": start_date,
+        "end_date": end_date,
+        "action_type": action_type,
+        "entity_type": entity_type,
+        "user_id": user_id
+    }
+    yield from _iter_log_pages(supabase, filters, page_size, cursor, max_rows)
+
 def get_user_logs(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     action_type: Optional[str] = None,
     entity_type: Optional[str] = None,
-    limit: int = 100
+    limit: int = 100,
+    cursor: Optional[LogCursor] = None
 ) -> List[Dict]:
     """
     Busca logs do usuário logado
@@ -102,51 +287,20 @@ def get_user_logs(
         action_type: Filtrar por tipo de ação (opcional)
         entity_type: Filtrar por tipo de entidade (opcional)
         limit: Limite de registros (padrão: 100)
+        cursor: Busca os logs depois deste cursor (opcional, ver next_log_cursor)
     
     Returns:
         Lista de logs
     """
     try:
-        supabase = get_service_role_client()
-        if not supabase:
-            return []
-        
-        user_id = get_user_id()
-        
-        if not user_id:
-            return []
-        
-        query = supabase.table("user_logs").select("*").eq("user_id", user_id)
-        
-        # Filtro explícito por user_id para garantir segurança
-        
-        if start_date:
-            query = query.gte("created_at", start_date.isoformat())
-        
-        if end_date:
-            query = query.lte("created_at", end_date.isoformat())
-        
-        if action_type:
-            query = query.eq("action_type", action_type)
-        
-        if entity_type:
-            query = query.eq("entity_type", entity_type)
-        
-        response = query\
-            .order("created_at", desc=True)\
-            .limit(limit)\
-            .execute()
-        
-        if response.data:
-            # Processa metadata JSON se existir
-            for log in response.data:
-                if log.get('metadata') and isinstance(log['metadata'], str):
-                    try:
-                        log['metadata'] = json.loads(log['metadata'])
-                    except:
-                        pass
-        
-        return response.data if response.data else []
+        return [
+            log
+            for page in iter_user_log_pages(
+                start_date, end_date, action_type, entity_type,
+                page_size=limit, cursor=cursor, max_rows=limit
+            )
+            for log in page
+        ]
     except Exception as e:
         st.error(f"Erro ao buscar logs: {str(e)}")
         return []
@@ -157,7 +311,8 @@ def get_all_logs(
     action_type: Optional[str] = None,
     entity_type: Optional[str] = None,
     user_id: Optional[str] = None,
-    limit: int = 500
+    limit: int = 500,
+    cursor: Optional[LogCursor] = None
 ) -> List[Dict]:
     """
     Busca todos os logs (apenas para admins)
@@ -169,52 +324,58 @@ def get_all_logs(
         entity_type: Filtrar por tipo de entidade (opcional)
         user_id: Filtrar por usuário (opcional)
         limit: Limite de registros (padrão: 500)
+        cursor: Busca os logs depois deste cursor (opcional, ver next_log_cursor)
     
     Returns:
         Lista de logs
     """
     try:
-        if not is_admin():
-            return []
-        
-        # Admin usa service_role para ver todos os logs
-        supabase = get_service_role_client()
-        query = supabase.table("user_logs").select("*")
-        
-        if start_date:
-            query = query.gte("created_at", start_date.isoformat())
-        
-        if end_date:
-            query = query.lte("created_at", end_date.isoformat())
-        
-        if action_type:
-            query = query.eq("action_type", action_type)
-        
-        if entity_type:
-            query = query.eq("entity_type", entity_type)
-        
-        if user_id:
-            query = query.eq("user_id", user_id)
-        
-        response = query\
-            .order("created_at", desc=True)\
-            .limit(limit)\
-            .execute()
-        
-        if response.data:
-            # Processa metadata JSON se existir
-            for log in response.data:
-                if log.get('metadata') and isinstance(log['metadata'], str):
-                    try:
-                        log['metadata'] = json.loads(log['metadata'])
-                    except:
-                        pass
-        
-        return response.data if response.data else []
+        return [
+            log
+            for page in iter_all_log_pages(
+                start_date, end_date, action_type, entity_type, user_id,
+                page_size=limit, cursor=cursor, max_rows=limit
+            )
+            for log in page
+        ]
     except Exception as e:
         st.error(f"Erro ao buscar logs: {str(e)}")
         return []
 
+def write_logs_export(fp: TextIO, pages: Iterable[List[Dict]], fmt: str = "csv") -> int:
+    """
+    Grava os logs em `fp` conforme as páginas chegam (memória constante)
+    
+    Args:
+        fp: Arquivo de texto aberto para escrita
+        pages: Páginas de logs (por exemplo, iter_all_log_pages(...))
+        fmt: "csv" ou "ndjson" (um objeto JSON por linha)
+    
+    Returns:
+        Número de logs gravados
+    """
+    if fmt not in ("csv", "ndjson"):
+        raise ValueError(f"Formato de exportação não suportado: {fmt}")
+    
+    writer = None
+    if fmt == "csv":
+        writer = csv.DictWriter(fp, fieldnames=LOG_EXPORT_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+    
+    total = 0
+    for page in pages:
+        for log in page:
+            if writer:
+                row = dict(log)
+                if isinstance(row.get("metadata"), (dict, list)):
+                    row["metadata"] = json.dumps(row["metadata"], ensure_ascii=False)
+                writer.writerow(row)
+            else:
+                fp.write(json.dumps(log, ensure_ascii=False, default=str))
+                fp.write("\n")
+        total += len(page)
+    return total
+
 def cleanup_expired_logs() -> int:
     """
     Limpa logs expirados (apenas para admins)
@@ -249,6 +410,8 @@ def get_log_statistics() -> Dict:
     """
     Retorna estatísticas dos logs (apenas para admins)
     
+    As contagens são agrupadas no banco e mantidas em cache por alguns segundos.
+    
     Returns:
         Dicionário com estatísticas
     """
@@ -256,33 +419,19 @@ def get_log_statistics() -> Dict:
         if not is_admin():
             return {}
         
-        supabase = get_service_role_client()
-        
-        # Total de logs
-        total = supabase.table("user_logs").select("id", count="exact").execute()
+        from services.statistics import grouped_counts
         
-        # Por tipo de ação
-        actions = supabase.table("user_logs").select("action_type").execute()
+        supabase = get_service_role_client()
         
-        # Por tipo de entidade
-        entities = supabase.table("user_logs").select("entity_type").execute()
+        # Total e contagens por tipo de ação/entidade agrupados no banco (com cache curto)
+        counts = grouped_counts(supabase, "user_logs", {"action_type": "other", "entity_type": "other"})
         
         stats = {
-            "total": total.count if hasattr(total, 'count') else 0,
-            "por_action_type": {},
-            "por_entity_type": {}
+            "total": counts["total"],
+            "por_action_type": counts["action_type"],
+            "por_entity_type": counts["entity_type"]
         }
         
-        if actions.data:
-            for action in actions.data:
-                action_val = action.get('action_type', 'other')
-                stats["por_action_type"][action_val] = stats["por_action_type"].get(action_val, 0) + 1
-        
-        if entities.data:
-            for entity in entities.data:
-                entity_val = entity.get('entity_type', 'other')
-                stats["por_entity_type"][entity_val] = stats["por_entity_type"].get(entity_val, 0) + 1
-        
         return stats
     except Exception as e:
         st.error(f"Erro ao buscar estatísticas: {str(e)}")
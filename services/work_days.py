@@ -0,0 +1,301 @@
+"""
+Dias trabalhados até o acidente (análise da página de Acidentes)
+
+Para cada acidente a estimativa segue a mesma ordem de prioridade de antes:
+1. Horas trabalhadas acumuladas até o mês do acidente (centenas de horas / 8h
+   por dia), limitadas aos dias corridos desde a admissão quando conhecida;
+2. Dias corridos desde a admissão (employees.admission_date ou, na falta dela,
+   profiles.created_at);
+3. Dias desde o primeiro acidente registrado pelo mesmo criador;
+4. Zero.
+
+Só são buscados os funcionários, perfis, horas e acidentes ligados aos acidentes
+exibidos, e o cálculo é feito com merges e somas acumuladas por criador.
+"""
+import threading
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from managers.supabase_config import get_service_role_client
+from services.kpi import HOURS_SCALE, _fetch_all_rows
+from utils.simple_logger import get_logger
+
+# Horas de um dia de trabalho
+WORK_HOURS_PER_DAY = 8.0
+
+# Valores por filtro in_ (mantém a URL de cada requisição curta)
+LOOKUP_BATCH_SIZE = 200
+
+# RPC com a data do primeiro acidente de cada criador (docs/migrations/create_first_accident_dates_rpc.sql)
+FIRST_ACCIDENT_RPC = "first_accident_dates"
+
+# Marcado quando a RPC não existe no banco, para não repetir a chamada que falha
+_first_accident_rpc_unavailable = False
+_first_accident_rpc_lock = threading.Lock()
+
+
+def _fetch_in(supabase, table: str, columns: str, column: str, values: Iterable[Any]) -> pd.DataFrame:
+    """Linhas de `table` cujo `column` está em `values`, em lotes e paginadas"""
+    values = sorted({str(v) for v in values if isinstance(v, str) and v})
+    rows: List[Dict[str, Any]] = []
+    for start in range(0, len(values), LOOKUP_BATCH_SIZE):
+        batch = values[start:start + LOOKUP_BATCH_SIZE]
+
+        def build_query(batch=batch):
+            return supabase.table(table).select(columns).in_(column, batch)
+
+        rows.extend(_fetch_all_rows(build_query))
+    return pd.DataFrame(rows, columns=[c.strip() for c in columns.split(",")])
+
+
+def _fetch_first_accidents(supabase, creators: Iterable[str]) -> pd.DataFrame:
+    """
+    Primeiro acidente (menor occurred_at) de cada criador, uma linha por criador.
+
+    Usa a RPC (uma requisição por lote de criadores); sem ela, lê só a primeira linha
+    de cada criador com order + limit(1), em vez de paginar todos os acidentes.
+    """
+    global _first_accident_rpc_unavailable
+    creators = sorted({str(v) for v in creators if isinstance(v, str) and v})
+    columns = ["occurred_at", "created_by"]
+    rows: List[Dict[str, Any]] = []
+    for start in range(0, len(creators), LOOKUP_BATCH_SIZE):
+        batch = creators[start:start + LOOKUP_BATCH_SIZE]
+        if not _first_accident_rpc_unavailable:
+            try:
+                response = supabase.rpc(FIRST_ACCIDENT_RPC, {"p_creators": batch}).execute()
+                rows.extend(response.data or [])
+                continue
+            except Exception as e:
+                message = str(e)
+                if getattr(e, "code", None) != "PGRST202" and "PGRST202" not in message \
+                        and "Could not find the function" not in message:
+                    raise
+                with _first_accident_rpc_lock:
+                    _first_accident_rpc_unavailable = True
+                get_logger().warning(f"RPC {FIRST_ACCIDENT_RPC} indisponível, lendo um acidente por criador: {e}")
+        for creator in batch:
+            response = supabase.table("accidents").select(", ".join(columns)).eq("created_by", creator) \
+                .not_.is_("occurred_at", "null").order("occurred_at").limit(1).execute()
+            rows.extend(response.data or [])
+    return pd.DataFrame(rows, columns=columns)
+
+
+def _is_uuid_like(value: Any) -> bool:
+    """Identificadores com '@' são e-mails e não podem ser comparados a colunas uuid"""
+    return isinstance(value, str) and bool(value) and '@' not in value
+
+
+def _to_day(values: pd.Series) -> pd.Series:
+    """Data (sem hora) de valores ISO 8601, no fuso em que foram gravados"""
+    return pd.to_datetime(values.astype("string").str[:10], errors="coerce", format="%Y-%m-%d")
+
+
+def _blank_to_na(values: pd.Series) -> pd.Series:
+    """Strings vazias contam como ausentes (o cálculo anterior testava a verdade dos valores)"""
+    values = values.astype(object)
+    return values.where(values.notna() & (values != ''), None)
+
+
+def load_work_days_sources(supabase, accidents: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """
+    Busca apenas os dados usados pelos acidentes informados.
+
+    Cada fonte que falhar (permissão, tabela ausente) volta vazia, e a estimativa
+    passa para o critério seguinte.
+    """
+    created_by = _blank_to_na(accidents['created_by']) if 'created_by' in accidents.columns \
+        else pd.Series(None, index=accidents.index, dtype=object)
+    employee_ids = _blank_to_na(accidents['employee_id']).dropna().unique() \
+        if 'employee_id' in accidents.columns else []
+
+    sources: Dict[str, pd.DataFrame] = {}
+
+    try:
+        sources['employees'] = _fetch_in(supabase, "employees", "id, email, admission_date, user_id",
+                                         "id", employee_ids)
+    except Exception:
+        sources['employees'] = pd.DataFrame(columns=["id", "email", "admission_date", "user_id"])
+
+    employees = sources['employees']
+    identifiers = set(created_by.dropna())
+    profile_ids = {v for v in identifiers if _is_uuid_like(v)} | set(employees['user_id'].dropna())
+    profile_emails = {v for v in identifiers if not _is_uuid_like(v)} | set(employees['email'].dropna())
+
+    profile_columns = "id, email, created_at"
+    try:
+        profiles = pd.concat([
+            _fetch_in(supabase, "profiles", profile_columns, "id", profile_ids),
+            _fetch_in(supabase, "profiles", profile_columns, "email", profile_emails),
+        ], ignore_index=True)
+        sources['profiles'] = profiles.drop_duplicates(subset=["id"], keep="last")
+    except Exception:
+        sources['profiles'] = pd.DataFrame(columns=["id", "email", "created_at"])
+
+    # Horas são agrupadas por created_by (UUID); a chave do acidente é o employee_id
+    # ou, sem ele, o e-mail resolvido (que nunca casa com um UUID)
+    try:
+        sources['hours'] = _fetch_in(supabase, "hours_worked_monthly", "year, month, hours, created_by",
+                                     "created_by", [v for v in employee_ids if _is_uuid_like(v)])
+    except Exception:
+        sources['hours'] = pd.DataFrame(columns=["year", "month", "hours", "created_by"])
+
+    try:
+        sources['first_accidents'] = _fetch_first_accidents(
+            supabase, [v for v in identifiers if _is_uuid_like(v)]
+        )
+    except Exception:
+        sources['first_accidents'] = pd.DataFrame(columns=["occurred_at", "created_by"])
+
+    return sources
+
+
+def _cumulative_monthly_hours(hours: pd.DataFrame) -> pd.DataFrame:
+    """Horas acumuladas por criador a cada mês com registro (created_by, month_start, cum_hours)"""
+    if hours.empty:
+        # Mesmo dtype de astype(str) (object ou str, conforme a versão do pandas) para o merge_asof
+        return pd.DataFrame({'created_by': pd.Series(dtype=str),
+                             'month_start': pd.Series(dtype='datetime64[ns]'),
+                             'cum_hours': pd.Series(dtype=float)})
+
+    years = pd.to_numeric(hours['year'], errors='coerce')
+    months = pd.to_numeric(hours['month'], errors='coerce')
+    valid = hours['created_by'].notna() & years.notna() & months.notna()
+    monthly = pd.DataFrame({
+        'created_by': hours['created_by'][valid].astype(str),
+        'month_start': pd.to_datetime(
+            (years[valid].astype(int) * 10000 + months[valid].astype(int) * 100 + 1).astype(str),
+            format="%Y%m%d", errors="coerce"),
+        'hours': pd.to_numeric(hours['hours'][valid], errors='coerce').fillna(0.0),
+    }).dropna(subset=['month_start'])
+
+    monthly = monthly.groupby(['created_by', 'month_start'], as_index=False)['hours'].sum()
+    monthly = monthly.sort_values(['created_by', 'month_start'])
+    monthly['cum_hours'] = monthly.groupby('created_by')['hours'].cumsum()
+    return monthly[['created_by', 'month_start', 'cum_hours']].astype({'month_start': 'datetime64[ns]'})
+
+
+def compute_work_days(accidents: pd.DataFrame, sources: Dict[str, pd.DataFrame]) -> pd.Series:
+    """
+    Dias trabalhados até cada acidente (ver a ordem de prioridade no módulo).
+
+    Args:
+        accidents: Colunas accident_date, created_by e, se houver, employee_id
+        sources: Resultado de load_work_days_sources
+
+    Returns:
+        Série alinhada ao índice de `accidents`, sem valores negativos
+    """
+    index = accidents.index
+    accident_day = pd.to_datetime(accidents['accident_date'], errors='coerce').astype('datetime64[ns]')
+    identifier = _blank_to_na(accidents['created_by']) if 'created_by' in accidents.columns \
+        else pd.Series(None, index=index, dtype=object)
+    employee_id = _blank_to_na(accidents['employee_id']) if 'employee_id' in accidents.columns \
+        else pd.Series(None, index=index, dtype=object)
+
+    # 1) Funcionário acidentado (employees)
+    employees = sources['employees'].drop_duplicates(subset=['id'], keep='last').set_index('id')
+    has_employee = employee_id.isin(employees.index)
+    admission = _to_day(employee_id.map(employees['admission_date']))
+    user_email = _blank_to_na(employee_id.map(employees['email']))
+    profile_id = _blank_to_na(employee_id.map(employees['user_id']))
+    admission = admission.where(has_employee)
+
+    # 2) Sem dados do funcionário, o criador do acidente identifica o perfil
+    from_identifier = user_email.isna() & profile_id.isna() & identifier.notna()
+    identifier_is_email = identifier.astype("string").str.contains('@', regex=False).fillna(False).astype(bool)
+    user_email = user_email.where(~(from_identifier & identifier_is_email), identifier)
+    profile_id = profile_id.where(~(from_identifier & ~identifier_is_email), identifier)
+
+    # 3) Perfil (created_at como proxy de admissão), por e-mail e depois por id
+    profiles = sources['profiles']
+    by_email = profiles.dropna(subset=['email']).drop_duplicates(subset=['email'], keep='last').set_index('email')
+    by_id = profiles.drop_duplicates(subset=['id'], keep='last').set_index('id')
+    needs_profile = admission.isna() & (user_email.notna() | profile_id.notna())
+    use_email = needs_profile & user_email.isin(by_email.index)
+    use_id = needs_profile & ~use_email & profile_id.isin(by_id.index)
+    admission = admission.where(~use_email, _to_day(user_email.map(by_email['created_at'])))
+    admission = admission.where(~use_id, _to_day(profile_id.map(by_id['created_at'])))
+    user_email = user_email.where(~use_id, _blank_to_na(profile_id.map(by_id['email'])))
+
+    # 4) Dias corridos desde a admissão
+    days_since_admission = (accident_day - admission).dt.days.clip(lower=0)
+
+    # 5) Horas acumuladas até o mês do acidente (inclusive)
+    hours_key = employee_id.where(employee_id.notna(), user_email)
+    left = pd.DataFrame({'row': np.arange(len(index)), 'created_by': hours_key.fillna('').astype(str).values,
+                         'accident_day': accident_day.values})
+    left = left[left['accident_day'].notna()].sort_values('accident_day')
+    cumulative = _cumulative_monthly_hours(sources['hours']).sort_values('month_start')
+    matched = pd.merge_asof(left, cumulative, left_on='accident_day', right_on='month_start',
+                            by='created_by', direction='backward')
+    total_hours = np.zeros(len(index))
+    total_hours[matched['row'].to_numpy()] = matched['cum_hours'].fillna(0.0).to_numpy()
+    total_hours = pd.Series(total_hours, index=index)
+
+    hours_days = total_hours * HOURS_SCALE / WORK_HOURS_PER_DAY
+    hours_days = hours_days.where(days_since_admission.isna(), pd.concat(
+        [hours_days, days_since_admission], axis=1).min(axis=1))
+
+    # 6) Dias desde o primeiro acidente do mesmo criador
+    first_accidents = sources['first_accidents']
+    first_accident_day = pd.Series(pd.NaT, index=index, dtype='datetime64[ns]')
+    if not first_accidents.empty:
+        first_day = _to_day(first_accidents['occurred_at']).groupby(first_accidents['created_by']).min()
+        # Sem nenhum criador encontrado o map devolve float64, que não converte para datetime
+        if not first_day.empty:
+            first_accident_day = pd.to_datetime(identifier.map(first_day.to_dict())).astype('datetime64[ns]')
+    days_since_first = (accident_day - first_accident_day).dt.days.clip(lower=0)
+
+    work_days = hours_days.where(total_hours > 0)
+    work_days = work_days.fillna(days_since_admission).fillna(days_since_first).fillna(0)
+    work_days = work_days.where(accident_day.notna(), 0).clip(lower=0)
+
+    if (work_days % 1 == 0).all():
+        return work_days.astype('int64')
+    return work_days
+
+
+def get_work_days_analysis(df: pd.DataFrame) -> Tuple[Dict[str, Any], pd.DataFrame]:
+    """
+    Analisa os dias trabalhados até acidentes e retorna estatísticas.
+    """
+    if df.empty or 'occurred_at' not in df.columns:
+        return {}, df
+
+    try:
+        # Cria uma cópia para não modificar o DataFrame original
+        df_work = df.copy()
+
+        # Converte data para datetime
+        df_work['occurred_at'] = pd.to_datetime(df_work['occurred_at'])
+        df_work['accident_date'] = df_work['occurred_at'].dt.date
+
+        supabase = get_service_role_client()
+        sources = load_work_days_sources(supabase, df_work)
+        df_work['work_days_until_accident'] = compute_work_days(df_work, sources)
+
+        # Filtra apenas valores válidos (maiores que 0)
+        work_days = df_work['work_days_until_accident']
+        valid_work_days = work_days[work_days > 0]
+
+        # Estatísticas
+        analysis = {
+            'total_accidents': len(df_work),
+            'avg_work_days': valid_work_days.mean() if len(valid_work_days) > 0 else 0,
+            'median_work_days': valid_work_days.median() if len(valid_work_days) > 0 else 0,
+            'min_work_days': valid_work_days.min() if len(valid_work_days) > 0 else 0,
+            'max_work_days': valid_work_days.max() if len(valid_work_days) > 0 else 0,
+            'accidents_first_week': int((work_days <= 7).sum()),
+            'accidents_first_month': int((work_days <= 30).sum()),
+            'accidents_first_year': int((work_days <= 365).sum())
+        }
+
+        return analysis, df_work
+
+    except Exception as e:
+        st.error(f"Erro na análise de dias trabalhados: {str(e)}")
+        return {}, df
@@ -3,8 +3,8 @@ Gerador de Relatório PDF no Padrão Vibra
 Usa HTML/CSS + WeasyPrint para alta fidelidade visual
 """
 import base64
-from jinja2 import Environment, Template
-from weasyprint import HTML, CSS
+import threading
+import time
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 import io
@@ -1097,129 +1097,136 @@ HTML_TEMPLATE = """
 """
 
 
-def convert_image_url_to_base64(image_url: str, image_cache: Optional[Dict[str, str]] = None) -> Optional[str]:
+# Download de imagens para o PDF: workers paralelos e orçamento de tempo por imagem (segundos)
+IMAGE_FETCH_WORKERS = 8
+IMAGE_FETCH_TIMEOUT = 30
+IMAGE_MAX_SIZE = 1920
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def _get_http_session():
+    """Retorna a sessão HTTP compartilhada (keep-alive) usada no download das imagens"""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=IMAGE_FETCH_WORKERS, pool_maxsize=IMAGE_FETCH_WORKERS)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({
+                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+                })
+                _http_session = session
+    return _http_session
+
+
+def _process_image_bytes(img_bytes: bytes) -> bytes:
+    """Valida com PIL, converte para RGB, reduz para IMAGE_MAX_SIZE e recodifica como JPEG"""
+    from io import BytesIO
+    from PIL import Image
+
+    try:
+        img = Image.open(BytesIO(img_bytes))
+        
+        # Converte para RGB se necessário (remove canal alpha)
+        if img.mode in ('RGBA', 'LA', 'P'):
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            if img.mode == 'P':
+                img = img.convert('RGBA')
+            background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+            img = background
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+        
+        # Redimensiona se muito grande (otimização para PDF)
+        if img.width > IMAGE_MAX_SIZE or img.height > IMAGE_MAX_SIZE:
+            img.thumbnail((IMAGE_MAX_SIZE, IMAGE_MAX_SIZE), Image.Resampling.LANCZOS)
+        
+        # Salva como JPEG com qualidade otimizada
+        output = BytesIO()
+        img.save(output, format='JPEG', quality=85, optimize=True)
+        return output.getvalue()
+    except Exception as e:
+        print(f"[CONVERT_IMAGE] Erro ao processar com PIL: {str(e)}; usando bytes originais")
+        return img_bytes
+
+
+def convert_image_url_to_base64(image_url: str, image_cache: Optional[Dict[str, str]] = None,
+                                timeout: float = IMAGE_FETCH_TIMEOUT) -> Optional[str]:
     """
     Converte URL de imagem para base64 (para embutir no PDF)
     Suporta URLs do Supabase Storage e outras URLs públicas
     Usa PIL para validar e processar imagens corretamente
     Tenta URL decodificada e original para resolver problemas de encoding
+    
+    O tempo total (todas as tentativas, incluindo o download) é limitado a `timeout` segundos.
     """
     try:
         import requests
-        from io import BytesIO
-        from PIL import Image
         from urllib.parse import unquote
         
-        # Se já for base64, retorna direto
-        if image_url.startswith('data:image'):
-            return image_url
-        
         if not image_url or not isinstance(image_url, str):
             print(f"[CONVERT_IMAGE] URL inválida: {image_url}")
             return None
         
+        # Se já for base64, retorna direto
+        if image_url.startswith('data:image'):
+            return image_url
+        
         # Remove espaços em branco no início/fim
         image_url = image_url.strip()
         
         # Verifica se a imagem está no cache primeiro
         if image_cache and image_url in image_cache:
-            cached_image = image_cache[image_url]
-            print(f"[CONVERT_IMAGE] ✓ Imagem encontrada no cache")
-            return cached_image
-        
-        print(f"[CONVERT_IMAGE] URL original: {image_url}")
+            return image_cache[image_url]
         
-        # Para URLs do Supabase que já vêm com %20, vamos tentar DECODIFICAR
+        # Para URLs do Supabase que já vêm com %20, tenta primeiro a URL DECODIFICADA
         # pois o servidor pode esperar os caracteres reais
-        try:
-            # Decodifica a URL (transforma %20 em espaço, etc.)
-            decoded_url = unquote(image_url)
-            print(f"[CONVERT_IMAGE] URL decodificada: {decoded_url}")
-            
-            # Se a URL decodificada for diferente, tenta primeiro a decodificada
-            urls_to_try = [decoded_url, image_url] if decoded_url != image_url else [image_url]
-        except Exception as e:
-            print(f"[CONVERT_IMAGE] Erro ao decodificar URL: {str(e)}")
-            urls_to_try = [image_url]
-        
-        # Tenta fazer download da imagem (tenta URLs decodificada e original)
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
+        decoded_url = unquote(image_url)
+        urls_to_try = [decoded_url, image_url] if decoded_url != image_url else [image_url]
         
+        session = _get_http_session()
+        deadline = time.monotonic() + timeout
         last_error = None
         for attempt, url_to_use in enumerate(urls_to_try, 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                last_error = "Orçamento de tempo esgotado"
+                break
             try:
-                print(f"[CONVERT_IMAGE] Tentativa {attempt}/{len(urls_to_try)}: Baixando de {url_to_use[:120]}...")
-                response = requests.get(url_to_use, timeout=30, headers=headers, stream=True, verify=True)
-            
-                if response.status_code == 200:
-                    img_bytes = response.content
-                    
-                    # Verifica se realmente é uma imagem
-                    if len(img_bytes) == 0:
-                        print(f"[CONVERT_IMAGE] Imagem vazia na tentativa {attempt}")
+                with session.get(url_to_use, timeout=remaining, stream=True) as response:
+                    if response.status_code != 200:
+                        last_error = f"Erro HTTP {response.status_code} na tentativa {attempt}"
+                        print(f"[CONVERT_IMAGE] {last_error}: {url_to_use[:120]}")
                         continue
                     
-                    print(f"[CONVERT_IMAGE] ✓ Imagem baixada na tentativa {attempt}: {len(img_bytes)} bytes")
-                    
-                    # Tenta abrir com PIL para validar e converter se necessário
-                    try:
-                        img = Image.open(BytesIO(img_bytes))
-                        print(f"[CONVERT_IMAGE] Imagem carregada: {img.format} {img.size} {img.mode}")
-                        
-                        # Converte para RGB se necessário (remove canal alpha)
-                        if img.mode in ('RGBA', 'LA', 'P'):
-                            background = Image.new('RGB', img.size, (255, 255, 255))
-                            if img.mode == 'P':
-                                img = img.convert('RGBA')
-                            background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                            img = background
-                            print(f"[CONVERT_IMAGE] Convertido para RGB")
-                        elif img.mode != 'RGB':
-                            img = img.convert('RGB')
-                            print(f"[CONVERT_IMAGE] Convertido de {img.mode} para RGB")
-                        
-                        # Redimensiona se muito grande (otimização para PDF)
-                        max_size = 1920
-                        if img.width > max_size or img.height > max_size:
-                            original_size = img.size
-                            img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-                            print(f"[CONVERT_IMAGE] Imagem redimensionada de {original_size} para {img.size}")
-                        
-                        # Salva como JPEG com qualidade otimizada
-                        output = BytesIO()
-                        img.save(output, format='JPEG', quality=85, optimize=True)
-                        img_bytes = output.getvalue()
-                        print(f"[CONVERT_IMAGE] Imagem processada: {len(img_bytes)} bytes")
-                        
-                    except Exception as e:
-                        print(f"[CONVERT_IMAGE] Erro ao processar com PIL: {str(e)}")
-                        print(f"[CONVERT_IMAGE] Continuando com bytes originais")
-                    
-                    img_b64 = base64.b64encode(img_bytes).decode('utf-8')
-                    result = f"data:image/jpeg;base64,{img_b64}"
-                    print(f"[CONVERT_IMAGE] ✓ Conversão bem-sucedida: {len(result)} caracteres")
-                    return result
-                    
-                else:
-                    error_msg = f"Erro HTTP {response.status_code} na tentativa {attempt}"
-                    print(f"[CONVERT_IMAGE] {error_msg}")
-                    try:
-                        error_body = response.text
-                        print(f"[CONVERT_IMAGE] Response body: {error_body}")
-                    except:
-                        pass
-                    last_error = error_msg
+                    # Lê em blocos para respeitar o orçamento também durante o download
+                    chunks = []
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        chunks.append(chunk)
+                        if time.monotonic() > deadline:
+                            raise requests.exceptions.Timeout("orçamento de tempo esgotado durante o download")
+                    img_bytes = b''.join(chunks)
+                
+                # Verifica se realmente é uma imagem
+                if len(img_bytes) == 0:
+                    print(f"[CONVERT_IMAGE] Imagem vazia na tentativa {attempt}")
+                    continue
+                
+                img_b64 = base64.b64encode(_process_image_bytes(img_bytes)).decode('utf-8')
+                return f"data:image/jpeg;base64,{img_b64}"
                     
             except requests.exceptions.Timeout:
-                error_msg = f"Timeout na tentativa {attempt}"
-                print(f"[CONVERT_IMAGE] {error_msg}")
-                last_error = error_msg
+                last_error = f"Timeout na tentativa {attempt}"
+                print(f"[CONVERT_IMAGE] {last_error}: {url_to_use[:120]}")
             except requests.exceptions.RequestException as e:
-                error_msg = f"Erro de requisição na tentativa {attempt}: {str(e)}"
-                print(f"[CONVERT_IMAGE] {error_msg}")
-                last_error = error_msg
+                last_error = f"Erro de requisição na tentativa {attempt}: {str(e)}"
+                print(f"[CONVERT_IMAGE] {last_error}")
         
         print(f"[CONVERT_IMAGE] ✗ Todas as tentativas falharam. Último erro: {last_error}")
         return None
@@ -1231,239 +1238,58 @@ def convert_image_url_to_base64(image_url: str, image_cache: Optional[Dict[str,
         return None
 
 
-def render_fault_tree_html_for_pdf(tree_json: Dict[str, Any]) -> str:
+def convert_images_to_base64(image_urls: List[str], image_cache: Optional[Dict[str, str]] = None,
+                             max_workers: int = IMAGE_FETCH_WORKERS,
+                             timeout: float = IMAGE_FETCH_TIMEOUT) -> Dict[str, Optional[str]]:
     """
-    Renderiza a árvore de falhas em HTML/CSS usando tabelas para compatibilidade com WeasyPrint.
-    Otimizado para caber em A4 paisagem.
-    """
-    if not tree_json:
-        return ""
+    Converte várias imagens para base64 em paralelo.
     
-    import html
-    from datetime import date
+    URLs repetidas são baixadas uma única vez; imagens já em base64 ou no cache
+    não geram requisição. Cada imagem tem seu próprio orçamento de `timeout`
+    segundos, então o tempo total fica limitado pela imagem mais lenta.
     
-    # Contadores para numeração automática
-    hypothesis_counter = 0
-    basic_cause_counter = 0
-    contributing_cause_counter = 0
-    
-    def get_node_number(node_type: str, status: str, has_children: bool, is_basic_cause: bool = False, is_contributing_cause: bool = False) -> str:
-        """Retorna o número do nó (H1, H2, CB1, CB2, CC1, CC2, etc.)"""
-        nonlocal hypothesis_counter, basic_cause_counter, contributing_cause_counter
-        
-        if node_type == 'root':
-            return ""
-        
-        if is_basic_cause:
-            basic_cause_counter += 1
-            return f"CB{basic_cause_counter}"
-        elif is_contributing_cause:
-            contributing_cause_counter += 1
-            return f"CC{contributing_cause_counter}"
-        elif node_type == 'hypothesis':
-            hypothesis_counter += 1
-            return f"H{hypothesis_counter}"
-        elif node_type == 'fact' and has_children:
-            hypothesis_counter += 1
-            return f"H{hypothesis_counter}"
-        elif status == 'validated' and has_children and node_type != 'root':
-            hypothesis_counter += 1
-            return f"H{hypothesis_counter}"
-        elif status in ['pending', 'discarded'] and node_type != 'root':
-            hypothesis_counter += 1
-            return f"H{hypothesis_counter}"
-        return ""
-    
-    def get_node_shape(node_type: str, status: str, has_children: bool, is_basic_cause: bool = False, is_contributing_cause: bool = False) -> Dict[str, str]:
-        """Retorna a forma e cor do nó baseado no tipo e status"""
-        if is_basic_cause:
-            return {
-                'shape': 'oval',
-                'bg_color': '#c8e6c9',
-                'border_color': '#4caf50',
-                'text_color': '#000000'
-            }
-        elif is_contributing_cause:
-            return {
-                'shape': 'oval',
-                'bg_color': '#bbdefb',
-                'border_color': '#2196f3',
-                'text_color': '#000000'
-            }
-        elif node_type == 'root':
-            return {
-                'shape': 'rounded-rect',
-                'bg_color': '#ffcdd2',
-                'border_color': '#f44336',
-                'text_color': '#000000'
-            }
-        elif status == 'validated' and has_children:
-            return {
-                'shape': 'rounded-rect',
-                'bg_color': '#fff9c4',
-                'border_color': '#f9a825',
-                'text_color': '#000000'
-            }
-        elif status == 'discarded':
-            return {
-                'shape': 'diamond',
-                'bg_color': '#ffcdd2',
-                'border_color': '#f44336',
-                'text_color': '#000000'
-            }
-        else:
-            return {
-                'shape': 'diamond',
-                'bg_color': '#e0e0e0',
-                'border_color': '#757575',
-                'text_color': '#000000'
-            }
+    Returns:
+        Dicionário URL (sem espaços nas pontas) -> data URI base64 ou None em caso de falha
+    """
+    from concurrent.futures import ThreadPoolExecutor
     
-    def render_node(node: Dict[str, Any], level: int = 0) -> str:
-        """Renderiza um nó usando tabelas para melhor compatibilidade"""
-        status = node.get('status', 'pending')
-        node_type = node.get('type', 'hypothesis')
-        label = node.get('label', '')
-        nbr_code = node.get('nbr_code')
-        is_basic_cause = node.get('is_basic_cause', False)
-        is_contributing_cause = node.get('is_contributing_cause', False)
-        children = node.get('children', [])
-        has_children = len(children) > 0
-        
-        node_number = get_node_number(node_type, status, has_children, is_basic_cause, is_contributing_cause)
-        shape_config = get_node_shape(node_type, status, has_children, is_basic_cause, is_contributing_cause)
-        
-        # Trunca label se muito longo (max 50 caracteres)
-        label_display = label[:50] + '...' if len(label) > 50 else label
-        label_escaped = html.escape(label_display).replace('\n', '<br>')
-        
-        # Renderiza conteúdo do nó com tamanhos MUITO reduzidos para A4 paisagem
-        if shape_config['shape'] == 'diamond':
-            # Losango usando SVG - MUITO REDUZIDO
-            node_content = f'''
-            <div style="position: relative; width: 60px; height: 60px; margin: 0 auto;">
-                <svg width="60" height="60" style="position: absolute; top: 0; left: 0;">
-                    <polygon points="30,2 58,30 30,58 2,30" 
-                             fill="{shape_config['bg_color']}" 
-                             stroke="{shape_config['border_color']}" 
-                             stroke-width="1"/>
-                </svg>
-                <div style="position: absolute; top: 50%; left: 50%; width: 50px; margin-left: -25px; margin-top: -12px; text-align: center; font-size: 5pt; line-height: 1.0; color: {shape_config['text_color']};">
-                    {label_escaped}
-                </div>
-                {f'<div style="position: absolute; top: 50%; left: 50%; margin-left: -8px; margin-top: -8px; font-size: 16px; color: #d32f2f; font-weight: bold;">✕</div>' if status == 'discarded' else ''}
-                {f'<div style="position: absolute; top: -2px; left: -2px; background-color: {shape_config["border_color"]}; color: white; width: 14px; height: 14px; border-radius: 50%; text-align: center; line-height: 14px; font-weight: bold; font-size: 6pt;">{node_number}</div>' if node_number else ''}
-            </div>
-            '''
-        elif shape_config['shape'] == 'oval':
-            # Oval - MUITO REDUZIDO
-            node_content = f'''
-            <div style="position: relative; width: 70px; min-height: 35px; margin: 0 auto; background-color: {shape_config['bg_color']}; border: 1px solid {shape_config['border_color']}; border-radius: 25px; padding: 4px 8px;">
-                <div style="text-align: center; font-size: 5pt; line-height: 1.0; color: {shape_config['text_color']};">
-                    {label_escaped}
-                    {f'<div style="margin-top: 1px; font-size: 4.5pt; color: #1976d2; font-weight: 600;">NBR: {html.escape(str(nbr_code))}</div>' if nbr_code else ''}
-                </div>
-                {f'<div style="position: absolute; top: -2px; left: -2px; background-color: {shape_config["border_color"]}; color: white; width: 14px; height: 14px; border-radius: 50%; text-align: center; line-height: 14px; font-weight: bold; font-size: 6pt;">{node_number}</div>' if node_number else ''}
-            </div>
-            '''
-        else:
-            # Retângulo arredondado - MUITO REDUZIDO
-            node_content = f'''
-            <div style="position: relative; width: 80px; min-height: 35px; margin: 0 auto; background-color: {shape_config['bg_color']}; border: 1px solid {shape_config['border_color']}; border-radius: 5px; padding: 4px 8px;">
-                <div style="text-align: center; font-size: 5pt; line-height: 1.0; color: {shape_config['text_color']};">
-                    {label_escaped}
-                    {f'<div style="margin-top: 1px; font-size: 4.5pt; color: #1976d2; font-weight: 600;">NBR: {html.escape(str(nbr_code))}</div>' if nbr_code else ''}
-                </div>
-                {f'<div style="position: absolute; top: -2px; left: -2px; background-color: {shape_config["border_color"]}; color: white; width: 14px; height: 14px; border-radius: 50%; text-align: center; line-height: 14px; font-weight: bold; font-size: 6pt;">{node_number}</div>' if node_number else ''}
-            </div>
-            '''
-        
-        # Se tem filhos, usa tabela para organizar
-        if children:
-            children_cells = []
-            for child in children:
-                children_cells.append(f'<td style="vertical-align: top; padding: 0 3px;">{render_node(child, level + 1)}</td>')
-            
-            children_row = f'<tr>{"".join(children_cells)}</tr>'
-            
-            # Linha vertical conectora - MUITO REDUZIDA
-            connector_line = f'<div style="width: 1px; height: 8px; background-color: #2196f3; margin: 0 auto;"></div>'
-            
-            # Linha horizontal (se múltiplos filhos) - MUITO REDUZIDA
-            horizontal_line = ''
-            if len(children) > 1:
-                horizontal_line = f'<div style="height: 1px; background-color: #2196f3; margin: 0 auto; width: 95%;"></div>'
-            
-            return f'''
-            <table style="border-collapse: collapse; margin: 0 auto;">
-                <tr>
-                    <td colspan="{len(children)}" style="text-align: center; padding-bottom: 2px;">
-                        {node_content}
-                        {connector_line}
-                        {horizontal_line}
-                    </td>
-                </tr>
-                {children_row}
-            </table>
-            '''
+    results: Dict[str, Optional[str]] = {}
+    pending = []
+    seen = set()
+    for url in image_urls:
+        if not url or not isinstance(url, str) or not url.strip():
+            continue
+        url = url.strip()
+        if url in seen:
+            continue
+        seen.add(url)
+        if url.startswith('data:image'):
+            results[url] = url
+        elif image_cache and url in image_cache:
+            results[url] = image_cache[url]
         else:
-            # Nó folha - sem filhos
-            if level > 0:
-                connector_line = f'<div style="width: 1px; height: 8px; background-color: #2196f3; margin: 0 auto; margin-bottom: 2px;"></div>'
-                return f'{connector_line}{node_content}'
-            return node_content
+            pending.append(url)
     
-    # Renderiza a árvore completa
-    tree_html = render_node(tree_json, level=0)
+    if pending:
+        start = time.monotonic()
+        workers = max(1, min(max_workers, len(pending)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pdf-image") as executor:
+            converted = executor.map(lambda url: convert_image_url_to_base64(url, None, timeout), pending)
+            results.update(zip(pending, converted))
+        ok = sum(1 for url in pending if results.get(url))
+        print(f"[CONVERT_IMAGE] {ok}/{len(pending)} imagens baixadas em {time.monotonic() - start:.1f}s "
+              f"({workers} workers)")
     
-    # Legenda corrigida para A4 paisagem (igual ao sistema)
-    legend_html = '''
-    <div style="position: absolute; top: 5px; right: 5px; background: white; border: 1.5px solid #333; padding: 5px; border-radius: 3px; font-size: 5.5pt; width: 120px;">
-        <div style="font-weight: bold; margin-bottom: 3px; border-bottom: 1px solid #ccc; padding-bottom: 2px; font-size: 6pt;">LEGENDA</div>
-        <div style="margin-bottom: 2px;"><strong>H:</strong> Hipótese</div>
-        <div style="margin-bottom: 2px;"><strong>CB:</strong> Causa Básica</div>
-        <div style="margin-bottom: 2px;"><strong>CC:</strong> Causa Contribuinte</div>
-        <div style="margin-top: 3px; margin-bottom: 2px;">
-            <span style="display: inline-block; width: 10px; height: 10px; background: #ffcdd2; border: 1px solid #f44336; border-radius: 2px; vertical-align: middle;"></span>
-            <span style="margin-left: 3px;">Evento Topo</span>
-        </div>
-        <div style="margin-bottom: 2px;">
-            <svg width="10" height="10" style="display: inline-block; vertical-align: middle; margin-right: 3px;">
-                <polygon points="5,1 9,5 5,9 1,5" fill="#e0e0e0" stroke="#757575" stroke-width="1"/>
-            </svg>
-            <span style="margin-left: 3px;">Hipótese</span>
-        </div>
-        <div style="margin-bottom: 2px;">
-            <svg width="10" height="10" style="display: inline-block; vertical-align: middle; margin-right: 3px;">
-                <polygon points="5,1 9,5 5,9 1,5" fill="#ffcdd2" stroke="#f44336" stroke-width="1"/>
-                <text x="5" y="7" text-anchor="middle" font-size="8" fill="#d32f2f" font-weight="bold">✕</text>
-            </svg>
-            <span style="margin-left: 3px;">Descartada</span>
-        </div>
-        <div style="margin-bottom: 2px;">
-            <span style="display: inline-block; width: 10px; height: 10px; background: #fff9c4; border: 1px solid #f9a825; border-radius: 2px; vertical-align: middle;"></span>
-            <span style="margin-left: 3px;">Intermediária</span>
-        </div>
-        <div style="margin-bottom: 2px;">
-            <span style="display: inline-block; width: 10px; height: 10px; background: #c8e6c9; border: 1px solid #4caf50; border-radius: 50%; vertical-align: middle;"></span>
-            <span style="margin-left: 3px;">Causa Básica</span>
-        </div>
-        <div>
-            <span style="display: inline-block; width: 10px; height: 10px; background: #bbdefb; border: 1px solid #2196f3; border-radius: 50%; vertical-align: middle;"></span>
-            <span style="margin-left: 3px;">Causa Contribuinte</span>
-        </div>
-    </div>
-    '''
-    
-    # HTML completo otimizado para A4 paisagem (árvore centralizada)
-    return f'''
-    <div class="fault-tree-landscape" style="position: relative; padding: 5px; padding-top: 6cm; background: white; min-height: 190mm; page-break-inside: avoid; border: 1px solid #e0e0e0;">
-        {legend_html}
-        <div style="overflow: hidden;">
-            {tree_html}
-        </div>
-    </div>
-    '''
+    return results
+
+
+def render_fault_tree_html_for_pdf(tree_json: Dict[str, Any]) -> str:
+    """
+    Renderiza a árvore de falhas em HTML/CSS usando tabelas para compatibilidade com WeasyPrint.
+    Otimizado para caber em A4 paisagem.
+    """
+    from services.fault_tree_html import render_fault_tree
+    return render_fault_tree(tree_json, theme='pdf')
 
 
 def extract_hypotheses_from_tree(tree_json: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -1665,29 +1491,21 @@ def generate_pdf_report(
         hypotheses = extract_hypotheses_from_tree(fault_tree_json)
         print(f"[PDF_GENERATION] Total de hipóteses extraídas: {len(hypotheses)}")
         
-        # Converte imagens de justificativa para base64 (com tratamento defensivo)
-        for i, hyp in enumerate(hypotheses):
-            # Garante que hyp é um dicionário e tem a chave justification_image_url
-            if not isinstance(hyp, dict):
-                hyp['justification_image_b64'] = None
-                continue
-                
-            justification_image_url = hyp.get('justification_image_url') or hyp.get('justification_image_url', None)
-            if justification_image_url and isinstance(justification_image_url, str) and justification_image_url.strip():
-                try:
-                    print(f"[PDF_GENERATION] [{i+1}/{len(hypotheses)}] Processando imagem de justificativa: {justification_image_url[:100]}...")
-                    img_b64 = convert_image_url_to_base64(justification_image_url.strip(), image_cache)
-                    if img_b64:
-                        hyp['justification_image_b64'] = img_b64
-                        print(f"[PDF_GENERATION] ✓ Imagem {i+1} convertida com sucesso")
-                    else:
-                        hyp['justification_image_b64'] = None
-                        print(f"[PDF_GENERATION] ✗ Falha ao converter imagem {i+1}")
-                except Exception as e:
-                    hyp['justification_image_b64'] = None
-                    print(f"[PDF_GENERATION] ✗ Exceção ao processar imagem {i+1}: {str(e)}")
-            else:
-                hyp['justification_image_b64'] = None
+        # Baixa e processa todas as imagens (justificativas + evidências) em paralelo, sem duplicatas
+        def justification_url(hyp) -> Optional[str]:
+            url = hyp.get('justification_image_url') if isinstance(hyp, dict) else None
+            return url.strip() if isinstance(url, str) and url.strip() else None
+        
+        justification_urls = [justification_url(hyp) for hyp in hypotheses]
+        evidence_urls = [img_url for img_url in evidence_images if img_url and isinstance(img_url, str)]
+        print(f"[PDF_GENERATION] Convertendo imagens ({len(evidence_urls)} evidências, "
+              f"{sum(1 for url in justification_urls if url)} justificativas)...")
+        images_b64 = convert_images_to_base64(justification_urls + evidence_urls, image_cache)
+        
+        # Associa as imagens de justificativa às hipóteses
+        for hyp, url in zip(hypotheses, justification_urls):
+            if isinstance(hyp, dict):
+                hyp['justification_image_b64'] = images_b64.get(url) if url else None
         
         # Extrai recomendações de causas básicas e contribuintes
         recommendations = extract_recommendations_from_tree(fault_tree_json)
@@ -1701,18 +1519,8 @@ def generate_pdf_report(
         # Prepara data atual
         current_date = datetime.now().strftime('%d/%m/%Y')
         
-        # Converte URLs de evidências para base64 (para embutir no PDF)
-        print(f"[PDF_GENERATION] Convertendo imagens de evidência...")
-        evidence_images_b64 = []
-        for i, img_url in enumerate(evidence_images):
-            if img_url:
-                print(f"[PDF_GENERATION] [{i+1}/{len(evidence_images)}] Convertendo: {img_url[:100]}...")
-                img_b64 = convert_image_url_to_base64(img_url, image_cache)
-                if img_b64:
-                    evidence_images_b64.append(img_b64)
-                    print(f"[PDF_GENERATION] ✓ Evidência {i+1} convertida")
-                else:
-                    print(f"[PDF_GENERATION] ✗ Falha ao converter evidência {i+1}")
+        # Evidências convertidas para base64 (mantém a ordem original)
+        evidence_images_b64 = [images_b64[url.strip()] for url in evidence_urls if images_b64.get(url.strip())]
         
         print(f"[PDF_GENERATION] Total de imagens convertidas: {len(evidence_images_b64)}/{len(evidence_images)}")
         
@@ -1721,6 +1529,11 @@ def generate_pdf_report(
         if commission_actions:
             commission_actions_sorted = sorted(commission_actions, key=lambda x: x.get('action_time', ''))
         
+        # Jinja2 e WeasyPrint só são carregados quando um PDF é gerado
+        # (extract_* deste módulo também são usados pelo gerador Word)
+        from jinja2 import Template
+        from weasyprint import HTML, CSS
+        
         # Renderiza HTML
         print(f"[PDF_GENERATION] Renderizando template HTML...")
         template = Template(HTML_TEMPLATE)
@@ -4,9 +4,40 @@ Sistema de Logging Simples para o Sistema SSO
 import logging
 import os
 import sys
+import threading
+import time
+from collections import deque
 from datetime import datetime
+from itertools import islice
 from typing import Dict, Any, Optional, List
 
+# Níveis mantidos no índice dos logs em memória
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+
+class MemoryLogEntry:
+    """Entrada do buffer de logs em memória (timestamp formatado só na leitura)"""
+    
+    __slots__ = ("seq", "created", "level", "message", "extra_data")
+    
+    def __init__(self, seq: int, created: float, level: str, message: str, extra_data: Optional[Dict] = None):
+        self.seq = seq
+        self.created = created
+        self.level = level
+        self.message = message
+        self.extra_data = extra_data
+    
+    @property
+    def timestamp(self) -> str:
+        return datetime.fromtimestamp(self.created).isoformat()
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "timestamp": self.timestamp,
+            "level": self.level,
+            "message": self.message,
+            "extra_data": self.extra_data or {}
+        }
+
 class SimpleLogger:
     """Sistema de logging simples e robusto"""
     
@@ -19,9 +50,15 @@ class SimpleLogger:
         if not self.logger.handlers:
             self._setup_handlers()
         
-        # Logs em memória para debug
-        self.memory_logs: List[Dict[str, Any]] = []
+        # Logs em memória para debug (buffer circular de capacidade fixa)
         self.max_memory_logs = 1000
+        self._memory_lock = threading.Lock()
+        self._ring: List[Optional[MemoryLogEntry]] = [None] * self.max_memory_logs
+        self._ring_next = 0
+        self._ring_size = 0
+        self._seq = 0
+        # Índice por nível: entradas de cada nível em ordem de chegada
+        self._by_level: Dict[str, deque] = {level: deque() for level in LOG_LEVELS}
     
     def _setup_handlers(self):
         """Configura os handlers de logging de forma segura"""
@@ -41,24 +78,31 @@ class SimpleLogger:
             pass
     
     def _add_memory_log(self, level: str, message: str, extra_data: Optional[Dict] = None):
-        """Adiciona log à memória para debug"""
+        """Adiciona log à memória para debug (O(1), sobrescreve o mais antigo quando cheio)"""
         try:
-            log_entry = {
-                "timestamp": datetime.now().isoformat(),
-                "level": level,
-                "message": message,
-                "extra_data": extra_data or {}
-            }
-            
-            self.memory_logs.append(log_entry)
-            
-            # Mantém apenas os últimos N logs
-            if len(self.memory_logs) > self.max_memory_logs:
-                self.memory_logs = self.memory_logs[-self.max_memory_logs:]
+            with self._memory_lock:
+                self._seq += 1
+                entry = MemoryLogEntry(self._seq, time.time(), level, message, extra_data)
+                evicted = self._ring[self._ring_next]
+                if evicted is not None:
+                    # O mais antigo do buffer é também o mais antigo do seu nível
+                    self._by_level[evicted.level].popleft()
+                self._ring[self._ring_next] = entry
+                self._ring_next = (self._ring_next + 1) % self.max_memory_logs
+                self._ring_size = min(self._ring_size + 1, self.max_memory_logs)
+                self._by_level.setdefault(level, deque()).append(entry)
         except:
             # Se falhar, não faz nada
             pass
     
+    def _recent_entries(self, limit: int) -> List[MemoryLogEntry]:
+        """Últimas `limit` entradas do buffer, da mais antiga para a mais recente"""
+        count = self._ring_size if limit <= 0 else min(limit, self._ring_size)
+        start = self._ring_next - count
+        if start >= 0:
+            return self._ring[start:self._ring_next]
+        return self._ring[start:] + self._ring[:self._ring_next]
+    
     def debug(self, message: str, extra_data: Optional[Dict] = None):
         """Log de debug"""
         try:
@@ -99,17 +143,51 @@ class SimpleLogger:
         except:
             pass
     
-    def get_memory_logs(self, limit: int = 50) -> List[Dict[str, Any]]:
-        """Retorna logs da memória"""
+    def get_memory_logs(self, limit: int = 50, levels: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Retorna logs da memória (do mais antigo para o mais recente)
+        
+        Com `levels`, lê apenas o índice dos níveis pedidos em vez de varrer o buffer.
+        """
         try:
-            return self.memory_logs[-limit:] if limit > 0 else self.memory_logs
+            with self._memory_lock:
+                if levels is None:
+                    entries = self._recent_entries(limit)
+                else:
+                    entries = []
+                    for level in set(levels):
+                        level_entries = self._by_level.get(level, ())
+                        if limit > 0:
+                            level_entries = list(islice(reversed(level_entries), limit))
+                        entries.extend(level_entries)
+                    entries.sort(key=lambda entry: entry.seq)
+                    if limit > 0:
+                        entries = entries[-limit:]
+            return [entry.to_dict() for entry in entries]
         except:
             return []
     
+    def get_level_counts(self) -> Dict[str, int]:
+        """Quantidade de logs em memória por nível"""
+        try:
+            with self._memory_lock:
+                return {level: len(entries) for level, entries in self._by_level.items()}
+        except:
+            return {}
+    
+    def memory_log_count(self) -> int:
+        """Quantidade total de logs em memória"""
+        return self._ring_size
+    
     def clear_memory_logs(self):
         """Limpa logs da memória"""
         try:
-            self.memory_logs.clear()
+            with self._memory_lock:
+                self._ring = [None] * self.max_memory_logs
+                self._ring_next = 0
+                self._ring_size = 0
+                for entries in self._by_level.values():
+                    entries.clear()
             self.info("Logs da memória limpos")
         except:
             pass
@@ -742,10 +742,21 @@ def generate_word_report(
         doc.add_paragraph('Abaixo a representação gráfica da Árvore de Falhas gerada durante a investigação.')
         
         if fault_tree_json:
-            # Adiciona nota sobre a árvore (no Word não podemos renderizar HTML/CSS facilmente)
-            note_p = doc.add_paragraph('Nota: A árvore de falhas completa está disponível no sistema e pode ser visualizada na interface web.')
-            note_p.runs[0].font.italic = True
-            note_p.runs[0].font.color.rgb = TEXT_GRAY
+            # Diagrama graphviz em PNG (mesmo cache em disco usado pela página)
+            from services.fault_tree_graph import fault_tree_graph_path
+            try:
+                tree_png_path = fault_tree_graph_path(fault_tree_json, 'png')
+            except OSError:
+                tree_png_path = None
+            
+            if tree_png_path:
+                doc.add_picture(tree_png_path, width=Inches(6.5))
+                doc.paragraphs[-1].alignment = WD_ALIGN_PARAGRAPH.CENTER
+            else:
+                # Sem graphviz no servidor: no Word não podemos renderizar HTML/CSS facilmente
+                note_p = doc.add_paragraph('Nota: A árvore de falhas completa está disponível no sistema e pode ser visualizada na interface web.')
+                note_p.runs[0].font.italic = True
+                note_p.runs[0].font.color.rgb = TEXT_GRAY
         
         # 5.1 Classificação NBR 14280
         if verified_causes: